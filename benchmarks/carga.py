@@ -0,0 +1,269 @@
+"""
+Carga roteirizada contra main.app, com os órgãos emulados por stubs.py.
+
+Sobe o servidor stub, aponta todos os hosts para ele (remapear_upstreams),
+dispara N requisições por cenário com C em paralelo direto no ASGI da API
+e informa vazão e p50/p95/p99. Na raiz do projeto:
+
+    python -m benchmarks.carga
+    python -m benchmarks.carga --requisicoes 500 --concorrencia 50 --cenarios feam,ima
+    python -m benchmarks.carga --perfis perfis.json
+    python -m benchmarks.carga --reproduzir gravacoes_upstream
+
+Com --reproduzir o stub não sobe: as chamadas aos órgãos são respondidas
+pelas gravações de services/gravacao.py, com a latência gravada.
+
+perfis.json tem um PerfilStub por órgão (chave "*" para o padrão):
+
+    {"*": {"latencia_ms": 80, "latencia_p95_ms": 400},
+     "FEAM": {"latencia_ms": 300, "latencia_p95_ms": 2500, "taxa_erro": 0.02}}
+
+Códigos, CNPJs e credenciais variam por requisição para que caches e
+coalescência não escondam as chamadas aos órgãos.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from benchmarks.stubs import PerfilStub, ServidorStub
+from services import gravacao, inea
+from services.clientes_http import fechar_clientes_async, remapear_upstreams
+
+
+RELAY_STUB = "https://relay.stub"
+RELAY_KEY_STUB = "chave-benchmark"
+
+
+def _cnpj(i: int) -> str:
+    return f"{10000000 + i:08d}000199"
+
+
+def _cpf(i: int) -> str:
+    return f"{100000000 + i:09d}00"
+
+
+@dataclass
+class Cenario:
+    nome: str
+    rota: str
+    corpo: Callable[[int], Dict[str, Any]]
+
+
+CENARIOS: Dict[str, Cenario] = {cenario.nome: cenario for cenario in [
+    Cenario("feam", "/feam/retorna-manifesto-codigo-de-barras", lambda i: {
+        "cnpj": _cnpj(i), "senha": f"s{i}", "unidadeGerador": 1000 + i, "codigoDeBarras": f"24{i:010d}",
+    }),
+    Cenario("ima", "/ima/retorna-manifesto-codigo-de-barras", lambda i: {
+        "cpf": _cpf(i), "cnpj": _cnpj(i), "senha": f"s{i}", "unidadeGerador": str(1000 + i), "codigoBarras": f"24{i:010d}",
+    }),
+    Cenario("fepam", "/fepam/retorna-manifesto-codigo-de-barras", lambda i: {
+        "cpf": _cpf(i), "cnpj": _cnpj(i), "senha": f"s{i}", "manifestoCodigo": f"24{i:010d}",
+    }),
+    Cenario("inea", "/inea/retorna-manifesto-codigo-de-barras", lambda i: {
+        "cpf": _cpf(i), "cnpj": _cnpj(i), "senha": f"s{i}", "unidadeGerador": str(1000 + i), "codigoBarras": f"24{i:010d}",
+    }),
+    Cenario("sinir", "/sinir/retorna-manifesto", lambda i: {
+        "cpfCnpj": _cnpj(i), "senha": f"s{i}", "unidade": str(1000 + i), "manifestoNumero": f"24{i:010d}",
+    }),
+    Cenario("sigor", "/sigor/retorna-manifesto", lambda i: {
+        "cpfCnpj": _cnpj(i), "senha": f"s{i}", "unidade": str(1000 + i), "manifestoNumero": f"24{i:010d}",
+    }),
+    Cenario("semad", "/semad/retorna-manifesto-codigo-de-barras", lambda i: {
+        "pessoaCodigo": 1000 + i, "cnpj": _cnpj(i), "cpf": _cpf(i), "senha": f"s{i}", "codigoBarras": f"24{i:010d}",
+    }),
+    Cenario("semad-pdf", "/semad/download-manifesto-codigo-de-barras", lambda i: {
+        "pessoaCodigo": 1000 + i, "cnpj": _cnpj(i), "cpf": _cpf(i), "senha": f"s{i}", "codigoBarras": f"{i:034d}",
+    }),
+    Cenario("fepam-parceiro", "/fepam/busca-parceiro", lambda i: {
+        "cnpj": _cnpj(i), "tipoParceiro": "transportador",
+    }),
+    Cenario("semad-parceiro", "/semad/busca-parceiro", lambda i: {
+        "cnpj": _cnpj(i), "tipoParceiro": "destino",
+    }),
+    Cenario("sinir-parceiro", "/sinir/busca-parceiro", lambda i: {
+        "cnpj": _cnpj(i), "tipoParceiro": "armazenador",
+    }),
+    Cenario("feam-dmr-listar", "/feam/dmr/listar-todas", lambda i: {
+        "JSESSIONID": f"sessao{i}",
+    }),
+    Cenario("feam-dmr-declaracao", "/feam/dmr/buscar-declaracao", lambda i: {
+        "idDeclaracao": str(100000 + i), "condicao": "E", "JSESSIONID": f"sessao{i}",
+    }),
+    Cenario("inea-salvar", "/inea/salvarManifesto", lambda i: {
+        "url": "https://mtr.inea.rj.gov.br/api/salvarManifestoLote",
+        "manifesto": {"cnp": _cnpj(i), "login": _cpf(i), "senha": f"s{i}", "manifestoJSONDTO": [{"manifestoCodigo": i}]},
+    }),
+    Cenario("ima-salvar", "/ima/salvarManifesto", lambda i: {
+        "url": "https://mtr.ima.sc.gov.br/mtrservice/salvarManifestoLote",
+        "manifesto": {"cnp": _cnpj(i), "login": _cpf(i), "senha": f"s{i}", "manifestoJSONDTO": [{"manifestoCodigo": i}]},
+    }),
+]}
+
+
+@dataclass
+class Resultado:
+    cenario: str
+    duracoes: List[float] = field(default_factory=list)
+    status: Counter = field(default_factory=Counter)
+    total_segundos: float = 0.0
+
+    def percentil(self, p: float) -> float:
+        if not self.duracoes:
+            return 0.0
+
+        ordenadas = sorted(self.duracoes)
+        indice = min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas)) - 1))
+        return ordenadas[indice]
+
+    @property
+    def vazao(self) -> float:
+        return len(self.duracoes) / self.total_segundos if self.total_segundos else 0.0
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "cenario": self.cenario,
+            "requisicoes": len(self.duracoes),
+            "vazao_rps": round(self.vazao, 1),
+            "p50_ms": round(self.percentil(50) * 1000, 1),
+            "p95_ms": round(self.percentil(95) * 1000, 1),
+            "p99_ms": round(self.percentil(99) * 1000, 1),
+            "status": dict(sorted(self.status.items())),
+        }
+
+
+def preparar_ambiente(url_stub: Optional[str]) -> None:
+    """Aponta todos os hosts para o stub e liga o relay INEA com um endereço fixo."""
+
+    if url_stub:
+        remapear_upstreams({"*": url_stub})
+
+    inea.INEA_WORKAROUND_ENABLED = True
+    inea.INEA_RELAY_KEY = RELAY_KEY_STUB
+    inea.INEA_RELAY_CACHE_SECONDS = 10 ** 9
+    inea.atualizar_cache_inea_relay(RELAY_STUB)
+
+
+async def _executar_cenario(cliente: httpx.AsyncClient, cenario: Cenario, requisicoes: int, concorrencia: int, deslocamento: int) -> Resultado:
+    resultado = Resultado(cenario.nome)
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def uma(i: int) -> None:
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.post(cenario.rota, json=cenario.corpo(deslocamento + i))
+                # Lê o corpo inteiro: as rotas com streaming só terminam aqui.
+                await resposta.aread()
+                status = str(resposta.status_code)
+            except Exception as error:
+                status = type(error).__name__
+
+            resultado.duracoes.append(time.perf_counter() - inicio)
+            resultado.status[status] += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma(i) for i in range(requisicoes)))
+    resultado.total_segundos = time.perf_counter() - inicio
+
+    return resultado
+
+
+async def executar_carga(
+    app: Any,
+    cenarios: Iterable[str],
+    requisicoes: int = 200,
+    concorrencia: int = 20,
+) -> List[Resultado]:
+    """Roda os cenários em sequência contra o app ASGI; o stub já deve estar no ar."""
+
+    transporte = httpx.ASGITransport(app=app)
+    resultados = []
+
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://api.local", timeout=120) as cliente:
+            for indice, nome in enumerate(cenarios):
+                resultados.append(
+                    await _executar_cenario(cliente, CENARIOS[nome], requisicoes, concorrencia, indice * requisicoes)
+                )
+    finally:
+        await fechar_clientes_async()
+
+    return resultados
+
+
+def _imprimir(resultados: List[Resultado]) -> None:
+    print(f"{'cenario':<22}{'req':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  status")
+
+    for resultado in resultados:
+        r = resultado.resumo()
+        status = " ".join(f"{codigo}={quantidade}" for codigo, quantidade in r["status"].items())
+        print(f"{r['cenario']:<22}{r['requisicoes']:>6}{r['vazao_rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}  {status}")
+
+
+def _ler_perfis(caminho: Optional[str]) -> Dict[str, PerfilStub]:
+    if not caminho:
+        return {}
+
+    with open(caminho, encoding="utf-8") as arquivo:
+        return {orgao: PerfilStub.de_dict(dados) for orgao, dados in json.load(arquivo).items()}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Carga offline da API contra órgãos emulados")
+    parser.add_argument("--requisicoes", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--concorrencia", type=int, default=20)
+    parser.add_argument("--cenarios", default=",".join(CENARIOS), help="lista separada por vírgula")
+    parser.add_argument("--perfis", help="JSON com PerfilStub por órgão (\"*\" = padrão)")
+    parser.add_argument("--latencia-ms", type=float, default=50.0, help="mediana padrão dos stubs")
+    parser.add_argument("--reproduzir", metavar="DIR", help="usa as gravações de DIR em vez do stub")
+    parser.add_argument("--fator-latencia", type=float, default=1.0, help="multiplica a latência gravada (--reproduzir)")
+    parser.add_argument("--json", action="store_true", help="resultado em JSON")
+    parser.add_argument("--logs", action="store_true", help="mantém logs e prints da API (ruidoso sob carga)")
+    args = parser.parse_args(argv)
+
+    cenarios = [nome.strip() for nome in args.cenarios.split(",") if nome.strip()]
+    desconhecidos = [nome for nome in cenarios if nome not in CENARIOS]
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(desconhecidos)} (disponíveis: {', '.join(CENARIOS)})")
+
+    perfis = _ler_perfis(args.perfis)
+    padrao = perfis.pop("*", PerfilStub(latencia_ms=args.latencia_ms))
+
+    # Importado aqui: main lê as variáveis de ambiente na importação.
+    from main import app
+
+    if args.reproduzir:
+        gravacao.configurar_gravacao(gravacao.REPRODUZIR, args.reproduzir, args.fator_latencia)
+        ambiente: Any = contextlib.nullcontext()
+    else:
+        ambiente = ServidorStub(perfis, padrao)
+
+    with ambiente as stub:
+        preparar_ambiente(stub.url if stub else None)
+
+        if args.logs:
+            resultados = asyncio.run(executar_carga(app, cenarios, args.requisicoes, args.concorrencia))
+        else:
+            logging.disable(logging.WARNING)
+            with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+                resultados = asyncio.run(executar_carga(app, cenarios, args.requisicoes, args.concorrencia))
+            logging.disable(logging.NOTSET)
+
+    if args.json:
+        print(json.dumps([resultado.resumo() for resultado in resultados], ensure_ascii=False, indent=2))
+    else:
+        _imprimir(resultados)
+
+
+if __name__ == "__main__":
+    main()
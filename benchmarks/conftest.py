@@ -0,0 +1,78 @@
+"""
+Benchmarks dos caminhos quentes da API: parse das páginas DMR da FEAM e
+serialização JSON das respostas.
+
+Requer pytest-benchmark (pip install pytest-benchmark). Na raiz do projeto:
+
+    python -m pytest benchmarks -q
+    python -m pytest benchmarks --benchmark-group-by=param:pagina
+
+Carga de ponta a ponta com os órgãos emulados: python -m benchmarks.carga
+
+Para incluir as declarações DMR gravadas (GRAVACAO_UPSTREAM=gravar):
+
+    BENCH_GRAVACOES=gravacoes_upstream python -m pytest benchmarks
+"""
+
+import json
+import os
+import re
+
+import pytest
+
+from services.gravacao import respostas_gravadas
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Linhas de resíduo da página grande, gerada a partir da declaração salva.
+LINHAS_PAGINA_GRANDE = 400
+
+
+def carregar_fixture(nome: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, nome), encoding="utf-8") as arquivo:
+        return arquivo.read()
+
+
+def _pagina_grande() -> str:
+    html = carregar_fixture("dmr_declaracao.html")
+    encontradas = list(re.finditer(r'<tr class="linha(?:Par|Impar)">.*?</tr>', html, flags=re.S))
+    linhas = [m.group(0) for m in encontradas]
+    repetidas = "\n".join(linhas[i % len(linhas)] for i in range(LINHAS_PAGINA_GRANDE))
+    return html[: encontradas[0].start()] + repetidas + html[encontradas[-1].end():]
+
+
+PAGINAS_DMR = {
+    "declaracao": lambda: carregar_fixture("dmr_declaracao.html"),
+    "sem_residuos": lambda: carregar_fixture("dmr_sem_residuos.html"),
+    "grande": _pagina_grande,
+}
+
+BENCH_GRAVACOES = os.getenv("BENCH_GRAVACOES", "")
+
+if BENCH_GRAVACOES:
+    for indice, corpo in enumerate(respostas_gravadas("buscaDeclaracao", BENCH_GRAVACOES)):
+        PAGINAS_DMR[f"gravada_{indice}"] = lambda corpo=corpo: corpo.decode("utf-8")
+
+
+@pytest.fixture(params=sorted(PAGINAS_DMR))
+def pagina_dmr(request):
+    return request.param, PAGINAS_DMR[request.param]()
+
+
+@pytest.fixture
+def html_declaracao():
+    return carregar_fixture("dmr_declaracao.html")
+
+
+@pytest.fixture
+def html_residuos():
+    # Trecho devolvido por buscaResiduosDeclaracaoNovo (só as linhas).
+    return carregar_fixture("dmr_residuos_fragmento.html")
+
+
+@pytest.fixture
+def manifesto():
+    # Resposta típica de retornaManifesto (24 resíduos, três parceiros).
+    with open(os.path.join(FIXTURES_DIR, "manifesto.json"), encoding="utf-8") as arquivo:
+        return json.load(arquivo)
@@ -0,0 +1,155 @@
+"""
+Substituto local do Redis para o ArmazemRedis, sem instalar o servidor.
+
+Fala o protocolo RESP com o mínimo que o armazém usa: PING, AUTH, SELECT,
+GET, SET [NX] [PX ms] e DEL, com expiração. DEBUG SLEEP segura a resposta,
+como no Redis, para testar cancelamento e timeout. Roda em outro processo, como
+o ServidorStub, para vários processos de teste dividirem o mesmo estado:
+
+    with ServidorRedisStub() as redis:
+        configurar_armazem(ArmazemRedis(redis.url))
+
+Também pode ser usado com os workers do uvicorn:
+
+    python -m benchmarks.stub_redis --porta 6379
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+def _bulk(valor: Optional[bytes]) -> bytes:
+    if valor is None:
+        return b"$-1\r\n"
+
+    return b"$%d\r\n%s\r\n" % (len(valor), valor)
+
+
+class _Estado:
+    def __init__(self) -> None:
+        self._dados: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+    def _vivo(self, chave: bytes) -> Optional[bytes]:
+        entrada = self._dados.get(chave)
+
+        if entrada is None:
+            return None
+
+        if entrada[1] is not None and entrada[1] <= time.monotonic():
+            del self._dados[chave]
+            return None
+
+        return entrada[0]
+
+    def executar(self, partes: List[bytes]) -> bytes:
+        comando = partes[0].upper()
+
+        if comando == b"PING":
+            return b"+PONG\r\n"
+
+        if comando in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+
+        if comando == b"GET":
+            return _bulk(self._vivo(partes[1]))
+
+        if comando == b"DEL":
+            removidas = 0
+            for chave in partes[1:]:
+                if self._vivo(chave) is not None:
+                    del self._dados[chave]
+                    removidas += 1
+            return b":%d\r\n" % removidas
+
+        if comando == b"SET":
+            chave, valor = partes[1], partes[2]
+            opcoes = [p.upper() for p in partes[3:]]
+            expira_em = None
+
+            if b"PX" in opcoes:
+                expira_em = time.monotonic() + int(partes[3 + opcoes.index(b"PX") + 1]) / 1000
+
+            if b"NX" in opcoes and self._vivo(chave) is not None:
+                return _bulk(None)
+
+            self._dados[chave] = (valor, expira_em)
+            return b"+OK\r\n"
+
+        return b"-ERR comando nao suportado '%s'\r\n" % comando
+
+
+async def _atender(estado: _Estado, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            linha = await reader.readline()
+
+            if not linha:
+                break
+
+            partes = []
+            for _ in range(int(linha[1:])):
+                tamanho = int((await reader.readline())[1:])
+                partes.append((await reader.readexactly(tamanho + 2))[:-2])
+
+            if partes[0].upper() == b"DEBUG" and partes[1].upper() == b"SLEEP":
+                await asyncio.sleep(float(partes[2]))
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(estado.executar(partes))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def _servir(sock: socket.socket) -> None:
+    estado = _Estado()
+
+    async def principal() -> None:
+        servidor = await asyncio.start_server(lambda r, w: _atender(estado, r, w), sock=sock)
+        async with servidor:
+            await servidor.serve_forever()
+
+    asyncio.run(principal())
+
+
+class ServidorRedisStub:
+    """Sobe o substituto em outro processo, numa porta livre."""
+
+    def __init__(self, porta: int = 0):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", porta))
+        self._socket.listen(128)
+        self.url = f"redis://127.0.0.1:{self._socket.getsockname()[1]}/0"
+
+        self._processo = multiprocessing.Process(
+            target=_servir,
+            args=(self._socket,),
+            name="servidor-redis-stub",
+            daemon=True,
+        )
+
+    def __enter__(self) -> "ServidorRedisStub":
+        self._processo.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._processo.terminate()
+        self._processo.join(timeout=10)
+        self._socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Substituto local do Redis para ARMAZEM_SESSOES=redis.")
+    parser.add_argument("--porta", type=int, default=6379)
+    args = parser.parse_args()
+
+    with ServidorRedisStub(args.porta) as servidor:
+        print(f"ARMAZEM_SESSOES=redis ARMAZEM_SESSOES_REDIS_URL={servidor.url}")
+        servidor._processo.join()
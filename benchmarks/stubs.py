@@ -0,0 +1,318 @@
+"""
+Servidor stub que imita os sistemas dos órgãos, para carga sem rede.
+
+Um único servidor HTTP local atende todos os hosts: a API é apontada para
+ele por remapear_upstreams (ou UPSTREAM_REMAP="*=http://127.0.0.1:porta")
+e cada requisição é atendida conforme o header Host (órgão) e o caminho.
+
+Cobre o que os serviços chamam: gettoken, retornaManifesto, login e
+pesquisaParceiro da API não oficial SINIR/SIGOR, ControllerServlet
+(autenticaUsuario, paginaPrincipal, buscaPessoaPorTipo, buscaDeclaracao,
+buscaResiduosDeclaracaoNovo), listagem DataTables das DMRs, listas do
+INEA, PDFs, salvarManifestoLote, os serviços Selenium e o relay INEA.
+
+Latência, taxa de erro e tamanho das respostas vêm do PerfilStub do órgão.
+"""
+
+import asyncio
+import copy
+import json
+import math
+import multiprocessing
+import os
+import random
+import secrets
+import socket
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from services.clientes_http import orgao_do_host
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+# z da normal padrão no percentil 95
+_Z_P95 = 1.645
+
+# Contagem de chamadas (qualquer host); fora dos caminhos dos órgãos.
+ROTA_CHAMADAS = "/_stub/chamadas"
+
+
+@dataclass
+class PerfilStub:
+    """Comportamento de um órgão no stub."""
+
+    # Mediana da latência; com latencia_p95_ms > mediana, a latência segue
+    # uma lognormal com esse p95 (cauda longa como nos sistemas reais).
+    latencia_ms: float = 50.0
+    latencia_p95_ms: float = 0.0
+
+    # Fração das requisições respondidas com 503.
+    taxa_erro: float = 0.0
+
+    # Resíduos por manifesto (uniforme entre os limites) e tamanho dos PDFs.
+    residuos: Tuple[int, int] = (24, 24)
+    pdf_kb: Tuple[int, int] = (150, 150)
+
+    # Linhas da listagem DataTables de DMRs.
+    dmrs_total: int = 300
+
+    def latencia(self, rng: random.Random) -> float:
+        if self.latencia_p95_ms <= self.latencia_ms or self.latencia_ms <= 0:
+            return max(0.0, self.latencia_ms) / 1000
+
+        sigma = math.log(self.latencia_p95_ms / self.latencia_ms) / _Z_P95
+        return rng.lognormvariate(math.log(self.latencia_ms), sigma) / 1000
+
+    @classmethod
+    def de_dict(cls, dados: Dict[str, Any]) -> "PerfilStub":
+        campos = dict(dados)
+        for faixa in ("residuos", "pdf_kb"):
+            if faixa in campos and not isinstance(campos[faixa], (list, tuple)):
+                campos[faixa] = (campos[faixa], campos[faixa])
+            if faixa in campos:
+                campos[faixa] = tuple(campos[faixa])
+        return cls(**campos)
+
+
+def _ler_fixture(nome: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, nome), "rb") as arquivo:
+        return arquivo.read()
+
+
+class AppStub:
+    """Aplicação ASGI do stub; conta as chamadas por (órgão, operação)."""
+
+    def __init__(self, perfis: Optional[Dict[str, PerfilStub]] = None, padrao: Optional[PerfilStub] = None, semente: int = 0):
+        self.perfis = perfis or {}
+        self.padrao = padrao or PerfilStub()
+        self.chamadas: Counter = Counter()
+        self._rng = random.Random(semente)
+
+        self._manifesto = json.loads(_ler_fixture("manifesto.json"))
+        self._residuos = self._manifesto["objetoResposta"]["listaManifestoResiduo"]
+        self._declaracao = _ler_fixture("dmr_declaracao.html")
+        self._fragmento_residuos = _ler_fixture("dmr_residuos_fragmento.html")
+
+    def perfil(self, orgao: str) -> PerfilStub:
+        return self.perfis.get(orgao, self.padrao)
+
+    # ------------------------------------------------------------------
+    # Respostas
+    # ------------------------------------------------------------------
+
+    def _manifesto_json(self, perfil: PerfilStub, codigo: str) -> bytes:
+        quantidade = self._rng.randint(*perfil.residuos)
+        manifesto = copy.copy(self._manifesto)
+        objeto = dict(manifesto["objetoResposta"])
+        objeto["manNumero"] = codigo
+        objeto["listaManifestoResiduo"] = [
+            self._residuos[i % len(self._residuos)] for i in range(quantidade)
+        ]
+        manifesto["objetoResposta"] = objeto
+        return json.dumps(manifesto, ensure_ascii=False).encode("utf-8")
+
+    def _pdf(self, perfil: PerfilStub) -> Response:
+        tamanho = self._rng.randint(*perfil.pdf_kb) * 1024
+        corpo = b"%PDF-1.4\n" + b"0" * max(0, tamanho - 14) + b"\n%%EOF"
+        return Response(corpo, media_type="application/pdf")
+
+    @staticmethod
+    def _parceiro(cnpj: str) -> List[Dict[str, Any]]:
+        return [{
+            "parCodigo": int(cnpj[-6:] or 0) if cnpj[-6:].isdigit() else 1,
+            "parCnpj": cnpj,
+            "parDescricao": f"PARCEIRO STUB {cnpj}",
+            "parCidade": "BELO HORIZONTE",
+            "parUf": "MG",
+        }]
+
+    def _datatables(self, perfil: PerfilStub, params: Dict[str, str]) -> Dict[str, Any]:
+        inicio = int(params.get("iDisplayStart", 0))
+        tamanho = int(params.get("iDisplayLength", 10))
+        fim = min(perfil.dmrs_total, inicio + tamanho)
+
+        return {
+            "sEcho": params.get("sEcho", "1"),
+            "iTotalRecords": perfil.dmrs_total,
+            "iTotalDisplayRecords": perfil.dmrs_total,
+            "aaData": [
+                [str(100000 + i), "2024", f"{1 + i % 12:02d}/2024", "Enviada", "Gerador", str(900000 + i), ""]
+                for i in range(inicio, fim)
+            ],
+        }
+
+    @staticmethod
+    def _com_sessao(resposta: Response) -> Response:
+        resposta.set_cookie("JSESSIONID", secrets.token_hex(16), path="/", httponly=True)
+        return resposta
+
+    def _controller(self, acao: str, campos: Dict[str, str], perfil: PerfilStub) -> Response:
+        if acao == "autenticaUsuario":
+            return self._com_sessao(JSONResponse({"sucesso": "s"}))
+
+        if acao == "paginaPrincipal":
+            return Response(b"<html><body><div id='menuPrincipal'>MTR</div></body></html>", media_type="text/html")
+
+        if acao == "buscaPessoaPorTipo":
+            return JSONResponse(self._parceiro(campos.get("cnpj", "")))
+
+        if acao == "buscaDeclaracao":
+            return Response(self._declaracao, media_type="text/html; charset=utf-8")
+
+        if acao == "buscaResiduosDeclaracaoNovo":
+            return Response(self._fragmento_residuos, media_type="text/html; charset=utf-8")
+
+        return JSONResponse({"erro": True, "mensagem": f"acao desconhecida: {acao}"}, status_code=404)
+
+    async def _responder(self, request: Request, perfil: PerfilStub) -> Response:
+        segmentos = [parte for parte in request.url.path.split("/") if parte]
+        params = dict(request.query_params)
+
+        campos: Dict[str, str] = {}
+        if "x-www-form-urlencoded" in request.headers.get("content-type", ""):
+            campos = {chave: valores[0] for chave, valores in parse_qs((await request.body()).decode("utf-8")).items()}
+
+        if not segmentos:
+            # Página inicial (SEMAD/INEA abrem antes do login para pegar cookies).
+            return self._com_sessao(Response(b"<html><body>MTR</body></html>", media_type="text/html"))
+
+        if segmentos[-1] == "ControllerServlet":
+            return self._controller(params.get("acao") or campos.get("acao", ""), {**params, **campos}, perfil)
+
+        if segmentos[-1].endswith(".java"):
+            return JSONResponse(self._datatables(perfil, params))
+
+        if "gettoken" in segmentos:
+            # Um formato que atende FEAM (token/chave), SEMAD (retornoCodigo)
+            # e SINIR/SIGOR (objetoResposta com o Bearer).
+            token = secrets.token_hex(12)
+            return JSONResponse({
+                "erro": False,
+                "retornoCodigo": 0,
+                "token": token,
+                "chave": secrets.token_hex(6),
+                "objetoResposta": f"Bearer {token}",
+            })
+
+        if "retornaManifesto" in segmentos:
+            codigo = segmentos[-1] if segmentos[-1] != "retornaManifesto" else ""
+            return Response(self._manifesto_json(perfil, codigo), media_type="application/json")
+
+        if segmentos[-1] == "login":
+            return JSONResponse({"erro": False, "objetoResposta": {"token": secrets.token_hex(12)}})
+
+        if "pesquisaParceiro" in segmentos:
+            return JSONResponse({"erro": False, "mensagem": None, "objetoResposta": self._parceiro(segmentos[-1])})
+
+        if "manifestoModelo" in segmentos:
+            return JSONResponse({"erro": False, "objetoResposta": [{"mamCodigo": i, "mamDescricao": f"Modelo {i}"} for i in range(5)]})
+
+        if "buscaPdfManifestoPorCodigoBarras" in segmentos or segmentos[-1] == "downloadManifesto":
+            return self._pdf(perfil)
+
+        if segmentos[-1] in ("salvarManifestoLote", "salvarManifesto"):
+            return JSONResponse({"erro": False, "mensagem": "Manifesto salvo", "objetoResposta": [{"manNumero": "240000000001"}]})
+
+        if segmentos[-1] == "cancelarManifesto":
+            return JSONResponse({"erro": False, "mensagem": "Manifesto cancelado"})
+
+        if segmentos[-1] == "retornaListaInea" or (len(segmentos) > 1 and segmentos[1].startswith("retornaLista")):
+            return JSONResponse([{"codigo": i, "descricao": f"Item {i}"} for i in range(50)])
+
+        # Formatos dos serviços Selenium: o do IMA devolve um dict, o da FEAM uma lista.
+        if segmentos[-1] == "ima-login":
+            return JSONResponse({"codigo": 200, "cookies": {"JSESSIONID": secrets.token_hex(16)}})
+
+        if segmentos[-1] == "feam-login":
+            return JSONResponse({"cookies": [{"name": "JSESSIONID", "value": secrets.token_hex(16)}]})
+
+        return JSONResponse({"erro": True, "mensagem": "rota não emulada pelo stub"}, status_code=404)
+
+    async def __call__(self, scope, receive, send) -> None:
+        request = Request(scope, receive)
+
+        if request.url.path == ROTA_CHAMADAS:
+            contagem = [[orgao, operacao, total] for (orgao, operacao), total in self.chamadas.items()]
+            await JSONResponse(contagem)(scope, receive, send)
+            return
+
+        orgao = orgao_do_host(request.headers.get("host", "").split(":")[0])
+        perfil = self.perfil(orgao)
+
+        segmentos = [parte for parte in request.url.path.split("/") if parte]
+        self.chamadas[(orgao, request.query_params.get("acao") or (segmentos[-1] if segmentos else "/"))] += 1
+
+        await asyncio.sleep(perfil.latencia(self._rng))
+
+        if perfil.taxa_erro and self._rng.random() < perfil.taxa_erro:
+            resposta: Response = JSONResponse({"erro": True, "mensagem": "stub: erro sorteado"}, status_code=503)
+        else:
+            resposta = await self._responder(request, perfil)
+
+        await resposta(scope, receive, send)
+
+
+def _servir(sock: socket.socket, perfis: Dict[str, PerfilStub], padrao: Optional[PerfilStub], semente: int) -> None:
+    config = uvicorn.Config(AppStub(perfis, padrao, semente), log_level="warning", access_log=False, lifespan="off")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class ServidorStub:
+    """
+    Sobe o AppStub com uvicorn em outro processo, numa porta livre:
+
+        with ServidorStub(perfis) as stub:
+            remapear_upstreams({"*": stub.url})
+
+    Processo separado para o stub não disputar o GIL com a API medida
+    (numa thread do mesmo processo cada resposta atrasava ~40 ms).
+    """
+
+    def __init__(self, perfis: Optional[Dict[str, PerfilStub]] = None, padrao: Optional[PerfilStub] = None, semente: int = 0):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+
+        self._processo = multiprocessing.Process(
+            target=_servir,
+            args=(self._socket, perfis or {}, padrao, semente),
+            name="servidor-stub",
+            daemon=True,
+        )
+
+    def chamadas(self) -> Counter:
+        """Chamadas recebidas pelo stub, por (órgão, operação)."""
+
+        resposta = httpx.get(f"{self.url}{ROTA_CHAMADAS}", timeout=10)
+        resposta.raise_for_status()
+        return Counter({(orgao, operacao): total for orgao, operacao, total in resposta.json()})
+
+    def __enter__(self) -> "ServidorStub":
+        self._processo.start()
+
+        limite = time.monotonic() + 15
+        while True:
+            try:
+                httpx.get(f"{self.url}{ROTA_CHAMADAS}", timeout=1)
+                return self
+            except httpx.TransportError:
+                if time.monotonic() > limite or not self._processo.is_alive():
+                    self.__exit__()
+                    raise RuntimeError("Servidor stub não iniciou")
+                time.sleep(0.05)
+
+    def __exit__(self, *_) -> None:
+        self._processo.terminate()
+        self._processo.join(timeout=10)
+        self._socket.close()
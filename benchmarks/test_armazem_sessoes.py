@@ -0,0 +1,263 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+from benchmarks.stub_redis import ServidorRedisStub
+from services import armazem_sessoes as modulo
+from services.armazem_sessoes import ArmazemMemoria, ArmazemRedis, ArmazemSessoes, ArmazemSqlite, configurar_armazem
+from services.cache_tokens import CacheTokens
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, SessaoExpirada
+
+
+@pytest.fixture(scope="module")
+def redis_stub():
+    with ServidorRedisStub() as servidor:
+        yield servidor
+
+
+@pytest.fixture(params=["memoria", "sqlite", "redis"])
+def armazem(request, tmp_path):
+    if request.param == "sqlite":
+        armazem = ArmazemSqlite(str(tmp_path / "sessoes.sqlite3"))
+    elif request.param == "redis":
+        armazem = ArmazemRedis(request.getfixturevalue("redis_stub").url, prefixo=f"{tmp_path.name}:")
+    else:
+        armazem = ArmazemMemoria()
+
+    configurar_armazem(armazem)
+    yield armazem
+    configurar_armazem(None)
+
+
+def test_grava_le_remove_e_expira(armazem):
+    async def cenario():
+        sessao = {"cookies": {"JSESSIONID": "abc"}, "token": None}
+
+        await armazem.gravar("sessao:X:0", sessao, time.time() + 60)
+        valor, expira_em = await armazem.ler("sessao:X:0")
+        assert valor == sessao and expira_em > time.time()
+
+        # Só remove se ainda for a sessão recusada.
+        await armazem.remover("sessao:X:0", {"cookies": {"JSESSIONID": "outro"}, "token": None})
+        assert await armazem.ler("sessao:X:0") is not None
+        await armazem.remover("sessao:X:0", sessao)
+        assert await armazem.ler("sessao:X:0") is None
+
+        await armazem.gravar("token:y", {"valor": "t"}, time.time() + 0.05)
+        await asyncio.sleep(0.1)
+        assert await armazem.ler("token:y") is None
+
+        await armazem.fechar()
+
+    asyncio.run(cenario())
+
+
+def test_renovacao_unica_entre_tarefas(armazem):
+    chamadas = []
+
+    async def renovar():
+        chamadas.append(1)
+        await asyncio.sleep(0.05)
+        return {"valor": "token"}, time.time() + 60
+
+    async def cenario():
+        resultados = await asyncio.gather(*[armazem.obter_ou_renovar("token:z", renovar) for _ in range(10)])
+        await armazem.fechar()
+        return resultados
+
+    resultados = asyncio.run(cenario())
+
+    assert len(chamadas) == 1
+    assert sum(renovado for _, _, renovado in resultados) == 1
+    assert all(valor == {"valor": "token"} for valor, _, _ in resultados)
+
+
+def _worker(tipo, destino, inicio, fila):
+    armazem = ArmazemSqlite(destino) if tipo == "sqlite" else ArmazemRedis(destino)
+
+    async def renovar():
+        await asyncio.sleep(0.2)
+        return {"valor": f"token-{multiprocessing.current_process().pid}"}, time.time() + 60
+
+    async def cenario():
+        resultado = await armazem.obter_ou_renovar("token:workers", renovar)
+        await armazem.fechar()
+        return resultado
+
+    inicio.wait()
+    valor, _, renovado = asyncio.run(cenario())
+    fila.put((valor["valor"], renovado))
+
+
+@pytest.mark.parametrize("tipo", ["sqlite", "redis"])
+def test_um_worker_renova_os_demais_reaproveitam(tipo, tmp_path, request):
+    destino = str(tmp_path / "sessoes.sqlite3") if tipo == "sqlite" else request.getfixturevalue("redis_stub").url
+    contexto = multiprocessing.get_context("spawn")
+    inicio, fila = contexto.Event(), contexto.Queue()
+
+    processos = [contexto.Process(target=_worker, args=(tipo, destino, inicio, fila)) for _ in range(4)]
+    for processo in processos:
+        processo.start()
+    inicio.set()
+
+    resultados = [fila.get(timeout=30) for _ in processos]
+    for processo in processos:
+        processo.join(timeout=10)
+
+    assert sum(renovado for _, renovado in resultados) == 1
+    assert len({token for token, _ in resultados}) == 1
+
+
+def test_cache_tokens_reaproveita_token_de_outro_worker(armazem):
+    gerados = []
+
+    async def gerar():
+        gerados.append(1)
+        return ("token-feam", "chave")
+
+    async def cenario():
+        # Duas instâncias = dois workers com o mesmo armazém.
+        primeiro = await CacheTokens().obter(("FEAM", "cpf", "senha"), gerar)
+        segundo = await CacheTokens().obter(("FEAM", "cpf", "senha"), gerar)
+
+        # Token recusado: some do armazém e o próximo worker gera outro.
+        await CacheTokens().invalidar(("FEAM", "cpf", "senha"), segundo)
+        terceiro = await CacheTokens().obter(("FEAM", "cpf", "senha"), gerar)
+        await armazem.fechar()
+        return primeiro, segundo, terceiro
+
+    primeiro, segundo, terceiro = asyncio.run(cenario())
+
+    assert primeiro == segundo == terceiro == ("token-feam", "chave")
+    assert len(gerados) == 2
+
+
+def test_pool_reaproveita_login_e_descarta_sessao_recusada(armazem):
+    logins, recusadas, vistas = [], [], []
+
+    async def login():
+        logins.append(1)
+        return SessaoAutenticada(cookies={"JSESSIONID": f"s{len(logins)}"})
+
+    async def jsessionid(sessao):
+        return sessao.cookies["JSESSIONID"]
+
+    async def recusar_primeira(sessao):
+        if not recusadas:
+            recusadas.append(sessao.cookies["JSESSIONID"])
+            raise SessaoExpirada("HTTP 401")
+        return sessao.cookies["JSESSIONID"]
+
+    async def recusar_s2_devagar(sessao):
+        vistas.append(sessao.cookies["JSESSIONID"])
+        await asyncio.sleep(0.05)
+        if sessao.cookies["JSESSIONID"] == "s2":
+            raise SessaoExpirada("HTTP 401")
+        return sessao.cookies["JSESSIONID"]
+
+    async def cenario():
+        # Pools diferentes = workers diferentes: o segundo usa o login do primeiro.
+        assert await PoolSessoes("TESTE", login, tamanho=1).executar(jsessionid) == "s1"
+        assert await PoolSessoes("TESTE", login, tamanho=1).executar(jsessionid) == "s1"
+        assert len(logins) == 1
+
+        # Sessão recusada: o pool a apaga do armazém e refaz o login.
+        assert await PoolSessoes("TESTE", login, tamanho=1).executar(recusar_primeira) == "s2"
+        assert await PoolSessoes("TESTE", login, tamanho=1).executar(jsessionid) == "s2"
+
+        # Com alguém esperando a vaga, a sessão recusada sai do armazém
+        # antes da vaga ser entregue: quem espera não a recarrega.
+        pool = PoolSessoes("TESTE", login, tamanho=1)
+        primeira = asyncio.create_task(pool.executar(recusar_s2_devagar))
+        await asyncio.sleep(0.01)
+        esperando = asyncio.create_task(pool.executar(recusar_s2_devagar))
+        assert await asyncio.gather(primeira, esperando) == ["s3", "s3"]
+
+        await armazem.fechar()
+
+    asyncio.run(cenario())
+
+    assert len(logins) == 3 and recusadas == ["s1"] and vistas.count("s2") == 1
+
+
+def test_armazem_padrao_e_memoria(monkeypatch):
+    monkeypatch.setattr(modulo, "ARMAZEM_SESSOES", "memoria")
+    configurar_armazem(None)
+
+    assert isinstance(modulo.armazem_sessoes(), ArmazemMemoria)
+    configurar_armazem(None)
+
+
+def test_armazem_incompleto_nao_instancia():
+    class SemTrava(ArmazemSessoes):
+        async def _ler(self, chave):
+            return None
+
+        async def _gravar(self, chave, texto, expira_em):
+            pass
+
+        async def _remover(self, chave, texto):
+            pass
+
+    with pytest.raises(TypeError):
+        SemTrava()
+
+
+def test_shutdown_fecha_o_armazem():
+    from main import app, lifespan
+
+    fechados = []
+
+    class Armazem(ArmazemMemoria):
+        async def fechar(self):
+            fechados.append(1)
+
+    async def cenario():
+        async with lifespan(app):
+            pass
+
+    configurar_armazem(Armazem())
+    try:
+        asyncio.run(cenario())
+    finally:
+        configurar_armazem(None)
+
+    assert fechados == [1]
+
+
+def test_redis_cancelado_no_meio_do_comando_nao_desalinha_respostas(redis_stub):
+    armazem = ArmazemRedis(redis_stub.url, prefixo="cancelamento:")
+
+    async def cenario():
+        await armazem.gravar("token:a", {"valor": "a"}, time.time() + 60)
+
+        # Comando já enviado, resposta ainda não lida.
+        pendente = asyncio.create_task(armazem._comando("DEBUG", "SLEEP", "0.3"))
+        await asyncio.sleep(0.05)
+        pendente.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pendente
+
+        assert await armazem._tentar_travar("trava:a", 5) is True
+        assert (await armazem.ler("token:a"))[0] == {"valor": "a"}
+        await armazem.fechar()
+
+    asyncio.run(cenario())
+
+
+def test_redis_travado_estoura_o_timeout(redis_stub):
+    armazem = ArmazemRedis(redis_stub.url, prefixo="timeout:", timeout=0.1)
+
+    async def cenario():
+        inicio = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await armazem._comando("DEBUG", "SLEEP", "2")
+        assert time.monotonic() - inicio < 1
+
+        # A conexão com resposta pendente foi descartada.
+        assert await armazem.ler("token:b") is None
+        await armazem.fechar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,132 @@
+import asyncio
+
+from services import cache_parceiros
+from services.cache_parceiros import CacheParceiros, buscar_parceiro_em_cache, resultado_negativo
+from services.json_bruto import JsonBruto
+
+
+PARCEIRO = {"erro": False, "objetoResposta": [{"cnpj": "12345678000190", "nome": "Transportadora"}]}
+VAZIO = {"erro": False, "objetoResposta": None}
+
+
+class Orgao:
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.chamadas = []
+
+    async def buscar(self, cnpj="12345678000190"):
+        self.chamadas.append(cnpj)
+        await asyncio.sleep(0.01)
+        resposta = self.respostas.pop(0) if len(self.respostas) > 1 else self.respostas[0]
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+
+def test_resultado_negativo():
+    assert resultado_negativo(VAZIO)
+    assert resultado_negativo(JsonBruto(b"[]"))
+    assert resultado_negativo({"ok": False, "status_code": 500})
+    assert not resultado_negativo(PARCEIRO)
+    assert not resultado_negativo(JsonBruto(b"[" + b"1," * 1000 + b"1]"))
+
+
+def test_hit_miss_e_single_flight():
+    cache = CacheParceiros()
+    orgao = Orgao(PARCEIRO)
+    chave = ("FEAM", "transportador", "12345678000190")
+
+    async def cenario():
+        resultados = await asyncio.gather(*[cache.obter(chave, orgao.buscar) for _ in range(5)])
+        resultados.append(await cache.obter(chave, orgao.buscar))
+        return resultados
+
+    assert asyncio.run(cenario()) == [PARCEIRO] * 6
+    assert len(orgao.chamadas) == 1
+    assert cache.estatisticas()["misses"] == 5 and cache.estatisticas()["hits"] == 1
+
+
+def test_negativo_usa_ttl_proprio_e_nao_e_servido_vencido():
+    cache = CacheParceiros(ttl_segundos=60, ttl_negativo_segundos=0.05, stale_segundos=60)
+    orgao = Orgao(VAZIO, PARCEIRO)
+    chave = ("SINIR", "destino", "1")
+
+    async def cenario():
+        assert await cache.obter(chave, orgao.buscar) == VAZIO
+        assert await cache.obter(chave, orgao.buscar) == VAZIO
+        await asyncio.sleep(0.06)
+        # Vencido e negativo: busca de novo na hora, sem stale.
+        assert await cache.obter(chave, orgao.buscar) == PARCEIRO
+
+    asyncio.run(cenario())
+
+    assert len(orgao.chamadas) == 2 and cache.estatisticas()["hits_negativos"] == 1
+
+
+def test_stale_while_revalidate():
+    cache = CacheParceiros(ttl_segundos=0.05, stale_segundos=60)
+    novo = {"erro": False, "objetoResposta": [{"nome": "Novo nome"}]}
+    orgao = Orgao(PARCEIRO, novo)
+    chave = ("IMA", "armazenador", "1")
+
+    async def cenario():
+        await cache.obter(chave, orgao.buscar)
+        await asyncio.sleep(0.06)
+
+        # Vencido dentro da janela: devolve o anterior e atualiza por trás.
+        assert await cache.obter(chave, orgao.buscar) == PARCEIRO
+        await asyncio.sleep(0.05)
+        assert await cache.obter(chave, orgao.buscar) == novo
+
+    asyncio.run(cenario())
+
+    estatisticas = cache.estatisticas()
+    assert estatisticas["hits_stale"] == 1 and estatisticas["atualizacoes"] == 1
+
+
+def test_falha_na_atualizacao_mantem_valor_anterior():
+    cache = CacheParceiros(ttl_segundos=0.05, stale_segundos=60)
+    orgao = Orgao(PARCEIRO, RuntimeError("órgão fora do ar"))
+    chave = ("FEPAM", "destino", "1")
+
+    async def cenario():
+        await cache.obter(chave, orgao.buscar)
+        await asyncio.sleep(0.06)
+        assert await cache.obter(chave, orgao.buscar) == PARCEIRO
+        await asyncio.sleep(0.05)
+        assert await cache.obter(chave, orgao.buscar) == PARCEIRO
+
+    asyncio.run(cenario())
+
+    assert cache.estatisticas()["falhas_atualizacao"] >= 1
+
+
+def test_remove_menos_usados():
+    cache = CacheParceiros(max_entradas=2)
+    orgao = Orgao(PARCEIRO)
+
+    async def cenario():
+        await cache.obter(("FEAM", "destino", "1"), orgao.buscar)
+        await cache.obter(("FEAM", "destino", "2"), orgao.buscar)
+        await cache.obter(("FEAM", "destino", "1"), orgao.buscar)
+        await cache.obter(("FEAM", "destino", "3"), orgao.buscar)
+        # "2" era o menos usado.
+        await cache.obter(("FEAM", "destino", "2"), orgao.buscar)
+
+    asyncio.run(cenario())
+
+    assert len(orgao.chamadas) == 4 and cache.estatisticas()["evictions"] == 2
+
+
+def test_cnpj_formatado_consulta_o_orgao_so_com_digitos(monkeypatch):
+    monkeypatch.setattr(cache_parceiros, "_CACHE_PARCEIROS", CacheParceiros())
+    orgao = Orgao(PARCEIRO)
+
+    async def cenario():
+        formatado = await buscar_parceiro_em_cache("SEMAD", "Transportador", "12.345.678/0001-90", orgao.buscar)
+        digitos = await buscar_parceiro_em_cache("semad", "transportador", "12345678000190", orgao.buscar)
+        return formatado, digitos
+
+    assert asyncio.run(cenario()) == (PARCEIRO, PARCEIRO)
+    assert orgao.chamadas == ["12345678000190"]
+
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from services import cache_pdf, cache_tokens, download_pdf
+from services.cache_pdf import CachePdf
+
+
+PDF = b"%PDF-1.4\n" + b"1" * 991
+CREDENCIAIS = ("SEMAD", "12345678000199", "senha")
+OUTRAS_CREDENCIAIS = ("SEMAD", "98765432000100", "outra")
+
+
+def _gravar(cache, codigo, credenciais=CREDENCIAIS, conteudo=PDF, tamanho_esperado=None):
+    async def gravar():
+        gravacao = cache.iniciar_gravacao("SEMAD", codigo, credenciais, tamanho_esperado)
+        await gravacao.escrever(conteudo[:100])
+        await gravacao.escrever(conteudo[100:])
+        await gravacao.concluir()
+
+    asyncio.run(gravar())
+
+
+def _ler(cache, codigo, credenciais=CREDENCIAIS):
+    arquivo = cache.abrir("SEMAD", codigo, credenciais)
+    if arquivo is None:
+        return None
+
+    with arquivo:
+        return arquivo.read()
+
+
+def test_hit_miss_e_credencial(tmp_path):
+    cache = CachePdf(str(tmp_path), max_bytes=10**6)
+
+    assert _ler(cache, "111") is None
+    _gravar(cache, "111")
+
+    assert _ler(cache, "111") == PDF
+    # Conhecer o código de barras não basta.
+    assert _ler(cache, "111", OUTRAS_CREDENCIAIS) is None
+    assert cache.estatisticas()["hits"] == 1 and cache.estatisticas()["misses"] == 2
+
+
+def test_credenciais_valem_apos_reinicio_e_entre_workers(tmp_path):
+    _gravar(CachePdf(str(tmp_path)), "222")
+
+    # Novo processo (reinício ou outro worker) com o mesmo diretório.
+    outro = CachePdf(str(tmp_path))
+    assert _ler(outro, "222") == PDF
+    assert _ler(outro, "222", OUTRAS_CREDENCIAIS) is None
+
+    # O outro worker baixa com a própria credencial; o primeiro passa a aceitá-la.
+    _gravar(outro, "222", OUTRAS_CREDENCIAIS)
+    assert _ler(CachePdf(str(tmp_path)), "222", OUTRAS_CREDENCIAIS) == PDF
+
+
+def test_cred_guarda_hmac_e_nao_o_hash_das_credenciais(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_tokens, "_SEGREDO", None)
+    monkeypatch.setattr(cache_tokens, "CREDENCIAIS_HMAC_SEGREDO", "")
+    monkeypatch.setattr(cache_tokens, "CREDENCIAIS_SEGREDO_ARQUIVO", str(tmp_path / "segredo"))
+
+    _gravar(CachePdf(str(tmp_path / "pdfs")), "333")
+    (cred,) = (tmp_path / "pdfs").rglob("*.cred")
+    gravado = cred.read_text().split()
+
+    bruto = "\x1f".join(CREDENCIAIS).encode("utf-8")
+    assert hashlib.sha256(bruto).hexdigest() not in gravado
+    assert gravado == [cache_tokens.chave_credenciais_persistida(CREDENCIAIS)]
+
+    # Outro worker lê o mesmo segredo do arquivo e reconhece a credencial.
+    monkeypatch.setattr(cache_tokens, "_SEGREDO", None)
+    assert _ler(CachePdf(str(tmp_path / "pdfs")), "333") == PDF
+
+    # Com outro segredo, o .cred não vale.
+    monkeypatch.setattr(cache_tokens, "_SEGREDO", b"outro segredo")
+    assert _ler(CachePdf(str(tmp_path / "pdfs")), "333") is None
+
+
+def test_remove_menos_acessados_e_arquivo_aberto_continua_valido(tmp_path):
+    cache = CachePdf(str(tmp_path), max_bytes=len(PDF) * 2)
+    _gravar(cache, "1")
+    _gravar(cache, "2")
+
+    aberto = cache.abrir("SEMAD", "1", CREDENCIAIS)
+    _gravar(cache, "3")
+
+    # "2" era o menos acessado.
+    assert _ler(cache, "2") is None
+    assert cache.estatisticas()["evictions"] == 1
+
+    _gravar(cache, "4")
+    assert _ler(cache, "1") is None
+    with aberto:
+        assert aberto.read() == PDF
+
+    # As credenciais saem junto com o PDF.
+    assert len(list(tmp_path.rglob("*.pdf"))) == len(list(tmp_path.rglob("*.cred"))) == 2
+
+
+def test_gravacao_incompleta_nao_entra_no_cache(tmp_path):
+    cache = CachePdf(str(tmp_path))
+
+    # Content-Length maior do que o recebido (conexão caiu no meio).
+    _gravar(cache, "333", tamanho_esperado=len(PDF) + 10)
+    assert _ler(cache, "333") is None
+
+    async def interromper():
+        gravacao = cache.iniciar_gravacao("SEMAD", "444", CREDENCIAIS)
+        await gravacao.escrever(PDF[:100])
+        await gravacao.descartar()
+        await gravacao.concluir()
+
+    asyncio.run(interromper())
+
+    assert _ler(cache, "444") is None
+    assert list(tmp_path.rglob("*.tmp")) == []
+    assert list(tmp_path.rglob("*.pdf")) == []
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_baixar_pdf_manifesto_grava_e_serve_do_cache(tmp_path, monkeypatch, streaming):
+    monkeypatch.setattr(cache_pdf, "_CACHE_PDF", CachePdf(str(tmp_path)))
+    monkeypatch.setattr(download_pdf, "DOWNLOAD_PDF_STREAMING", streaming)
+    downloads = []
+
+    async def baixar(stream):
+        downloads.append(stream)
+        return httpx.Response(
+            200,
+            content=PDF,
+            headers={"Content-Type": "application/pdf", "Content-Length": str(len(PDF))},
+            request=httpx.Request("GET", "https://mtr.meioambiente.mg.gov.br/manifesto.pdf"),
+        )
+
+    async def corpo(resposta):
+        if hasattr(resposta, "body_iterator"):
+            return b"".join([bloco async for bloco in resposta.body_iterator])
+        return resposta.body
+
+    async def cenario():
+        primeira = await download_pdf.baixar_pdf_manifesto("SEMAD", "555", CREDENCIAIS, baixar)
+        assert await corpo(primeira) == PDF
+
+        segunda = await download_pdf.baixar_pdf_manifesto("SEMAD", "555", CREDENCIAIS, baixar)
+        assert segunda.headers["X-Cache"] == "HIT" and segunda.headers["Content-Length"] == str(len(PDF))
+        assert await corpo(segunda) == PDF
+
+    asyncio.run(cenario())
+
+    assert downloads == [streaming]
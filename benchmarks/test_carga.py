@@ -0,0 +1,64 @@
+import asyncio
+import random
+import statistics
+
+import pytest
+
+from benchmarks.carga import CENARIOS, executar_carga, preparar_ambiente
+from benchmarks.stubs import PerfilStub, ServidorStub
+from services import feam, ima, inea
+from services.clientes_http import HOSTS_UPSTREAM, remapear_upstreams
+
+
+pytest.importorskip("uvicorn")
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # preparar_ambiente altera o módulo do INEA; o monkeypatch guarda os originais.
+    for nome in ("INEA_WORKAROUND_ENABLED", "INEA_RELAY_KEY", "INEA_RELAY_CACHE_SECONDS"):
+        monkeypatch.setattr(inea, nome, getattr(inea, nome))
+    for chave, valor in inea._INEA_RELAY_CACHE.items():
+        monkeypatch.setitem(inea._INEA_RELAY_CACHE, chave, valor)
+
+    with ServidorStub(padrao=PerfilStub(latencia_ms=0, residuos=(5, 5), pdf_kb=(4, 4), dmrs_total=25)) as servidor:
+        preparar_ambiente(servidor.url)
+        try:
+            yield servidor
+        finally:
+            remapear_upstreams({})
+
+
+def test_cenarios_respondem_pelos_stubs(stub):
+    from main import app
+
+    resultados = asyncio.run(executar_carga(app, CENARIOS, requisicoes=3, concorrencia=3))
+
+    for resultado in resultados:
+        assert set(resultado.status) == {"200"}, resultado.resumo()
+        assert len(resultado.duracoes) == 3
+
+    # Nenhuma chamada escapou para os órgãos reais: todas chegaram ao stub.
+    orgaos = {orgao for orgao, _ in stub.chamadas()}
+    assert {config["orgao"] for config in HOSTS_UPSTREAM.values()} <= orgaos
+
+
+def test_logins_selenium_aceitam_os_cookies_do_stub(stub):
+    async def logins():
+        return (
+            await ima._login_ima_selenium_async("1", "s", "", "2"),
+            await feam._get_cookies_feam_selenium_async("2", "1", "", "s"),
+        )
+
+    cookies_ima, cookies_feam = asyncio.run(logins())
+
+    assert "JSESSIONID" in cookies_ima and "JSESSIONID" in cookies_feam
+
+
+def test_latencia_lognormal_respeita_p95():
+    perfil = PerfilStub(latencia_ms=100, latencia_p95_ms=800)
+    rng = random.Random(1)
+    amostras = sorted(perfil.latencia(rng) for _ in range(20000))
+
+    assert statistics.median(amostras) == pytest.approx(0.1, rel=0.05)
+    assert amostras[int(len(amostras) * 0.95)] == pytest.approx(0.8, rel=0.1)
@@ -0,0 +1,60 @@
+import pytest
+
+from services.codec_json import BACKENDS, ORJSON, STDLIB
+
+
+pytest.importorskip("pytest_benchmark")
+
+# Respostas do /manifestos/lote: um manifesto por código consultado.
+ITENS_LOTE = 50
+
+
+@pytest.fixture
+def lote(manifesto):
+    return {
+        "sucesso": True,
+        "orgao": "SINIR",
+        "total": ITENS_LOTE,
+        "resultados": [
+            {"codigo": str(240012345678 + i), "sucesso": True, "dados": manifesto}
+            for i in range(ITENS_LOTE)
+        ],
+    }
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    return request.param
+
+
+def test_backends_equivalentes(manifesto):
+    dumps_stdlib, loads_stdlib = BACKENDS[STDLIB]
+
+    for dumps, loads in BACKENDS.values():
+        assert loads(dumps(manifesto)) == manifesto
+        assert loads_stdlib(dumps(manifesto)) == loads(dumps_stdlib(manifesto))
+
+
+@pytest.mark.skipif(ORJSON not in BACKENDS, reason="orjson não instalado")
+def test_orjson_sem_escape_de_acentos():
+    dumps, _ = BACKENDS[ORJSON]
+
+    assert dumps({"descricao": "Óleo"}) == '{"descricao":"Óleo"}'.encode("utf-8")
+
+
+def test_benchmark_dumps_manifesto(benchmark, backend, manifesto):
+    benchmark.group = "json:dumps-manifesto"
+    benchmark(BACKENDS[backend][0], manifesto)
+
+
+def test_benchmark_dumps_lote(benchmark, backend, lote):
+    benchmark.group = "json:dumps-lote"
+    benchmark(BACKENDS[backend][0], lote)
+
+
+def test_benchmark_loads_manifesto(benchmark, backend, manifesto):
+    dumps, loads = BACKENDS[backend]
+    corpo = dumps(manifesto)
+
+    benchmark.group = "json:loads-manifesto"
+    benchmark(loads, corpo)
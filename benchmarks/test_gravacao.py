@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from services import gravacao
+from services.log_payload import MASCARA
+
+
+def test_mascara_documentos_e_credenciais():
+    texto = gravacao.mascarar_texto('CPF 123.456.789-01, CNPJ 12345678000199, código 240012345678, "senha": "x"')
+
+    assert "123.456.789-01" not in texto and "000.000.000-00" in texto
+    assert "12345678000199" not in texto
+    assert "240012345678" in texto
+    assert f'"senha": "{MASCARA}"' in texto
+
+    assert gravacao.mascarar_valor({"token": "abc", "objetoResposta": "Bearer xyz", "cnp": "12345678000199"}) == {
+        "token": MASCARA,
+        "objetoResposta": f"Bearer {MASCARA}",
+        "cnp": "00000000000000",
+    }
+
+
+def test_senha_no_caminho_ima_inea():
+    caminho = "/mtrservice/retornaManifesto/240012345678/1234/segredo/12345678000199"
+
+    assert gravacao.mascarar_caminho(caminho, "mtr.ima.sc.gov.br") == (
+        f"/mtrservice/retornaManifesto/240012345678/1234/{MASCARA}/00000000000000"
+    )
+    # Fora do IMA/INEA o segmento antes do CNPJ é parâmetro (tipo do parceiro).
+    assert gravacao.mascarar_caminho("/api/mtr/pesquisaParceiro/5/12345678000199", "mtr.sinir.gov.br") == (
+        "/api/mtr/pesquisaParceiro/5/00000000000000"
+    )
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.path.endswith(".pdf"):
+        return httpx.Response(200, content=b"%PDF-1.4\n" + b"1" * 500, headers={"Content-Type": "application/pdf"})
+
+    return httpx.Response(
+        200,
+        json={"erro": False, "token": "segredo", "dados": {"cnpj": "12345678000199", "itens": [1, 2, 3]}},
+        headers={"Set-Cookie": "JSESSIONID=abc123; Path=/"},
+    )
+
+
+def test_grava_e_reproduz_sem_rede(tmp_path, monkeypatch):
+    monkeypatch.setattr(gravacao, "GRAVACAO_DIR", str(tmp_path))
+    monkeypatch.setattr(gravacao, "GRAVACAO_FATOR_LATENCIA", 0.0)
+    monkeypatch.setattr(gravacao, "_INDICE", None)
+
+    async def chamar(transporte, url, **kwargs):
+        async with httpx.AsyncClient(transport=transporte) as cliente:
+            resposta = await cliente.post(url, **kwargs)
+            return resposta.status_code, resposta.content, resposta.cookies.get("JSESSIONID")
+
+    gravador = gravacao.TransporteGravacao(httpx.MockTransport(_upstream))
+    url = "https://mtr.fepam.rs.gov.br/ControllerServlet"
+    original = asyncio.run(chamar(gravador, url, data={"acao": "autenticaUsuario", "txtSenha": "segredo"}))
+    asyncio.run(chamar(gravador, "https://mtr.fepam.rs.gov.br/manifesto.pdf"))
+
+    # A resposta repassada durante a gravação é a original.
+    assert b"segredo" in original[1] and original[2] == "abc123"
+
+    gravados = sorted(tmp_path.rglob("*.json"))
+    assert len(gravados) == 2
+    for arquivo in gravados:
+        conteudo = arquivo.read_text(encoding="utf-8")
+        assert "segredo" not in conteudo and "12345678000199" not in conteudo and "abc123" not in conteudo
+
+    registro = json.loads(next((tmp_path / "mtr.fepam.rs.gov.br" / "autenticaUsuario").glob("*.json")).read_text())
+    assert registro["operacao"] == "autenticaUsuario"
+
+    # Outra senha: cai na gravação da mesma operação.
+    status, corpo, cookie = asyncio.run(
+        chamar(gravacao.TransporteReproducao(), url, data={"acao": "autenticaUsuario", "txtSenha": "outra"})
+    )
+    assert status == 200 and json.loads(corpo)["dados"]["itens"] == [1, 2, 3] and cookie == MASCARA
+
+    _, pdf, _ = asyncio.run(chamar(gravacao.TransporteReproducao(), "https://mtr.fepam.rs.gov.br/manifesto.pdf"))
+    assert pdf.startswith(b"%PDF") and len(pdf) == 509
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(chamar(gravacao.TransporteReproducao(), "https://mtr.ima.sc.gov.br/mtrservice/retornaManifesto/1"))
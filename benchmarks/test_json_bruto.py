@@ -0,0 +1,42 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services.json_bruto import JsonBruto, codificar_envelope, json_bruto
+
+
+def _resposta(corpo: bytes, content_type: str = "application/json;charset=utf-8") -> httpx.Response:
+    return httpx.Response(200, content=corpo, headers={"Content-Type": content_type})
+
+
+@pytest.mark.parametrize(
+    "corpo",
+    [b'{"erro": false}', b" [1, 2]\n", b"null", b"true", b"-12.5", b'"texto"', b"\xef\xbb\xbf{}"],
+)
+def test_json_valido_passa_sem_mudar(corpo):
+    assert json_bruto(_resposta(corpo)).conteudo == corpo.strip().replace(b"\xef\xbb\xbf", b"")
+
+
+@pytest.mark.parametrize(
+    "corpo",
+    [
+        b"null pointer exception at line 3",
+        b"404 Not Found",
+        b"true story",
+        b'{"erro": true, "mensagem": "cortado',
+        b"[1, 2",
+        b"<html>erro</html>",
+        b"",
+    ],
+)
+def test_corpo_que_nao_e_json_vira_502(corpo):
+    with pytest.raises(HTTPException) as erro:
+        json_bruto(_resposta(corpo), "SINIR")
+
+    assert erro.value.status_code == 502 and "SINIR" in erro.value.detail
+
+
+def test_envelope_emenda_o_json_bruto():
+    envelope = {"sucesso": True, "dados": JsonBruto(b'{"a":[1,2]}')}
+
+    assert codificar_envelope(envelope) == b'{"sucesso":true,"dados":{"a":[1,2]}}'
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import lote_manifestos
+from services.concorrencia import LimiteConcorrencia
+from services.lote_manifestos import ConsultaManifestosLoteRequest, consultar_manifestos_lote_async
+
+
+def _lote(codigos, orgao="FEPAM"):
+    return ConsultaManifestosLoteRequest(orgao=orgao, codigos=codigos, cpf="1", cnpj="2", senha="s")
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    chamadas = []
+    simultaneas = {"agora": 0, "maximo": 0}
+
+    async def consultar(codigo):
+        chamadas.append(codigo)
+        simultaneas["agora"] += 1
+        simultaneas["maximo"] = max(simultaneas["maximo"], simultaneas["agora"])
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            simultaneas["agora"] -= 1
+
+        if codigo == "invalido":
+            raise HTTPException(status_code=404, detail="Manifesto não encontrado")
+        if codigo == "quebra":
+            raise ValueError("resposta inesperada")
+        return {"codigo": codigo}
+
+    monkeypatch.setattr(lote_manifestos, "_consulta_por_orgao", lambda orgao, dados: (None, consultar))
+    monkeypatch.setitem(lote_manifestos._LIMITES, "FEPAM", LimiteConcorrencia(3))
+    return chamadas, simultaneas
+
+
+def test_codigos_repetidos_contam_sobre_os_resultados(consultas):
+    chamadas, _ = consultas
+
+    resultado = asyncio.run(consultar_manifestos_lote_async(_lote(["1", "1", "invalido", "2", "invalido"])))
+
+    assert sorted(chamadas) == ["1", "2", "invalido"]
+    assert [item["codigo"] for item in resultado["resultados"]] == ["1", "1", "invalido", "2", "invalido"]
+    assert resultado["total"] == 5 and resultado["unicos"] == 3
+    assert resultado["sucessos"] == 3 and resultado["falhas"] == 2
+    assert resultado["sucessos"] + resultado["falhas"] == resultado["total"]
+
+
+def test_codigo_com_erro_nao_derruba_o_lote(consultas):
+    resultado = asyncio.run(consultar_manifestos_lote_async(_lote(["1", "invalido", "quebra"])))
+    por_codigo = {item["codigo"]: item for item in resultado["resultados"]}
+
+    assert por_codigo["1"]["sucesso"] is True
+    assert por_codigo["invalido"]["status_code"] == 404
+    assert por_codigo["quebra"]["status_code"] == 500 and por_codigo["quebra"]["sucesso"] is False
+
+
+def test_concorrencia_limitada_por_orgao(consultas):
+    _, simultaneas = consultas
+
+    asyncio.run(consultar_manifestos_lote_async(_lote([str(i) for i in range(20)])))
+
+    assert simultaneas["maximo"] == 3
+
+
+def test_lote_invalido(consultas, monkeypatch):
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(consultar_manifestos_lote_async(_lote(["1"], orgao="XPTO")))
+    assert erro.value.status_code == 400
+
+    monkeypatch.setattr(lote_manifestos, "LOTE_MAX_CODIGOS", 2)
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(consultar_manifestos_lote_async(_lote(["1", "2", "3"])))
+    assert erro.value.status_code == 400
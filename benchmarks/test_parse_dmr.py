@@ -0,0 +1,48 @@
+import pytest
+
+from services.feam import PARSER_BS4, PARSER_LXML, parse_dmr_page, parse_residuos_dmr
+
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_motores_retornam_o_mesmo_resultado(pagina_dmr):
+    _, html = pagina_dmr
+
+    assert parse_dmr_page(html, PARSER_LXML) == parse_dmr_page(html, PARSER_BS4)
+
+
+def test_declaracao_salva(html_declaracao):
+    dados = parse_dmr_page(html_declaracao, PARSER_LXML)
+
+    assert dados["cabecalho"] == {
+        "tipoDeclaracao": "DMR - 2º Semestre de 2024",
+        "dataInicial": "01/07/2024",
+        "dataFinal": "31/12/2024",
+    }
+    assert dados["dadosGerador"]["declarantePerfil"] == "Gerador / Destinador"
+    assert dados["dadosGerador"]["loNumero"] == "1234/2020"
+    assert len(dados["residuos"]) == 5
+    assert dados["residuos"][0]["quantidadeDestinada"] == 1250.5
+    assert dados["residuos"][4]["quantidadeArmazenada"] is None
+    assert dados["observacoes"] == "Armazenamento temporário em baias cobertas."
+
+
+@pytest.mark.parametrize("motor", [PARSER_BS4, PARSER_LXML])
+def test_residuos_do_trecho_iguais_aos_da_pagina(html_declaracao, html_residuos, motor):
+    assert parse_residuos_dmr(html_residuos, motor) == parse_dmr_page(html_declaracao, motor)["residuos"]
+
+
+@pytest.mark.parametrize("motor", [PARSER_BS4, PARSER_LXML])
+def test_benchmark_parse_residuos(benchmark, html_residuos, motor):
+    benchmark.group = "parse_residuos:trecho"
+
+    benchmark(parse_residuos_dmr, html_residuos, motor)
+
+
+@pytest.mark.parametrize("motor", [PARSER_BS4, PARSER_LXML])
+def test_benchmark_parse_dmr(benchmark, pagina_dmr, motor):
+    nome, html = pagina_dmr
+    benchmark.group = f"parse_dmr:{nome}"
+
+    benchmark(parse_dmr_page, html, motor)
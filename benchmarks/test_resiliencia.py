@@ -0,0 +1,173 @@
+import asyncio
+import gc
+import time
+
+import httpx
+import pytest
+
+from services import resiliencia
+from services.resiliencia import (
+    ABERTO,
+    FECHADO,
+    MEIO_ABERTO,
+    Bulkhead,
+    BulkheadCheio,
+    CircuitoAberto,
+    Disjuntor,
+    proteger,
+)
+
+
+def _falhar(disjuntor, vezes):
+    for _ in range(vezes):
+        disjuntor.registrar_falha(disjuntor.permitir())
+
+
+def test_circuito_abre_apos_falhas_seguidas_e_recusa_com_retry_after():
+    disjuntor = Disjuntor("TESTE", limiar_falhas=3, tempo_aberto=30)
+
+    _falhar(disjuntor, 2)
+    disjuntor.registrar_sucesso(disjuntor.permitir())
+    _falhar(disjuntor, 2)
+    # O sucesso zerou a sequência.
+    assert disjuntor.estado()["estado"] == FECHADO
+
+    _falhar(disjuntor, 1)
+    assert disjuntor.estado()["estado"] == ABERTO
+
+    with pytest.raises(CircuitoAberto) as erro:
+        disjuntor.permitir()
+
+    assert erro.value.status_code == 503
+    assert 29 <= int(erro.value.headers["Retry-After"]) <= 30
+    assert disjuntor.estado()["recusadas"] == 1 and disjuntor.estado()["aberturas"] == 1
+
+
+def test_meio_aberto_libera_um_teste_e_fecha_no_sucesso():
+    disjuntor = Disjuntor("TESTE", limiar_falhas=1, tempo_aberto=0.05)
+    _falhar(disjuntor, 1)
+    time.sleep(0.06)
+
+    assert disjuntor.estado()["estado"] == MEIO_ABERTO
+    teste = disjuntor.permitir()
+    assert teste is True
+
+    # Só uma requisição de teste por vez.
+    with pytest.raises(CircuitoAberto) as erro:
+        disjuntor.permitir()
+    assert erro.value.headers["Retry-After"] == "1"
+
+    disjuntor.registrar_sucesso(teste)
+    assert disjuntor.estado()["estado"] == FECHADO
+    assert disjuntor.permitir() is False
+
+
+def test_meio_aberto_volta_a_abrir_na_falha():
+    disjuntor = Disjuntor("TESTE", limiar_falhas=5, tempo_aberto=0.05)
+    _falhar(disjuntor, 5)
+    time.sleep(0.06)
+
+    disjuntor.registrar_falha(disjuntor.permitir())
+
+    assert disjuntor.estado()["estado"] == ABERTO and disjuntor.estado()["aberturas"] == 2
+
+
+def test_teste_cancelado_libera_o_meio_aberto():
+    disjuntor = Disjuntor("TESTE", limiar_falhas=1, tempo_aberto=0.05)
+    _falhar(disjuntor, 1)
+    time.sleep(0.06)
+
+    disjuntor.liberar(disjuntor.permitir())
+
+    assert disjuntor.permitir() is True
+
+
+def test_bulkhead_cheio_responde_503():
+    bulkhead = Bulkhead("TESTE", limite=1, espera=0.05)
+
+    async def cenario():
+        vaga = await bulkhead.ocupar()
+
+        with pytest.raises(BulkheadCheio) as erro:
+            await bulkhead.ocupar()
+
+        assert erro.value.status_code == 503 and erro.value.headers["Retry-After"] == "1"
+        assert bulkhead.estado()["em_uso"] == 1 and bulkhead.estado()["recusadas"] == 1
+
+        vaga.soltar()
+        vaga.soltar()
+        assert bulkhead.estado()["em_uso"] == 0
+
+    asyncio.run(cenario())
+
+
+@pytest.fixture
+def orgao(monkeypatch, request):
+    monkeypatch.setattr(resiliencia, "RESILIENCIA_ENABLED", True)
+    monkeypatch.setenv(f"BULKHEAD_LIMITE_{request.node.name.upper()}", "1")
+    monkeypatch.setenv(f"BULKHEAD_ESPERA_SEGUNDOS_{request.node.name.upper()}", "0.05")
+    return request.node.name
+
+
+def _em_uso(orgao):
+    return resiliencia._bulkhead(orgao).estado()["em_uso"]
+
+
+def test_proteger_conta_falhas_de_transporte_e_status_502(orgao, monkeypatch):
+    monkeypatch.setenv(f"CIRCUITO_LIMIAR_FALHAS_{orgao.upper()}", "2")
+
+    async def cenario():
+        with pytest.raises(httpx.ConnectError):
+            async with proteger(orgao):
+                raise httpx.ConnectError("recusada")
+
+        async with proteger(orgao) as protecao:
+            protecao.registrar(httpx.Response(502))
+
+        with pytest.raises(CircuitoAberto):
+            async with proteger(orgao):
+                pass
+
+    asyncio.run(cenario())
+
+    assert _em_uso(orgao) == 0
+
+
+def test_stream_segura_a_vaga_ate_o_aclose(orgao):
+    async def cenario():
+        resp = httpx.Response(200, stream=httpx.ByteStream(b"%PDF" * 100))
+
+        async with proteger(orgao) as protecao:
+            protecao.registrar(resp)
+            protecao.manter_vaga(resp)
+
+        # O corpo ainda não foi repassado: o órgão segue ocupado.
+        assert _em_uso(orgao) == 1
+        with pytest.raises(BulkheadCheio):
+            async with proteger(orgao):
+                pass
+
+        assert await resp.aread() == b"%PDF" * 100
+        assert _em_uso(orgao) == 0
+
+        async with proteger(orgao):
+            pass
+
+    asyncio.run(cenario())
+
+
+def test_stream_descartado_sem_aclose_solta_a_vaga(orgao):
+    async def cenario():
+        resp = httpx.Response(200, stream=httpx.ByteStream(b"x"))
+
+        async with proteger(orgao) as protecao:
+            protecao.manter_vaga(resp)
+
+        return resp
+
+    resp = asyncio.run(cenario())
+    assert _em_uso(orgao) == 1
+
+    del resp
+    gc.collect()
+    assert _em_uso(orgao) == 0
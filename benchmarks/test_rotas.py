@@ -0,0 +1,34 @@
+import builtins
+import dis
+
+import pytest
+from fastapi.routing import APIRoute
+
+from main import app
+
+
+ROTAS = [rota for rota in app.routes if isinstance(rota, APIRoute)]
+
+
+def _nomes_globais(codigo):
+    for instrucao in dis.get_instructions(codigo):
+        if instrucao.opname in ("LOAD_GLOBAL", "LOAD_NAME"):
+            yield instrucao.argval
+
+    for constante in codigo.co_consts:
+        if hasattr(constante, "co_code"):
+            yield from _nomes_globais(constante)
+
+
+@pytest.mark.parametrize("rota", ROTAS, ids=lambda rota: f"{sorted(rota.methods)[0]} {rota.path}")
+def test_rota_so_usa_nomes_definidos(rota):
+    # Um import esquecido em main.py só aparece como NameError (HTTP 500)
+    # quando a rota é chamada; aqui falha já na coleta dos nomes.
+    funcao = rota.endpoint
+    faltando = {
+        nome
+        for nome in _nomes_globais(funcao.__code__)
+        if nome not in funcao.__globals__ and not hasattr(builtins, nome)
+    }
+
+    assert not faltando, f"{rota.path} usa nomes não importados: {sorted(faltando)}"
@@ -1,74 +1,75 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-from services.fepam import ConsultaFepamManifestoRequest, retorna_manifesto_fepam
+from services.fepam import ConsultaFepamManifestoRequest, retorna_manifesto_fepam_async
 from services.feam import (
     BuscarDeclaracaoDMRRequest,
+    BuscarDeclaracoesDMRLoteRequest,
     ListarDMRRequest,
+    ListarTodasDMRRequest,
     AtualizarItensDMRRequest,
     ConsultaFeamCookiesRequest,
     ConsultaFeamManifestoRequest,
-    atualizar_itens_dmr,
-    buscar_declaracao_dmr,
-    get_cookies_feam,
+    atualizar_itens_dmr_async,
+    buscar_declaracao_dmr_async,
+    buscar_declaracoes_dmr_lote_async,
+    encerrar_executor_parse,
+    validar_lote_declaracoes,
+    get_cookies_feam_async,
     gerar_token_feam,
-    listar_dmrs,
-    retorna_manifesto_feam,
+    listar_dmrs_async,
+    listar_todas_dmrs_async,
+    retorna_manifesto_feam_async,
 )
 from services.feam import (
-    buscar_armazenador_feam,
-    buscar_destino_feam,
-    buscar_transportador_feam,
+    buscar_armazenador_feam_async,
+    buscar_destino_feam_async,
+    buscar_transportador_feam_async,
 )
 from services.ima import (
-    buscar_armazenador_ima,
-    buscar_destino_ima,
-    buscar_transportador_ima,
+    buscar_armazenador_ima_async,
+    buscar_destino_ima_async,
+    buscar_transportador_ima_async,
 )
 from services.fepam import (
-    buscar_armazenador_fepam,
-    buscar_destino_fepam,
-    buscar_transportador_fepam,
+    buscar_armazenador_fepam_async,
+    buscar_destino_fepam_async,
+    buscar_transportador_fepam_async,
 )
 from services.sigor import (
-    retorna_dados_armazenador_sigor,
-    retorna_dados_destino_sigor,
-    retorna_dados_transportador_sigor,
+    retorna_dados_armazenador_sigor_async,
+    retorna_dados_destino_sigor_async,
+    retorna_dados_transportador_sigor_async,
 )
 from services.sinir import (
-    retorna_dados_transportador_sinir,
-    retorna_dados_armazenador_sinir,
-    retorna_dados_destino_sinir,
+    retorna_dados_transportador_sinir_async,
+    retorna_dados_armazenador_sinir_async,
+    retorna_dados_destino_sinir_async,
 )
 from services.semad import (
     ConsultaSemadManifestoRequest,
-    gerar_token_semad,
-    retorna_manifesto_semad,
-    download_mtr_semad,
-    buscar_destino_semad,
-    buscar_parceiro_semad,
-    buscar_transportador_semad,
-    buscar_armazenador_semad,
+    download_mtr_semad_async,
+    buscar_destino_semad_async,
+    buscar_transportador_semad_async,
+    buscar_armazenador_semad_async,
 )
 
 from services.ima import (
     ConsultaIMAManifestoRequest,
-    consultar_manifesto_ima,
-    salvar_manifesto_ima,
+    consultar_manifesto_ima_async,
+    salvar_manifesto_ima_async,
 )
 from services.sinir import (
     ConsultaSinirManifestoRequest,
-    gerar_token_sinir,
-    retorna_manifesto_sinir,
+    consultar_manifesto_sinir_async,
 )
 from services.sigor import (
     ConsultaSigorManifestoRequest,
-    gerar_token_sigor,
-    retorna_manifesto_sigor,
+    consultar_manifesto_sigor_async,
 )
 from services.semad import (
     ConsultaSemadManifestoRequest,
-    gerar_token_semad,
-    retorna_manifesto_semad,
+    consultar_manifesto_semad_async,
 )
 
 from services.inea import (
@@ -76,34 +77,71 @@ from services.inea import (
     ConsultaListaIneaRequest,
     DownloadManifestoIneaRequest,
     CancelarManifestoIneaRequest,
-    cancelar_manifesto_inea,
-    retorna_lista_inea,
-    retorna_manifesto_inea,
-    salvar_manifesto_inea,
-    download_manifesto_inea,
+    cancelar_manifesto_inea_async,
+    retorna_manifesto_inea_async,
+    salvar_manifesto_inea_async,
+    download_manifesto_inea_async,
     validar_url_download_manifesto_inea,
     RegistrarIneaRelayRequest,
-    registrar_inea_relay,
+    registrar_inea_relay_async,
 )
 
-from services.sinir import busca_modelos_sinir, ConsultaSinirModeloRequest
-from services.sigor import busca_modelos_sigor, ConsultaSigorModeloRequest
+from services.sinir import busca_modelos_sinir_async, ConsultaSinirModeloRequest
+from services.sigor import busca_modelos_sigor_async, ConsultaSigorModeloRequest
+from services.armazem_sessoes import armazem_sessoes
+from services.clientes_http import fechar_clientes_async
+from services.cache_listas_inea import (
+    ConsultaListasIneaRequest,
+    estatisticas_cache_listas_inea,
+    etag_confere,
+    obter_lista_inea_async,
+    obter_todas_listas_inea_async,
+)
+from services.cache_parceiros import buscar_parceiro_em_cache, estatisticas_cache_parceiros
+from services.cache_pdf import estatisticas_cache_pdf
+from services.concorrencia import coalescencias_em_voo
+from services.download_pdf import baixar_pdf_manifesto
+from services.json_bruto import RespostaEnvelope
+from services.codec_json import RespostaJson, RotaJson, dumps
+from services.log_payload import RastreioPayload
+from services.metricas import exposicao_prometheus
+from services.rastreamento import configurar_rastreamento, encerrar_rastreamento, instrumentar_rotas
+from services.resiliencia import estado_resiliencia
+from services.login_controller import estatisticas_login
+from services.lote_manifestos import ConsultaManifestosLoteRequest, consultar_manifestos_lote_async
 
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Request, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 
 from pydantic import BaseModel
 import requests
-import json
 import logging
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(name)s | %(message)s')
 
 
-app = FastAPI(title='API FEAM - Consulta MTR', version='1.0.0')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tracing só com OTEL_ENABLED=true (exportador em OTEL_EXPORTER)
+    configurar_rastreamento()
+    yield
+    # Fecha os pools keep-alive dos órgãos e a conexão do armazém de sessões no shutdown
+    await fechar_clientes_async()
+    await armazem_sessoes().fechar()
+    encerrar_executor_parse()
+    encerrar_rastreamento()
+
+
+app = FastAPI(title='API FEAM - Consulta MTR', version='1.0.0', lifespan=lifespan, default_response_class=RespostaJson)
+
+# Corpo das requisições lido pelo mesmo backend de JSON das respostas.
+app.router.route_class = RotaJson
+
+# Span por requisição, com o traceparent recebido
+instrumentar_rotas(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -128,16 +166,16 @@ class BuscaParceiro(BaseModel):
 # FEAM - MG
 # -------------------------
 @app.post('/feam/retorna-manifesto-codigo-de-barras')
-def feam_retorna_manifesto(dados: ConsultaFeamManifestoRequest):
+async def feam_retorna_manifesto(dados: ConsultaFeamManifestoRequest):
     try:
-        manifesto = retorna_manifesto_feam(
+        manifesto = await retorna_manifesto_feam_async(
             cnpj=dados.cnpj,
             senha=dados.senha,
             unidade=dados.unidadeGerador,
             codigo_barras=dados.codigoDeBarras,
         )
 
-        return {'sucesso': True, 'orgao': 'FEAM', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'FEAM', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
@@ -147,15 +185,16 @@ def feam_retorna_manifesto(dados: ConsultaFeamManifestoRequest):
 # FEAM - Atualizar Itens DMR
 # -------------------------
 @app.post('/feam/dmr/atualizar-itens')
-def feam_atualizar_itens_dmr(dados: AtualizarItensDMRRequest):
+async def feam_atualizar_itens_dmr(dados: AtualizarItensDMRRequest):
 
     try:
-        resultado = atualizar_itens_dmr(
+        resultado = await atualizar_itens_dmr_async(
             cod_declarante=dados.codDeclarante,
             id_declaracao=dados.idDeclaracao,
             data_inicial=dados.dataInicial,
             data_final=dados.dataFinal,
             jsessionid=dados.JSESSIONID,
+            incluir_html=dados.incluirHtml,
         )
 
         return {
@@ -176,10 +215,10 @@ def feam_atualizar_itens_dmr(dados: AtualizarItensDMRRequest):
 # FEAM - Get Cookies (Selenium)
 # -------------------------
 @app.post('/feam/get-cookies')
-def feam_get_cookies(dados: ConsultaFeamCookiesRequest):
+async def feam_get_cookies(dados: ConsultaFeamCookiesRequest):
 
     try:
-        cookies = get_cookies_feam(cpf=dados.cpf, cnpj=dados.cnpj, unidade=dados.unidade, senha=dados.senha)
+        cookies = await get_cookies_feam_async(cpf=dados.cpf, cnpj=dados.cnpj, unidade=dados.unidade, senha=dados.senha)
 
         return {'sucesso': True, 'orgao': 'FEAM', 'cookies': cookies}
 
@@ -194,10 +233,10 @@ def feam_get_cookies(dados: ConsultaFeamCookiesRequest):
 # FEAM - Listar DMRs
 # -------------------------
 @app.post('/feam/dmr/listar')
-def feam_listar_dmrs(dados: ListarDMRRequest):
+async def feam_listar_dmrs(dados: ListarDMRRequest):
 
     try:
-        resultado = listar_dmrs(
+        resultado = await listar_dmrs_async(
             jsessionid=dados.JSESSIONID,
             i_display_start=dados.iDisplayStart,
             i_display_length=dados.iDisplayLength,
@@ -221,14 +260,47 @@ def feam_listar_dmrs(dados: ListarDMRRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post('/feam/dmr/listar-todas')
+async def feam_listar_todas_dmrs(dados: ListarTodasDMRRequest):
+    """
+    Lista todas as DMRs do declarante em NDJSON (uma linha JSON por evento).
+
+    As páginas são buscadas em paralelo e as linhas enviadas conforme
+    chegam; "posicao" indica a ordem original. Eventos: inicio, linha,
+    erro (página que falhou) e fim.
+    """
+
+    eventos = listar_todas_dmrs_async(
+        jsessionid=dados.JSESSIONID,
+        s_search=dados.sSearch,
+        i_columns=dados.iColumns,
+        tabela=dados.tabela,
+        i_display_length=dados.iDisplayLength,
+    )
+
+    # A primeira página define o status: sessão inválida ainda vira erro HTTP.
+    inicio = await eventos.__anext__()
+
+    async def ndjson():
+        try:
+            yield dumps(inicio) + b'\n'
+
+            async for evento in eventos:
+                yield dumps(evento) + b'\n'
+        finally:
+            await eventos.aclose()
+
+    return StreamingResponse(ndjson(), media_type='application/x-ndjson', headers={'Cache-Control': 'no-store'})
+
+
 # =========================
 # FEAM - Buscar Declaração DMR
 # =========================
 @app.post('/feam/dmr/buscar-declaracao')
-def feam_buscar_declaracao_dmr(dados: BuscarDeclaracaoDMRRequest):
+async def feam_buscar_declaracao_dmr(dados: BuscarDeclaracaoDMRRequest):
 
     try:
-        resultado = buscar_declaracao_dmr(
+        resultado = await buscar_declaracao_dmr_async(
             id_declaracao=dados.idDeclaracao,
             condicao=dados.condicao,
             jsessionid=dados.JSESSIONID,
@@ -248,22 +320,61 @@ def feam_buscar_declaracao_dmr(dados: BuscarDeclaracaoDMRRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post('/feam/dmr/buscar-declaracoes')
+async def feam_buscar_declaracoes_dmr_lote(dados: BuscarDeclaracoesDMRLoteRequest):
+    """
+    Busca e interpreta várias declarações DMR com um único JSESSIONID.
+
+    Com "stream": true responde em NDJSON, uma declaração por linha conforme
+    ficam prontas; senão devolve a lista completa na ordem do pedido.
+    """
+
+    validar_lote_declaracoes(dados.declaracoes)
+
+    resultados = buscar_declaracoes_dmr_lote_async(dados.JSESSIONID, dados.declaracoes)
+
+    if dados.stream:
+        async def ndjson():
+            try:
+                async for resultado in resultados:
+                    yield dumps(resultado) + b'\n'
+            finally:
+                await resultados.aclose()
+
+        return StreamingResponse(ndjson(), media_type='application/x-ndjson', headers={'Cache-Control': 'no-store'})
+
+    itens = sorted([resultado async for resultado in resultados], key=lambda resultado: resultado['indice'])
+    sucessos = sum(1 for item in itens if item['sucesso'])
+
+    return {
+        'sucesso': True,
+        'orgao': 'FEAM',
+        'acao': 'BUSCAR_DECLARACOES_DMR',
+        'total': len(itens),
+        'sucessos': sucessos,
+        'falhas': len(itens) - sucessos,
+        'resultados': itens,
+    }
+
+
 @app.post('/feam/busca-parceiro')
-def feam_buscar_parceiro(dados: BuscaParceiro):
+async def feam_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = buscar_destino_feam(dados.cnpj)
+        buscar = buscar_destino_feam_async
     elif tipo == 'transportador':
-        resultado = buscar_transportador_feam(dados.cnpj)
+        buscar = buscar_transportador_feam_async
     elif tipo == 'armazenador':
-        resultado = buscar_armazenador_feam(dados.cnpj)
+        buscar = buscar_armazenador_feam_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
+    resultado = await buscar_parceiro_em_cache('FEAM', tipo, dados.cnpj, buscar)
+
     return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
 
 
@@ -273,16 +384,16 @@ def feam_buscar_parceiro(dados: BuscaParceiro):
 
 
 @app.post('/ima/retorna-manifesto-codigo-de-barras')
-def retorna_manifesto_ima(dados: ConsultaIMAManifestoRequest):
+async def retorna_manifesto_ima(dados: ConsultaIMAManifestoRequest):
     try:
-        manifesto = consultar_manifesto_ima(
+        manifesto = await consultar_manifesto_ima_async(
             codigo_barras=dados.codigoBarras,
             unidade_gerador=dados.unidadeGerador,
             senha=dados.senha,
             cnpj=dados.cnpj,
         )
 
-        return {'sucesso': True, 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'dados': manifesto})
 
     except HTTPException as e:
         raise e
@@ -292,21 +403,23 @@ def retorna_manifesto_ima(dados: ConsultaIMAManifestoRequest):
 
 
 @app.post('/ima/busca-parceiro')
-def ima_buscar_parceiro(dados: BuscaParceiro):
+async def ima_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = buscar_destino_ima(dados.cnpj)
+        buscar = buscar_destino_ima_async
     elif tipo == 'transportador':
-        resultado = buscar_transportador_ima(dados.cnpj)
+        buscar = buscar_transportador_ima_async
     elif tipo == 'armazenador':
-        resultado = buscar_armazenador_ima(dados.cnpj)
+        buscar = buscar_armazenador_ima_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
+    resultado = await buscar_parceiro_em_cache('IMA', tipo, dados.cnpj, buscar)
+
     return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
 
 
@@ -315,49 +428,38 @@ async def salvar_manifesto_ima_route(request: Request):
     logger = logging.getLogger('ima')
     logger.setLevel(logging.INFO)
 
-    try:
-        logger.info('Iniciando rota /ima/salvarManifesto')
+    # Só metadados por requisição; o corpo mascarado vai para o log na
+    # amostra (LOG_PAYLOAD_AMOSTRAGEM) ou quando a chamada falha.
+    rastreio = RastreioPayload(logger, '/ima/salvarManifesto')
 
+    try:
         data = await request.json()
-        logger.info(f'Body recebido na rota: {json.dumps(data, ensure_ascii=False)}')
-        print(f'Body recebido na rota: {json.dumps(data, ensure_ascii=False)}')
+        rastreio.entrada(data, len(await request.body()))
 
         url = data.get('url')
         manifesto = data.get('manifesto')
 
-        logger.info(f' URL recebida: {url}')
-        logger.info(f' Manifesto recebido: {json.dumps(manifesto, ensure_ascii=False)}')
-        print(f' ✅ URL recebida: {url}')
-        print(f' ✅ Manifesto recebido: {json.dumps(manifesto, ensure_ascii=False)}')
-
         if not url or manifesto is None:
-            logger.warning(' ⚠️ Campos url e manifesto são obrigatórios')
-            print(' ⚠️ Campos url e manifesto são obrigatórios')
-
             raise HTTPException(status_code=400, detail='Campos url e manifesto são obrigatórios')
 
-        response_inea = salvar_manifesto_ima(url, manifesto)
-
-        logger.info(f' ✅ Status retornado pelo IMA: {response_inea.status_code}')
-        logger.info(f' ✅ Body retornado pelo IMA: {response_inea.text}')
+        response_ima = await salvar_manifesto_ima_async(url, manifesto)
 
-        print(f' ✅ Status retornado pelo IMA: {response_inea.status_code}')
-        print(f'✅ Body retornado pelo IMA: {response_inea.text}')
+        rastreio.saida(response_ima, 'IMA')
 
         return Response(
-            content=response_inea.text,
-            status_code=response_inea.status_code,
+            content=response_ima.text,
+            status_code=response_ima.status_code,
             media_type='application/json',
         )
 
-    except HTTPException:
+    except HTTPException as error:
+        rastreio.falha(error.status_code, error.detail)
         raise
     except Exception as error:
-        logger.exception('Erro inesperado na rota /inea/salvarManifesto')
-        print(' ❌ Erro inesperado na rota /inea/salvarManifesto')
+        rastreio.excecao()
 
         return Response(
-            content=json.dumps({'ok': False, 'error': str(error)}, ensure_ascii=False),
+            content=dumps({'ok': False, 'error': str(error)}),
             status_code=500,
             media_type='application/json',
         )
@@ -369,16 +471,16 @@ async def salvar_manifesto_ima_route(request: Request):
 
 
 @app.post('/fepam/retorna-manifesto-codigo-de-barras')
-def fepam_retorna_manifesto(dados: ConsultaFepamManifestoRequest):
+async def fepam_retorna_manifesto(dados: ConsultaFepamManifestoRequest):
     try:
-        manifesto = retorna_manifesto_fepam(
+        manifesto = await retorna_manifesto_fepam_async(
             cnpj=dados.cnpj,
             cpf=dados.cpf,
             senha=dados.senha,
             manifesto_codigo=dados.manifestoCodigo,
         )
 
-        return {'sucesso': True, 'orgao': 'FEPAM', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'FEPAM', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
@@ -388,21 +490,23 @@ def fepam_retorna_manifesto(dados: ConsultaFepamManifestoRequest):
 
 
 @app.post('/fepam/busca-parceiro')
-def fepam_buscar_parceiro(dados: BuscaParceiro):
+async def fepam_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = buscar_destino_fepam(dados.cnpj)
+        buscar = buscar_destino_fepam_async
     elif tipo == 'transportador':
-        resultado = buscar_transportador_fepam(dados.cnpj)
+        buscar = buscar_transportador_fepam_async
     elif tipo == 'armazenador':
-        resultado = buscar_armazenador_fepam(dados.cnpj)
+        buscar = buscar_armazenador_fepam_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
+    resultado = await buscar_parceiro_em_cache('FEPAM', tipo, dados.cnpj, buscar)
+
     return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
 
 
@@ -410,10 +514,16 @@ def fepam_buscar_parceiro(dados: BuscaParceiro):
 # INEA - RJ
 # =========================
 @app.post('/inea/retornaListaInea')
-def inea_retorna_lista(dados: ConsultaListaIneaRequest):
+async def inea_retorna_lista(
+    dados: ConsultaListaIneaRequest,
+    if_none_match: str | None = Header(default=None, alias='If-None-Match'),
+):
     """
     Proxy controlado para consulta das listas auxiliares do INEA.
 
+    As listas ficam em cache no servidor; envie o ETag recebido em
+    If-None-Match para receber 304 quando nada mudou.
+
     Body esperado:
     {
         "url": "https://mtr.inea.rj.gov.br/api/retornaListaUnidade/..."
@@ -423,25 +533,37 @@ def inea_retorna_lista(dados: ConsultaListaIneaRequest):
     logger_inea = logging.getLogger('inea')
 
     try:
-        response_inea = retorna_lista_inea(dados.url)
+        lista = await obter_lista_inea_async(dados.url)
+
+        if lista.status_code != 200:
+            return Response(
+                content=lista.conteudo,
+                status_code=lista.status_code,
+                headers={
+                    'Content-Type': lista.content_type,
+                    'Cache-Control': 'no-store',
+                },
+            )
+
+        headers_cache = {
+            'ETag': lista.etag,
+            'Cache-Control': 'private, no-cache',
+            'X-Cache': lista.cache,
+        }
 
-        content_type = response_inea.headers.get(
-            'Content-Type',
-            'application/json; charset=utf-8',
-        )
+        if etag_confere(if_none_match, lista.etag):
+            return Response(status_code=304, headers=headers_cache)
 
         logger_inea.info(
-            '[API INEA] Resposta repassada ao client | status=%s',
-            response_inea.status_code,
+            '[API INEA] Resposta repassada ao client | status=%s | cache=%s',
+            lista.status_code,
+            lista.cache,
         )
 
         return Response(
-            content=response_inea.content,
-            status_code=response_inea.status_code,
-            headers={
-                'Content-Type': content_type,
-                'Cache-Control': 'no-store',
-            },
+            content=lista.conteudo,
+            status_code=200,
+            headers={'Content-Type': lista.content_type, **headers_cache},
         )
 
     except HTTPException:
@@ -456,10 +578,35 @@ def inea_retorna_lista(dados: ConsultaListaIneaRequest):
         )
 
 
+@app.post('/inea/listas')
+async def inea_retorna_todas_listas(
+    dados: ConsultaListasIneaRequest,
+    if_none_match: str | None = Header(default=None, alias='If-None-Match'),
+):
+    """
+    Retorna as seis listas auxiliares do INEA numa única resposta.
+
+    Com o cache frio, as listas são buscadas concorrentemente. Listas que
+    falharem aparecem em "erros" e a resposta não recebe ETag.
+    """
+
+    corpo, etag = await obter_todas_listas_inea_async(dados)
+
+    if etag is None:
+        return RespostaJson(content=corpo, headers={'Cache-Control': 'no-store'})
+
+    headers_cache = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag_confere(if_none_match, etag):
+        return Response(status_code=304, headers=headers_cache)
+
+    return RespostaJson(content=corpo, headers=headers_cache)
+
+
 @app.post('/inea/retorna-manifesto-codigo-de-barras')
-def inea_retorna_manifesto(dados: ConsultaIneaManifestoRequest):
+async def inea_retorna_manifesto(dados: ConsultaIneaManifestoRequest):
     try:
-        manifesto = retorna_manifesto_inea(
+        manifesto = await retorna_manifesto_inea_async(
             cpf=dados.cpf,
             senha=dados.senha,
             cnpj=dados.cnpj,
@@ -467,48 +614,24 @@ def inea_retorna_manifesto(dados: ConsultaIneaManifestoRequest):
             codigo_barras=dados.codigoBarras,
         )
 
-        return {'sucesso': True, 'orgao': 'INEA', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'INEA', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
 
 
 @app.post('/inea/downloadManifesto')
-def download_manifesto(
+async def download_manifesto(
     dados: DownloadManifestoIneaRequest,
 ):
     codigo_barras, _ = validar_url_download_manifesto_inea(dados.url)
 
-    response_inea = download_manifesto_inea(dados.url)
-
-    conteudo = response_inea.content or b''
-
-    content_type = response_inea.headers.get(
-        'Content-Type',
-        'application/octet-stream',
-    )
-
-    is_pdf = 'application/pdf' in content_type.lower() or conteudo.startswith(b'%PDF')
-
-    if response_inea.status_code == 200 and is_pdf:
-        return Response(
-            content=conteudo,
-            status_code=200,
-            media_type='application/pdf',
-            headers={
-                'Content-Disposition': (f'attachment; filename="MTR-{codigo_barras}.pdf"'),
-                'Cache-Control': 'no-store',
-                'Content-Length': str(len(conteudo)),
-            },
-        )
-
-    return Response(
-        content=conteudo,
-        status_code=response_inea.status_code,
-        headers={
-            'Content-Type': content_type,
-            'Cache-Control': 'no-store',
-        },
+    # As credenciais do INEA vão no path da própria URL.
+    return await baixar_pdf_manifesto(
+        'INEA',
+        codigo_barras,
+        ('INEA', dados.url),
+        lambda stream: download_manifesto_inea_async(dados.url, stream=stream),
     )
 
 
@@ -517,34 +640,21 @@ async def salvar_manifesto_inea_route(request: Request):
     logger = logging.getLogger('inea')
     logger.setLevel(logging.INFO)
 
-    try:
-        logger.info('Iniciando rota /inea/salvarManifesto')
+    rastreio = RastreioPayload(logger, '/inea/salvarManifesto')
 
+    try:
         data = await request.json()
-        logger.info(f'Body recebido na rota: {json.dumps(data, ensure_ascii=False)}')
-        print(f'Body recebido na rota: {json.dumps(data, ensure_ascii=False)}')
+        rastreio.entrada(data, len(await request.body()))
 
         url = data.get('url')
         manifesto = data.get('manifesto')
 
-        logger.info(f' URL recebida: {url}')
-        logger.info(f' Manifesto recebido: {json.dumps(manifesto, ensure_ascii=False)}')
-        print(f' ✅ URL recebida: {url}')
-        print(f' ✅ Manifesto recebido: {json.dumps(manifesto, ensure_ascii=False)}')
-
         if not url or manifesto is None:
-            logger.warning(' ⚠️ Campos url e manifesto são obrigatórios')
-            print(' ⚠️ Campos url e manifesto são obrigatórios')
-
             raise HTTPException(status_code=400, detail='Campos url e manifesto são obrigatórios')
 
-        response_inea = salvar_manifesto_inea(url, manifesto)
+        response_inea = await salvar_manifesto_inea_async(url, manifesto)
 
-        logger.info(f' ✅ Status retornado pelo INEA: {response_inea.status_code}')
-        logger.info(f' ✅ Body retornado pelo INEA: {response_inea.text}')
-
-        print(f' ✅ Status retornado pelo INEA: {response_inea.status_code}')
-        print(f'✅ Body retornado pelo INEA: {response_inea.text}')
+        rastreio.saida(response_inea, 'INEA')
 
         return Response(
             content=response_inea.text,
@@ -552,33 +662,24 @@ async def salvar_manifesto_inea_route(request: Request):
             media_type='application/json',
         )
 
-    except HTTPException:
+    except HTTPException as error:
+        rastreio.falha(error.status_code, error.detail)
         raise
     except Exception as error:
-        logger.exception('Erro inesperado na rota /inea/salvarManifesto')
-        print(' ❌ Erro inesperado na rota /inea/salvarManifesto')
+        rastreio.excecao()
 
         return Response(
-            content=json.dumps({'ok': False, 'error': str(error)}, ensure_ascii=False),
+            content=dumps({'ok': False, 'error': str(error)}),
             status_code=500,
             media_type='application/json',
         )
 
 
-def mascarar_manifesto(manifesto):
-    manifesto_safe = dict(manifesto)
-    if 'login' in manifesto_safe:
-        manifesto_safe['login'] = '***'
-    if 'senha' in manifesto_safe:
-        manifesto_safe['senha'] = '***'
-    return manifesto_safe
-
-
 @app.post('/inea/cancelarManifesto')
-def cancelar_manifesto_inea_route(
+async def cancelar_manifesto_inea_route(
     dados: CancelarManifestoIneaRequest,
 ):
-    response_inea = cancelar_manifesto_inea(
+    response_inea = await cancelar_manifesto_inea_async(
         url=dados.url,
         cancelamento=dados.cancelamento,
     )
@@ -600,14 +701,14 @@ def cancelar_manifesto_inea_route(
 
 # Adicione junto às demais rotas do INEA
 @app.post('/inea/relay/register')
-def inea_registrar_relay(
+async def inea_registrar_relay(
     dados: RegistrarIneaRelayRequest,
     x_tree_relay_key: str | None = Header(
         default=None,
         alias='X-Tree-Relay-Key',
     ),
 ):
-    return registrar_inea_relay(
+    return await registrar_inea_relay_async(
         dados=dados,
         x_tree_relay_key=x_tree_relay_key,
     )
@@ -617,43 +718,48 @@ def inea_registrar_relay(
 # SINIR - Federal
 # =========================
 @app.post('/sinir/retorna-manifesto')
-def sinir_retorna_manifesto(dados: ConsultaSinirManifestoRequest):
+async def sinir_retorna_manifesto(dados: ConsultaSinirManifestoRequest):
     try:
-        token = gerar_token_sinir(cpf_cnpj=dados.cpfCnpj, senha=dados.senha, unidade=dados.unidade)
-
-        manifesto = retorna_manifesto_sinir(token_bearer=token, manifesto_numero=dados.manifestoNumero)
+        manifesto = await consultar_manifesto_sinir_async(
+            cpf_cnpj=dados.cpfCnpj,
+            senha=dados.senha,
+            unidade=dados.unidade,
+            manifesto_numero=dados.manifestoNumero,
+        )
 
-        return {'sucesso': True, 'orgao': 'SINIR', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'SINIR', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
 
 
 @app.post('/sinir/busca-parceiro')
-def sinir_buscar_parceiro(dados: BuscaParceiro):
+async def sinir_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = retorna_dados_destino_sinir(dados.cnpj)
+        buscar = retorna_dados_destino_sinir_async
     elif tipo == 'transportador':
-        resultado = retorna_dados_transportador_sinir(dados.cnpj)
+        buscar = retorna_dados_transportador_sinir_async
     elif tipo == 'armazenador':
-        resultado = retorna_dados_armazenador_sinir(dados.cnpj)
+        buscar = retorna_dados_armazenador_sinir_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
-    return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
+    resultado = await buscar_parceiro_em_cache('SINIR', tipo, dados.cnpj, buscar)
+
+    return RespostaEnvelope({'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado})
 
 
 @app.post('/sinir/busca-modelos')
-def sinir_buscar_modelos(dados: ConsultaSinirModeloRequest):
+async def sinir_buscar_modelos(dados: ConsultaSinirModeloRequest):
     try:
-        modelos = busca_modelos_sinir(login=dados.cpfCnpj, senha=dados.senha, parCodigo=dados.parCodigo)
+        modelos = await busca_modelos_sinir_async(login=dados.cpfCnpj, senha=dados.senha, parCodigo=dados.parCodigo)
 
-        return {'sucesso': True, 'orgao': 'SINIR', 'dados': modelos}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'SINIR', 'dados': modelos})
 
     except HTTPException as e:
         raise e
@@ -663,43 +769,48 @@ def sinir_buscar_modelos(dados: ConsultaSinirModeloRequest):
 # SIGOR / CETESB - SP
 # =========================
 @app.post('/sigor/retorna-manifesto')
-def sigor_retorna_manifesto(dados: ConsultaSigorManifestoRequest):
+async def sigor_retorna_manifesto(dados: ConsultaSigorManifestoRequest):
     try:
-        token = gerar_token_sigor(cpf_cnpj=dados.cpfCnpj, senha=dados.senha, unidade=dados.unidade)
-
-        manifesto = retorna_manifesto_sigor(token_bearer=token, manifesto_numero=dados.manifestoNumero)
+        manifesto = await consultar_manifesto_sigor_async(
+            cpf_cnpj=dados.cpfCnpj,
+            senha=dados.senha,
+            unidade=dados.unidade,
+            manifesto_numero=dados.manifestoNumero,
+        )
 
-        return {'sucesso': True, 'orgao': 'SIGOR', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'SIGOR', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
 
 
 @app.post('/sigor/busca-parceiro')
-def sigor_buscar_parceiro(dados: BuscaParceiro):
+async def sigor_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = retorna_dados_destino_sigor(dados.cnpj)
+        buscar = retorna_dados_destino_sigor_async
     elif tipo == 'transportador':
-        resultado = retorna_dados_transportador_sigor(dados.cnpj)
+        buscar = retorna_dados_transportador_sigor_async
     elif tipo == 'armazenador':
-        resultado = retorna_dados_armazenador_sigor(dados.cnpj)
+        buscar = retorna_dados_armazenador_sigor_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
-    return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
+    resultado = await buscar_parceiro_em_cache('SIGOR', tipo, dados.cnpj, buscar)
+
+    return RespostaEnvelope({'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado})
 
 
 @app.post('/sigor/busca-modelos')
-def sigor_buscar_modelos(dados: ConsultaSigorModeloRequest):
+async def sigor_buscar_modelos(dados: ConsultaSigorModeloRequest):
     try:
-        modelos = busca_modelos_sigor(login=dados.cpfCnpj, senha=dados.senha, parCodigo=dados.parCodigo)
+        modelos = await busca_modelos_sigor_async(login=dados.cpfCnpj, senha=dados.senha, parCodigo=dados.parCodigo)
 
-        return {'sucesso': True, 'orgao': 'SIGOR', 'dados': modelos}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'SIGOR', 'dados': modelos})
 
     except HTTPException as e:
         raise e
@@ -709,71 +820,129 @@ def sigor_buscar_modelos(dados: ConsultaSigorModeloRequest):
 # SEMAD - GO
 # =========================
 @app.post('/semad/retorna-manifesto-codigo-de-barras')
-def semad_retorna_manifesto(dados: ConsultaSemadManifestoRequest):
+async def semad_retorna_manifesto(dados: ConsultaSemadManifestoRequest):
     try:
-        token = gerar_token_semad(
+        manifesto = await consultar_manifesto_semad_async(
             pessoa_codigo=dados.pessoaCodigo,
             cnpj=dados.cnpj,
             cpf=dados.cpf,
             senha=dados.senha,
+            codigo_barras=dados.codigoBarras,
         )
 
-        manifesto = retorna_manifesto_semad(token=token, codigo_barras=dados.codigoBarras)
-
-        return {'sucesso': True, 'orgao': 'SEMAD', 'dados': manifesto}
+        return RespostaEnvelope({'sucesso': True, 'orgao': 'SEMAD', 'dados': manifesto})
 
     except HTTPException as e:
         raise e
 
 
 @app.post('/semad/busca-parceiro')
-def semad_buscar_parceiro(dados: BuscaParceiro):
+async def semad_buscar_parceiro(dados: BuscaParceiro):
     tipo = (dados.tipoParceiro or '').strip().lower()
 
     if tipo == 'destino':
-        resultado = buscar_destino_semad(dados.cnpj)
+        buscar = buscar_destino_semad_async
     elif tipo == 'transportador':
-        resultado = buscar_transportador_semad(dados.cnpj)
+        buscar = buscar_transportador_semad_async
     elif tipo == 'armazenador':
-        resultado = buscar_armazenador_semad(dados.cnpj)
+        buscar = buscar_armazenador_semad_async
     else:
         raise HTTPException(
             status_code=400,
             detail='Tipo de parceiro inválido. Use: destino, transportador, armazenador',
         )
 
+    resultado = await buscar_parceiro_em_cache('SEMAD', tipo, dados.cnpj, buscar)
+
     return {'tipoParceiro': tipo, 'cnpj': dados.cnpj, 'resultado': resultado}
 
 
 @app.post('/semad/download-manifesto-codigo-de-barras')
-def semad_download_manifesto(dados: ConsultaSemadManifestoRequest):
-    response_semad = download_mtr_semad(
-        pessoa_codigo=dados.pessoaCodigo, cnpj=dados.cnpj, cpf=dados.cpf, senha=dados.senha, codigo_barras=dados.codigoBarras
+async def semad_download_manifesto(dados: ConsultaSemadManifestoRequest):
+    return await baixar_pdf_manifesto(
+        'SEMAD',
+        dados.codigoBarras,
+        ('SEMAD', dados.pessoaCodigo, dados.cnpj, dados.cpf, dados.senha),
+        lambda stream: download_mtr_semad_async(
+            pessoa_codigo=dados.pessoaCodigo,
+            cnpj=dados.cnpj,
+            cpf=dados.cpf,
+            senha=dados.senha,
+            codigo_barras=dados.codigoBarras,
+            stream=stream,
+        ),
     )
 
-    conteudo = response_semad.content or b''
 
-    content_type = response_semad.headers.get('Content-Type', 'application/octet-stream')
+# =========================
+# LOTE - Manifestos por código de barras
+# =========================
+@app.post('/manifestos/lote')
+async def consultar_manifestos_lote_route(dados: ConsultaManifestosLoteRequest):
+    """
+    Consulta vários manifestos de um órgão com uma única credencial.
+
+    Body esperado:
+    {
+        "orgao": "FEAM",
+        "cnpj": "...",
+        "senha": "...",
+        "unidadeGerador": "...",
+        "codigos": ["...", "..."]
+    }
+
+    Cada item traz o próprio resultado ou erro; um código inválido não
+    derruba o lote. "resultados" segue a ordem de "codigos", repetidos
+    inclusive (consultados uma vez só, ver "unicos"); "total", "sucessos"
+    e "falhas" contam os itens dessa lista.
+    """
 
-    is_pdf = 'application/pdf' in content_type.lower() or conteudo.startswith(b'%PDF')
+    resultado = await consultar_manifestos_lote_async(dados)
 
-    if response_semad.status_code == 200 and is_pdf:
-        return Response(
-            content=conteudo,
-            status_code=200,
-            media_type='application/pdf',
-            headers={
-                'Content-Disposition': (f'attachment; filename="MTR-{dados.codigoBarras}.pdf"'),
-                'Cache-Control': 'no-store',
-                'Content-Length': str(len(conteudo)),
-            },
-        )
+    return RespostaEnvelope({'sucesso': True, **resultado})
 
-    return Response(content=conteudo, status_code=response_semad.status_code, media_type=content_type, headers={'Cache-Control': 'no-store'})
+
+@app.get('/busca-parceiro/cache')
+async def busca_parceiro_cache_estatisticas():
+    return estatisticas_cache_parceiros()
+
+
+@app.get('/inea/listas/cache')
+async def inea_listas_cache_estatisticas():
+    return estatisticas_cache_listas_inea()
+
+
+@app.get('/manifestos/pdf/cache')
+async def manifestos_pdf_cache_estatisticas():
+    return await estatisticas_cache_pdf()
+
+
+@app.get('/consultas/coalescidas')
+async def consultas_coalescidas():
+    # Consultas idênticas em andamento, cada uma servindo a todos que a pediram juntos.
+    return {'em_voo': coalescencias_em_voo()}
+
+
+@app.get('/upstreams/circuitos')
+async def upstreams_circuitos():
+    return estado_resiliencia()
+
+
+@app.get('/login/estrategias')
+async def login_estrategias():
+    return estatisticas_login()
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    return Response(
+        content=exposicao_prometheus(),
+        media_type='text/plain; version=0.0.4; charset=utf-8',
+    )
 
 
 @app.get('/healthz')
-def healthcheck():
+async def healthcheck():
     return {
         'status': 'ok',
         'service': 'tree-apis',
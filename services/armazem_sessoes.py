@@ -0,0 +1,569 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+logger = logging.getLogger("armazem_sessoes")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Armazém de tokens e sessões compartilhado entre workers
+# ==========================================================
+# Tokens do gettoken (cache_tokens) e sessões das contas de busca de
+# parceiros (pool_sessoes) ficam aqui além da memória do processo. Com
+# sqlite ou redis, workers do uvicorn e réplicas do container enxergam o
+# mesmo login, e uma trava por credencial garante que só um deles o
+# renova; os demais esperam e leem o resultado.
+#
+# As chaves dos tokens são hashes das credenciais; os valores (tokens,
+# JSESSIONID) são credenciais de sessão: o arquivo SQLite é criado só com
+# permissão do dono e o Redis deve ficar em rede privada.
+
+MEMORIA = "memoria"
+SQLITE = "sqlite"
+REDIS = "redis"
+
+ARMAZEM_SESSOES = os.getenv("ARMAZEM_SESSOES", MEMORIA).strip().lower()
+
+# Arquivo compartilhado pelos workers (mesmo host ou volume local, não NFS).
+ARMAZEM_SESSOES_SQLITE = os.getenv(
+    "ARMAZEM_SESSOES_SQLITE",
+    os.path.join(tempfile.gettempdir(), "tree-apis-sessoes.sqlite3"),
+)
+
+# Redis ou qualquer servidor do mesmo protocolo (GET, SET NX PX, DEL).
+ARMAZEM_SESSOES_REDIS_URL = os.getenv("ARMAZEM_SESSOES_REDIS_URL", "redis://127.0.0.1:6379/0")
+
+# Prefixo das chaves, para dividir o Redis com outras aplicações.
+ARMAZEM_SESSOES_PREFIXO = os.getenv("ARMAZEM_SESSOES_PREFIXO", "tree-apis:")
+
+# Limite de cada comando (conexão, envio e resposta): um Redis travado não
+# pode segurar todas as consultas de token e sessão.
+ARMAZEM_SESSOES_REDIS_TIMEOUT_SEGUNDOS = float(os.getenv("ARMAZEM_SESSOES_REDIS_TIMEOUT_SEGUNDOS", "5"))
+
+# Validade da trava de renovação: se o worker que renova morrer, outro
+# assume depois desse tempo. Cobre o login mais lento (Selenium).
+ARMAZEM_SESSOES_TRAVA_SEGUNDOS = float(os.getenv("ARMAZEM_SESSOES_TRAVA_SEGUNDOS", "90"))
+
+# Intervalo entre tentativas de pegar a trava.
+_ESPERA_INICIAL = 0.05
+_ESPERA_MAXIMA = 0.5
+
+
+def codificar(valor: Any) -> str:
+    # Ordenado e compacto: remover(chave, valor) compara o texto.
+    return json.dumps(valor, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ArmazemSessoes(abc.ABC):
+    """
+    Interface dos armazéns: valores JSON com expiração (epoch) e trava
+    por chave entre processos. Subclasses implementam os métodos _*.
+    """
+
+    nome = ""
+
+    def __init__(self) -> None:
+        self._dono = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+    @abc.abstractmethod
+    async def _ler(self, chave: str) -> Optional[Tuple[str, float]]:
+        ...
+
+    @abc.abstractmethod
+    async def _gravar(self, chave: str, texto: str, expira_em: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _remover(self, chave: str, texto: Optional[str]) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _tentar_travar(self, chave: str, segundos: float) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def _destravar(self, chave: str) -> None:
+        ...
+
+    async def fechar(self) -> None:
+        pass
+
+    async def ler(self, chave: str) -> Optional[Tuple[Any, float]]:
+        """(valor, expira_em em epoch) ou None se ausente/vencido."""
+
+        lido = await self._ler(chave)
+
+        if lido is None or lido[1] <= time.time():
+            return None
+
+        return json.loads(lido[0]), lido[1]
+
+    async def gravar(self, chave: str, valor: Any, expira_em: float) -> None:
+        if expira_em > time.time():
+            await self._gravar(chave, codificar(valor), expira_em)
+
+    async def remover(self, chave: str, valor: Any = None) -> None:
+        """Remove a chave; com valor, só se ainda for esse (outro worker pode já ter renovado)."""
+
+        await self._remover(chave, None if valor is None else codificar(valor))
+
+    @asynccontextmanager
+    async def trava(self, chave: str, segundos: float = ARMAZEM_SESSOES_TRAVA_SEGUNDOS) -> AsyncIterator[bool]:
+        """
+        Trava exclusiva entre processos. Se não sair em `segundos` (dono
+        travado sem morrer), segue sem ela: melhor um login a mais do que
+        a requisição parada. O valor indica se a trava foi obtida.
+        """
+
+        limite = time.monotonic() + segundos
+        espera = _ESPERA_INICIAL
+        obtida = await self._tentar_travar(chave, segundos)
+
+        while not obtida and time.monotonic() < limite:
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, _ESPERA_MAXIMA)
+            obtida = await self._tentar_travar(chave, segundos)
+
+        if not obtida:
+            logger.warning("[ARMAZEM SESSOES] Trava não obtida; renovando mesmo assim | armazem=%s", self.nome)
+
+        try:
+            yield obtida
+        finally:
+            if obtida:
+                await self._destravar(chave)
+
+    async def obter_ou_renovar(
+        self,
+        chave: str,
+        renovar: Callable[[], Awaitable[Tuple[Any, float]]],
+    ) -> Tuple[Any, float, bool]:
+        """
+        Valor guardado em chave ou, se ausente, o resultado de renovar()
+        (valor, expira_em), chamado por um único processo de cada vez.
+        Retorna (valor, expira_em, renovado).
+        """
+
+        lido = await self.ler(chave)
+        if lido is not None:
+            return lido[0], lido[1], False
+
+        async with self.trava(f"trava:{chave}"):
+            # Quem segurava a trava pode ter acabado de renovar.
+            lido = await self.ler(chave)
+            if lido is not None:
+                return lido[0], lido[1], False
+
+            valor, expira_em = await renovar()
+            await self.gravar(chave, valor, expira_em)
+
+        return valor, expira_em, True
+
+
+# ==========================================================
+# Memória (um processo)
+# ==========================================================
+
+
+class ArmazemMemoria(ArmazemSessoes):
+    """Padrão: nada é compartilhado entre processos."""
+
+    nome = MEMORIA
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._valores: Dict[str, Tuple[str, float]] = {}
+        self._travas: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    async def _ler(self, chave: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._valores.get(chave)
+
+    async def _gravar(self, chave: str, texto: str, expira_em: float) -> None:
+        agora = time.time()
+
+        with self._lock:
+            self._valores[chave] = (texto, expira_em)
+
+            for vencida in [c for c, (_, exp) in self._valores.items() if exp <= agora]:
+                del self._valores[vencida]
+
+    async def _remover(self, chave: str, texto: Optional[str]) -> None:
+        with self._lock:
+            atual = self._valores.get(chave)
+            if atual is not None and (texto is None or atual[0] == texto):
+                del self._valores[chave]
+
+    async def _tentar_travar(self, chave: str, segundos: float) -> bool:
+        agora = time.monotonic()
+
+        with self._lock:
+            if self._travas.get(chave, 0) > agora:
+                return False
+            self._travas[chave] = agora + segundos
+            return True
+
+    async def _destravar(self, chave: str) -> None:
+        with self._lock:
+            self._travas.pop(chave, None)
+
+
+# ==========================================================
+# SQLite (arquivo compartilhado)
+# ==========================================================
+
+
+class ArmazemSqlite(ArmazemSessoes):
+    """
+    Um arquivo SQLite para todos os workers do host. As travas são linhas
+    com dono e validade; pegar a trava é um INSERT dentro de BEGIN
+    IMMEDIATE, que o SQLite serializa entre processos.
+    """
+
+    nome = SQLITE
+
+    def __init__(self, caminho: str = ARMAZEM_SESSOES_SQLITE):
+        super().__init__()
+        self.caminho = caminho
+        self._criar()
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+        conexao.execute("PRAGMA busy_timeout = 10000")
+        return conexao
+
+    def _criar(self) -> None:
+        if not os.path.exists(self.caminho):
+            os.close(os.open(self.caminho, os.O_CREAT | os.O_WRONLY, 0o600))
+
+        conexao = self._conectar()
+
+        try:
+            conexao.execute("PRAGMA journal_mode = WAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS sessoes (chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_em REAL NOT NULL)"
+            )
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS travas (chave TEXT PRIMARY KEY, dono TEXT NOT NULL, expira_em REAL NOT NULL)"
+            )
+        finally:
+            conexao.close()
+
+    def _executar(self, sql: str, parametros: Tuple[Any, ...]) -> List[Tuple[Any, ...]]:
+        conexao = self._conectar()
+
+        try:
+            return conexao.execute(sql, parametros).fetchall()
+        finally:
+            conexao.close()
+
+    async def _ler(self, chave: str) -> Optional[Tuple[str, float]]:
+        linhas = await asyncio.to_thread(
+            self._executar, "SELECT valor, expira_em FROM sessoes WHERE chave = ?", (chave,)
+        )
+        return linhas[0] if linhas else None
+
+    def _gravar_sincrono(self, chave: str, texto: str, expira_em: float) -> None:
+        conexao = self._conectar()
+
+        try:
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute("DELETE FROM sessoes WHERE expira_em <= ?", (time.time(),))
+            conexao.execute("INSERT OR REPLACE INTO sessoes VALUES (?, ?, ?)", (chave, texto, expira_em))
+            conexao.execute("COMMIT")
+        finally:
+            conexao.close()
+
+    async def _gravar(self, chave: str, texto: str, expira_em: float) -> None:
+        await asyncio.to_thread(self._gravar_sincrono, chave, texto, expira_em)
+
+    async def _remover(self, chave: str, texto: Optional[str]) -> None:
+        if texto is None:
+            await asyncio.to_thread(self._executar, "DELETE FROM sessoes WHERE chave = ?", (chave,))
+        else:
+            await asyncio.to_thread(
+                self._executar, "DELETE FROM sessoes WHERE chave = ? AND valor = ?", (chave, texto)
+            )
+
+    def _tentar_travar_sincrono(self, chave: str, segundos: float) -> bool:
+        conexao = self._conectar()
+        agora = time.time()
+
+        try:
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute("DELETE FROM travas WHERE chave = ? AND expira_em <= ?", (chave, agora))
+            cursor = conexao.execute(
+                "INSERT OR IGNORE INTO travas VALUES (?, ?, ?)", (chave, self._dono, agora + segundos)
+            )
+            conexao.execute("COMMIT")
+            return cursor.rowcount == 1
+        finally:
+            conexao.close()
+
+    async def _tentar_travar(self, chave: str, segundos: float) -> bool:
+        return await asyncio.to_thread(self._tentar_travar_sincrono, chave, segundos)
+
+    async def _destravar(self, chave: str) -> None:
+        await asyncio.to_thread(
+            self._executar, "DELETE FROM travas WHERE chave = ? AND dono = ?", (chave, self._dono)
+        )
+
+
+# ==========================================================
+# Protocolo Redis (RESP)
+# ==========================================================
+
+
+class ErroRedis(Exception):
+    """Resposta de erro do servidor (-ERR ...)."""
+
+
+class _ConexaoResp:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.lock = asyncio.Lock()
+        self.quebrada = False
+
+    async def _ler_resposta(self) -> Any:
+        linha = await self.reader.readline()
+        if not linha:
+            raise ConnectionError("conexão fechada pelo servidor")
+
+        tipo, conteudo = linha[:1], linha[1:-2]
+
+        if tipo == b"+":
+            return conteudo.decode("utf-8")
+        if tipo == b"-":
+            # Devolvido, não levantado: o restante de um array ainda está no stream.
+            return ErroRedis(conteudo.decode("utf-8"))
+        if tipo == b":":
+            return int(conteudo)
+        if tipo == b"$":
+            tamanho = int(conteudo)
+            if tamanho < 0:
+                return None
+            dados = await self.reader.readexactly(tamanho + 2)
+            return dados[:-2].decode("utf-8")
+        if tipo == b"*":
+            quantidade = int(conteudo)
+            if quantidade < 0:
+                return None
+            return [await self._ler_resposta() for _ in range(quantidade)]
+
+        raise ConnectionError(f"resposta RESP inválida: {linha!r}")
+
+    async def comando(self, *partes: Any) -> Any:
+        codificadas = [str(parte).encode("utf-8") for parte in partes]
+        pacote = [b"*%d\r\n" % len(codificadas)]
+        for parte in codificadas:
+            pacote.append(b"$%d\r\n%s\r\n" % (len(parte), parte))
+
+        async with self.lock:
+            if self.quebrada:
+                raise ConnectionError("conexão descartada")
+
+            try:
+                resposta = await asyncio.wait_for(self._trocar(b"".join(pacote)), self.timeout)
+            except BaseException:
+                # Cancelamento, timeout ou erro no meio da troca: a resposta
+                # pendente ficaria no stream e seria lida pelo próximo comando.
+                self.quebrada = True
+                self.writer.close()
+                raise
+
+        if isinstance(resposta, ErroRedis):
+            raise resposta
+
+        return resposta
+
+    async def _trocar(self, pacote: bytes) -> Any:
+        self.writer.write(pacote)
+        await self.writer.drain()
+        return await self._ler_resposta()
+
+
+class ArmazemRedis(ArmazemSessoes):
+    """
+    Cliente RESP mínimo (GET, SET NX PX, DEL), sem dependência nova: serve
+    Redis, Valkey, KeyDB ou um substituto local. Uma conexão por event
+    loop, como os clientes HTTP.
+    """
+
+    nome = REDIS
+
+    def __init__(
+        self,
+        url: str = ARMAZEM_SESSOES_REDIS_URL,
+        prefixo: str = ARMAZEM_SESSOES_PREFIXO,
+        timeout: float = ARMAZEM_SESSOES_REDIS_TIMEOUT_SEGUNDOS,
+    ):
+        super().__init__()
+        partes = urlparse(url)
+        self._host = partes.hostname or "127.0.0.1"
+        self._porta = partes.port or 6379
+        self._senha = unquote(partes.password) if partes.password else None
+        self._usuario = unquote(partes.username) if partes.username else None
+        self._banco = int((partes.path or "/0").strip("/") or 0)
+        self._prefixo = prefixo
+        self._timeout = timeout
+        self._conexoes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _ConexaoResp]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def _abrir(self) -> _ConexaoResp:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self._host, self._porta), self._timeout)
+        conexao = _ConexaoResp(reader, writer, self._timeout)
+
+        try:
+            if self._senha is not None:
+                if self._usuario:
+                    await conexao.comando("AUTH", self._usuario, self._senha)
+                else:
+                    await conexao.comando("AUTH", self._senha)
+            if self._banco:
+                await conexao.comando("SELECT", self._banco)
+        except BaseException:
+            writer.close()
+            raise
+
+        return conexao
+
+    def _esquecer(self, loop: asyncio.AbstractEventLoop, conexao: _ConexaoResp) -> None:
+        with self._lock:
+            if self._conexoes.get(loop) is conexao:
+                del self._conexoes[loop]
+        conexao.writer.close()
+
+    async def _comando(self, *partes: Any) -> Any:
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            conexao = self._conexoes.get(loop)
+
+        for tentativa in range(2):
+            if conexao is None or conexao.quebrada:
+                conexao = await self._abrir()
+                with self._lock:
+                    self._conexoes[loop] = conexao
+
+            try:
+                return await conexao.comando(*partes)
+            except asyncio.TimeoutError:
+                # Servidor travado: repetir só dobraria a espera.
+                self._esquecer(loop, conexao)
+                raise
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                # Servidor reiniciado ou conexão ociosa derrubada: reabre uma vez.
+                self._esquecer(loop, conexao)
+                conexao = None
+                if tentativa:
+                    raise
+            except BaseException:
+                # Cancelamento: comando() já marcou a conexão como quebrada.
+                if conexao.quebrada:
+                    self._esquecer(loop, conexao)
+                raise
+
+    def _chave(self, chave: str) -> str:
+        return f"{self._prefixo}{chave}"
+
+    async def _ler(self, chave: str) -> Optional[Tuple[str, float]]:
+        bruto = await self._comando("GET", self._chave(chave))
+        if bruto is None:
+            return None
+
+        envelope = json.loads(bruto)
+        return envelope["valor"], envelope["expira_em"]
+
+    async def _gravar(self, chave: str, texto: str, expira_em: float) -> None:
+        # A expiração vai junto do valor (ler compara com o relógio local)
+        # e no PX, para o Redis descartar sozinho.
+        milissegundos = max(1, int((expira_em - time.time()) * 1000))
+        envelope = json.dumps({"valor": texto, "expira_em": expira_em})
+        await self._comando("SET", self._chave(chave), envelope, "PX", milissegundos)
+
+    async def _remover(self, chave: str, texto: Optional[str]) -> None:
+        if texto is not None:
+            lido = await self._ler(chave)
+            if lido is None or lido[0] != texto:
+                return
+
+        await self._comando("DEL", self._chave(chave))
+
+    async def _tentar_travar(self, chave: str, segundos: float) -> bool:
+        resposta = await self._comando("SET", self._chave(chave), self._dono, "NX", "PX", int(segundos * 1000))
+        return resposta == "OK"
+
+    async def _destravar(self, chave: str) -> None:
+        # GET + DEL sem script: o intervalo entre os dois é desprezível
+        # perto da validade da trava.
+        if await self._comando("GET", self._chave(chave)) == self._dono:
+            await self._comando("DEL", self._chave(chave))
+
+    async def fechar(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            conexao = self._conexoes.pop(loop, None)
+
+        if conexao is not None:
+            conexao.writer.close()
+            try:
+                await conexao.writer.wait_closed()
+            except OSError:
+                pass
+
+
+# ==========================================================
+# Armazém da aplicação
+# ==========================================================
+
+_ARMAZEM: Optional[ArmazemSessoes] = None
+_ARMAZEM_LOCK = threading.Lock()
+
+
+def _criar_armazem() -> ArmazemSessoes:
+    if ARMAZEM_SESSOES == SQLITE:
+        return ArmazemSqlite()
+
+    if ARMAZEM_SESSOES == REDIS:
+        return ArmazemRedis()
+
+    if ARMAZEM_SESSOES != MEMORIA:
+        logger.warning("[ARMAZEM SESSOES] ARMAZEM_SESSOES desconhecido (%s); usando memória", ARMAZEM_SESSOES)
+
+    return ArmazemMemoria()
+
+
+def armazem_sessoes() -> ArmazemSessoes:
+    global _ARMAZEM
+
+    with _ARMAZEM_LOCK:
+        if _ARMAZEM is None:
+            _ARMAZEM = _criar_armazem()
+            logger.info("[ARMAZEM SESSOES] Armazém de sessões | tipo=%s", _ARMAZEM.nome)
+
+        return _ARMAZEM
+
+
+def configurar_armazem(armazem: Optional[ArmazemSessoes]) -> None:
+    """Troca o armazém (testes, benchmarks); None volta ao de ARMAZEM_SESSOES."""
+
+    global _ARMAZEM
+
+    with _ARMAZEM_LOCK:
+        _ARMAZEM = armazem
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from services import codec_json
+from services.concorrencia import SingleFlight
+from services.inea import INEA_LIST_ENDPOINTS, retorna_lista_inea_async, validar_url_lista_inea
+
+
+logger = logging.getLogger("inea")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do cache das listas auxiliares do INEA
+# ==========================================================
+
+# As listas são tabelas de referência que quase nunca mudam.
+INEA_LISTAS_CACHE_TTL_SEGUNDOS = float(os.getenv("INEA_LISTAS_CACHE_TTL_SEGUNDOS", "86400"))
+
+# Endpoints cujo conteúdo é o mesmo para qualquer credencial: a entrada do
+# cache é compartilhada. Os demais são guardados por credencial.
+INEA_LISTAS_COMPARTILHADAS = {
+    endpoint.strip()
+    for endpoint in os.getenv(
+        "INEA_LISTAS_COMPARTILHADAS",
+        ",".join(sorted(INEA_LIST_ENDPOINTS)),
+    ).split(",")
+    if endpoint.strip()
+}
+
+INEA_LISTAS_BASE_URL = "https://mtr.inea.rj.gov.br/api"
+
+
+# =========================
+# Schema de entrada (todas as listas)
+# =========================
+class ConsultaListasIneaRequest(BaseModel):
+    cpf: str
+    senha: str
+    cnpj: str
+    unidade: str
+
+
+@dataclass
+class ListaInea:
+    conteudo: bytes
+    content_type: str
+    status_code: int
+    etag: str
+    cache: str = "MISS"
+
+
+def gerar_etag(conteudo: bytes) -> str:
+    return '"' + hashlib.sha256(conteudo).hexdigest()[:32] + '"'
+
+
+def etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    candidatos = [valor.strip() for valor in if_none_match.split(",")]
+    # Aceita também a forma fraca (W/"...") enviada por alguns proxies.
+    return "*" in candidatos or etag in candidatos or f"W/{etag}" in candidatos
+
+
+def _hash_credenciais(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class CacheListasInea:
+    """
+    Cache das listas auxiliares do INEA por endpoint.
+
+    Somente respostas 200 são guardadas. A busca em andamento é
+    compartilhada apenas entre chamadas com a mesma URL (mesma credencial),
+    para que um erro de autenticação de um usuário não seja repassado a
+    outro.
+    """
+
+    def __init__(self, ttl_segundos: float = INEA_LISTAS_CACHE_TTL_SEGUNDOS):
+        self._ttl_segundos = ttl_segundos
+        self._entradas: Dict[Tuple[str, str], Tuple[ListaInea, float]] = {}
+        self._voos = SingleFlight()
+        self._lock = threading.Lock()
+        self._contadores = {"hits": 0, "misses": 0}
+
+    def _chave(self, endpoint: str, url: str) -> Tuple[str, str]:
+        if endpoint in INEA_LISTAS_COMPARTILHADAS:
+            return endpoint, ""
+
+        return endpoint, _hash_credenciais(url)
+
+    async def _buscar(self, chave: Tuple[str, str], url: str) -> ListaInea:
+        response_inea = await retorna_lista_inea_async(url)
+
+        conteudo = response_inea.content or b""
+
+        lista = ListaInea(
+            conteudo=conteudo,
+            content_type=response_inea.headers.get(
+                "Content-Type",
+                "application/json; charset=utf-8",
+            ),
+            status_code=response_inea.status_code,
+            etag=gerar_etag(conteudo),
+        )
+
+        if response_inea.status_code == 200:
+            with self._lock:
+                self._entradas[chave] = (lista, time.monotonic() + self._ttl_segundos)
+
+        return lista
+
+    async def obter(self, url: str) -> ListaInea:
+        endpoint, _ = validar_url_lista_inea(url)
+        chave = self._chave(endpoint, url)
+
+        with self._lock:
+            entrada = self._entradas.get(chave)
+
+            if entrada and time.monotonic() < entrada[1]:
+                self._contadores["hits"] += 1
+                lista = entrada[0]
+                return ListaInea(lista.conteudo, lista.content_type, lista.status_code, lista.etag, "HIT")
+
+            self._contadores["misses"] += 1
+
+        return await self._voos.executar(
+            (endpoint, _hash_credenciais(url)),
+            lambda: self._buscar(chave, url),
+        )
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._contadores, "entradas": len(self._entradas)}
+
+
+_CACHE_LISTAS_INEA = CacheListasInea()
+
+
+async def obter_lista_inea_async(url: str) -> ListaInea:
+    return await _CACHE_LISTAS_INEA.obter(url)
+
+
+def _url_lista(endpoint: str, dados: ConsultaListasIneaRequest) -> str:
+    return f"{INEA_LISTAS_BASE_URL}/{endpoint}/{dados.cpf}/{dados.senha}/{dados.cnpj}/{dados.unidade}"
+
+
+def _decodificar(lista: ListaInea) -> Any:
+    try:
+        return codec_json.loads(lista.conteudo)
+    except ValueError:
+        return lista.conteudo.decode("utf-8", errors="replace")
+
+
+async def obter_todas_listas_inea_async(dados: ConsultaListasIneaRequest) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Busca as seis listas concorrentemente (pelo cache).
+
+    Retorna o corpo agregado e o ETag do conjunto; o ETag é None quando
+    alguma lista falhou, pois o resultado é parcial.
+    """
+
+    endpoints = sorted(INEA_LIST_ENDPOINTS)
+
+    resultados = await asyncio.gather(
+        *[obter_lista_inea_async(_url_lista(endpoint, dados)) for endpoint in endpoints],
+        return_exceptions=True,
+    )
+
+    listas: Dict[str, Any] = {}
+    erros: Dict[str, Any] = {}
+    etags = []
+
+    for endpoint, resultado in zip(endpoints, resultados):
+        if isinstance(resultado, HTTPException):
+            erros[endpoint] = {"status_code": resultado.status_code, "erro": resultado.detail}
+        elif isinstance(resultado, BaseException):
+            logger.error(
+                "[API INEA] Erro inesperado ao montar o pacote de listas | endpoint=%s | erro=%s",
+                endpoint,
+                str(resultado),
+            )
+            erros[endpoint] = {"status_code": 500, "erro": str(resultado)}
+        elif resultado.status_code != 200:
+            erros[endpoint] = {"status_code": resultado.status_code, "erro": _decodificar(resultado)}
+        else:
+            listas[endpoint] = _decodificar(resultado)
+            etags.append(resultado.etag)
+
+    corpo = {"listas": listas, "erros": erros}
+
+    if erros:
+        return corpo, None
+
+    return corpo, gerar_etag("".join(etags).encode("utf-8"))
+
+
+def estatisticas_cache_listas_inea() -> Dict[str, Any]:
+    return _CACHE_LISTAS_INEA.estatisticas()
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from services.concorrencia import SingleFlight, manter_tarefa
+from services.json_bruto import JsonBruto
+
+
+logger = logging.getLogger("cache_parceiros")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do cache de busca de parceiros
+# ==========================================================
+
+PARCEIROS_CACHE_MAX_ENTRADAS = int(os.getenv("PARCEIROS_CACHE_MAX_ENTRADAS", "5000"))
+
+# Validade de um parceiro encontrado.
+PARCEIROS_CACHE_TTL_SEGUNDOS = float(os.getenv("PARCEIROS_CACHE_TTL_SEGUNDOS", "21600"))
+
+# Validade de um resultado vazio (CNPJ não encontrado): bem menor, pois o
+# parceiro pode ser cadastrado no órgão a qualquer momento.
+PARCEIROS_CACHE_TTL_NEGATIVO_SEGUNDOS = float(os.getenv("PARCEIROS_CACHE_TTL_NEGATIVO_SEGUNDOS", "300"))
+
+# Depois de vencido, o valor ainda é servido por este tempo enquanto uma
+# atualização roda em segundo plano (stale-while-revalidate).
+PARCEIROS_CACHE_STALE_SEGUNDOS = float(os.getenv("PARCEIROS_CACHE_STALE_SEGUNDOS", "86400"))
+
+
+# Acima deste tamanho um JSON de parceiro não é uma resposta vazia.
+_TAMANHO_MAXIMO_NEGATIVO = 1024
+
+
+def resultado_negativo(resultado: Any) -> bool:
+    """Identifica respostas de "parceiro não encontrado" dos órgãos."""
+
+    if isinstance(resultado, JsonBruto):
+        # Respostas vazias são pequenas; as grandes nem são decodificadas.
+        if len(resultado) > _TAMANHO_MAXIMO_NEGATIVO:
+            return False
+        resultado = resultado.conteudo
+
+    if isinstance(resultado, (str, bytes)):
+        texto = resultado.strip()
+
+        if not texto:
+            return True
+
+        try:
+            resultado = json.loads(texto)
+        except ValueError:
+            return False
+
+    if resultado is None:
+        return True
+
+    if isinstance(resultado, (list, tuple, dict)) and not resultado:
+        return True
+
+    if isinstance(resultado, dict):
+        # SINIR/SIGOR: {"erro": false, "objetoResposta": null}
+        if "objetoResposta" in resultado and not resultado["objetoResposta"]:
+            return True
+
+        # Fallback de buscar_parceiro_* quando o órgão não devolve JSON.
+        if resultado.get("ok") is False:
+            return True
+
+    return False
+
+
+class CacheParceiros:
+    """
+    Cache LRU + TTL dos resultados de busca de parceiros.
+
+    - resultados vazios usam TTL próprio (menor);
+    - entradas vencidas continuam sendo servidas dentro da janela de
+      stale enquanto uma única atualização roda em segundo plano;
+    - buscas concorrentes da mesma chave viram uma só (single-flight).
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = PARCEIROS_CACHE_MAX_ENTRADAS,
+        ttl_segundos: float = PARCEIROS_CACHE_TTL_SEGUNDOS,
+        ttl_negativo_segundos: float = PARCEIROS_CACHE_TTL_NEGATIVO_SEGUNDOS,
+        stale_segundos: float = PARCEIROS_CACHE_STALE_SEGUNDOS,
+    ):
+        self._max_entradas = max(1, max_entradas)
+        self._ttl_segundos = ttl_segundos
+        self._ttl_negativo_segundos = ttl_negativo_segundos
+        self._stale_segundos = stale_segundos
+        # chave -> (resultado, expira_em, negativo)
+        self._entradas: "OrderedDict[Tuple[str, str, str], Tuple[Any, float, bool]]" = OrderedDict()
+        self._voos = SingleFlight()
+        self._lock = threading.Lock()
+        self._contadores = {
+            "hits": 0,
+            "hits_negativos": 0,
+            "hits_stale": 0,
+            "misses": 0,
+            "evictions": 0,
+            "atualizacoes": 0,
+            "falhas_atualizacao": 0,
+        }
+
+    def _contar(self, nome: str, quantidade: int = 1) -> None:
+        # Chamado com o lock adquirido.
+        self._contadores[nome] += quantidade
+
+    def _guardar(self, chave: Tuple[str, str, str], resultado: Any) -> None:
+        negativo = resultado_negativo(resultado)
+        ttl = self._ttl_negativo_segundos if negativo else self._ttl_segundos
+
+        with self._lock:
+            self._entradas.pop(chave, None)
+            self._entradas[chave] = (resultado, time.monotonic() + ttl, negativo)
+
+            while len(self._entradas) > self._max_entradas:
+                self._entradas.popitem(last=False)
+                self._contar("evictions")
+
+    async def _buscar_e_guardar(self, chave: Tuple[str, str, str], buscar: Callable[[], Awaitable[Any]]) -> Any:
+        resultado = await buscar()
+        self._guardar(chave, resultado)
+        return resultado
+
+    async def _atualizar_em_segundo_plano(
+        self,
+        chave: Tuple[str, str, str],
+        buscar: Callable[[], Awaitable[Any]],
+    ) -> None:
+        try:
+            await self._voos.executar(chave, lambda: self._buscar_e_guardar(chave, buscar))
+
+            with self._lock:
+                self._contar("atualizacoes")
+        except Exception as error:
+            with self._lock:
+                self._contar("falhas_atualizacao")
+
+            logger.warning(
+                "[CACHE PARCEIROS] Falha ao atualizar entrada vencida; mantendo valor anterior | "
+                "orgao=%s | tipo=%s | erro=%s",
+                chave[0],
+                chave[1],
+                str(error),
+            )
+
+    async def obter(self, chave: Tuple[str, str, str], buscar: Callable[[], Awaitable[Any]]) -> Any:
+        agora = time.monotonic()
+
+        with self._lock:
+            entrada = self._entradas.get(chave)
+
+            if entrada is not None:
+                resultado, expira_em, negativo = entrada
+
+                if agora < expira_em:
+                    self._entradas.move_to_end(chave)
+                    self._contar("hits_negativos" if negativo else "hits")
+                    return resultado
+
+                # Resultado vazio não é servido vencido.
+                if not negativo and agora < expira_em + self._stale_segundos:
+                    self._entradas.move_to_end(chave)
+                    self._contar("hits_stale")
+                    stale = True
+                else:
+                    self._entradas.pop(chave, None)
+                    stale = False
+            else:
+                stale = False
+
+            if not stale:
+                self._contar("misses")
+
+        if stale:
+            manter_tarefa(self._atualizar_em_segundo_plano(chave, buscar))
+            return resultado
+
+        return await self._voos.executar(chave, lambda: self._buscar_e_guardar(chave, buscar))
+
+    def invalidar(self, chave: Tuple[str, str, str]) -> None:
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._contadores,
+                "entradas": len(self._entradas),
+                "max_entradas": self._max_entradas,
+                "em_voo": self._voos.em_voo(),
+            }
+
+
+_CACHE_PARCEIROS = CacheParceiros()
+
+
+def chave_parceiro(orgao: str, tipo_parceiro: str, cnpj: str) -> Tuple[str, str, str]:
+    return (
+        orgao.strip().upper(),
+        tipo_parceiro.strip().lower(),
+        re.sub(r"\D", "", str(cnpj)) or str(cnpj).strip(),
+    )
+
+
+async def buscar_parceiro_em_cache(
+    orgao: str,
+    tipo_parceiro: str,
+    cnpj: str,
+    buscar: Callable[[str], Awaitable[Any]],
+) -> Any:
+    """
+    Busca o parceiro pelo cache; em miss chama buscar(cnpj) no órgão com o
+    CNPJ só com dígitos, o mesmo da chave: "12.345.678/0001-90" e
+    "12345678000190" dividem a entrada e a consulta.
+    """
+
+    chave = chave_parceiro(orgao, tipo_parceiro, cnpj)
+
+    return await _CACHE_PARCEIROS.obter(chave, lambda: buscar(chave[2]))
+
+
+def estatisticas_cache_parceiros() -> Dict[str, Any]:
+    return _CACHE_PARCEIROS.estatisticas()
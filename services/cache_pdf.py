@@ -0,0 +1,392 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional, Set, Tuple
+
+from services.cache_tokens import chave_credenciais_persistida
+
+
+logger = logging.getLogger("cache_pdf")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do cache de PDFs de manifesto
+# ==========================================================
+
+# O PDF de um MTR emitido não muda: uma vez baixado, as próximas cópias
+# são servidas do disco.
+PDF_CACHE_ENABLED = os.getenv("PDF_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+PDF_CACHE_DIR = os.getenv(
+    "PDF_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "tree-apis-pdf"),
+)
+
+# Espaço máximo em disco; os PDFs menos acessados são removidos primeiro.
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+# Só serve do cache para credenciais que já obtiveram o mesmo PDF no órgão,
+# para que conhecer o código de barras não baste para baixar o manifesto.
+PDF_CACHE_EXIGE_CREDENCIAL = (
+    os.getenv("PDF_CACHE_EXIGE_CREDENCIAL", "true").strip().lower() in ("1", "true", "sim", "yes")
+)
+
+_SUFIXO_TEMPORARIO = ".tmp"
+
+# Temporários mais antigos que isso são restos de gravação interrompida;
+# os mais novos podem ser de outro worker gravando agora.
+_IDADE_TEMPORARIO_ORFAO = 3600
+
+# Hashes das credenciais autorizadas, um por linha, ao lado de cada PDF.
+_SUFIXO_CREDENCIAIS = ".cred"
+
+
+def chave_pdf(orgao: str, codigo_barras: str) -> str:
+    bruto = f"{orgao.strip().upper()}:{str(codigo_barras).strip()}"
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class GravacaoPdf:
+    """
+    Gravação de um PDF no cache enquanto ele é repassado ao cliente.
+
+    Os blocos vão para um arquivo temporário no próprio diretório do cache;
+    só ao concluir ele é renomeado (os.replace, atômico) para o nome final.
+    Uma gravação descartada não deixa arquivo parcial visível.
+
+    Os métodos são assíncronos: escrita, fsync e rename rodam em
+    asyncio.to_thread para não parar o event loop com disco lento.
+    """
+
+    def __init__(self, cache: "CachePdf", chave: str, credencial: str, tamanho_esperado: Optional[int] = None):
+        self._cache = cache
+        self._chave = chave
+        self._credencial = credencial
+        self.tamanho_esperado = tamanho_esperado
+        self._tamanho = 0
+        self._finalizada = False
+
+        destino = cache.caminho(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+        descritor, self._temporario = tempfile.mkstemp(
+            dir=os.path.dirname(destino),
+            suffix=_SUFIXO_TEMPORARIO,
+        )
+        self._arquivo = os.fdopen(descritor, "wb")
+
+    async def escrever(self, bloco: bytes) -> None:
+        if self._finalizada:
+            return
+
+        await asyncio.to_thread(self._arquivo.write, bloco)
+        self._tamanho += len(bloco)
+
+    async def concluir(self) -> None:
+        if self._finalizada:
+            return
+
+        await asyncio.to_thread(self._concluir)
+
+    def _concluir(self) -> None:
+
+        if self.tamanho_esperado is not None and self._tamanho != self.tamanho_esperado:
+            logger.warning(
+                "[CACHE PDF] Tamanho recebido difere do Content-Length; descartando | "
+                "esperado=%s | recebido=%s",
+                self.tamanho_esperado,
+                self._tamanho,
+            )
+            self._finalizada = True
+            self._remover_temporario()
+            return
+
+        self._finalizada = True
+
+        try:
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._arquivo.close()
+            os.replace(self._temporario, self._cache.caminho(self._chave))
+        except OSError as error:
+            logger.error("[CACHE PDF] Falha ao gravar PDF no cache | erro=%s", str(error))
+            self._remover_temporario()
+            return
+
+        self._cache._registrar(self._chave, self._tamanho, self._credencial)
+
+    async def descartar(self) -> None:
+        if self._finalizada:
+            return
+
+        self._finalizada = True
+        await asyncio.to_thread(self._remover_temporario)
+
+    def _remover_temporario(self) -> None:
+        try:
+            self._arquivo.close()
+        except OSError:
+            pass
+
+        try:
+            os.unlink(self._temporario)
+        except FileNotFoundError:
+            pass
+
+
+class CachePdf:
+    """
+    Cache em disco dos PDFs de manifesto, por órgão + código de barras.
+
+    O índice (tamanho e ordem de acesso) fica em memória e é reconstruído
+    a partir do diretório na primeira consulta; a ordem de acesso sobrevive
+    a reinícios pelo mtime dos arquivos. Quando o total passa de max_bytes,
+    os PDFs menos acessados são removidos.
+
+    As credenciais autorizadas a cada PDF ficam em <chave>.cred (HMAC,
+    nunca CPF/senha), relido quando a credencial não está em memória: vale
+    após reinício e entre workers. Um PDF gravado por outro worker entra no
+    índice na primeira consulta a ele; cada worker aplica max_bytes ao que
+    conhece.
+
+    Os métodos são síncronos e fazem I/O de disco; as funções do módulo os
+    chamam em asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        diretorio: str = PDF_CACHE_DIR,
+        max_bytes: int = PDF_CACHE_MAX_BYTES,
+        exige_credencial: bool = PDF_CACHE_EXIGE_CREDENCIAL,
+    ):
+        self._diretorio = diretorio
+        self._max_bytes = max_bytes
+        self._exige_credencial = exige_credencial
+        self._indice: "OrderedDict[str, int]" = OrderedDict()
+        self._credenciais: Dict[str, Set[str]] = {}
+        self._total_bytes = 0
+        self._carregado = False
+        self._lock = threading.Lock()
+        self._contadores = {"hits": 0, "misses": 0, "gravacoes": 0, "evictions": 0}
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self._diretorio, chave[:2], f"{chave}.pdf")
+
+    def _caminho_credenciais(self, chave: str) -> str:
+        return os.path.join(self._diretorio, chave[:2], f"{chave}{_SUFIXO_CREDENCIAIS}")
+
+    def _ler_credenciais(self, chave: str) -> Set[str]:
+        try:
+            with open(self._caminho_credenciais(chave), encoding="ascii") as arquivo:
+                return {linha.strip() for linha in arquivo if linha.strip()}
+        except OSError:
+            return set()
+
+    def _gravar_credenciais(self, chave: str, credenciais: Set[str]) -> None:
+        destino = self._caminho_credenciais(chave)
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=_SUFIXO_TEMPORARIO)
+
+        try:
+            with os.fdopen(descritor, "w", encoding="ascii") as arquivo:
+                arquivo.write("\n".join(sorted(credenciais)) + "\n")
+            os.replace(temporario, destino)
+        except OSError:
+            try:
+                os.unlink(temporario)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _autorizado(self, chave: str, credencial: str) -> bool:
+        # Chamado com o lock adquirido.
+        if not self._exige_credencial or credencial in self._credenciais.get(chave, ()):
+            return True
+
+        # Outro worker (ou este, antes de reiniciar) pode ter autorizado.
+        self._credenciais[chave] = self._ler_credenciais(chave)
+        return credencial in self._credenciais[chave]
+
+    def _descobrir(self, chave: str) -> None:
+        # Chamado com o lock adquirido: PDF gravado por outro worker.
+        try:
+            tamanho = os.stat(self.caminho(chave)).st_size
+        except OSError:
+            return
+
+        self._indice[chave] = tamanho
+        self._total_bytes += tamanho
+
+    def _carregar(self) -> None:
+        # Chamado com o lock adquirido.
+        if self._carregado:
+            return
+
+        self._carregado = True
+        arquivos = []
+
+        if not os.path.isdir(self._diretorio):
+            return
+
+        for raiz, _, nomes in os.walk(self._diretorio):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+
+                try:
+                    # Restos de gravações interrompidas por queda do processo.
+                    if nome.endswith(_SUFIXO_TEMPORARIO):
+                        if time.time() - os.stat(caminho).st_mtime > _IDADE_TEMPORARIO_ORFAO:
+                            os.unlink(caminho)
+                        continue
+
+                    if nome.endswith(".pdf"):
+                        status = os.stat(caminho)
+                        arquivos.append((status.st_mtime, nome[:-4], status.st_size))
+
+                    # Credenciais de um PDF que já foi removido.
+                    if nome.endswith(_SUFIXO_CREDENCIAIS) and not os.path.exists(caminho[: -len(_SUFIXO_CREDENCIAIS)] + ".pdf"):
+                        os.unlink(caminho)
+                except OSError:
+                    continue
+
+        for _, chave, tamanho in sorted(arquivos):
+            self._indice[chave] = tamanho
+            self._total_bytes += tamanho
+
+        logger.info(
+            "[CACHE PDF] Índice carregado | arquivos=%s | bytes=%s",
+            len(self._indice),
+            self._total_bytes,
+        )
+
+    def _remover(self, chave: str) -> None:
+        # Chamado com o lock adquirido.
+        tamanho = self._indice.pop(chave, 0)
+        self._total_bytes -= tamanho
+        self._credenciais.pop(chave, None)
+
+        for caminho in (self.caminho(chave), self._caminho_credenciais(chave)):
+            try:
+                os.unlink(caminho)
+            except FileNotFoundError:
+                pass
+
+    def _registrar(self, chave: str, tamanho: int, credencial: str) -> None:
+        with self._lock:
+            self._carregar()
+
+            self._total_bytes -= self._indice.pop(chave, 0)
+            self._indice[chave] = tamanho
+            self._total_bytes += tamanho
+            self._contadores["gravacoes"] += 1
+
+            # Junta com as de outros workers que gravaram o mesmo PDF.
+            credenciais = self._credenciais.get(chave, set()) | self._ler_credenciais(chave) | {credencial}
+            self._credenciais[chave] = credenciais
+
+            try:
+                self._gravar_credenciais(chave, credenciais)
+            except OSError as error:
+                logger.error("[CACHE PDF] Falha ao gravar credenciais do PDF | erro=%s", str(error))
+
+            while self._total_bytes > self._max_bytes and len(self._indice) > 1:
+                antiga = next(iter(self._indice))
+                self._remover(antiga)
+                self._contadores["evictions"] += 1
+
+    def abrir(self, orgao: str, codigo_barras: str, credenciais: Tuple[Any, ...]) -> Optional[BinaryIO]:
+        """
+        PDF em cache já aberto para leitura, ou None se precisar buscar no
+        órgão. Aberto com o lock: uma remoção por espaço logo depois não
+        afeta quem já tem o arquivo.
+        """
+
+        chave = chave_pdf(orgao, codigo_barras)
+        credencial = chave_credenciais_persistida(credenciais)
+
+        with self._lock:
+            self._carregar()
+
+            if chave not in self._indice:
+                self._descobrir(chave)
+
+            if chave not in self._indice or not self._autorizado(chave, credencial):
+                self._contadores["misses"] += 1
+                return None
+
+            caminho = self.caminho(chave)
+
+            try:
+                arquivo = open(caminho, "rb")
+                os.utime(caminho)
+            except FileNotFoundError:
+                # Removido por fora (limpeza do diretório temporário, outro worker).
+                self._remover(chave)
+                self._contadores["misses"] += 1
+                return None
+
+            self._indice.move_to_end(chave)
+            self._contadores["hits"] += 1
+            return arquivo
+
+    def iniciar_gravacao(
+        self,
+        orgao: str,
+        codigo_barras: str,
+        credenciais: Tuple[Any, ...],
+        tamanho_esperado: Optional[int] = None,
+    ) -> Optional[GravacaoPdf]:
+        try:
+            return GravacaoPdf(
+                self,
+                chave_pdf(orgao, codigo_barras),
+                chave_credenciais_persistida(credenciais),
+                tamanho_esperado,
+            )
+        except OSError as error:
+            # Sem espaço ou sem permissão: o download segue sem cache.
+            logger.error("[CACHE PDF] Não foi possível iniciar a gravação | erro=%s", str(error))
+            return None
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            self._carregar()
+
+            return {
+                **self._contadores,
+                "arquivos": len(self._indice),
+                "bytes": self._total_bytes,
+                "max_bytes": self._max_bytes,
+                "diretorio": self._diretorio,
+            }
+
+
+_CACHE_PDF = CachePdf()
+
+
+async def abrir_pdf_em_cache(orgao: str, codigo_barras: str, credenciais: Tuple[Any, ...]) -> Optional[BinaryIO]:
+    if not PDF_CACHE_ENABLED:
+        return None
+
+    # A primeira chamada percorre o diretório inteiro para montar o índice.
+    return await asyncio.to_thread(_CACHE_PDF.abrir, orgao, codigo_barras, credenciais)
+
+
+async def iniciar_gravacao_pdf(
+    orgao: str,
+    codigo_barras: str,
+    credenciais: Tuple[Any, ...],
+    tamanho_esperado: Optional[int] = None,
+) -> Optional[GravacaoPdf]:
+    if not PDF_CACHE_ENABLED:
+        return None
+
+    return await asyncio.to_thread(_CACHE_PDF.iniciar_gravacao, orgao, codigo_barras, credenciais, tamanho_esperado)
+
+
+async def estatisticas_cache_pdf() -> Dict[str, Any]:
+    return {"habilitado": PDF_CACHE_ENABLED, **await asyncio.to_thread(_CACHE_PDF.estatisticas)}
@@ -0,0 +1,290 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from services.armazem_sessoes import armazem_sessoes
+from services.concorrencia import SingleFlight
+from services.pool_sessoes import SessaoExpirada
+
+
+logger = logging.getLogger("cache_tokens")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do cache de tokens
+# ==========================================================
+
+# Validade usada quando o token não é um JWT com "exp".
+TOKEN_CACHE_TTL_SEGUNDOS = float(os.getenv("TOKEN_CACHE_TTL_SEGUNDOS", "600"))
+
+# Folga antes do "exp" para não usar um token prestes a vencer.
+TOKEN_CACHE_MARGEM_SEGUNDOS = float(os.getenv("TOKEN_CACHE_MARGEM_SEGUNDOS", "60"))
+
+TOKEN_CACHE_MAX_ENTRADAS = int(os.getenv("TOKEN_CACHE_MAX_ENTRADAS", "1024"))
+
+# Segredo do HMAC das credenciais que saem da memória (chaves do armazém
+# de sessões, .cred do cache de PDFs). Sem ele, um sha256 de CNPJ/CPF
+# conhecidos + senha curta é quebrado por força bruta. Deve ser o mesmo
+# em todos os workers e réplicas que dividem o disco ou o Redis; se não
+# for informado, um aleatório é gerado em CREDENCIAIS_SEGREDO_ARQUIVO,
+# que serve aos workers do mesmo host.
+CREDENCIAIS_HMAC_SEGREDO = os.getenv("CREDENCIAIS_HMAC_SEGREDO", "")
+
+CREDENCIAIS_SEGREDO_ARQUIVO = os.getenv(
+    "CREDENCIAIS_SEGREDO_ARQUIVO",
+    os.path.join(tempfile.gettempdir(), "tree-apis-segredo-credenciais"),
+)
+
+T = TypeVar("T")
+
+
+def _bruto(credenciais: Tuple[Any, ...]) -> bytes:
+    return "\x1f".join(str(parte) for parte in credenciais).encode("utf-8")
+
+
+def chave_credenciais(credenciais: Tuple[Any, ...]) -> str:
+    """Gera a chave do cache sem manter CPF/CNPJ e senha em memória."""
+
+    return hashlib.sha256(_bruto(credenciais)).hexdigest()
+
+
+_SEGREDO: Optional[bytes] = None
+_SEGREDO_LOCK = threading.Lock()
+
+
+def _ler_ou_criar_segredo(caminho: str) -> bytes:
+    try:
+        # O_EXCL: entre workers subindo juntos, só um cria; os outros leem.
+        descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(caminho, "rb") as arquivo:
+                segredo = arquivo.read().strip()
+            if segredo:
+                return segredo
+            # Criado por outro worker e ainda não escrito.
+            time.sleep(0.02)
+        raise RuntimeError(f"Arquivo de segredo vazio: {caminho}")
+
+    segredo = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(descritor, "wb") as arquivo:
+        arquivo.write(segredo)
+
+    logger.warning(
+        "[CACHE TOKENS] CREDENCIAIS_HMAC_SEGREDO não definido; segredo gerado em %s "
+        "(defina a variável se o armazém for dividido entre hosts)",
+        caminho,
+    )
+    return segredo
+
+
+def _segredo() -> bytes:
+    global _SEGREDO
+
+    with _SEGREDO_LOCK:
+        if _SEGREDO is None:
+            if CREDENCIAIS_HMAC_SEGREDO:
+                _SEGREDO = CREDENCIAIS_HMAC_SEGREDO.encode("utf-8")
+            else:
+                _SEGREDO = _ler_ou_criar_segredo(CREDENCIAIS_SEGREDO_ARQUIVO)
+
+        return _SEGREDO
+
+
+def chave_credenciais_persistida(credenciais: Tuple[Any, ...]) -> str:
+    """
+    Chave das credenciais para o que vai a disco ou a outro serviço: HMAC
+    com segredo do servidor, para não servir de ataque offline à senha.
+    """
+
+    return hmac.new(_segredo(), _bruto(credenciais), hashlib.sha256).hexdigest()
+
+
+def expiracao_jwt(token: Any) -> Optional[float]:
+    """Lê o "exp" (epoch) de um JWT; aceita "Bearer xxx" e tuplas (token, chave)."""
+
+    if isinstance(token, (tuple, list)):
+        token = token[0] if token else None
+
+    if not isinstance(token, str):
+        return None
+
+    token = token.strip()
+
+    if token.lower().startswith("bearer "):
+        token = token[7:].strip()
+
+    partes = token.split(".")
+
+    if len(partes) != 3:
+        return None
+
+    try:
+        payload = partes[1] + "=" * (-len(partes[1]) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(payload))
+        return float(dados["exp"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _codificar_token(token: Any) -> Dict[str, Any]:
+    # O FEAM devolve (token, chave); JSON não tem tupla.
+    if isinstance(token, tuple):
+        return {"tupla": list(token)}
+
+    return {"valor": token}
+
+
+def _decodificar_token(dados: Dict[str, Any]) -> Any:
+    if "tupla" in dados:
+        return tuple(dados["tupla"])
+
+    return dados["valor"]
+
+
+class CacheTokens:
+    """
+    Cache de tokens por credencial com validade e single-flight.
+
+    Quando várias requisições não encontram o token ao mesmo tempo,
+    apenas uma chama o gettoken do órgão; as demais aguardam o mesmo
+    resultado (ou a mesma exceção).
+
+    Fora da memória do processo, o token vai para o armazém de sessões
+    (ARMAZEM_SESSOES): com sqlite/redis os outros workers reaproveitam o
+    token, e a trava do armazém deixa um único worker chamar o gettoken.
+    """
+
+    def __init__(
+        self,
+        ttl_segundos: float = TOKEN_CACHE_TTL_SEGUNDOS,
+        margem_segundos: float = TOKEN_CACHE_MARGEM_SEGUNDOS,
+        max_entradas: int = TOKEN_CACHE_MAX_ENTRADAS,
+    ):
+        self._ttl_segundos = ttl_segundos
+        self._margem_segundos = margem_segundos
+        self._max_entradas = max_entradas
+        self._tokens: Dict[str, Tuple[Any, float]] = {}
+        self._voos = SingleFlight()
+        self._lock = threading.Lock()
+
+    def _validade(self, token: Any) -> float:
+        # Em epoch: o armazém é lido por outros processos.
+        exp = expiracao_jwt(token)
+
+        if exp is None:
+            return time.time() + self._ttl_segundos
+
+        return exp - self._margem_segundos
+
+    def _guardar(self, chave: str, token: Any, expira_em: float) -> None:
+        if expira_em <= time.monotonic():
+            return
+
+        self._tokens.pop(chave, None)
+        self._tokens[chave] = (token, expira_em)
+
+        if len(self._tokens) > self._max_entradas:
+            agora = time.monotonic()
+
+            for chave_antiga in [c for c, (_, exp) in self._tokens.items() if exp <= agora]:
+                del self._tokens[chave_antiga]
+
+            while len(self._tokens) > self._max_entradas:
+                del self._tokens[next(iter(self._tokens))]
+
+    async def obter(self, credenciais: Tuple[Any, ...], gerar: Callable[[], Awaitable[T]]) -> T:
+        chave = chave_credenciais(credenciais)
+
+        with self._lock:
+            entrada = self._tokens.get(chave)
+
+            if entrada and time.monotonic() < entrada[1]:
+                return entrada[0]
+
+        async def renovar() -> Tuple[Dict[str, Any], float]:
+            token = await gerar()
+            return _codificar_token(token), self._validade(token)
+
+        async def gerar_e_guardar() -> T:
+            dados, expira_em, _ = await armazem_sessoes().obter_ou_renovar(
+                f"token:{chave_credenciais_persistida(credenciais)}",
+                renovar,
+            )
+            token = _decodificar_token(dados)
+
+            with self._lock:
+                self._guardar(chave, token, time.monotonic() + (expira_em - time.time()))
+
+            return token
+
+        return await self._voos.executar(chave, gerar_e_guardar)
+
+    async def invalidar(self, credenciais: Tuple[Any, ...], token: Any = None) -> None:
+        """Descarta o token; com token, no armazém só se outro worker ainda não o trocou."""
+
+        chave = chave_credenciais(credenciais)
+
+        with self._lock:
+            self._tokens.pop(chave, None)
+
+        await armazem_sessoes().remover(
+            f"token:{chave_credenciais_persistida(credenciais)}",
+            None if token is None else _codificar_token(token),
+        )
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+
+_CACHE_TOKENS = CacheTokens()
+
+
+async def obter_token(credenciais: Tuple[Any, ...], gerar: Callable[[], Awaitable[T]]) -> T:
+    return await _CACHE_TOKENS.obter(credenciais, gerar)
+
+
+async def invalidar_token(credenciais: Tuple[Any, ...], token: Any = None) -> None:
+    await _CACHE_TOKENS.invalidar(credenciais, token)
+
+
+async def executar_com_token(
+    credenciais: Tuple[Any, ...],
+    gerar: Callable[[], Awaitable[Any]],
+    operacao: Callable[[Any], Awaitable[T]],
+) -> T:
+    """
+    Executa a operação com o token em cache. Se o órgão recusar o token
+    (SessaoExpirada), descarta-o e tenta mais uma vez com um token novo.
+    """
+
+    token = await obter_token(credenciais, gerar)
+
+    try:
+        return await operacao(token)
+    except SessaoExpirada as error:
+        logger.warning(
+            "[CACHE TOKENS] Token recusado pelo órgão; gerando novo | orgao=%s | motivo=%s",
+            credenciais[0],
+            str(error),
+        )
+        await invalidar_token(credenciais, token)
+
+    try:
+        return await operacao(await obter_token(credenciais, gerar))
+    except SessaoExpirada as error:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Token {credenciais[0]} recusado mesmo após nova autenticação: {str(error)}",
+        )
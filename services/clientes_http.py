@@ -0,0 +1,405 @@
+import asyncio
+import logging
+import os
+import ssl
+import threading
+import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Coroutine, Dict, Mapping, Optional, TypeVar
+from urllib.parse import urlparse
+
+import httpx
+import requests
+
+from services import gravacao, metricas
+from services.rastreamento import injetar_contexto, marcar_status, span
+from services.resiliencia import proteger
+
+
+logger = logging.getLogger("clientes_http")
+logger.setLevel(logging.INFO)
+
+# O httpx registra cada URL em INFO; algumas rotas dos órgãos levam
+# senha no path (retornaManifesto do IMA/INEA).
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# ==========================================================
+# Configuração dos pools de conexão
+# ==========================================================
+
+# Conexões keep-alive mantidas por host upstream.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+
+# Tempo que uma conexão ociosa fica aberta aguardando reuso.
+HTTP_KEEPALIVE_SEGUNDOS = float(os.getenv("HTTP_KEEPALIVE_SEGUNDOS", "60"))
+
+# Hosts dos órgãos. Para os demais (relay, serviços Selenium) o pool
+# é criado sob demanda com a configuração padrão.
+#
+# "orgao" agrupa os hosts no mesmo circuit breaker/bulkhead; hosts fora
+# da lista usam o próprio nome.
+HOSTS_UPSTREAM = {
+    "mtr.inea.rj.gov.br": {"orgao": "INEA"},
+    "mtr.ima.sc.gov.br": {"orgao": "IMA"},
+    "mtr.meioambiente.mg.gov.br": {"orgao": "FEAM", "retries": True},
+    "mtr.meioambiente.go.gov.br": {"orgao": "SEMAD"},
+    "mtr.fepam.rs.gov.br": {"orgao": "FEPAM"},
+    "admin.sinir.gov.br": {"orgao": "SINIR"},
+    "mtr.sinir.gov.br": {"orgao": "SINIR"},
+    "mtrr.cetesb.sp.gov.br": {"orgao": "SIGOR"},
+}
+
+# Redirecionamento dos hosts para outro endereço (servidores stub dos
+# benchmarks, ambientes de homologação). Formato:
+#   UPSTREAM_REMAP="mtr.inea.rj.gov.br=http://127.0.0.1:8765,*=http://127.0.0.1:8765"
+# "*" vale para qualquer host, inclusive relay e serviços Selenium. Só o
+# destino da conexão muda: URL original no header Host, rótulos das
+# métricas e circuit breaker pelo órgão original.
+UPSTREAM_REMAP = os.getenv("UPSTREAM_REMAP", "")
+
+_REMAP: Dict[str, httpx.URL] = {}
+
+# Mesmo retry que a FEAM já usava: apenas GET, que é idempotente.
+RETRY_TENTATIVAS = 5
+RETRY_BACKOFF_SEGUNDOS = 0.6
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Um conjunto de clientes por event loop: o loop do uvicorn e o loop
+# de fundo usado pelos wrappers síncronos.
+_CLIENTES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_LOCK = threading.Lock()
+
+T = TypeVar("T")
+
+
+class ErroSSL(httpx.ConnectError):
+    """Falha de handshake TLS (equivalente ao requests.SSLError)."""
+
+
+def _host(url_ou_host: str) -> str:
+    if "://" not in url_ou_host:
+        return url_ou_host.strip().lower()
+
+    return (urlparse(url_ou_host).hostname or "").lower()
+
+
+def orgao_do_host(url_ou_host: str) -> str:
+    host = _host(url_ou_host)
+    return HOSTS_UPSTREAM.get(host, {}).get("orgao", host)
+
+
+def orgao_metricas(url_ou_host: str) -> str:
+    # Hosts fora da lista (relay, Selenium) num rótulo só: subdomínios
+    # variáveis não criam séries novas nas métricas.
+    return HOSTS_UPSTREAM.get(_host(url_ou_host), {}).get("orgao", metricas.ORGAO_EXTERNO)
+
+
+def remapear_upstreams(destinos: Mapping[str, str]) -> None:
+    """Substitui o redirecionamento de hosts; vazio volta aos endereços reais."""
+
+    novos = {_host(host): httpx.URL(destino) for host, destino in destinos.items()}
+
+    with _LOCK:
+        _REMAP.clear()
+        _REMAP.update(novos)
+
+
+def _ler_remap(valor: str) -> Dict[str, str]:
+    destinos: Dict[str, str] = {}
+
+    for item in valor.split(","):
+        if not item.strip():
+            continue
+
+        host, separador, destino = item.partition("=")
+        if not separador or not destino.strip():
+            raise ValueError(f"UPSTREAM_REMAP inválido: {item!r} (esperado host=http://destino)")
+
+        destinos[host.strip()] = destino.strip()
+
+    return destinos
+
+
+def _remapear(request: httpx.Request) -> None:
+    destino = _REMAP.get(request.url.host) or _REMAP.get("*")
+
+    if destino is not None:
+        request.url = request.url.copy_with(scheme=destino.scheme, host=destino.host, port=destino.port)
+
+
+remapear_upstreams(_ler_remap(UPSTREAM_REMAP))
+
+
+def _cookie_jar_desativado() -> CookieJar:
+    # O cliente é compartilhado entre usuários: não guarda Set-Cookie.
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+def _novo_cliente() -> httpx.AsyncClient:
+    limites = httpx.Limits(
+        max_connections=HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_SEGUNDOS,
+    )
+
+    return httpx.AsyncClient(
+        limits=limites,
+        # Gravação/reprodução das chamadas (GRAVACAO_UPSTREAM); None = rede.
+        transport=gravacao.transporte(limites),
+        cookies=_cookie_jar_desativado(),
+        follow_redirects=True,
+        timeout=30,
+    )
+
+
+def cliente_async(url_ou_host: str) -> httpx.AsyncClient:
+    """AsyncClient com pool keep-alive do host, no event loop corrente."""
+
+    host = _host(url_ou_host)
+    loop = asyncio.get_running_loop()
+
+    with _LOCK:
+        clientes = _CLIENTES.setdefault(loop, {})
+        cliente = clientes.get(host)
+
+        if cliente is None or cliente.is_closed:
+            cliente = _novo_cliente()
+            clientes[host] = cliente
+
+        return cliente
+
+
+def _timeout(valor: Any) -> Any:
+    # Aceita o formato (connect, read) herdado do requests.
+    if isinstance(valor, tuple):
+        conexao, leitura = valor
+        return httpx.Timeout(leitura, connect=conexao)
+
+    return valor
+
+
+def _erro_ssl(error: BaseException) -> bool:
+    causa = error.__cause__ or error.__context__
+
+    while causa is not None:
+        if isinstance(causa, ssl.SSLError):
+            return True
+        causa = causa.__cause__ or causa.__context__
+
+    return "ssl" in str(error).lower()
+
+
+def cabecalho_cookies(cookies: Mapping[str, Optional[str]]) -> str:
+    return "; ".join(f"{nome}={valor}" for nome, valor in cookies.items() if valor is not None)
+
+
+def cookies_dict(cookies: Any) -> Dict[str, str]:
+    """Normaliza dict, CookieJar do requests ou httpx.Cookies para dict."""
+
+    if not cookies:
+        return {}
+
+    if isinstance(cookies, CookieJar):
+        return {cookie.name: cookie.value for cookie in cookies}
+
+    return {nome: valor for nome, valor in dict(cookies).items() if valor is not None}
+
+
+def cookies_resposta(resp: httpx.Response) -> Dict[str, str]:
+    """Cookies definidos pela resposta, incluindo os redirecionamentos seguidos."""
+
+    cookies: Dict[str, str] = {}
+
+    for anterior in [*resp.history, resp]:
+        cookies.update(cookies_dict(anterior.cookies.jar))
+
+    return cookies
+
+
+async def requisitar_async(
+    metodo: str,
+    url: str,
+    *,
+    cookies: Any = None,
+    timeout: Any = 30,
+    stream: bool = False,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Requisição pelo pool keep-alive do host; cookies vão por requisição.
+
+    Com stream=True o corpo não é lido: quem chama consome com
+    aiter_bytes() e precisa fechar a resposta (aclose) no final.
+
+    Latência, tamanhos, status e timeouts entram nas métricas (GET /metrics)
+    por órgão e operação (nome tirado da URL, ver operacao_da_requisicao).
+    Com tracing ligado, cada chamada vira um span CLIENT; hosts fora de
+    HOSTS_UPSTREAM (relay, serviços Selenium) recebem o traceparent.
+    """
+
+    headers = dict(kwargs.pop("headers", None) or {})
+    cookies = cookies_dict(cookies)
+
+    if cookies:
+        headers["Cookie"] = cabecalho_cookies(cookies)
+
+    host = _host(url)
+    tentativas = (
+        RETRY_TENTATIVAS
+        if metodo.upper() == "GET" and HOSTS_UPSTREAM.get(host, {}).get("retries")
+        else 0
+    )
+
+    cliente = cliente_async(host)
+    follow_redirects = kwargs.pop("follow_redirects", True)
+
+    def montar() -> httpx.Request:
+        request = cliente.build_request(
+            metodo,
+            url,
+            headers=headers,
+            timeout=_timeout(timeout),
+            **kwargs,
+        )
+
+        if _REMAP:
+            _remapear(request)
+
+        return request
+
+    request = montar()
+    orgao = orgao_metricas(host)
+    operacao = metricas.operacao_da_requisicao(request)
+    propagar = host not in HOSTS_UPSTREAM
+    inicio = time.monotonic()
+
+    atributos = {
+        "http.request.method": metodo.upper(),
+        "server.address": host,
+        "mtr.orgao": orgao,
+        "mtr.operacao": operacao,
+    }
+
+    with span(f"{metodo.upper()} {orgao} {operacao}", atributos, cliente=True) as atual:
+        try:
+            # Circuito aberto ou órgão sem vaga: 503 com Retry-After, sem esperar
+            # o timeout do upstream.
+            async with proteger(orgao_do_host(host)) as protecao:
+                for tentativa in range(tentativas + 1):
+                    if tentativa:
+                        request = montar()
+
+                    if propagar:
+                        injetar_contexto(request.headers)
+
+                    try:
+                        resp = await cliente.send(request, stream=stream, follow_redirects=follow_redirects)
+                    except httpx.ConnectError as error:
+                        if _erro_ssl(error):
+                            raise ErroSSL(str(error), request=error.request) from error
+                        raise
+
+                    if tentativa < tentativas and resp.status_code in RETRY_STATUS:
+                        await resp.aclose()
+                        await asyncio.sleep(RETRY_BACKOFF_SEGUNDOS * (2**tentativa))
+                        continue
+
+                    break
+
+                if protecao is not None:
+                    protecao.registrar(resp)
+
+                    # O corpo ainda vai ser lido do órgão: a vaga segue com a resposta.
+                    if stream:
+                        protecao.manter_vaga(resp)
+
+        except Exception as error:
+            # Rejeição do circuito/bulkhead não chega ao órgão: sem latência.
+            duracao = time.monotonic() - inicio if isinstance(error, httpx.HTTPError) else None
+            metricas.registrar_falha(orgao, operacao, error, duracao)
+            raise
+
+        atual.set_attribute("mtr.tentativas", tentativa + 1)
+        marcar_status(atual, resp.status_code)
+
+    metricas.registrar_resposta(orgao, operacao, request, resp, time.monotonic() - inicio, stream)
+    return resp
+
+
+def registrar_fim_stream(resp: httpx.Response, total: int) -> None:
+    """Tamanho de um corpo repassado com stream=True, ao fim do repasse."""
+
+    metricas.registrar_bytes_stream(
+        orgao_metricas(resp.request.url.host),
+        metricas.operacao_da_requisicao(resp.request),
+        total,
+    )
+
+
+async def fechar_clientes_async() -> None:
+    """Fecha os clientes do event loop corrente (shutdown da aplicação)."""
+
+    loop = asyncio.get_running_loop()
+
+    with _LOCK:
+        clientes = _CLIENTES.pop(loop, {})
+
+    for cliente in clientes.values():
+        await cliente.aclose()
+
+
+# ==========================================================
+# Ponte para os wrappers síncronos
+# ==========================================================
+
+_LOOP_SINCRONO: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_SINCRONO_LOCK = threading.Lock()
+
+
+def _loop_sincrono() -> asyncio.AbstractEventLoop:
+    global _LOOP_SINCRONO
+
+    with _LOOP_SINCRONO_LOCK:
+        if _LOOP_SINCRONO is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever,
+                name="clientes-http-sincrono",
+                daemon=True,
+            ).start()
+            _LOOP_SINCRONO = loop
+
+        return _LOOP_SINCRONO
+
+
+def executar_sincrono(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Executa uma corrotina dos serviços a partir de código síncrono.
+
+    Usa um event loop de fundo permanente para que os wrappers síncronos
+    também reaproveitem o pool de conexões entre chamadas.
+    """
+
+    return asyncio.run_coroutine_threadsafe(coro, _loop_sincrono()).result()
+
+
+def sessao_com_cookies(cookies: Mapping[str, str]) -> requests.Session:
+    """
+    requests.Session com os cookies informados, para quem ainda consome
+    o retorno antigo dos logins (session, cookies) de forma síncrona.
+    """
+
+    session = requests.Session()
+    session.cookies.update(cookies)
+    return session
+
+
+def cookies_com_sessao(cookies: Any, session: Optional[requests.Session]) -> Dict[str, str]:
+    """Mescla os cookies de uma requests.Session legada com os informados."""
+
+    mesclados = cookies_dict(session.cookies) if session is not None else {}
+    mesclados.update(cookies_dict(cookies))
+    return mesclados
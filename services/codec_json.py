@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Tuple, Union
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+logger = logging.getLogger("codec_json")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Backend de JSON da API
+# ==========================================================
+
+# "orjson" (padrão, se instalado) ou "json" (biblioteca padrão). Vale para
+# as respostas, a leitura do corpo das requisições e os payloads montados
+# pelos serviços.
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson").strip().lower()
+
+ORJSON = "orjson"
+STDLIB = "json"
+
+if JSON_BACKEND == ORJSON and orjson is None:
+    logger.warning("[JSON] orjson não instalado; usando a biblioteca padrão")
+
+BACKEND = ORJSON if JSON_BACKEND == ORJSON and orjson is not None else STDLIB
+
+
+def _padrao(obj: Any) -> Any:
+    # Tipos fora do JSON nativo (modelos pydantic, set, datetime...) seguem
+    # a mesma conversão do FastAPI.
+    return jsonable_encoder(obj)
+
+
+def _dumps_stdlib(obj: Any) -> bytes:
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_padrao,
+    ).encode("utf-8")
+
+
+def _loads_stdlib(dados: Union[bytes, str]) -> Any:
+    return json.loads(dados)
+
+
+def _dumps_orjson(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj, default=_padrao, option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # Inteiros acima de 64 bits e afins: a biblioteca padrão aceita.
+        return _dumps_stdlib(obj)
+
+
+def _loads_orjson(dados: Union[bytes, str]) -> Any:
+    return orjson.loads(dados)
+
+
+# Nome -> (dumps, loads). Ambos geram JSON compacto em UTF-8, sem escapar acentos.
+BACKENDS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[Union[bytes, str]], Any]]] = {
+    STDLIB: (_dumps_stdlib, _loads_stdlib),
+}
+
+if orjson is not None:
+    BACKENDS[ORJSON] = (_dumps_orjson, _loads_orjson)
+
+dumps, loads = BACKENDS[BACKEND]
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+
+class RespostaJson(JSONResponse):
+    """Resposta padrão da API, serializada pelo backend configurado."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RequestJson(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class RotaJson(APIRoute):
+    """Rota que lê o corpo JSON com o backend configurado."""
+
+    def get_route_handler(self) -> Callable:
+        original = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            return await original(RequestJson(request.scope, request.receive))
+
+        return handler
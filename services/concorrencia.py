@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Set, TypeVar
+
+
+T = TypeVar("T")
+
+# Leituras idênticas em andamento viram uma só chamada ao órgão.
+COALESCENCIA_ENABLED = os.getenv("COALESCENCIA_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+# Os serviços rodam no loop do uvicorn e no loop de fundo dos wrappers
+# síncronos. Por isso os primitivos abaixo usam threading.Lock e
+# concurrent.futures.Future em vez de asyncio.Lock, que é preso a um loop.
+
+_TAREFAS: Set[asyncio.Task] = set()
+
+
+def manter_tarefa(coro: Awaitable[Any]) -> asyncio.Task:
+    """Agenda a corrotina mantendo referência até o fim (evita coleta pelo GC)."""
+
+    tarefa = asyncio.ensure_future(coro)
+    _TAREFAS.add(tarefa)
+    tarefa.add_done_callback(_TAREFAS.discard)
+    return tarefa
+
+
+async def aguardar_compartilhado(futuro: "Future[T]") -> T:
+    """Aguarda um Future compartilhado; cancelar quem espera não cancela o Future."""
+
+    return await asyncio.shield(asyncio.wrap_future(futuro))
+
+
+class SingleFlight:
+    """
+    Coalesce chamadas concorrentes com a mesma chave numa única execução.
+
+    A execução roda numa tarefa própria: se a requisição que a iniciou for
+    cancelada, as demais continuam aguardando o mesmo resultado.
+    """
+
+    def __init__(self):
+        self._em_voo: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    async def executar(self, chave: Hashable, fabrica: Callable[[], Awaitable[T]]) -> T:
+        with self._lock:
+            futuro = self._em_voo.get(chave)
+            lider = futuro is None
+
+            if lider:
+                futuro = Future()
+                futuro.set_running_or_notify_cancel()
+                self._em_voo[chave] = futuro
+
+        if lider:
+            manter_tarefa(self._voar(chave, fabrica, futuro))
+
+        return await aguardar_compartilhado(futuro)
+
+    async def _voar(self, chave: Hashable, fabrica: Callable[[], Awaitable[T]], futuro: Future) -> None:
+        try:
+            resultado = await fabrica()
+        except BaseException as error:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+            futuro.set_exception(error)
+
+            if isinstance(error, (KeyboardInterrupt, SystemExit)):
+                raise
+            return
+
+        with self._lock:
+            self._em_voo.pop(chave, None)
+        futuro.set_result(resultado)
+
+    def em_voo(self) -> int:
+        with self._lock:
+            return len(self._em_voo)
+
+
+class LimiteConcorrencia:
+    """
+    Semáforo compartilhado entre event loops.
+
+    Quem não encontra vaga recebe um Future; ao sair, a vaga passa direto
+    para o próximo da fila, na ordem de chegada.
+    """
+
+    def __init__(self, limite: int):
+        self._limite = max(1, limite)
+        self._em_uso = 0
+        self._esperando: Deque[Future] = deque()
+        self._lock = threading.Lock()
+
+    async def __aenter__(self) -> "LimiteConcorrencia":
+        with self._lock:
+            if self._em_uso < self._limite:
+                self._em_uso += 1
+                return self
+
+            futuro: Future = Future()
+            self._esperando.append(futuro)
+
+        try:
+            await asyncio.wrap_future(futuro)
+        except asyncio.CancelledError:
+            # A vaga pode ter sido entregue junto com o cancelamento.
+            if futuro.done() and not futuro.cancelled():
+                self.liberar()
+            raise
+
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.liberar()
+
+    def liberar(self) -> None:
+        """Devolve a vaga; síncrono, para quem a solta fora do async with."""
+
+        with self._lock:
+            while self._esperando:
+                futuro = self._esperando.popleft()
+
+                if futuro.set_running_or_notify_cancel():
+                    futuro.set_result(None)
+                    return
+
+            self._em_uso -= 1
+
+    def em_uso(self) -> int:
+        with self._lock:
+            return self._em_uso
+
+    def aguardando(self) -> int:
+        with self._lock:
+            return len(self._esperando)
+
+
+_COALESCENCIA = SingleFlight()
+
+
+def _normalizar(valor: Any) -> Any:
+    # Strings ficam como vieram: o líder usa os próprios argumentos, e um
+    # código com espaço pode gerar outra URL no órgão.
+    if isinstance(valor, dict):
+        return tuple(sorted((str(chave), _normalizar(item)) for chave, item in valor.items()))
+
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(item) for item in valor)
+
+    return valor
+
+
+def chave_coalescencia(orgao: str, operacao: str, argumentos: Dict[str, Any]) -> str:
+    """
+    Chave (órgão, operação, argumentos normalizados).
+
+    As credenciais fazem parte dos argumentos: só se juntam chamadas do
+    mesmo usuário, para que o erro de login de um não chegue a outro. O
+    hash evita manter senha em memória enquanto a chamada está em voo.
+    """
+
+    bruto = repr((orgao, operacao, _normalizar(argumentos)))
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def coalescer(orgao: str, operacao: str):
+    """
+    Decorator para leituras async: enquanto uma chamada está em andamento,
+    chamadas com os mesmos argumentos aguardam o mesmo resultado (ou a
+    mesma exceção) em vez de irem ao órgão de novo.
+    """
+
+    def decorador(funcao: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        assinatura = inspect.signature(funcao)
+
+        @functools.wraps(funcao)
+        async def coalescida(*args, **kwargs) -> T:
+            if not COALESCENCIA_ENABLED:
+                return await funcao(*args, **kwargs)
+
+            # Posicional ou nomeado dá na mesma chave.
+            argumentos = assinatura.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+
+            return await _COALESCENCIA.executar(
+                chave_coalescencia(orgao, operacao, dict(argumentos.arguments)),
+                lambda: funcao(*args, **kwargs),
+            )
+
+        return coalescida
+
+    return decorador
+
+
+def coalescencias_em_voo() -> int:
+    return _COALESCENCIA.em_voo()
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from services.cache_pdf import GravacaoPdf, abrir_pdf_em_cache, iniciar_gravacao_pdf
+from services.clientes_http import registrar_fim_stream
+
+
+logger = logging.getLogger("download_pdf")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do download de PDFs
+# ==========================================================
+
+# Repasse do corpo do órgão ao cliente sem carregar o PDF inteiro em
+# memória. DOWNLOAD_PDF_STREAMING=false volta ao modo bufferizado.
+DOWNLOAD_PDF_STREAMING = os.getenv("DOWNLOAD_PDF_STREAMING", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+# Tamanho dos blocos lidos do upstream e enviados ao cliente.
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("DOWNLOAD_CHUNK_BYTES", "65536"))
+
+# "%PDF" + versão: o suficiente para reconhecer o arquivo.
+_TAMANHO_ASSINATURA = 5
+
+
+def _is_pdf(content_type: str, inicio: bytes) -> bool:
+    return "application/pdf" in content_type.lower() or inicio.startswith(b"%PDF")
+
+
+def _cabecalhos_pdf(codigo_barras: str) -> Dict[str, str]:
+    return {
+        "Content-Disposition": f'attachment; filename="MTR-{codigo_barras}.pdf"',
+        "Cache-Control": "no-store",
+    }
+
+
+def _tamanho_upstream(resp: httpx.Response) -> Optional[int]:
+    # Com compressão o Content-Length do órgão não corresponde ao corpo
+    # descomprimido que é repassado.
+    if "Content-Encoding" in resp.headers:
+        return None
+
+    try:
+        return int(resp.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def resposta_download_pdf(
+    resp: httpx.Response,
+    codigo_barras: str,
+    gravacao: Optional[GravacaoPdf] = None,
+) -> Response:
+    """Resposta bufferizada (corpo já lido), mesmo formato de antes."""
+
+    conteudo = resp.content or b""
+    content_type = resp.headers.get("Content-Type", "application/octet-stream")
+
+    if resp.status_code == 200 and _is_pdf(content_type, conteudo):
+        if gravacao is not None and conteudo.startswith(b"%PDF"):
+            await gravacao.escrever(conteudo)
+            await gravacao.concluir()
+        elif gravacao is not None:
+            await gravacao.descartar()
+
+        return Response(
+            content=conteudo,
+            status_code=200,
+            media_type="application/pdf",
+            headers={
+                **_cabecalhos_pdf(codigo_barras),
+                "Content-Length": str(len(conteudo)),
+            },
+        )
+
+    if gravacao is not None:
+        await gravacao.descartar()
+
+    return Response(
+        content=conteudo,
+        status_code=resp.status_code,
+        headers={
+            "Content-Type": content_type,
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+async def _ler_arquivo(arquivo: BinaryIO) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            bloco = await asyncio.to_thread(arquivo.read, DOWNLOAD_CHUNK_BYTES)
+            if not bloco:
+                break
+            yield bloco
+    finally:
+        arquivo.close()
+
+
+def resposta_pdf_em_cache(arquivo: BinaryIO, codigo_barras: str) -> Response:
+    # Lê do descritor já aberto pelo cache: se o PDF for removido do disco
+    # enquanto isso (espaço, outro worker), a cópia aberta continua válida.
+    return StreamingResponse(
+        _ler_arquivo(arquivo),
+        media_type="application/pdf",
+        headers={
+            **_cabecalhos_pdf(codigo_barras),
+            "Content-Length": str(os.fstat(arquivo.fileno()).st_size),
+            "X-Cache": "HIT",
+        },
+    )
+
+
+async def _ler_inicio(blocos: AsyncIterator[bytes]) -> bytes:
+    inicio = b""
+
+    async for bloco in blocos:
+        inicio += bloco
+
+        if len(inicio) >= _TAMANHO_ASSINATURA:
+            break
+
+    return inicio
+
+
+async def _repassar(
+    resp: httpx.Response,
+    inicio: bytes,
+    blocos: AsyncIterator[bytes],
+    codigo_barras: str,
+    gravacao: Optional[GravacaoPdf] = None,
+) -> AsyncIterator[bytes]:
+    enviados = len(inicio)
+
+    try:
+        if inicio:
+            if gravacao is not None:
+                await gravacao.escrever(inicio)
+            yield inicio
+
+        async for bloco in blocos:
+            enviados += len(bloco)
+            if gravacao is not None:
+                await gravacao.escrever(bloco)
+            yield bloco
+
+        registrar_fim_stream(resp, enviados)
+
+        # Só entra no cache o corpo que chegou inteiro ao cliente.
+        if gravacao is not None:
+            await gravacao.concluir()
+
+    except httpx.HTTPError as error:
+        # Os cabeçalhos já foram enviados: só resta interromper o corpo.
+        logger.error(
+            "[DOWNLOAD PDF] Falha ao repassar o corpo do órgão | "
+            "codigo_barras=%s | enviados=%s | erro=%s",
+            codigo_barras,
+            enviados,
+            str(error),
+        )
+        raise
+
+    finally:
+        if gravacao is not None:
+            await gravacao.descartar()
+        await resp.aclose()
+
+    logger.info(
+        "[DOWNLOAD PDF] Download repassado | codigo_barras=%s | status=%s | tamanho=%s",
+        codigo_barras,
+        resp.status_code,
+        enviados,
+    )
+
+
+async def resposta_download_pdf_streaming(
+    resp: httpx.Response,
+    codigo_barras: str,
+    gravacao: Optional[GravacaoPdf] = None,
+) -> Response:
+    """
+    Repassa uma resposta aberta com stream=True ao cliente.
+
+    Somente o primeiro bloco é lido antes de responder, para decidir entre
+    PDF (attachment MTR-{codigo}.pdf) e erro do órgão (status e
+    Content-Type originais). O restante segue bloco a bloco, e a conexão
+    com o órgão é fechada ao final ou se o cliente desistir.
+    """
+
+    content_type = resp.headers.get("Content-Type", "application/octet-stream")
+    blocos = resp.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_BYTES)
+
+    try:
+        inicio = await _ler_inicio(blocos)
+    except httpx.ReadTimeout as error:
+        if gravacao is not None:
+            await gravacao.descartar()
+        await resp.aclose()
+        raise HTTPException(
+            status_code=504,
+            detail=f"O órgão demorou demais para enviar o arquivo: {str(error)}",
+        )
+    except httpx.HTTPError as error:
+        if gravacao is not None:
+            await gravacao.descartar()
+        await resp.aclose()
+        raise HTTPException(
+            status_code=502,
+            detail=f"Erro de comunicação durante o download: {str(error)}",
+        )
+
+    if resp.status_code == 200 and _is_pdf(content_type, inicio):
+        headers = _cabecalhos_pdf(codigo_barras)
+        tamanho = _tamanho_upstream(resp)
+
+        if tamanho is not None:
+            headers["Content-Length"] = str(tamanho)
+
+        # Páginas de erro servidas como application/pdf não vão para o cache.
+        if gravacao is not None and not inicio.startswith(b"%PDF"):
+            await gravacao.descartar()
+            gravacao = None
+
+        return StreamingResponse(
+            _repassar(resp, inicio, blocos, codigo_barras, gravacao),
+            status_code=200,
+            media_type="application/pdf",
+            headers=headers,
+        )
+
+    if gravacao is not None:
+        await gravacao.descartar()
+
+    return StreamingResponse(
+        _repassar(resp, inicio, blocos, codigo_barras),
+        status_code=resp.status_code,
+        headers={
+            "Content-Type": content_type,
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+async def baixar_pdf_manifesto(
+    orgao: str,
+    codigo_barras: str,
+    credenciais: Tuple[Any, ...],
+    baixar: Callable[[bool], Awaitable[httpx.Response]],
+) -> Response:
+    """
+    Entrega o PDF do manifesto: do cache em disco quando possível, senão
+    baixando do órgão com baixar(stream) e gravando a cópia no cache.
+    """
+
+    arquivo = await abrir_pdf_em_cache(orgao, codigo_barras, credenciais)
+
+    if arquivo is not None:
+        logger.info(
+            "[DOWNLOAD PDF] PDF servido do cache | orgao=%s | codigo_barras=%s",
+            orgao,
+            codigo_barras,
+        )
+        return resposta_pdf_em_cache(arquivo, codigo_barras)
+
+    resp = await baixar(DOWNLOAD_PDF_STREAMING)
+
+    gravacao = None
+
+    if resp.status_code == 200:
+        gravacao = await iniciar_gravacao_pdf(orgao, codigo_barras, credenciais, _tamanho_upstream(resp))
+
+    if not DOWNLOAD_PDF_STREAMING:
+        return await resposta_download_pdf(resp, codigo_barras, gravacao)
+
+    return await resposta_download_pdf_streaming(resp, codigo_barras, gravacao)
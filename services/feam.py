@@ -1,9 +1,35 @@
-import requests
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+import httpx
+from bs4 import BeautifulSoup
 from fastapi import HTTPException
+from lxml import etree
 from pydantic import BaseModel
 
+from services.cache_tokens import executar_com_token, obter_token
+from services.clientes_http import executar_sincrono, requisitar_async
+from services.concorrencia import LimiteConcorrencia, coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import tamanho_payload
+from services.login_controller import estrategias_login, login_com_fallback_async, login_controller_servlet_async
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, SessaoExpirada, verificar_sessao_valida
+from services.rastreamento import rastrear
+
 FEAM_BASE_URL = "https://mtr.meioambiente.mg.gov.br/api"
 
+logger = logging.getLogger("feam")
+logger.setLevel(logging.INFO)
+
 
 # =========================
 # Schema de entrada FEAM
@@ -32,12 +58,14 @@ class AtualizarItensDMRRequest(BaseModel):
     dataInicial: str  # formato: DD/MM/YYYY
     dataFinal: str    # formato: DD/MM/YYYY
     JSESSIONID: str
+    incluirHtml: bool = False  # devolve também o HTML bruto em "conteudo"
 
 
 # =========================
 # Token FEAM
 # =========================
-def gerar_token_feam(cnpj: str, senha: str, unidade: int):
+@rastrear("token FEAM")
+async def _solicitar_token_feam(cnpj: str, senha: str, unidade: int):
     url = f"{FEAM_BASE_URL}/gettoken"
 
     payload = {
@@ -49,7 +77,7 @@ def gerar_token_feam(cnpj: str, senha: str, unidade: int):
 
     headers = {"Content-Type": "application/json"}
 
-    response = requests.post(url, json=payload, headers=headers, timeout=30)
+    response = await requisitar_async("POST", url, json=payload, headers=headers, timeout=30)
 
     if response.status_code != 200:
         raise HTTPException(
@@ -68,16 +96,45 @@ def gerar_token_feam(cnpj: str, senha: str, unidade: int):
     return data["token"], data["chave"]
 
 
+async def gerar_token_feam_async(cnpj: str, senha: str, unidade: int):
+    return await obter_token(
+        ("FEAM", cnpj, unidade, senha),
+        lambda: _solicitar_token_feam(cnpj, senha, unidade),
+    )
+
+
+def gerar_token_feam(cnpj: str, senha: str, unidade: int):
+    return executar_sincrono(gerar_token_feam_async(cnpj, senha, unidade))
+
+
 # =========================
 # Consulta Manifesto FEAM
 # =========================
+@coalescer("FEAM", "retorna_manifesto")
+async def retorna_manifesto_feam_async(
+    cnpj: str,
+    senha: str,
+    unidade: int,
+    codigo_barras: str
+):
+    return await executar_com_token(
+        ("FEAM", cnpj, unidade, senha),
+        lambda: _solicitar_token_feam(cnpj, senha, unidade),
+        lambda token_chave: _consultar_manifesto_feam(token_chave, codigo_barras),
+    )
+
+
 def retorna_manifesto_feam(
     cnpj: str,
     senha: str,
     unidade: int,
     codigo_barras: str
 ):
-    token, chave = gerar_token_feam(cnpj, senha, unidade)
+    return executar_sincrono(retorna_manifesto_feam_async(cnpj, senha, unidade, codigo_barras))
+
+
+async def _consultar_manifesto_feam(token_chave, codigo_barras: str):
+    token, chave = token_chave
 
     url = f"{FEAM_BASE_URL}/retornaManifesto/{codigo_barras}"
 
@@ -86,7 +143,10 @@ def retorna_manifesto_feam(
         "chave_feam": chave
     }
 
-    response = requests.post(url, headers=headers, timeout=30)
+    response = await requisitar_async("POST", url, headers=headers, timeout=30)
+
+    if response.status_code in (401, 403):
+        raise SessaoExpirada(f"HTTP {response.status_code}")
 
     if response.status_code != 200:
         raise HTTPException(
@@ -94,13 +154,13 @@ def retorna_manifesto_feam(
             detail="Erro ao consultar manifesto na FEAM"
         )
 
-    return response.json()
+    return json_bruto(response, "FEAM")
 
 
 # =========================
 # Serviço de cookies FEAM
 # =========================
-def get_cookies_feam(
+async def _get_cookies_feam_selenium_async(
     cpf: str,
     cnpj: str,
     unidade: str,
@@ -112,8 +172,8 @@ def get_cookies_feam(
     )
 
     try:
-        response = requests.get(url, timeout=60)
-    except requests.RequestException as e:
+        response = await requisitar_async("GET", url, timeout=60)
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro ao comunicar com serviço Selenium FEAM: {str(e)}"
@@ -143,7 +203,12 @@ def get_cookies_feam(
             detail="JSESSIONID não encontrado nos cookies FEAM"
         )
 
+    return _cookies_feam(cookies_map)
+
+
+def _cookies_feam(cookies_map: Dict[str, str]) -> Dict[str, Any]:
     return {
+        **cookies_map,
         "JSESSIONID": cookies_map.get("JSESSIONID"),
         "_ga": cookies_map.get("_ga"),
         "_gid": cookies_map.get("_gid"),
@@ -152,6 +217,47 @@ def get_cookies_feam(
     }
 
 
+async def _get_cookies_feam_http_async(
+    cpf: str,
+    cnpj: str,
+    unidade: str,
+    senha: str
+):
+    cookies = await login_controller_servlet_async(FEAM_CONTROLLER_URL, cnpj, senha, cpf, unidade)
+    return _cookies_feam(cookies)
+
+
+async def get_cookies_feam_async(
+    cpf: str,
+    cnpj: str,
+    unidade: str,
+    senha: str
+):
+    """
+    Cookies de sessão da FEAM (JSESSIONID para as rotas de DMR).
+
+    Tenta o login direto no ControllerServlet e, se a sessão não se
+    confirmar, usa o serviço Selenium.
+    """
+
+    return await login_com_fallback_async(
+        "FEAM",
+        estrategias_login(
+            lambda: _get_cookies_feam_http_async(cpf, cnpj, unidade, senha),
+            lambda: _get_cookies_feam_selenium_async(cpf, cnpj, unidade, senha),
+        ),
+    )
+
+
+def get_cookies_feam(
+    cpf: str,
+    cnpj: str,
+    unidade: str,
+    senha: str
+):
+    return executar_sincrono(get_cookies_feam_async(cpf, cnpj, unidade, senha))
+
+
 FEAM_DMR_URL = (
     "https://mtr.meioambiente.mg.gov.br/"
     "ControllerServlet?acao=buscaResiduosDeclaracaoNovo"
@@ -160,12 +266,13 @@ FEAM_DMR_URL = (
 # =========================
 # Atualizar Itens DMR
 # =========================
-def atualizar_itens_dmr(
+async def atualizar_itens_dmr_async(
     cod_declarante: str,
     id_declaracao: str,
     data_inicial: str,
     data_final: str,
-    jsessionid: str
+    jsessionid: str,
+    incluir_html: bool = False,
 ):
     headers = {
         "Cookie": f"JSESSIONID={jsessionid}"
@@ -180,13 +287,14 @@ def atualizar_itens_dmr(
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             FEAM_DMR_URL,
             headers=headers,
             data=payload,
             timeout=60
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com FEAM (DMR): {str(e)}"
@@ -198,18 +306,32 @@ def atualizar_itens_dmr(
             detail="Erro ao buscar resíduos da DMR na FEAM"
         )
 
-    # FEAM retorna HTML/texto
-    return {
+    # FEAM retorna HTML/texto; as linhas vão já no formato de parse_dmr_page.
+    residuos = await parse_residuos_dmr_async(response.text)
+
+    resultado = {
         "status_code": response.status_code,
-        "conteudo": response.text
+        "total": len(residuos),
+        "residuos": residuos,
     }
 
-import time
-import json
-from typing import Any, Dict, Optional
+    if incluir_html:
+        resultado["conteudo"] = response.text
+
+    return resultado
 
-import requests
-from requests.adapters import HTTPAdapter, Retry
+
+def atualizar_itens_dmr(
+    cod_declarante: str,
+    id_declaracao: str,
+    data_inicial: str,
+    data_final: str,
+    jsessionid: str,
+    incluir_html: bool = False,
+):
+    return executar_sincrono(
+        atualizar_itens_dmr_async(cod_declarante, id_declaracao, data_inicial, data_final, jsessionid, incluir_html)
+    )
 
 
 BASE_URL_LISTA_DMRS = (
@@ -217,26 +339,10 @@ BASE_URL_LISTA_DMRS = (
     "br/com/brdti/mtr/controller/JqueryDatatablePluginDemo.java"
 )
 
-# =========================
-# Session com retries
-# =========================
-def _session_with_retries() -> requests.Session:
-    session = requests.Session()
-
-    retries = Retry(
-        total=5,
-        backoff_factor=0.6,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"],
-        raise_on_status=False,
-    )
-
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-
-    return session
-
+# Listagem completa: linhas por página pedida à FEAM e páginas buscadas
+# ao mesmo tempo (por listagem; o bulkhead da FEAM continua valendo).
+FEAM_DMR_PAGINA_TAMANHO = int(os.getenv("FEAM_DMR_PAGINA_TAMANHO", "100"))
+FEAM_DMR_LISTAR_CONCORRENCIA = int(os.getenv("FEAM_DMR_LISTAR_CONCORRENCIA", "4"))
 
 # =========================
 # Schema de entrada
@@ -251,10 +357,18 @@ class ListarDMRRequest(BaseModel):
     tabela: str = "DMR"
 
 
+class ListarTodasDMRRequest(BaseModel):
+    JSESSIONID: str
+    iDisplayLength: int = FEAM_DMR_PAGINA_TAMANHO
+    sSearch: str = ""
+    iColumns: int = 7
+    tabela: str = "DMR"
+
+
 # =========================
 # Listar DMR (DataTable)
 # =========================
-def listar_dmrs(
+async def listar_dmrs_async(
     jsessionid: str,
     i_display_start: int,
     i_display_length: int,
@@ -280,16 +394,15 @@ def listar_dmrs(
         "JSESSIONID": jsessionid
     }
 
-    session = _session_with_retries()
-
     try:
-        resp = session.get(
+        resp = await requisitar_async(
+            "GET",
             BASE_URL_LISTA_DMRS,
             params=params,
             cookies=cookies,
             timeout=timeout,
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com FEAM (listar DMR): {str(e)}"
@@ -314,16 +427,139 @@ def listar_dmrs(
                 detail=f"Resposta FEAM não-JSON: {txt[:800]}"
             )
 
-import re
-import time
-import json
-from typing import Any, Dict, List, Optional, Tuple, Union
 
-import requests
-from requests.adapters import HTTPAdapter, Retry
-from bs4 import BeautifulSoup
-from fastapi import HTTPException
-from pydantic import BaseModel
+def listar_dmrs(
+    jsessionid: str,
+    i_display_start: int,
+    i_display_length: int,
+    s_search: str,
+    i_columns: int,
+    s_echo: int,
+    tabela: str,
+    timeout: int = 30,
+) -> Dict[str, Any]:
+    return executar_sincrono(
+        listar_dmrs_async(
+            jsessionid,
+            i_display_start,
+            i_display_length,
+            s_search,
+            i_columns,
+            s_echo,
+            tabela,
+            timeout,
+        )
+    )
+
+
+def _total_registros(pagina: Dict[str, Any]) -> int:
+    # Com sSearch o DataTables informa o total filtrado em iTotalDisplayRecords.
+    for campo in ("iTotalDisplayRecords", "iTotalRecords"):
+        try:
+            return int(pagina[campo])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    return len(pagina.get("aaData") or [])
+
+
+async def listar_todas_dmrs_async(
+    jsessionid: str,
+    s_search: str = "",
+    i_columns: int = 7,
+    tabela: str = "DMR",
+    i_display_length: int = FEAM_DMR_PAGINA_TAMANHO,
+    concorrencia: int = FEAM_DMR_LISTAR_CONCORRENCIA,
+    timeout: int = 30,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Percorre todas as páginas da listagem de DMR com o mesmo JSESSIONID.
+
+    Gera eventos na ordem em que as páginas chegam:
+        {"tipo": "inicio", "total": ..., "paginas": ...}
+        {"tipo": "linha", "posicao": ..., "dados": [...]}
+        {"tipo": "erro", "iDisplayStart": ..., "status_code": ..., "erro": ...}
+        {"tipo": "fim", "linhas": ..., "erros": ...}
+
+    A primeira página é lida antes do evento "inicio": se ela falhar, a
+    HTTPException sobe normalmente. As demais são buscadas em paralelo,
+    no máximo `concorrencia` por vez; a falha de uma página vira um
+    evento "erro" e não interrompe as outras.
+    """
+
+    tamanho = max(1, i_display_length)
+
+    async def pagina(inicio: int, echo: int) -> Dict[str, Any]:
+        return await listar_dmrs_async(
+            jsessionid=jsessionid,
+            i_display_start=inicio,
+            i_display_length=tamanho,
+            s_search=s_search,
+            i_columns=i_columns,
+            s_echo=echo,
+            tabela=tabela,
+            timeout=timeout,
+        )
+
+    primeira = await pagina(0, 1)
+    total = _total_registros(primeira)
+    inicios = list(range(tamanho, total, tamanho))
+
+    yield {"tipo": "inicio", "total": total, "paginas": len(inicios) + 1}
+
+    linhas = 0
+    erros = 0
+
+    for posicao, linha in enumerate(primeira.get("aaData") or []):
+        linhas += 1
+        yield {"tipo": "linha", "posicao": posicao, "dados": linha}
+
+    # Janela deslizante: no máximo `concorrencia` páginas em andamento e
+    # em memória, mesmo que o cliente consuma o stream devagar.
+    pendentes: Dict[asyncio.Task, int] = {}
+    proximas = iter(enumerate(inicios, start=2))
+
+    def agendar() -> None:
+        while len(pendentes) < max(1, concorrencia):
+            try:
+                echo, inicio = next(proximas)
+            except StopIteration:
+                return
+            pendentes[asyncio.ensure_future(pagina(inicio, echo))] = inicio
+
+    agendar()
+
+    try:
+        while pendentes:
+            prontas, _ = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+
+            for tarefa in prontas:
+                inicio = pendentes.pop(tarefa)
+
+                try:
+                    dados = tarefa.result()
+                except HTTPException as error:
+                    erros += 1
+                    yield {
+                        "tipo": "erro",
+                        "iDisplayStart": inicio,
+                        "status_code": error.status_code,
+                        "erro": error.detail,
+                    }
+                    continue
+
+                for deslocamento, linha in enumerate(dados.get("aaData") or []):
+                    linhas += 1
+                    yield {"tipo": "linha", "posicao": inicio + deslocamento, "dados": linha}
+
+            agendar()
+
+    finally:
+        # Cliente desconectou: não deixa páginas sendo buscadas à toa.
+        for tarefa in pendentes:
+            tarefa.cancel()
+
+    yield {"tipo": "fim", "linhas": linhas, "erros": erros}
 
 
 #==========================================================================================
@@ -332,6 +568,20 @@ from pydantic import BaseModel
 
 BASE_URL_DECLARACAO = "https://mtr.meioambiente.mg.gov.br/ControllerServlet"
 
+# Processos que fazem o parse do HTML das declarações fora do event loop.
+# 0 usa uma thread (asyncio.to_thread) em vez de processos.
+FEAM_DMR_PARSE_WORKERS = int(os.getenv("FEAM_DMR_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Lote de declarações: máximo por requisição e downloads simultâneos.
+FEAM_DMR_LOTE_MAX = int(os.getenv("FEAM_DMR_LOTE_MAX", "500"))
+FEAM_DMR_LOTE_CONCORRENCIA = int(os.getenv("FEAM_DMR_LOTE_CONCORRENCIA", "6"))
+
+# Motor do parse da página da declaração: "lxml" (XPath pré-compilado)
+# ou "bs4" (BeautifulSoup, implementação original).
+PARSER_LXML = "lxml"
+PARSER_BS4 = "bs4"
+FEAM_DMR_PARSER = os.getenv("FEAM_DMR_PARSER", PARSER_LXML).strip().lower()
+
 
 # =====================
 # Utils de parsing
@@ -360,7 +610,31 @@ def _ptbr_to_float(s: str) -> Optional[float]:
 # =====================
 # Parse HTML da DMR
 # =====================
-def parse_dmr_page(html: str) -> Dict[str, Any]:
+def _residuos_bs4(linhas) -> List[Dict[str, Any]]:
+    residuos: List[Dict[str, Any]] = []
+
+    for tr in linhas:
+        tds = tr.find_all('td')
+        if len(tds) < 8:
+            continue
+
+        residuos.append({
+            "destinador": _text(tds[0]),
+            "denominacaoResiduos": _text(tds[1]),
+            "classe": _text(tds[2]),
+            "quantidadeDestinada": _ptbr_to_float(_text(tds[3])),
+            "quantidadeGerada": _ptbr_to_float(
+                tds[4].find('input').get('value') if tds[4].find('input') else ''
+            ),
+            "quantidadeArmazenada": _ptbr_to_float(_text(tds[5])),
+            "unidade": _text(tds[6]),
+            "tecnologia": _text(tds[7]),
+        })
+
+    return residuos
+
+
+def _parse_dmr_page_bs4(html: str) -> Dict[str, Any]:
     soup = BeautifulSoup(html, 'lxml')
 
     header = {
@@ -387,27 +661,8 @@ def parse_dmr_page(html: str) -> Dict[str, Any]:
         "responsavelLegal": _find_input_value(soup, 'txtNomeRespLegal') or "",
     }
 
-    residuos: List[Dict[str, Any]] = []
     tb = soup.select_one('#tbResiduo')
-
-    if tb:
-        for tr in tb.find_all('tr'):
-            tds = tr.find_all('td')
-            if len(tds) < 8:
-                continue
-
-            residuos.append({
-                "destinador": _text(tds[0]),
-                "denominacaoResiduos": _text(tds[1]),
-                "classe": _text(tds[2]),
-                "quantidadeDestinada": _ptbr_to_float(_text(tds[3])),
-                "quantidadeGerada": _ptbr_to_float(
-                    tds[4].find('input').get('value') if tds[4].find('input') else ''
-                ),
-                "quantidadeArmazenada": _ptbr_to_float(_text(tds[5])),
-                "unidade": _text(tds[6]),
-                "tecnologia": _text(tds[7]),
-            })
+    residuos = _residuos_bs4(tb.find_all('tr')) if tb else []
 
     observacoes = _find_input_value(soup, 'txtObservacoes') or ''
 
@@ -420,20 +675,169 @@ def parse_dmr_page(html: str) -> Dict[str, Any]:
 
 
 # =====================
-# Session com retries
+# Parse HTML da DMR com lxml
 # =====================
-def _session_with_retries() -> requests.Session:
-    s = requests.Session()
-    retries = Retry(
-        total=5,
-        backoff_factor=0.6,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"],
-        raise_on_status=False,
-    )
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    s.mount("http://", HTTPAdapter(max_retries=retries))
-    return s
+# Mesmo resultado de _parse_dmr_page_bs4, sem montar a árvore do
+# BeautifulSoup: as expressões são compiladas uma vez e só os campos do
+# cabeçalho e as linhas de #tbResiduo são visitados.
+
+_IDS_CAMPOS_DMR = frozenset((
+    "lblSemestre",
+    "spanPerfil",
+    "txtDataInicial",
+    "txtDataFinal",
+    "idLao",
+    "idAtividade",
+    "txtDataValidade",
+    "txtNomeResp",
+    "txtCargoResp",
+    "txtNomeRespLegal",
+    "txtObservacoes",
+))
+
+# Filtrar os ids em Python sai mais barato que um predicado com vários "or".
+_XPATH_ELEMENTOS_COM_ID = etree.XPath("//*[@id]")
+_XPATH_LINHAS_RESIDUO = etree.XPath('(//*[@id="tbResiduo"])[1]//tr')
+_XPATH_LINHAS = etree.XPath("//tr")
+_XPATH_CELULAS = etree.XPath(".//td")
+_XPATH_VALOR_INPUT = etree.XPath("(.//input)[1]/@value", smart_strings=False)
+
+# get_text do BeautifulSoup ignora comentários e o conteúdo de script/style.
+_XPATH_TEXTOS = etree.XPath(".//text()[not(ancestor::script or ancestor::style)]", smart_strings=False)
+
+_PARSER_HTML = etree.HTMLParser(encoding="utf-8")
+
+
+def _text_lxml(el) -> str:
+    # Equivalente a _text: get_text(strip=True) junta os trechos aparados
+    # sem separador; depois os espaços são colapsados.
+    if el is None:
+        return ""
+    return " ".join("".join(t.strip() for t in _XPATH_TEXTOS(el)).split())
+
+
+def _html_lxml(html: str):
+    return etree.fromstring(html.encode("utf-8"), _PARSER_HTML) if html.strip() else None
+
+
+def _residuos_lxml(linhas) -> List[Dict[str, Any]]:
+    residuos: List[Dict[str, Any]] = []
+
+    for tr in linhas:
+        tds = _XPATH_CELULAS(tr)
+        if len(tds) < 8:
+            continue
+
+        quantidade_gerada = _XPATH_VALOR_INPUT(tds[4])
+
+        residuos.append({
+            "destinador": _text_lxml(tds[0]),
+            "denominacaoResiduos": _text_lxml(tds[1]),
+            "classe": _text_lxml(tds[2]),
+            "quantidadeDestinada": _ptbr_to_float(_text_lxml(tds[3])),
+            "quantidadeGerada": _ptbr_to_float(quantidade_gerada[0] if quantidade_gerada else ''),
+            "quantidadeArmazenada": _ptbr_to_float(_text_lxml(tds[5])),
+            "unidade": _text_lxml(tds[6]),
+            "tecnologia": _text_lxml(tds[7]),
+        })
+
+    return residuos
+
+
+def _parse_dmr_page_lxml(html: str) -> Dict[str, Any]:
+    raiz = _html_lxml(html)
+
+    # Primeira ocorrência de cada id, como o select_one.
+    campos: Dict[str, Any] = {}
+    if raiz is not None:
+        for el in _XPATH_ELEMENTOS_COM_ID(raiz):
+            id_ = el.get("id")
+            if id_ in _IDS_CAMPOS_DMR:
+                campos.setdefault(id_, el)
+
+    def valor(input_id: str) -> str:
+        el = campos.get(input_id)
+        if el is not None and el.get("value") is not None:
+            return el.get("value").strip()
+        return ""
+
+    header = {
+        "tipoDeclaracao": _text_lxml(campos.get("lblSemestre")) or "DMR",
+        "dataInicial": valor("txtDataInicial"),
+        "dataFinal": valor("txtDataFinal"),
+    }
+
+    dados_gerador = {
+        "declarantePerfil": _text_lxml(campos.get("spanPerfil")),
+        "cnpjRazaoOuCpfNome": "",
+        "telefone": "",
+        "loNumero": valor("idLao"),
+        "endereco": "",
+        "fax": "",
+        "codigoAtividade": valor("idAtividade"),
+        "municipio": "",
+        "estado": "",
+        "dataValidade": valor("txtDataValidade"),
+        "responsavel": valor("txtNomeResp"),
+        "cargoResponsavel": valor("txtCargoResp"),
+        "responsavelLegal": valor("txtNomeRespLegal"),
+    }
+
+    residuos = _residuos_lxml(_XPATH_LINHAS_RESIDUO(raiz)) if raiz is not None else []
+
+    return {
+        "cabecalho": header,
+        "dadosGerador": dados_gerador,
+        "residuos": residuos,
+        "observacoes": valor("txtObservacoes"),
+    }
+
+
+def _parse_residuos_bs4(html: str) -> List[Dict[str, Any]]:
+    soup = BeautifulSoup(html, 'lxml')
+    tb = soup.select_one('#tbResiduo')
+    return _residuos_bs4((tb or soup).find_all('tr'))
+
+
+def _parse_residuos_lxml(html: str) -> List[Dict[str, Any]]:
+    raiz = _html_lxml(html)
+
+    if raiz is None:
+        return []
+
+    return _residuos_lxml(_XPATH_LINHAS_RESIDUO(raiz) or _XPATH_LINHAS(raiz))
+
+
+_PARSERS_DMR = {
+    PARSER_LXML: (_parse_dmr_page_lxml, _parse_residuos_lxml),
+    PARSER_BS4: (_parse_dmr_page_bs4, _parse_residuos_bs4),
+}
+
+
+def _parsers(motor: Optional[str]):
+    motor = motor or FEAM_DMR_PARSER
+
+    try:
+        return _PARSERS_DMR[motor]
+    except KeyError:
+        raise ValueError(f"Motor de parse DMR desconhecido: {motor}") from None
+
+
+def parse_dmr_page(html: str, motor: Optional[str] = None) -> Dict[str, Any]:
+    """Parse da página da declaração com o motor escolhido (FEAM_DMR_PARSER por padrão)."""
+
+    return _parsers(motor)[0](html)
+
+
+def parse_residuos_dmr(html: str, motor: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Linhas de resíduo no formato de parse_dmr_page()["residuos"].
+
+    Aceita a página inteira (usa #tbResiduo) ou só o trecho de linhas
+    devolvido por buscaResiduosDeclaracaoNovo.
+    """
+
+    return _parsers(motor)[1](html)
 
 
 # =====================
@@ -445,10 +849,79 @@ class BuscarDeclaracaoDMRRequest(BaseModel):
     JSESSIONID: str
 
 
+class DeclaracaoDMRItem(BaseModel):
+    idDeclaracao: Union[str, int]
+    condicao: Union[str, int]
+
+
+class BuscarDeclaracoesDMRLoteRequest(BaseModel):
+    JSESSIONID: str
+    declaracoes: List[DeclaracaoDMRItem]
+    stream: bool = False
+
+
+# =====================
+# Parse fora do event loop
+# =====================
+_EXECUTOR_PARSE: Optional[Executor] = None
+_EXECUTOR_PARSE_LOCK = threading.Lock()
+
+
+def _executor_parse() -> Executor:
+    global _EXECUTOR_PARSE
+
+    with _EXECUTOR_PARSE_LOCK:
+        if _EXECUTOR_PARSE is None:
+            # spawn: o processo da API tem threads (loop de fundo, uvicorn),
+            # e fork com threads ativas pode travar o filho.
+            _EXECUTOR_PARSE = ProcessPoolExecutor(
+                max_workers=FEAM_DMR_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        return _EXECUTOR_PARSE
+
+
+def encerrar_executor_parse() -> None:
+    global _EXECUTOR_PARSE
+
+    with _EXECUTOR_PARSE_LOCK:
+        executor, _EXECUTOR_PARSE = _EXECUTOR_PARSE, None
+
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _parse_fora_do_loop(parser: Callable[[str], Any], html: str) -> Any:
+    if FEAM_DMR_PARSE_WORKERS <= 0:
+        return await asyncio.to_thread(parser, html)
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        return await loop.run_in_executor(_executor_parse(), parser, html)
+    except BrokenProcessPool:
+        # Um processo morreu (OOM, por exemplo): recria o pool na próxima
+        # chamada e faz este parse numa thread.
+        logger.warning("[API FEAM] Pool de parse DMR quebrado; recriando")
+        encerrar_executor_parse()
+        return await asyncio.to_thread(parser, html)
+
+
+async def parse_dmr_page_async(html: str) -> Dict[str, Any]:
+    """parse_dmr_page num processo do pool, sem segurar o event loop."""
+
+    return await _parse_fora_do_loop(parse_dmr_page, html)
+
+
+async def parse_residuos_dmr_async(html: str) -> List[Dict[str, Any]]:
+    return await _parse_fora_do_loop(parse_residuos_dmr, html)
+
+
 # =====================
 # Busca + Parse da Declaração
 # =====================
-def buscar_declaracao_dmr(
+async def buscar_declaracao_dmr_async(
     id_declaracao: Union[str, int],
     condicao: Union[str, int],
     jsessionid: str,
@@ -465,17 +938,16 @@ def buscar_declaracao_dmr(
         "JSESSIONID": jsessionid
     }
 
-    session = _session_with_retries()
-
     try:
-        resp = session.get(
+        resp = await requisitar_async(
+            "GET",
             BASE_URL_DECLARACAO,
             params=params,
             cookies=cookies,
             timeout=timeout,
-            allow_redirects=True,
+            follow_redirects=True,
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com FEAM (busca declaração): {str(e)}"
@@ -488,7 +960,86 @@ def buscar_declaracao_dmr(
         )
 
     html = resp.content.decode("utf-8", errors="ignore")
-    return parse_dmr_page(html)
+    return await parse_dmr_page_async(html)
+
+
+def buscar_declaracao_dmr(
+    id_declaracao: Union[str, int],
+    condicao: Union[str, int],
+    jsessionid: str,
+    timeout: int = 30,
+) -> Dict[str, Any]:
+    return executar_sincrono(buscar_declaracao_dmr_async(id_declaracao, condicao, jsessionid, timeout))
+
+
+def validar_lote_declaracoes(declaracoes: List[DeclaracaoDMRItem]) -> None:
+    if not declaracoes:
+        raise HTTPException(
+            status_code=400,
+            detail="Informe ao menos uma declaração.",
+        )
+
+    if len(declaracoes) > FEAM_DMR_LOTE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {FEAM_DMR_LOTE_MAX} declarações por lote.",
+        )
+
+
+async def _buscar_declaracao_item(
+    limite: LimiteConcorrencia,
+    indice: int,
+    item: DeclaracaoDMRItem,
+    jsessionid: str,
+) -> Dict[str, Any]:
+    resultado: Dict[str, Any] = {
+        "indice": indice,
+        "idDeclaracao": item.idDeclaracao,
+        "condicao": item.condicao,
+    }
+
+    async with limite:
+        try:
+            dados = await buscar_declaracao_dmr_async(item.idDeclaracao, item.condicao, jsessionid)
+            return {**resultado, "sucesso": True, "dados": dados}
+        except HTTPException as error:
+            return {**resultado, "sucesso": False, "status_code": error.status_code, "erro": error.detail}
+        except Exception as error:
+            logger.exception(
+                "[API FEAM] Erro inesperado na declaração do lote | idDeclaracao=%s",
+                item.idDeclaracao,
+            )
+            return {**resultado, "sucesso": False, "status_code": 500, "erro": str(error)}
+
+
+async def buscar_declaracoes_dmr_lote_async(
+    jsessionid: str,
+    declaracoes: List[DeclaracaoDMRItem],
+    concorrencia: int = FEAM_DMR_LOTE_CONCORRENCIA,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Busca várias declarações com o mesmo JSESSIONID.
+
+    Os downloads usam o pool keep-alive da FEAM (até `concorrencia` ao
+    mesmo tempo) e o parse roda no pool de processos. Os resultados saem
+    na ordem em que ficam prontos; "indice" aponta a posição no pedido.
+    Uma declaração com erro não interrompe as demais.
+    """
+
+    validar_lote_declaracoes(declaracoes)
+
+    limite = LimiteConcorrencia(concorrencia)
+    tarefas = [
+        asyncio.ensure_future(_buscar_declaracao_item(limite, indice, item, jsessionid))
+        for indice, item in enumerate(declaracoes)
+    ]
+
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            yield await proxima
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
 
 
 
@@ -497,59 +1048,78 @@ def buscar_declaracao_dmr(
 #==========================================================================================
 
 # =====================
-# Busca Transportador
+# Pool de sessões da conta de busca de parceiros
 # =====================
 
-def buscar_transportador_feam(cnpj):
-    print('\n ==== BUSCANDO TRANSPORTADOR FEAM ====== ')
-    
-    cookies = get_cookies_feam('04304532642','39228967000160', '201050', 'T2m@2024')
-    print('cookies', cookies)
-    
-    params = {
-    "acao": "buscaPessoaPorTipo",
-    "cnpj": str(cnpj),
-    "tipoPessoa": str(2),
-    }
-    
-    session = _session_with_retries()
-    timeout: int = 30
-    
+FEAM_CONTROLLER_URL = "https://mtr.meioambiente.mg.gov.br/ControllerServlet"
+
+
+async def _login_parceiros_feam() -> SessaoAutenticada:
+    cookies = await get_cookies_feam_async('04304532642','39228967000160', '201050', 'T2m@2024')
+
+    return SessaoAutenticada(cookies={nome: valor for nome, valor in cookies.items() if valor})
+
+
+_POOL_PARCEIROS_FEAM = PoolSessoes("FEAM", _login_parceiros_feam)
+
+
+async def buscar_parceiro_feam_async(
+    sessao: SessaoAutenticada,
+    params: Dict[str, str],
+    timeout: int = 30,
+) -> Dict[str, Any]:
     try:
-        resp = session.post(
-            'https://mtr.meioambiente.mg.gov.br/ControllerServlet',
+        resp = await requisitar_async(
+            "POST",
+            FEAM_CONTROLLER_URL,
             params=params,
-            cookies=cookies,
+            cookies=sessao.cookies,
             timeout=timeout,
-            allow_redirects=True,
+            follow_redirects=True,
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
-            detail=f"Erro de comunicação com FEAM (busca declaração): {str(e)}"
+            detail=f"Erro de comunicação com FEAM (busca parceiro): {str(e)}"
         )
 
+    verificar_sessao_valida(resp)
+
     if resp.status_code != 200:
         raise HTTPException(
             status_code=502,
             detail=f"Erro FEAM HTTP {resp.status_code}"
         )
-        
-    print(resp.json())
+
     return resp.json()
-    print('======================================= ')
 
-          
+
+# =====================
+# Busca Transportador
+# =====================
+
+async def buscar_transportador_feam_async(cnpj):
+    params = {
+    "acao": "buscaPessoaPorTipo",
+    "cnpj": str(cnpj),
+    "tipoPessoa": str(2),
+    }
+
+    r = await _POOL_PARCEIROS_FEAM.executar(lambda sessao: buscar_parceiro_feam_async(sessao, params))
+
+    logger.debug("[FEAM] Busca de transportador concluída | %s", tamanho_payload(r))
+    return r
+
+
+def buscar_transportador_feam(cnpj):
+    return executar_sincrono(buscar_transportador_feam_async(cnpj))
+
+
 # =====================
 # Busca Armazenador
 # =====================
 
-def buscar_armazenador_feam(cnpj):
-    print('\n ==== BUSCANDO ARMAZENADOR FEAM ====== ')
-    
-    cookies = get_cookies_feam('04304532642','39228967000160', '201050', 'T2m@2024')
-    print('cookies', cookies)
-    
+async def buscar_armazenador_feam_async(cnpj):
     params = {
     "acao": "buscaPessoaPorTipo",
     "cnpj": str(cnpj),
@@ -557,76 +1127,35 @@ def buscar_armazenador_feam(cnpj):
     "codigoUnidade": "",
     "armazenador": "S"
     }
-    
-    session = _session_with_retries()
-    timeout: int = 30
-    
-    try:
-        resp = session.post(
-            'https://mtr.meioambiente.mg.gov.br/ControllerServlet',
-            params=params,
-            cookies=cookies,
-            timeout=timeout,
-            allow_redirects=True,
-        )
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Erro de comunicação com FEAM (busca declaração): {str(e)}"
-        )
 
-    if resp.status_code != 200:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Erro FEAM HTTP {resp.status_code}"
-        )
-        
-    print(resp.json())
-    print('===================================== ')
-    return resp.json()
+    r = await _POOL_PARCEIROS_FEAM.executar(lambda sessao: buscar_parceiro_feam_async(sessao, params))
+
+    logger.debug("[FEAM] Busca de armazenador concluída | %s", tamanho_payload(r))
+    return r
+
+
+def buscar_armazenador_feam(cnpj):
+    return executar_sincrono(buscar_armazenador_feam_async(cnpj))
 # =====================
 # Busca Destino
 # =====================
 
-def buscar_destino_feam(cnpj):
-    print('\n ==== BUSCANDO DESTINO FEAM ====== ')
-    
-    cookies = get_cookies_feam('04304532642','39228967000160', '201050', 'T2m@2024')
-    print('cookies', cookies)
-    
+async def buscar_destino_feam_async(cnpj):
     params = {
     "acao": "buscaPessoaPorTipo",
     "cnpj": str(cnpj),
     "tipoPessoa": str(4),
     }
-    
-    session = _session_with_retries()
-    timeout: int = 30
-    
-    try:
-        resp = session.post(
-            'https://mtr.meioambiente.mg.gov.br/ControllerServlet',
-            params=params,
-            cookies=cookies,
-            timeout=timeout,
-            allow_redirects=True,
-        )
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Erro de comunicação com FEAM (busca declaração): {str(e)}"
-        )
 
-    if resp.status_code != 200:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Erro FEAM HTTP {resp.status_code}"
-        )
-        
-    print(resp.json())
-    print('================================= ')
-    return resp.json()
-            
+    r = await _POOL_PARCEIROS_FEAM.executar(lambda sessao: buscar_parceiro_feam_async(sessao, params))
+
+    logger.debug("[FEAM] Busca de destino concluída | %s", tamanho_payload(r))
+    return r
+
+
+def buscar_destino_feam(cnpj):
+    return executar_sincrono(buscar_destino_feam_async(cnpj))
+
 
 #buscar_transportador_feam('39228967000160')
 #buscar_armazenador_feam('39228967000160')
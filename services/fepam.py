@@ -1,8 +1,27 @@
+import logging
+import httpx
 import requests
 from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import Dict, Tuple, Optional, Union, Any
 
+from services.clientes_http import (
+    cookies_com_sessao,
+    cookies_resposta,
+    executar_sincrono,
+    requisitar_async,
+    sessao_com_cookies,
+)
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import tamanho_payload
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, verificar_sessao_valida
+from services.rastreamento import rastrear
+
+
+logger = logging.getLogger("fepam")
+logger.setLevel(logging.INFO)
+
 FEPAM_URL = "https://mtr.fepam.rs.gov.br/mtrservice/retornaManifesto"
 
 
@@ -19,7 +38,8 @@ class ConsultaFepamManifestoRequest(BaseModel):
 # =========================
 # Chamada à API FEPAM
 # =========================
-def retorna_manifesto_fepam(
+@coalescer("FEPAM", "retorna_manifesto")
+async def retorna_manifesto_fepam_async(
     cnpj: str,
     cpf: str,
     senha: str,
@@ -39,13 +59,14 @@ def retorna_manifesto_fepam(
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             FEPAM_URL,
             json=payload,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com a FEPAM: {str(e)}"
@@ -57,19 +78,25 @@ def retorna_manifesto_fepam(
             detail="Erro ao consultar manifesto na FEPAM"
         )
 
-    return response.json()
+    return json_bruto(response, "FEPAM")
 
 
-import requests
-from fastapi import HTTPException
-from typing import Optional, Tuple, Dict
+def retorna_manifesto_fepam(
+    cnpj: str,
+    cpf: str,
+    senha: str,
+    manifesto_codigo: str
+):
+    return executar_sincrono(retorna_manifesto_fepam_async(cnpj, cpf, senha, manifesto_codigo))
 
-def autenticar_fepam_e_obter_sessao(
+
+@rastrear("login FEPAM")
+async def autenticar_fepam_async(
     pessoa_codigo: Optional[str],
     cnpj: str,
     cpf: str,
     senha: str
-) -> Tuple[requests.Session, Dict[str, str]]:
+) -> Dict[str, str]:
     url = "https://mtr.fepam.rs.gov.br/ControllerServlet"
 
     payload = {
@@ -89,11 +116,9 @@ def autenticar_fepam_e_obter_sessao(
         "Accept": "application/json, text/plain, */*",
     }
 
-    session = requests.Session()
-
     try:
-        resp = session.post(url, data=payload, headers=headers, timeout=30)
-    except requests.RequestException as e:
+        resp = await requisitar_async("POST", url, data=payload, headers=headers, timeout=30)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"Erro de comunicação com a FEPAM (login): {e}")
 
     if resp.status_code != 200:
@@ -115,8 +140,8 @@ def autenticar_fepam_e_obter_sessao(
         # Por enquanto, só não vamos considerar sucesso.
         raise HTTPException(status_code=401, detail=f"Falha na autenticação FEPAM: {data}")
 
-    # Cookies persistidos no session (inclui JSESSIONID quando existir)
-    cookies_dict = session.cookies.get_dict()
+    # Cookies da resposta (inclui JSESSIONID quando existir)
+    cookies_dict = cookies_resposta(resp)
 
     if not cookies_dict:
         # Às vezes vem em Set-Cookie e o Session pega; se não veio nada, vale inspecionar headers
@@ -125,27 +150,28 @@ def autenticar_fepam_e_obter_sessao(
             detail=f"Autenticou mas não capturou cookies. Set-Cookie={resp.headers.get('Set-Cookie')}"
         )
 
-    return session, cookies_dict
+    return cookies_dict
 
-def buscar_parceiro_fepam(
+
+def autenticar_fepam_e_obter_sessao(
+    pessoa_codigo: Optional[str],
+    cnpj: str,
+    cpf: str,
+    senha: str
+) -> Tuple[requests.Session, Dict[str, str]]:
+    cookies = executar_sincrono(autenticar_fepam_async(pessoa_codigo, cnpj, cpf, senha))
+    return sessao_com_cookies(cookies), cookies
+
+
+async def buscar_parceiro_fepam_async(
     cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
     cnpj: str,
     armazenador: bool = False,
     tipo_pessoa: str = "2",
     codigo_unidade: str = "armazenador",
     timeout: int = 30,
-    session: Optional[requests.Session] = None,
 ) -> Dict[str, Any]:
 
-    # Reaproveita session se você passar uma (recomendado).
-    s = session or requests.Session()
-
-    # Injeta cookies recebidos
-    if isinstance(cookies, requests.cookies.RequestsCookieJar):
-        s.cookies.update(cookies)
-    else:
-        s.cookies.update(cookies)
-
     headers = {
         "Accept": "*/*",
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -160,24 +186,32 @@ def buscar_parceiro_fepam(
 
     # Form data na ordem (pra ficar bem próximo do Network do Chrome)
     if armazenador == True:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-            ("codigoUnidade", ""),
-            ("armazenador", "S"),  # esse "S" solto do payload
-        ]
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+            "codigoUnidade": "",
+            "armazenador": "S",  # esse "S" solto do payload
+        }
     else:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-        ]
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+        }
 
     BASE_URL = "https://mtr.fepam.rs.gov.br/ControllerServlet"
 
 
-    resp = s.post(BASE_URL, headers=headers, data=form_fields, timeout=timeout)
+    resp = await requisitar_async(
+        "POST",
+        BASE_URL,
+        cookies=cookies,
+        headers=headers,
+        data=form_fields,
+        timeout=timeout,
+    )
+    verificar_sessao_valida(resp)
     resp.raise_for_status()
 
     # A resposta diz ser application/json;charset=utf-8
@@ -192,112 +226,113 @@ def buscar_parceiro_fepam(
             "text": resp.text[:2000],
         }
 
+
+def buscar_parceiro_fepam(
+    cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
+    cnpj: str,
+    armazenador: bool = False,
+    tipo_pessoa: str = "2",
+    codigo_unidade: str = "armazenador",
+    timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
+    return executar_sincrono(
+        buscar_parceiro_fepam_async(
+            cookies=cookies_com_sessao(cookies, session),
+            cnpj=cnpj,
+            armazenador=armazenador,
+            tipo_pessoa=tipo_pessoa,
+            codigo_unidade=codigo_unidade,
+            timeout=timeout,
+        )
+    )
+
 # =========================
-# BUSCAR TRANSPORTADOR
+# POOL DE SESSÕES (conta de busca de parceiros)
 # =========================
 
-def buscar_transportador_fepam(cnpj):
-    print('\n===================BUSCANDO TRANSPORTADOR ========\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    session, cookies = autenticar_fepam_e_obter_sessao(
+async def _login_parceiros_fepam() -> SessaoAutenticada:
+    cookies = await autenticar_fepam_async(
         cnpj="39228967000160",
         senha="T2m@2024",
         cpf="04304532642",
         pessoa_codigo=None
     )
-    print('\n-------------------Cookies capturados --------------')
-    print('cookies', cookies)
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('---------------------------------------------------\n')
-    
+
     cookies_login = {
     "JSESSIONID": cookies.get('JSESSIONID'),
     }
-    
-    r = buscar_parceiro_fepam(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="2",
-    )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
 
-    return r
+    return SessaoAutenticada(cookies=cookies_login)
+
+
+_POOL_PARCEIROS_FEPAM = PoolSessoes("FEPAM", _login_parceiros_fepam)
 
 
 # =========================
 # BUSCAR TRANSPORTADOR
 # =========================
 
-def buscar_armazenador_fepam(cnpj):
-    print('\n===================BUSCANDO ARMAZENADOR ========\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    session, cookies = autenticar_fepam_e_obter_sessao(
-        cnpj="39228967000160",
-        senha="T2m@2024",
-        cpf="04304532642",
-        pessoa_codigo=None
+async def buscar_transportador_fepam_async(cnpj):
+    r = await _POOL_PARCEIROS_FEPAM.executar(
+        lambda sessao: buscar_parceiro_fepam_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+        )
     )
-    print('\n-------------------Cookies capturados --------------')
-    print('cookies', cookies)
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('---------------------------------------------------\n')
-    
-    cookies_login = {
-    "JSESSIONID": cookies.get('JSESSIONID'),
-    }
-    
-    r = buscar_parceiro_fepam(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="2",
-        armazenador=True
+    logger.debug("[FEPAM] Busca de transportador concluída | %s", tamanho_payload(r))
+
+    return r
+
+
+def buscar_transportador_fepam(cnpj):
+    return executar_sincrono(buscar_transportador_fepam_async(cnpj))
+
+
+# =========================
+# BUSCAR ARMAZENADOR
+# =========================
+
+async def buscar_armazenador_fepam_async(cnpj):
+    r = await _POOL_PARCEIROS_FEPAM.executar(
+        lambda sessao: buscar_parceiro_fepam_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+            armazenador=True,
+        )
     )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[FEPAM] Busca de armazenador concluída | %s", tamanho_payload(r))
 
     return r
 
 
+def buscar_armazenador_fepam(cnpj):
+    return executar_sincrono(buscar_armazenador_fepam_async(cnpj))
+
+
 # =========================
 # BUSCAR Destino
 # =========================
 
-def buscar_destino_fepam(cnpj):
-    print('\n===================BUSCANDO DESTINO ========\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    session, cookies = autenticar_fepam_e_obter_sessao(
-        cnpj="39228967000160",
-        senha="T2m@2024",
-        cpf="04304532642",
-        pessoa_codigo=None
-    )
-    print('\n-------------------Cookies capturados --------------')
-    print('cookies', cookies)
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('---------------------------------------------------\n')
-    
-    cookies_login = {
-    "JSESSIONID": cookies.get('JSESSIONID'),
-    }
-    
-    r = buscar_parceiro_fepam(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="4",
+async def buscar_destino_fepam_async(cnpj):
+    r = await _POOL_PARCEIROS_FEPAM.executar(
+        lambda sessao: buscar_parceiro_fepam_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="4",
+        )
     )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[FEPAM] Busca de destino concluída | %s", tamanho_payload(r))
 
     return r
 
 
+def buscar_destino_fepam(cnpj):
+    return executar_sincrono(buscar_destino_fepam_async(cnpj))
+
+
 
 #buscar_transportador_fepam('19775328000108')
 #buscar_armazenador_fepam('80415771000189')
@@ -0,0 +1,434 @@
+import asyncio
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+from services import codec_json, metricas
+from services.log_payload import MASCARA, chave_sensivel
+
+
+logger = logging.getLogger("gravacao")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Gravação e reprodução do tráfego com os órgãos
+# ==========================================================
+# Com GRAVACAO_UPSTREAM=gravar, cada chamada do cliente compartilhado
+# (requisitar_async) vira um arquivo JSON em GRAVACAO_DIR, com senhas,
+# tokens, cookies e CPF/CNPJ mascarados. Com GRAVACAO_UPSTREAM=reproduzir,
+# as chamadas são respondidas desses arquivos, com a latência gravada,
+# sem acesso à rede (benchmarks, testes de parser).
+#
+# Arquivos: GRAVACAO_DIR/<host>/<operacao>/<hash da requisição>.json.
+# A mesma requisição (já mascarada) sobrescreve o arquivo anterior.
+
+GRAVAR = "gravar"
+REPRODUZIR = "reproduzir"
+
+GRAVACAO_UPSTREAM = os.getenv("GRAVACAO_UPSTREAM", "").strip().lower()
+
+GRAVACAO_DIR = os.getenv("GRAVACAO_DIR", "gravacoes_upstream")
+
+# Multiplica a latência gravada na reprodução (0 responde na hora).
+GRAVACAO_FATOR_LATENCIA = float(os.getenv("GRAVACAO_FATOR_LATENCIA", "1.0"))
+
+# CPF e CNPJ, com ou sem pontuação, fora de números maiores.
+_RE_DOCUMENTO = re.compile(r"(?<!\d)(?:\d{3}\.?\d{3}\.?\d{3}-?\d{2}|\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})(?!\d)")
+_RE_CNPJ_SEGMENTO = re.compile(r"^\d{14}$")
+
+# IMA e INEA levam a senha no path, sempre logo antes do CNPJ:
+# .../{cpf}/{senha}/{cnpj}/... e .../{unidade}/{senha}/{cnpj}.
+_HOSTS_SENHA_NO_CAMINHO = frozenset(("mtr.ima.sc.gov.br", "mtr.inea.rj.gov.br"))
+
+_RE_DIGITO = re.compile(r"\d")
+_RE_BEARER = re.compile(r"(Bearer\s+)\S+", re.IGNORECASE)
+_RE_CAMPO_TEXTO = re.compile(
+    r'("(?:[^"]*(?:senha|password|token|secret)[^"]*|login|cpf|chave|jsessionid)"\s*:\s*)"[^"]*"',
+    re.IGNORECASE,
+)
+
+_HEADERS_SENSIVEIS = frozenset(("authorization", "proxy-authorization", "cookie", "x-tree-relay-key"))
+
+# Recalculados na reprodução (o corpo gravado já está decodificado).
+_HEADERS_DESCARTADOS = frozenset(("content-length", "content-encoding", "transfer-encoding", "connection"))
+
+VAZIO = "vazio"
+JSON = "json"
+FORM = "form"
+TEXTO = "texto"
+BINARIO = "binario"
+
+_TIPOS_TEXTO = ("text/", "html", "xml", "javascript")
+
+_LOCK = threading.Lock()
+
+
+def configurar_gravacao(modo: str, diretorio: Optional[str] = None, fator_latencia: Optional[float] = None) -> None:
+    """Troca o modo em tempo de execução; vale para os clientes criados depois."""
+
+    global GRAVACAO_UPSTREAM, GRAVACAO_DIR, GRAVACAO_FATOR_LATENCIA, _INDICE
+
+    with _LOCK:
+        GRAVACAO_UPSTREAM = (modo or "").strip().lower()
+        if diretorio is not None:
+            GRAVACAO_DIR = diretorio
+        if fator_latencia is not None:
+            GRAVACAO_FATOR_LATENCIA = fator_latencia
+        _INDICE = None
+
+
+def transporte(limites: httpx.Limits) -> Optional[httpx.AsyncBaseTransport]:
+    """Transporte do cliente compartilhado no modo atual (None = padrão do httpx)."""
+
+    if GRAVACAO_UPSTREAM == GRAVAR:
+        return TransporteGravacao(httpx.AsyncHTTPTransport(limits=limites))
+
+    if GRAVACAO_UPSTREAM == REPRODUZIR:
+        return TransporteReproducao()
+
+    if GRAVACAO_UPSTREAM:
+        logger.warning("[GRAVACAO] GRAVACAO_UPSTREAM desconhecido (%s); usando a rede", GRAVACAO_UPSTREAM)
+
+    return None
+
+
+# ==========================================================
+# Máscaras
+# ==========================================================
+
+
+def mascarar_texto(texto: str) -> str:
+    texto = _RE_DOCUMENTO.sub(lambda m: _RE_DIGITO.sub("0", m.group(0)), texto)
+    texto = _RE_BEARER.sub(rf"\1{MASCARA}", texto)
+    return _RE_CAMPO_TEXTO.sub(rf'\1"{MASCARA}"', texto)
+
+
+def mascarar_valor(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        return {
+            chave: MASCARA if item is not None and chave_sensivel(chave) else mascarar_valor(item)
+            for chave, item in valor.items()
+        }
+
+    if isinstance(valor, list):
+        return [mascarar_valor(item) for item in valor]
+
+    if isinstance(valor, str):
+        return mascarar_texto(valor)
+
+    return valor
+
+
+def mascarar_caminho(caminho: str, host: str) -> str:
+    segmentos = caminho.split("/")
+
+    if host in _HOSTS_SENHA_NO_CAMINHO:
+        for indice in range(1, len(segmentos)):
+            if _RE_CNPJ_SEGMENTO.match(segmentos[indice]) and segmentos[indice - 1]:
+                segmentos[indice - 1] = MASCARA
+
+    return mascarar_texto("/".join(segmentos))
+
+
+def _mascarar_pares(pares: List[Tuple[str, str]]) -> List[List[str]]:
+    return [[chave, MASCARA if chave_sensivel(chave) else mascarar_texto(valor)] for chave, valor in pares]
+
+
+def _mascarar_cookie(valor: str) -> str:
+    # Mantém o nome: a reprodução precisa do JSESSIONID para o login passar.
+    nome, _, resto = valor.partition("=")
+    atributos = resto.partition(";")[2]
+    return f"{nome}={MASCARA}" + (f";{atributos}" if atributos else "")
+
+
+def mascarar_headers(headers: httpx.Headers) -> List[List[str]]:
+    mascarados = []
+
+    for chave, valor in headers.multi_items():
+        nome = chave.lower()
+        if nome in _HEADERS_DESCARTADOS:
+            continue
+        if nome == "set-cookie":
+            valor = _mascarar_cookie(valor)
+        elif nome in _HEADERS_SENSIVEIS or chave_sensivel(nome):
+            valor = MASCARA
+        mascarados.append([chave, valor])
+
+    return mascarados
+
+
+def _formato(conteudo: bytes, tipo: str) -> str:
+    tipo = tipo.lower()
+
+    if not conteudo:
+        return VAZIO
+    if "json" in tipo or conteudo[:1] in (b"{", b"["):
+        return JSON
+    if "x-www-form-urlencoded" in tipo:
+        return FORM
+    if any(trecho in tipo for trecho in _TIPOS_TEXTO):
+        return TEXTO
+    if b"\x00" in conteudo[:1024] or conteudo.startswith(b"%PDF"):
+        return BINARIO
+
+    try:
+        conteudo.decode("utf-8")
+    except UnicodeDecodeError:
+        return BINARIO
+    return TEXTO
+
+
+def mascarar_corpo(conteudo: bytes, tipo: str) -> Dict[str, Any]:
+    """
+    Corpo gravável: JSON e formulários campo a campo, texto por expressão
+    regular. Binários (PDF) não são gravados, só o tamanho e o início; na
+    reprodução viram um arquivo do mesmo tamanho.
+    """
+
+    formato = _formato(conteudo, tipo)
+
+    if formato == JSON:
+        try:
+            return {"formato": JSON, "corpo": mascarar_valor(codec_json.loads(conteudo))}
+        except ValueError:
+            formato = TEXTO
+
+    if formato == FORM:
+        pares = parse_qsl(conteudo.decode("utf-8", errors="replace"), keep_blank_values=True)
+        return {"formato": FORM, "corpo": _mascarar_pares(pares)}
+
+    if formato == TEXTO:
+        return {"formato": TEXTO, "corpo": mascarar_texto(conteudo.decode("utf-8", errors="replace"))}
+
+    if formato == BINARIO:
+        return {"formato": BINARIO, "corpo": None, "tamanho": len(conteudo), "inicio": conteudo[:8].decode("latin-1")}
+
+    return {"formato": VAZIO, "corpo": None}
+
+
+def conteudo_gravado(corpo: Dict[str, Any]) -> bytes:
+    """Bytes de um corpo gravado por mascarar_corpo."""
+
+    formato = corpo.get("formato")
+
+    if formato == JSON:
+        return codec_json.dumps(corpo["corpo"])
+    if formato == FORM:
+        return urlencode(corpo["corpo"]).encode("utf-8")
+    if formato == TEXTO:
+        return corpo["corpo"].encode("utf-8")
+    if formato == BINARIO:
+        inicio = corpo.get("inicio", "").encode("latin-1")
+        return inicio + b"0" * max(0, corpo.get("tamanho", 0) - len(inicio))
+
+    return b""
+
+
+# ==========================================================
+# Gravação
+# ==========================================================
+
+
+def _host_original(request: httpx.Request) -> str:
+    # Com UPSTREAM_REMAP a URL aponta para o stub; o Host segue original.
+    return request.headers.get("host", request.url.host).split(":")[0].lower()
+
+
+def _descrever_requisicao(request: httpx.Request) -> Dict[str, Any]:
+    host = _host_original(request)
+
+    return {
+        "metodo": request.method,
+        "host": host,
+        "caminho": mascarar_caminho(request.url.path, host),
+        "query": _mascarar_pares(request.url.params.multi_items()),
+        "operacao": metricas.operacao_da_requisicao(request),
+        "corpo": mascarar_corpo(request.content, request.headers.get("content-type", "")),
+    }
+
+
+def chave_requisicao(descricao: Dict[str, Any]) -> str:
+    bruto = json.dumps(
+        [descricao["metodo"], descricao["host"], descricao["caminho"], descricao["query"], descricao["corpo"]],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(bruto.encode("utf-8")).hexdigest()[:16]
+
+
+def _nome_seguro(valor: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", valor) or "_"
+
+
+def _salvar(registro: Dict[str, Any]) -> str:
+    pasta = os.path.join(GRAVACAO_DIR, _nome_seguro(registro["host"]), _nome_seguro(registro["operacao"]))
+    caminho = os.path.join(pasta, f"{registro['chave']}.json")
+    os.makedirs(pasta, exist_ok=True)
+
+    temporario = f"{caminho}.{threading.get_ident()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(registro, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+    return caminho
+
+
+class TransporteGravacao(httpx.AsyncBaseTransport):
+    """
+    Repassa ao transporte real e grava o par requisição/resposta mascarado.
+    O corpo da resposta é lido inteiro antes de voltar (streams incluídos).
+    """
+
+    def __init__(self, transporte: httpx.AsyncBaseTransport):
+        self._transporte = transporte
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        inicio = time.monotonic()
+
+        resposta = await self._transporte.handle_async_request(request)
+        try:
+            bruto = await resposta.aread()
+        finally:
+            await resposta.aclose()
+
+        duracao = time.monotonic() - inicio
+
+        repassada = httpx.Response(
+            resposta.status_code,
+            headers=resposta.headers,
+            stream=httpx.ByteStream(bruto),
+            extensions=resposta.extensions,
+            request=request,
+        )
+
+        try:
+            # Decodifica gzip/deflate numa cópia; a resposta repassada segue intacta.
+            decodificada = httpx.Response(resposta.status_code, headers=resposta.headers, stream=httpx.ByteStream(bruto))
+            conteudo = decodificada.read()
+
+            descricao = _descrever_requisicao(request)
+            registro = {
+                **descricao,
+                "chave": chave_requisicao(descricao),
+                "gravado_em": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "duracao_segundos": round(duracao, 4),
+                "requisicao_headers": mascarar_headers(request.headers),
+                "resposta": {
+                    "status": resposta.status_code,
+                    "headers": mascarar_headers(resposta.headers),
+                    **mascarar_corpo(conteudo, resposta.headers.get("content-type", "")),
+                },
+            }
+            caminho = await asyncio.to_thread(_salvar, registro)
+            logger.info("[GRAVACAO] Gravado | operacao=%s | status=%s | arquivo=%s", registro["operacao"], resposta.status_code, caminho)
+        except Exception:
+            # Falha ao gravar não derruba a chamada ao órgão.
+            logger.exception("[GRAVACAO] Falha ao gravar | url=%s", request.url.copy_with(query=None))
+
+        return repassada
+
+    async def aclose(self) -> None:
+        await self._transporte.aclose()
+
+
+# ==========================================================
+# Reprodução
+# ==========================================================
+
+
+class _Indice:
+    def __init__(self, diretorio: str):
+        self.por_chave: Dict[str, Dict[str, Any]] = {}
+        self.por_operacao: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        self._proximo: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+        for caminho in sorted(glob.glob(os.path.join(diretorio, "*", "*", "*.json"))):
+            with open(caminho, encoding="utf-8") as arquivo:
+                registro = json.load(arquivo)
+
+            self.por_chave[registro["chave"]] = registro
+            grupo = (registro["metodo"], registro["host"], registro["operacao"])
+            self.por_operacao.setdefault(grupo, []).append(registro)
+
+    def procurar(self, descricao: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        registro = self.por_chave.get(chave_requisicao(descricao))
+        if registro is not None:
+            return registro
+
+        # Outra requisição da mesma operação (outro código/CNPJ): os
+        # gravados se revezam em ordem, o que mantém a carga determinística.
+        grupo = (descricao["metodo"], descricao["host"], descricao["operacao"])
+        candidatos = self.por_operacao.get(grupo)
+        if not candidatos:
+            return None
+
+        with self._lock:
+            posicao = self._proximo.get(grupo, 0)
+            self._proximo[grupo] = posicao + 1
+
+        return candidatos[posicao % len(candidatos)]
+
+
+_INDICE: Optional[_Indice] = None
+
+
+def _indice() -> _Indice:
+    global _INDICE
+
+    with _LOCK:
+        if _INDICE is None:
+            _INDICE = _Indice(GRAVACAO_DIR)
+            logger.info("[GRAVACAO] Reprodução | diretorio=%s | gravacoes=%s", GRAVACAO_DIR, len(_INDICE.por_chave))
+
+        return _INDICE
+
+
+class TransporteReproducao(httpx.AsyncBaseTransport):
+    """Responde com as gravações de GRAVACAO_DIR, sem rede."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        descricao = _descrever_requisicao(request)
+        registro = _indice().procurar(descricao)
+
+        if registro is None:
+            raise httpx.ConnectError(
+                f"Sem gravação para {descricao['metodo']} {descricao['host']} {descricao['operacao']}",
+                request=request,
+            )
+
+        espera = registro.get("duracao_segundos", 0) * GRAVACAO_FATOR_LATENCIA
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+        resposta = registro["resposta"]
+        return httpx.Response(
+            resposta["status"],
+            headers=resposta["headers"],
+            content=conteudo_gravado(resposta),
+            request=request,
+        )
+
+
+def respostas_gravadas(operacao: str, diretorio: Optional[str] = None) -> List[bytes]:
+    """Corpos gravados de uma operação (buscaDeclaracao, retornaManifesto...), para benchmarks."""
+
+    corpos = []
+
+    for caminho in sorted(glob.glob(os.path.join(diretorio or GRAVACAO_DIR, "*", _nome_seguro(operacao), "*.json"))):
+        with open(caminho, encoding="utf-8") as arquivo:
+            corpos.append(conteudo_gravado(json.load(arquivo)["resposta"]))
+
+    return corpos
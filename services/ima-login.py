@@ -1,112 +1,355 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import asyncio
+import os
+import queue
+import threading
 import traceback
 import time
 
-app = FastAPI()
+# ==========================================================
+# Configuração
+# ==========================================================
+
+# Pausa opcional entre as ações. As esperas agora são por elemento;
+# só vale a pena aumentar isto para depurar o fluxo na tela.
+STEP_DELAY = float(os.getenv("IMA_LOGIN_STEP_DELAY", "0"))
+
+# Navegadores mantidos abertos e reaproveitados entre logins.
+# IMA_LOGIN_POOL_ENABLED=false volta a abrir um Chrome por login.
+IMA_LOGIN_POOL_ENABLED = os.getenv("IMA_LOGIN_POOL_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+IMA_LOGIN_POOL_TAMANHO = int(os.getenv("IMA_LOGIN_POOL_TAMANHO", "2"))
+
+# Logins que aguardam um navegador livre além dos que estão rodando, e o
+# tempo máximo de espera na fila. Acima disso a resposta é 503.
+IMA_LOGIN_FILA_MAXIMA = int(os.getenv("IMA_LOGIN_FILA_MAXIMA", "20"))
+IMA_LOGIN_ESPERA_SEGUNDOS = float(os.getenv("IMA_LOGIN_ESPERA_SEGUNDOS", "60"))
+
+# Um navegador é reiniciado após este número de logins (o Chrome vai
+# acumulando memória).
+IMA_LOGIN_MAX_USOS = int(os.getenv("IMA_LOGIN_MAX_USOS", "50"))
+
+IMA_LOGIN_HEADLESS = os.getenv("IMA_LOGIN_HEADLESS", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+IMA_LOGIN_TIMEOUT_SEGUNDOS = float(os.getenv("IMA_LOGIN_TIMEOUT_SEGUNDOS", "20"))
+
+IMA_URL = "https://mtr.ima.sc.gov.br/"
 
-STEP_DELAY = 1 # ✅ 0,5s entre inputs/ações
 
 def log(msg: str):
     print(f"[IMA-LOGIN] {msg}", flush=True)
 
 def pause(step=STEP_DELAY):
-    time.sleep(step)
+    if step > 0:
+        time.sleep(step)
 
 def iniciar_navegador():
     log("Iniciando navegador (Chrome headless)...")
     options = Options()
-    #options.add_argument("--headless=new")  # pode usar "--headless" se preferir
+    if IMA_LOGIN_HEADLESS:
+        options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    # Não espera imagens/fontes carregarem para devolver o controle.
+    options.page_load_strategy = "eager"
     driver = webdriver.Chrome(options=options)
     log("✅ Driver ready")
     return driver
 
 from selenium.webdriver.common.keys import Keys
 
-def ima_login(cnpj: str, senha: str, unidadeCodigo: str = "", cpf: str = ""):
-    driver = iniciar_navegador()
-    wait = WebDriverWait(driver, 20)
+
+# ==========================================================
+# Pool de navegadores
+# ==========================================================
+
+class NavegadorPool:
+    """Chrome pré-iniciado; cada login roda num contexto anônimo próprio."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.janela_base = driver.current_window_handle
+        self.usos = 0
+
+    def abrir_contexto(self):
+        """
+        Cria um contexto anônimo (Target.createBrowserContext) com uma aba.
+
+        O contexto tem cookies, cache e storage isolados: um login não vê a
+        sessão do anterior, sem precisar reiniciar o Chrome.
+        """
+
+        contexto = self.driver.execute_cdp_cmd(
+            "Target.createBrowserContext",
+            {"disposeOnDetach": True},
+        )["browserContextId"]
+
+        alvo = self.driver.execute_cdp_cmd(
+            "Target.createTarget",
+            {"url": "about:blank", "browserContextId": contexto},
+        )["targetId"]
+
+        # No chromedriver o handle da janela é o id do target.
+        self.driver.switch_to.window(alvo)
+        return contexto, alvo
+
+    def fechar_contexto(self, contexto, alvo):
+        try:
+            self.driver.execute_cdp_cmd("Target.closeTarget", {"targetId": alvo})
+        finally:
+            self.driver.switch_to.window(self.janela_base)
+            self.driver.execute_cdp_cmd("Target.disposeBrowserContext", {"browserContextId": contexto})
+
+    def encerrar(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+class FilaCheia(Exception):
+    pass
+
+
+class PoolNavegadores:
+    """
+    N navegadores abertos, emprestados um por login.
+
+    Quem não encontra navegador livre espera na fila (até
+    IMA_LOGIN_ESPERA_SEGUNDOS); com a fila cheia o login é recusado.
+    Navegadores que falham ou atingem IMA_LOGIN_MAX_USOS são trocados.
+    """
+
+    def __init__(self, tamanho: int):
+        self._tamanho = max(1, tamanho)
+        self._livres = queue.Queue()
+        self._lock = threading.Lock()
+        self._aguardando = 0
+        self._iniciados = 0
+
+    def aquecer(self):
+        log(f"Aquecendo pool com {self._tamanho} navegador(es)...")
+        for _ in range(self._tamanho):
+            self._livres.put(self._novo())
+
+    def _novo(self):
+        with self._lock:
+            self._iniciados += 1
+        return NavegadorPool(iniciar_navegador())
+
+    def emprestar(self) -> NavegadorPool:
+        with self._lock:
+            if self._aguardando >= IMA_LOGIN_FILA_MAXIMA:
+                raise FilaCheia()
+            self._aguardando += 1
+
+        try:
+            return self._livres.get(timeout=IMA_LOGIN_ESPERA_SEGUNDOS)
+        except queue.Empty:
+            raise FilaCheia()
+        finally:
+            with self._lock:
+                self._aguardando -= 1
+
+    def devolver(self, navegador: NavegadorPool, saudavel: bool = True):
+        navegador.usos += 1
+
+        if saudavel and navegador.usos < IMA_LOGIN_MAX_USOS:
+            self._livres.put(navegador)
+            return
+
+        log(f"Reiniciando navegador (usos={navegador.usos}, saudavel={saudavel})")
+        navegador.encerrar()
+
+        try:
+            self._livres.put(self._novo())
+        except Exception as e:
+            # Mantém a capacidade: tenta de novo no próximo empréstimo.
+            log(f"🔴 Falha ao reiniciar navegador: {repr(e)}")
+            threading.Thread(target=self._repor, daemon=True).start()
+
+    def _repor(self):
+        while True:
+            time.sleep(5)
+            try:
+                self._livres.put(self._novo())
+                return
+            except Exception as e:
+                log(f"🔴 Falha ao repor navegador: {repr(e)}")
+
+    def encerrar(self):
+        while True:
+            try:
+                self._livres.get_nowait().encerrar()
+            except queue.Empty:
+                return
+
+    def estado(self):
+        with self._lock:
+            return {
+                "tamanho": self._tamanho,
+                "livres": self._livres.qsize(),
+                "aguardando": self._aguardando,
+                "navegadores_iniciados": self._iniciados,
+            }
+
+
+_POOL = PoolNavegadores(IMA_LOGIN_POOL_TAMANHO)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if IMA_LOGIN_POOL_ENABLED:
+        await asyncio.to_thread(_POOL.aquecer)
+    yield
+    if IMA_LOGIN_POOL_ENABLED:
+        await asyncio.to_thread(_POOL.encerrar)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# ==========================================================
+# Fluxo de login
+# ==========================================================
+
+def _executar_login(driver, cnpj: str, senha: str, cpf: str) -> dict:
+    wait = WebDriverWait(driver, IMA_LOGIN_TIMEOUT_SEGUNDOS, poll_frequency=0.1)
+
+    log(f"Abrindo URL: {IMA_URL}")
+    driver.get(IMA_URL)
+
+    # Seleciona login por CNPJ
+    log("Clicando no radio CNPJ (rdCnpj)")
+    wait.until(EC.element_to_be_clickable((By.ID, "rdCnpj"))).click()
+    pause()
+
+    # -------- CNPJ --------
+    log(f"Digitando CNPJ (txtCnpj): {cnpj}")
+    cnpj_el = wait.until(EC.element_to_be_clickable((By.ID, "txtCnpj")))
+    cnpj_el.clear()
+    cnpj_el.send_keys(cnpj)
+
+    # 🔥 Dispara blur via TAB
+    log("Disparando blur no CNPJ (TAB)")
+    cnpj_el.send_keys(Keys.TAB)
+    pause()
+
+    # -------- CPF (campo dinâmico) --------
+    log("Aguardando campo CPF (txtCpfUsuario) aparecer")
+    cpf_el = wait.until(EC.element_to_be_clickable((By.ID, "txtCpfUsuario")))
+    log("Campo CPF detectado")
+
+    log(f"Digitando CPF: {cpf}")
+    cpf_el.clear()
+    cpf_el.send_keys(cpf)
+    pause()
+
+    # -------- SENHA --------
+    log("Digitando senha (txtSenha): ******")
+    senha_el = wait.until(EC.element_to_be_clickable((By.ID, "txtSenha")))
+    senha_el.clear()
+    senha_el.send_keys(senha)
+    pause()
+
+    # -------- LOGIN --------
+    log("Clicando no botão Entrar (btEntrar)")
+    wait.until(EC.element_to_be_clickable((By.ID, "btEntrar"))).click()
+
+    # -------- ESPERA PÓS LOGIN --------
+    log("Aguardando pós-login: URL conter 'acao=paginaPrincipal'")
+    wait.until(EC.url_contains("acao=paginaPrincipal"))
+
+    log(f"✅ Pós-login OK. URL atual: {driver.current_url}")
+
+    # -------- COOKIES --------
+    cookies_list = driver.get_cookies()
+    cookies = {c["name"]: c["value"] for c in cookies_list}
+
+    log(f"✅ Cookies capturados ({len(cookies)}): {list(cookies)}")
+    return cookies
+
+
+def _resposta_erro(e: Exception):
+    log(f"🔴 ERRO: {repr(e)}")
+    log(traceback.format_exc())
+    return JSONResponse(
+        content={"codigo": 900, "erro": repr(e)},
+        status_code=500
+    )
+
+
+def _ima_login_pool(cnpj: str, senha: str, cpf: str):
+    inicio = time.monotonic()
+
+    try:
+        navegador = _POOL.emprestar()
+    except FilaCheia:
+        log("🔴 Fila de login cheia; recusando")
+        return JSONResponse(
+            content={"codigo": 503, "erro": "Todos os navegadores ocupados. Tente novamente."},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+
+    saudavel = True
 
     try:
-        log("Abrindo URL: https://mtr.ima.sc.gov.br/")
-        driver.get("https://mtr.ima.sc.gov.br/")
-        pause()
-
-        # Seleciona login por CNPJ
-        log("Clicando no radio CNPJ (rdCnpj)")
-        wait.until(EC.element_to_be_clickable((By.ID, "rdCnpj"))).click()
-        pause()
-
-        # -------- CNPJ --------
-        log(f"Digitando CNPJ (txtCnpj): {cnpj}")
-        cnpj_el = wait.until(EC.presence_of_element_located((By.ID, "txtCnpj")))
-        cnpj_el.clear()
-        pause()
-        cnpj_el.send_keys(cnpj)
-        pause()
-
-        # 🔥 Dispara blur via TAB
-        log("Disparando blur no CNPJ (TAB)")
-        cnpj_el.send_keys(Keys.TAB)
-        pause()
-
-        # -------- CPF (campo dinâmico) --------
-        log("Aguardando campo CPF (txtCpfUsuario) aparecer")
-        cpf_el = wait.until(EC.presence_of_element_located((By.ID, "txtCpfUsuario")))
-        log("Campo CPF detectado")
-
-        log(f"Digitando CPF: {cpf}")
-        cpf_el.clear()
-        pause()
-        cpf_el.send_keys(cpf)
-        pause()
-
-        # -------- SENHA --------
-        log("Digitando senha (txtSenha): ******")
-        senha_el = wait.until(EC.presence_of_element_located((By.ID, "txtSenha")))
-        senha_el.clear()
-        pause()
-        senha_el.send_keys(senha)
-        pause()
-
-        # -------- LOGIN --------
-        log("Clicando no botão Entrar (btEntrar)")
-        driver.find_element(By.ID, "btEntrar").click()
-        pause()
-
-        # -------- ESPERA PÓS LOGIN --------
-        log("Aguardando pós-login: URL conter 'acao=paginaPrincipal'")
-        wait.until(EC.url_contains("acao=paginaPrincipal"))
-
-        log(f"✅ Pós-login OK. URL atual: {driver.current_url}")
-        pause()
-
-        # -------- COOKIES --------
-        cookies_list = driver.get_cookies()
-        cookies = {c["name"]: c["value"] for c in cookies_list}
-
-        log(f"✅ Cookies capturados ({len(cookies)}): {cookies}")
+        contexto, alvo = navegador.abrir_contexto()
 
+        try:
+            cookies = _executar_login(navegador.driver, cnpj, senha, cpf)
+        finally:
+            navegador.fechar_contexto(contexto, alvo)
+
+        log(f"✅ Login concluído em {time.monotonic() - inicio:.2f}s")
         return JSONResponse(
             content={"codigo": 200, "cookies": cookies},
             status_code=200
         )
 
+    except TimeoutException as e:
+        # Credencial errada ou página lenta: o navegador continua bom.
+        return _resposta_erro(e)
+
+    except WebDriverException as e:
+        # Chrome travado ou caído: é trocado por um novo.
+        saudavel = False
+        return _resposta_erro(e)
+
     except Exception as e:
-        log(f"🔴 ERRO: {repr(e)}")
-        log(traceback.format_exc())
+        return _resposta_erro(e)
+
+    finally:
+        _POOL.devolver(navegador, saudavel)
+
+
+def ima_login(cnpj: str, senha: str, unidadeCodigo: str = "", cpf: str = ""):
+    if IMA_LOGIN_POOL_ENABLED:
+        return _ima_login_pool(cnpj, senha, cpf)
+
+    driver = iniciar_navegador()
+
+    try:
+        cookies = _executar_login(driver, cnpj, senha, cpf)
+
         return JSONResponse(
-            content={"codigo": 900, "erro": repr(e)},
-            status_code=500
+            content={"codigo": 200, "cookies": cookies},
+            status_code=200
         )
 
+    except Exception as e:
+        return _resposta_erro(e)
+
     finally:
         try:
             driver.quit()
@@ -114,5 +357,21 @@ def ima_login(cnpj: str, senha: str, unidadeCodigo: str = "", cpf: str = ""):
         except Exception:
             pass
 
-        
-#ima_login('39.228.967/0001-60','5099ea', '','043.045.326-42')S
\ No newline at end of file
+
+# ==========================================================
+# Rotas
+# ==========================================================
+
+# Rota síncrona: o FastAPI executa no threadpool, e o pool limita quantos
+# logins usam o Chrome ao mesmo tempo.
+@app.get("/ima-login")
+def ima_login_route(cnpj: str, senha: str, unidadeCodigo: str = "", cpf: str = ""):
+    return ima_login(cnpj, senha, unidadeCodigo, cpf)
+
+
+@app.get("/ima-login/pool")
+def ima_login_pool_estado():
+    return {"habilitado": IMA_LOGIN_POOL_ENABLED, **_POOL.estado()}
+
+
+#ima_login('39.228.967/0001-60','5099ea', '','043.045.326-42')
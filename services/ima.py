@@ -1,10 +1,30 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+import httpx
 import requests
 from typing import Dict, Tuple, Optional, Union, Any
 from urllib.parse import urlparse
 import logging
-import json
+
+from services.clientes_http import (
+    ErroSSL,
+    cookies_com_sessao,
+    executar_sincrono,
+    requisitar_async,
+    sessao_com_cookies,
+)
+from services import codec_json
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import resumo_texto, tamanho_payload
+from services.login_controller import (
+    autenticar_controller_servlet_async,
+    estrategias_login,
+    login_com_fallback_async,
+    login_controller_servlet_async,
+)
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, verificar_sessao_valida
+from services.rastreamento import rastrear
 
 
 
@@ -25,11 +45,16 @@ class ConsultaIMAManifestoRequest(BaseModel):
 
 IMA_WORKAROUND_ENABLED = False
 
+IMA_CONTROLLER_URL = "https://mtr.ima.sc.gov.br/ControllerServlet"
+
+IMA_LOGIN_SELENIUM_URL = "http://scheduler-python-login-ima.4ps3wk.easypanel.host/ima-login"
+
 
 logger = logging.getLogger("ima")
 logger.setLevel(logging.INFO)
 
-def consultar_manifesto_ima(
+@coalescer("IMA", "retorna_manifesto")
+async def consultar_manifesto_ima_async(
     codigo_barras: str,
     unidade_gerador: str,
     senha: str,
@@ -44,7 +69,7 @@ def consultar_manifesto_ima(
         "Content-Type": "application/json"
     }
 
-    response = requests.post(url, headers=headers, timeout=30)
+    response = await requisitar_async("POST", url, headers=headers, timeout=30)
 
     if response.status_code != 200:
         raise HTTPException(
@@ -52,72 +77,63 @@ def consultar_manifesto_ima(
             detail="Erro ao consultar manifesto no IMA"
         )
 
-    return response.json()
+    return json_bruto(response, "IMA")
 
-def autenticar_e_obter_cookies(
+
+def consultar_manifesto_ima(
+    codigo_barras: str,
+    unidade_gerador: str,
+    senha: str,
+    cnpj: str
+):
+    return executar_sincrono(consultar_manifesto_ima_async(codigo_barras, unidade_gerador, senha, cnpj))
+
+
+@rastrear("login IMA")
+async def autenticar_e_obter_cookies_async(
     cnpj: str,
     senha: str,
     cpf_usuario: str,
     unidade_codigo: str = "",
     timeout: int = 30,
-) -> Tuple[Dict[str, str], str, requests.Session]:
+) -> Tuple[Dict[str, str], str]:
     
-    s = requests.Session()
-    
-    LOGIN_URL = "https://mtr.ima.sc.gov.br/ControllerServlet"
-
+    cookies, resp = await autenticar_controller_servlet_async(
+        IMA_CONTROLLER_URL,
+        cnpj,
+        senha,
+        cpf_usuario,
+        unidade_codigo,
+        timeout,
+    )
 
-    # Headers parecidos com o browser (os essenciais)
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "Origin": "https://mtr.meioambiente.go.gov.br",
-        "Referer": "https://mtr.meioambiente.go.gov.br/index.jsp",
-        "X-Requested-With": "XMLHttpRequest",
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36"
-        ),
-    }
+    logger.info("[API IMA] Login ControllerServlet | cookies=%s", sorted(cookies))
 
-    data = {
-        "acao": "autenticaUsuario",
-        "txtCnpj": cnpj,
-        "txtSenha": senha,
-        "txtUnidadeCodigo": unidade_codigo,
-        "txtCpfUsuario": cpf_usuario,
-        "tipoPessoaSociedade": "J",
-    }
+    return cookies, resp.text
 
-    resp = s.post(LOGIN_URL, headers=headers, data=data, timeout=timeout)
-    resp.raise_for_status()
 
-    # Cookies que a sessão armazenou (vindos dos Set-Cookie do servidor)
-    cookies = s.cookies.get_dict()
-    
-    print('cookies', cookies)
+def autenticar_e_obter_cookies(
+    cnpj: str,
+    senha: str,
+    cpf_usuario: str,
+    unidade_codigo: str = "",
+    timeout: int = 30,
+) -> Tuple[Dict[str, str], str, requests.Session]:
+    cookies, texto = executar_sincrono(
+        autenticar_e_obter_cookies_async(cnpj, senha, cpf_usuario, unidade_codigo, timeout)
+    )
+    return cookies, texto, sessao_com_cookies(cookies)
 
-    return cookies, resp.text, s
 
-def buscar_parceiro_ima(
+async def buscar_parceiro_ima_async(
     cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
     cnpj: str,
     armazenador: bool = False,
     tipo_pessoa: str = "2",
     codigo_unidade: str = "armazenador",
     timeout: int = 30,
-    session: Optional[requests.Session] = None,
 ) -> Dict[str, Any]:
 
-    # Reaproveita session se você passar uma (recomendado).
-    s = session or requests.Session()
-
-    # Injeta cookies recebidos
-    if isinstance(cookies, requests.cookies.RequestsCookieJar):
-        s.cookies.update(cookies)
-    else:
-        s.cookies.update(cookies)
-
     headers = {
         "Accept": "*/*",
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -132,24 +148,29 @@ def buscar_parceiro_ima(
 
     # Form data na ordem (pra ficar bem próximo do Network do Chrome)
     if armazenador == True:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-            ("codigoUnidade", ""),
-            ("armazenador", "S"),  # esse "S" solto do payload
-        ]
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+            "codigoUnidade": "",
+            "armazenador": "S",  # esse "S" solto do payload
+        }
     else:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-        ]
-
-    BASE_URL = "https://mtr.ima.sc.gov.br/ControllerServlet"
-
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+        }
 
-    resp = s.post(BASE_URL, headers=headers, data=form_fields, timeout=timeout)
+    resp = await requisitar_async(
+        "POST",
+        IMA_CONTROLLER_URL,
+        cookies=cookies,
+        headers=headers,
+        data=form_fields,
+        timeout=timeout,
+    )
+    verificar_sessao_valida(resp)
     resp.raise_for_status()
 
     # A resposta diz ser application/json;charset=utf-8
@@ -165,133 +186,112 @@ def buscar_parceiro_ima(
         }
 
 
+def buscar_parceiro_ima(
+    cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
+    cnpj: str,
+    armazenador: bool = False,
+    tipo_pessoa: str = "2",
+    codigo_unidade: str = "armazenador",
+    timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
+    return executar_sincrono(
+        buscar_parceiro_ima_async(
+            cookies=cookies_com_sessao(cookies, session),
+            cnpj=cnpj,
+            armazenador=armazenador,
+            tipo_pessoa=tipo_pessoa,
+            codigo_unidade=codigo_unidade,
+            timeout=timeout,
+        )
+    )
+
+
 # =========================
-# BUSCAR TRANSPORTADOR
+# POOL DE SESSÕES (conta de busca de parceiros)
 # =========================
 
-def buscar_transportador_ima(cnpj):
-    print('\n===================BUSCANDO TRANSPORTADOR ========\n')
-
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies = login_ima()  # deve retornar dict: {"JSESSIONID": "...", "route": "..."}
+async def _login_parceiros_ima() -> SessaoAutenticada:
+    cookies = await login_ima_async()  # deve retornar dict: {"JSESSIONID": "...", "route": "..."}
     if not isinstance(cookies, dict):
         raise RuntimeError(f"login_ima retornou algo inesperado: {type(cookies)} -> {cookies!r}")
 
-    jsid = cookies.get("JSESSIONID")
-    route = cookies.get("route")
-
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', jsid)
-    print('route', route)
-    print('---------------------------------------------------\n')
-
-    if not jsid:
+    if not cookies.get("JSESSIONID"):
         raise RuntimeError(f"Cookie JSESSIONID não veio no login_ima: {cookies!r}")
 
-    # ✅ Reaproveita uma Session e injeta cookies uma única vez
-    s = requests.Session()
-    s.cookies.update(cookies)
-
-    # ✅ Chama o endpoint real do IMA usando a session com cookies
-    r = buscar_parceiro_ima(
-        cookies=s.cookies,     # pode passar o CookieJar da session (ou o dict cookies)
-        cnpj=cnpj,
-        tipo_pessoa="2",
-        session=s,             # recomendado (reutiliza conexão + cookies)
-        timeout=30
-    )
+    return SessaoAutenticada(cookies=cookies)
 
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
 
-    return r
+_POOL_PARCEIROS_IMA = PoolSessoes("IMA", _login_parceiros_ima)
+
 
 # =========================
-# BUSCAR DESTINO
+# BUSCAR TRANSPORTADOR
 # =========================
-  
-def buscar_destino_ima(cnpj):
-    print('\n===================BUSCANDO DESTINO ========\n')
 
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies = login_ima()  # deve retornar dict: {"JSESSIONID": "...", "route": "..."}
-    if not isinstance(cookies, dict):
-        raise RuntimeError(f"login_ima retornou algo inesperado: {type(cookies)} -> {cookies!r}")
+async def buscar_transportador_ima_async(cnpj):
+    r = await _POOL_PARCEIROS_IMA.executar(
+        lambda sessao: buscar_parceiro_ima_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+            timeout=30
+        )
+    )
 
-    jsid = cookies.get("JSESSIONID")
-    route = cookies.get("route")
+    logger.debug("[IMA] Busca de transportador concluída | %s", tamanho_payload(r))
 
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', jsid)
-    print('route', route)
-    print('---------------------------------------------------\n')
+    return r
 
-    if not jsid:
-        raise RuntimeError(f"Cookie JSESSIONID não veio no login_ima: {cookies!r}")
 
-    # ✅ Reaproveita uma Session e injeta cookies uma única vez
-    s = requests.Session()
-    s.cookies.update(cookies)
-
-    # ✅ Chama o endpoint real do IMA usando a session com cookies
-    r = buscar_parceiro_ima(
-        cookies=s.cookies,     # pode passar o CookieJar da session (ou o dict cookies)
-        cnpj=cnpj,
-        tipo_pessoa="4",
-        session=s,             # recomendado (reutiliza conexão + cookies)
-        timeout=30
+def buscar_transportador_ima(cnpj):
+    return executar_sincrono(buscar_transportador_ima_async(cnpj))
+
+# =========================
+# BUSCAR DESTINO
+# =========================
+
+async def buscar_destino_ima_async(cnpj):
+    r = await _POOL_PARCEIROS_IMA.executar(
+        lambda sessao: buscar_parceiro_ima_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="4",
+            timeout=30
+        )
     )
 
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[IMA] Busca de destino concluída | %s", tamanho_payload(r))
 
     return r
 
+
+def buscar_destino_ima(cnpj):
+    return executar_sincrono(buscar_destino_ima_async(cnpj))
+
 # =========================
 # BUSCAR ARMAZENADOR
 # =========================
-  
-def buscar_armazenador_ima(cnpj):
-    print('\n===================BUSCANDO ARMAZENADOR ========\n')
 
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies = login_ima()  # deve retornar dict: {"JSESSIONID": "...", "route": "..."}
-    if not isinstance(cookies, dict):
-        raise RuntimeError(f"login_ima retornou algo inesperado: {type(cookies)} -> {cookies!r}")
+async def buscar_armazenador_ima_async(cnpj):
+    r = await _POOL_PARCEIROS_IMA.executar(
+        lambda sessao: buscar_parceiro_ima_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+            armazenador=True,
+            timeout=30
+        )
+    )
 
-    jsid = cookies.get("JSESSIONID")
-    route = cookies.get("route")
+    logger.debug("[IMA] Busca de armazenador concluída | %s", tamanho_payload(r))
 
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', jsid)
-    print('route', route)
-    print('---------------------------------------------------\n')
+    return r
 
-    if not jsid:
-        raise RuntimeError(f"Cookie JSESSIONID não veio no login_ima: {cookies!r}")
 
-    # ✅ Reaproveita uma Session e injeta cookies uma única vez
-    s = requests.Session()
-    s.cookies.update(cookies)
-
-    # ✅ Chama o endpoint real do IMA usando a session com cookies
-    r = buscar_parceiro_ima(
-        cookies=s.cookies,     # pode passar o CookieJar da session (ou o dict cookies)
-        cnpj=cnpj,
-        tipo_pessoa="2",
-        armazenador=True,
-        session=s,             # recomendado (reutiliza conexão + cookies)
-        timeout=30
-    )
-
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+def buscar_armazenador_ima(cnpj):
+    return executar_sincrono(buscar_armazenador_ima_async(cnpj))
 
-    return r
- 
 
 IMA_SALVAR_MANIFESTO_URL = (
     "https://mtr.ima.sc.gov.br"
@@ -362,10 +362,10 @@ def validar_url_salvar_manifesto_ima(
 
     return "salvarManifestoLote", IMA_SALVAR_MANIFESTO_URL
 
-def salvar_manifesto_ima(
+async def salvar_manifesto_ima_async(
     url: str,
     manifesto: dict,
-) -> requests.Response:
+) -> httpx.Response:
     
     endpoint, url_mascarada = validar_url_salvar_manifesto_ima(url)
 
@@ -378,11 +378,7 @@ def salvar_manifesto_ima(
     destino_url = ""
 
     try:
-        payload_ima = json.dumps(
-            manifesto,
-            ensure_ascii=False,
-            separators=(",", ":"),
-        ).encode("utf-8")
+        payload_ima = codec_json.dumps(manifesto)
 
     except (TypeError, ValueError) as error:
         logger.error(
@@ -421,22 +417,22 @@ def salvar_manifesto_ima(
             url_mascarada,
         )
 
-        response_ima = requests.post(
-            url=destino_url,
+        response_ima = await requisitar_async(
+            "POST",
+            destino_url,
             headers={
                 "Content-Type": "application/json; charset=utf-8",
                 "Accept": "application/json, text/plain, */*",
                 "User-Agent": "Tree-ESG-API/1.0",
-                "Connection": "close",
             },
-            data=payload_ima,
+            content=payload_ima,
             timeout=(15, 90),
-            allow_redirects=False,
+            follow_redirects=False,
         )
     except HTTPException:
         raise
 
-    except requests.ConnectTimeout as error:
+    except httpx.ConnectTimeout as error:
         logger.error(
             "API IMA Timeout de conexão ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -455,7 +451,7 @@ def salvar_manifesto_ima(
             ),
         )
 
-    except requests.ReadTimeout as error:
+    except httpx.ReadTimeout as error:
         logger.error(
             "[API IMA] Timeout de resposta ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -474,7 +470,7 @@ def salvar_manifesto_ima(
             ),
         )
 
-    except requests.SSLError as error:
+    except ErroSSL as error:
         logger.error(
             "API IMA Erro SSL ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -489,7 +485,7 @@ def salvar_manifesto_ima(
             detail=f"Erro SSL ao salvar manifesto no IMA: {str(error)}",
         )
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         logger.error(
             "API IMA Erro de comunicação ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -530,35 +526,84 @@ def salvar_manifesto_ima(
             modo,
             endpoint,
             response_ima.status_code,
-            response_ima.text[:1000],
+            resumo_texto(conteudo),
         )
 
     return response_ima
 
 
-def login_ima():
-    url = "http://scheduler-python-login-ima.4ps3wk.easypanel.host/ima-login"
+def salvar_manifesto_ima(
+    url: str,
+    manifesto: dict,
+) -> httpx.Response:
+    return executar_sincrono(salvar_manifesto_ima_async(url, manifesto))
+
 
+async def _login_ima_selenium_async(cnpj: str, senha: str, unidade_codigo: str, cpf: str) -> Dict[str, str]:
     params = {
-        "cnpj": "39228967000160",
-        "senha": "5099ea",
-        "unidadeCodigo": "",
-        "cpf": "04304532642"
+        "cnpj": cnpj,
+        "senha": senha,
+        "unidadeCodigo": unidade_codigo,
+        "cpf": cpf
     }
 
-    response = requests.get(url, params=params, timeout=120)
-    print("Status:", response.status_code)
-    print("Body bruto:", response.text)  # <-- debug
+    try:
+        response = await requisitar_async("GET", IMA_LOGIN_SELENIUM_URL, params=params, timeout=120)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Erro ao comunicar com serviço Selenium IMA: {str(e)}"
+        )
+
+    logger.info("[API IMA] Login Selenium | status=%s", response.status_code)
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=502,
+            detail="Falha ao autenticar no IMA"
+        )
+
+    cookies = response.json().get("cookies") or {}
+    logger.info("[API IMA] Login Selenium | cookies=%s", sorted(cookies))
+
+    if "JSESSIONID" not in cookies:
+        raise HTTPException(
+            status_code=401,
+            detail="JSESSIONID não encontrado nos cookies IMA"
+        )
+
+    return cookies
 
-    response.raise_for_status()
 
-    data = response.json()
-    print("JSON:", data)
+async def login_ima_async(
+    cnpj: str = "39228967000160",
+    senha: str = "5099ea",
+    unidade_codigo: str = "",
+    cpf: str = "04304532642",
+) -> Dict[str, str]:
+    """
+    Cookies de uma sessão autenticada no ControllerServlet do IMA.
+
+    Tenta o login direto por HTTP e, se a sessão não se confirmar, usa o
+    serviço Selenium.
+    """
 
-    cookies = data.get("cookies") or {}
-    print("Cookies:", cookies)
+    return await login_com_fallback_async(
+        "IMA",
+        estrategias_login(
+            lambda: login_controller_servlet_async(IMA_CONTROLLER_URL, cnpj, senha, cpf, unidade_codigo),
+            lambda: _login_ima_selenium_async(cnpj, senha, unidade_codigo, cpf),
+        ),
+    )
 
-    return cookies  # <-- retorna cookies sempre
+
+def login_ima(
+    cnpj: str = "39228967000160",
+    senha: str = "5099ea",
+    unidade_codigo: str = "",
+    cpf: str = "04304532642",
+) -> Dict[str, str]:
+    return executar_sincrono(login_ima_async(cnpj, senha, unidade_codigo, cpf))
 
 
 
@@ -1,3 +1,5 @@
+import asyncio
+import httpx
 import requests
 from fastapi import HTTPException
 from pydantic import BaseModel
@@ -15,6 +17,19 @@ import logging
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from services.clientes_http import (
+    ErroSSL,
+    cookies_resposta,
+    executar_sincrono,
+    requisitar_async,
+    sessao_com_cookies,
+)
+from services import codec_json
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import resumo_texto
+from services.rastreamento import rastrear, span
+
 
 logger = logging.getLogger("inea")
 logger.setLevel(logging.INFO)
@@ -182,12 +197,13 @@ def obter_inea_relay_url(force_refresh: bool = False) -> str:
         return cached_url
 
     try:
-        snapshot = (
-            obter_firestore_client()
-            .collection(INEA_RELAY_COLLECTION)
-            .document(INEA_RELAY_DOCUMENT)
-            .get()
-        )
+        with span("firestore relay INEA", {"db.system.name": "firestore", "mtr.forcar_atualizacao": force_refresh}):
+            snapshot = (
+                obter_firestore_client()
+                .collection(INEA_RELAY_COLLECTION)
+                .document(INEA_RELAY_DOCUMENT)
+                .get()
+            )
     except Exception as error:
         if cached_url:
             logger.warning(
@@ -238,12 +254,28 @@ def obter_inea_relay_url(force_refresh: bool = False) -> str:
     return relay_url
 
 
-def executar_post_inea_relay(
+async def obter_inea_relay_url_async(force_refresh: bool = False) -> str:
+    """Versão assíncrona: o Firestore é síncrono e roda numa thread."""
+
+    with _INEA_RELAY_CACHE_LOCK:
+        cached_url = _INEA_RELAY_CACHE["url"]
+        cache_is_valid = (
+            cached_url
+            and time.monotonic() < _INEA_RELAY_CACHE["expires_at"]
+        )
+
+    if cache_is_valid and not force_refresh:
+        return cached_url
+
+    return await asyncio.to_thread(obter_inea_relay_url, force_refresh)
+
+
+async def executar_post_inea_relay_async(
     endpoint_path: str,
     *,
     safe_to_retry: bool,
     **request_kwargs,
-) -> tuple[requests.Response, str]:
+) -> tuple[httpx.Response, str]:
     """Envia uma chamada ao relay e atualiza a URL após falha de conexão."""
 
     if not INEA_RELAY_KEY:
@@ -256,19 +288,30 @@ def executar_post_inea_relay(
     headers["X-Tree-Relay-Key"] = INEA_RELAY_KEY
     request_kwargs["headers"] = headers
 
-    relay_url = obter_inea_relay_url()
+    with span(f"relay INEA {endpoint_path}", {"mtr.relay.endpoint": endpoint_path}):
+        return await _post_inea_relay_async(endpoint_path, safe_to_retry, request_kwargs)
+
+
+async def _post_inea_relay_async(
+    endpoint_path: str,
+    safe_to_retry: bool,
+    request_kwargs: Dict[str, Any],
+) -> tuple[httpx.Response, str]:
+    # O traceparent segue nos headers: requisitar_async propaga o contexto
+    # para hosts fora dos órgãos, como o relay.
+    relay_url = await obter_inea_relay_url_async()
     destino_url = f"{relay_url}{endpoint_path}"
 
     try:
         return (
-            requests.post(url=destino_url, **request_kwargs),
+            await requisitar_async("POST", destino_url, **request_kwargs),
             destino_url,
         )
-    except (requests.ConnectTimeout, requests.ConnectionError):
+    except (httpx.ConnectTimeout, httpx.ConnectError):
         refreshed_url = relay_url
 
         try:
-            refreshed_url = obter_inea_relay_url(force_refresh=True)
+            refreshed_url = await obter_inea_relay_url_async(force_refresh=True)
         except HTTPException:
             pass
 
@@ -280,15 +323,56 @@ def executar_post_inea_relay(
                 endpoint_path,
             )
             return (
-                requests.post(url=refreshed_destino, **request_kwargs),
+                await requisitar_async("POST", refreshed_destino, **request_kwargs),
                 refreshed_destino,
             )
 
         raise
 
 
+def executar_post_inea_relay(
+    endpoint_path: str,
+    *,
+    safe_to_retry: bool,
+    **request_kwargs,
+) -> tuple[httpx.Response, str]:
+    return executar_sincrono(
+        executar_post_inea_relay_async(
+            endpoint_path,
+            safe_to_retry=safe_to_retry,
+            **request_kwargs,
+        )
+    )
+
+
+def _gravar_inea_relay_firestore(relay_url: str) -> bool:
+    """Grava a URL do relay em configuracoes/ineaRelay; retorna se mudou."""
+
+    doc_ref = (
+        obter_firestore_client()
+        .collection(INEA_RELAY_COLLECTION)
+        .document(INEA_RELAY_DOCUMENT)
+    )
+    snapshot = doc_ref.get()
+    previous_data = snapshot.to_dict() if snapshot.exists else {}
+    changed = previous_data.get("url") != relay_url
+
+    relay_data = {
+        "url": relay_url,
+        "status": "online",
+        "lastHealthCheck": firestore.SERVER_TIMESTAMP,
+        "source": "cloudflare-quick-tunnel",
+    }
+
+    if changed:
+        relay_data["updatedAt"] = firestore.SERVER_TIMESTAMP
+
+    doc_ref.set(relay_data, merge=True)
+    return changed
+
+
 @router.post("/relay/register")
-def registrar_inea_relay(
+async def registrar_inea_relay_async(
     dados: RegistrarIneaRelayRequest,
     x_tree_relay_key: Optional[str] = Header(
         default=None,
@@ -315,14 +399,15 @@ def registrar_inea_relay(
     relay_url = validar_url_publica_relay(dados.url)
 
     try:
-        health_response = requests.get(
+        health_response = await requisitar_async(
+            "GET",
             f"{relay_url}/health",
             timeout=(5, 15),
-            allow_redirects=False,
+            follow_redirects=False,
         )
         health_response.raise_for_status()
         health_data = health_response.json()
-    except (requests.RequestException, ValueError) as error:
+    except (httpx.HTTPError, ValueError) as error:
         logger.warning(
             "[API INEA] Registro recusado: health check falhou | erro=%s",
             str(error),
@@ -343,26 +428,7 @@ def registrar_inea_relay(
         )
 
     try:
-        doc_ref = (
-            obter_firestore_client()
-            .collection(INEA_RELAY_COLLECTION)
-            .document(INEA_RELAY_DOCUMENT)
-        )
-        snapshot = doc_ref.get()
-        previous_data = snapshot.to_dict() if snapshot.exists else {}
-        changed = previous_data.get("url") != relay_url
-
-        relay_data = {
-            "url": relay_url,
-            "status": "online",
-            "lastHealthCheck": firestore.SERVER_TIMESTAMP,
-            "source": "cloudflare-quick-tunnel",
-        }
-
-        if changed:
-            relay_data["updatedAt"] = firestore.SERVER_TIMESTAMP
-
-        doc_ref.set(relay_data, merge=True)
+        changed = await asyncio.to_thread(_gravar_inea_relay_firestore, relay_url)
     except Exception as error:
         logger.exception(
             "[API INEA] Falha ao registrar URL do relay no Firestore"
@@ -387,6 +453,13 @@ def registrar_inea_relay(
     }
 
 
+def registrar_inea_relay(
+    dados: RegistrarIneaRelayRequest,
+    x_tree_relay_key: Optional[str] = None,
+):
+    return executar_sincrono(registrar_inea_relay_async(dados, x_tree_relay_key))
+
+
 
 INEA_BASE_URL = "http://mtr.inea.rj.gov.br/api"
 INEA_HOST = "mtr.inea.rj.gov.br"
@@ -783,10 +856,10 @@ def validar_url_lista_inea(url: str) -> tuple[str, str]:
 
     return endpoint, url_mascarada
 
-def cancelar_manifesto_inea(
+async def cancelar_manifesto_inea_async(
     url: str,
     cancelamento: dict,
-) -> requests.Response:
+) -> httpx.Response:
     """
     Cancela um manifesto no INEA.
 
@@ -829,30 +902,26 @@ def cancelar_manifesto_inea(
                 cancelamento.get("manifestoCodigo"),
             )
 
-            response_inea, destino_url = executar_post_inea_relay(
+            response_inea, destino_url = await executar_post_inea_relay_async(
                 "/inea/cancelarManifesto",
                 safe_to_retry=False,
                 headers={
                     "Content-Type": "application/json",
                     "Accept": "application/json, text/plain, */*",
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
                 json={
                     "url": url_validada,
                     "cancelamento": cancelamento,
                 },
                 timeout=(20, 120),
-                allow_redirects=False,
+                follow_redirects=False,
             )
 
         else:
             destino_url = url_validada
 
-            payload = json.dumps(
-                cancelamento,
-                ensure_ascii=False,
-            )
+            payload = codec_json.dumps(cancelamento)
 
             logger.info(
                 "[API INEA] Cancelamento direto | "
@@ -861,23 +930,23 @@ def cancelar_manifesto_inea(
                 cancelamento.get("manifestoCodigo"),
             )
 
-            response_inea = requests.post(
+            response_inea = await requisitar_async(
+                "POST",
                 url=destino_url,
                 headers={
                     "Content-Type": "application/json",
                     "Accept": "application/json, text/plain, */*",
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
-                data=payload,
+                content=payload,
                 timeout=(15, 90),
-                allow_redirects=False,
+                follow_redirects=False,
             )
 
     except HTTPException:
         raise
 
-    except requests.ConnectTimeout as error:
+    except httpx.ConnectTimeout as error:
         logger.error(
             "[API INEA] Timeout de conexão no cancelamento | "
             "modo=%s | destino=%s | erro=%s",
@@ -895,7 +964,7 @@ def cancelar_manifesto_inea(
             ),
         )
 
-    except requests.ReadTimeout as error:
+    except httpx.ReadTimeout as error:
         logger.error(
             "[API INEA] Timeout de resposta no cancelamento | "
             "modo=%s | destino=%s | erro=%s",
@@ -909,7 +978,7 @@ def cancelar_manifesto_inea(
             detail="Timeout ao processar o cancelamento do manifesto.",
         )
 
-    except requests.SSLError as error:
+    except ErroSSL as error:
         logger.error(
             "[API INEA] Erro SSL no cancelamento | "
             "modo=%s | destino=%s | erro=%s",
@@ -923,7 +992,7 @@ def cancelar_manifesto_inea(
             detail=f"Erro SSL ao cancelar manifesto: {str(error)}",
         )
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         logger.error(
             "[API INEA] Erro de comunicação no cancelamento | "
             "modo=%s | destino=%s | erro=%s",
@@ -953,6 +1022,13 @@ def cancelar_manifesto_inea(
 
     return response_inea
 
+
+def cancelar_manifesto_inea(
+    url: str,
+    cancelamento: dict,
+) -> httpx.Response:
+    return executar_sincrono(cancelar_manifesto_inea_async(url, cancelamento))
+
 def validar_url_salvar_manifesto_inea(
     url: str,
 ) -> tuple[str, str]:
@@ -1025,7 +1101,7 @@ def validar_url_salvar_manifesto_inea(
 
     return "salvarManifestoLote", url_validada
 
-def retorna_lista_inea(url: str) -> requests.Response:
+async def retorna_lista_inea_async(url: str) -> httpx.Response:
     """
     Consulta uma das listas auxiliares da API do INEA.
 
@@ -1044,7 +1120,6 @@ def retorna_lista_inea(url: str) -> requests.Response:
         "Accept": "application/json",
         "Content-Type": "application/json",
         "User-Agent": "Tree-ESG-API/1.0",
-        "Connection": "close",
     }
 
     try:
@@ -1059,7 +1134,7 @@ def retorna_lista_inea(url: str) -> requests.Response:
                 url_mascarada,
             )
 
-            response_inea, _ = executar_post_inea_relay(
+            response_inea, _ = await executar_post_inea_relay_async(
                 "/inea/retornaListaInea",
                 safe_to_retry=True,
                 headers={
@@ -1071,7 +1146,7 @@ def retorna_lista_inea(url: str) -> requests.Response:
                     "url": url,
                 },
                 timeout=(15, 60),
-                allow_redirects=True,
+                follow_redirects=True,
             )
 
         # ======================================================
@@ -1085,17 +1160,18 @@ def retorna_lista_inea(url: str) -> requests.Response:
                 url_mascarada,
             )
 
-            response_inea = requests.post(
+            response_inea = await requisitar_async(
+                "POST",
                 url=url,
                 headers=headers_inea,
                 timeout=(15, 30),
-                allow_redirects=True,
+                follow_redirects=True,
             )
 
     except HTTPException:
         raise
 
-    except requests.ConnectTimeout as error:
+    except httpx.ConnectTimeout as error:
         destino = (
             "relay local"
             if INEA_WORKAROUND_ENABLED
@@ -1115,7 +1191,7 @@ def retorna_lista_inea(url: str) -> requests.Response:
             detail=f"Timeout ao estabelecer conexão com o {destino}.",
         )
 
-    except requests.ReadTimeout as error:
+    except httpx.ReadTimeout as error:
         destino = (
             "relay local"
             if INEA_WORKAROUND_ENABLED
@@ -1135,7 +1211,7 @@ def retorna_lista_inea(url: str) -> requests.Response:
             detail=f"O {destino} demorou demais para responder.",
         )
 
-    except requests.SSLError as error:
+    except ErroSSL as error:
         destino = (
             "relay local"
             if INEA_WORKAROUND_ENABLED
@@ -1155,7 +1231,7 @@ def retorna_lista_inea(url: str) -> requests.Response:
             detail=f"Erro SSL ao consultar o {destino}: {str(error)}",
         )
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         destino = (
             "relay local"
             if INEA_WORKAROUND_ENABLED
@@ -1192,10 +1268,15 @@ def retorna_lista_inea(url: str) -> requests.Response:
 
     return response_inea
 
+
+def retorna_lista_inea(url: str) -> httpx.Response:
+    return executar_sincrono(retorna_lista_inea_async(url))
+
 # =========================
 # Consulta Manifesto INEA
 # =========================
-def retorna_manifesto_inea(
+@coalescer("INEA", "retorna_manifesto")
+async def retorna_manifesto_inea_async(
     cpf: str,
     senha: str,
     cnpj: str,
@@ -1208,8 +1289,8 @@ def retorna_manifesto_inea(
     )
 
     try:
-        response = requests.post(url, timeout=30)
-    except requests.RequestException as e:
+        response = await requisitar_async("POST", url, timeout=30)
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o INEA: {str(e)}"
@@ -1221,7 +1302,17 @@ def retorna_manifesto_inea(
             detail="Erro ao consultar manifesto no INEA"
         )
 
-    return response.json()
+    return json_bruto(response, "INEA")
+
+
+def retorna_manifesto_inea(
+    cpf: str,
+    senha: str,
+    cnpj: str,
+    unidade_gerador: str,
+    codigo_barras: str
+):
+    return executar_sincrono(retorna_manifesto_inea_async(cpf, senha, cnpj, unidade_gerador, codigo_barras))
 
 INEA_BASE = "https://mtr.inea.rj.gov.br"
 LOGIN_URL = f"{INEA_BASE}/ControllerServlet"
@@ -1236,18 +1327,18 @@ def sse_event(event: str, data: Any) -> str:
     - data: dict/string/list
     """
     if not isinstance(data, str):
-        data = json.dumps(data, ensure_ascii=False)
+        data = codec_json.dumps_str(data)
     # SSE format: event: <name>\ndata: <payload>\n\n
     return f"event: {event}\ndata: {data}\n\n"
 
 # ----------------------------
-# Login (requests/session)
+# Login (cookies da sessão)
 # ----------------------------
-def login_inea_session(cnpj: str, cpf: str, senha: str, unidade_codigo: str = "", tipo: str = "J") -> requests.Session:
+@rastrear("login INEA")
+async def login_inea_cookies_async(cnpj: str, cpf: str, senha: str, unidade_codigo: str = "", tipo: str = "J") -> Dict[str, str]:
     """
-    Faz login e devolve requests.Session autenticada (com cookies).
+    Faz login e devolve os cookies da sessão autenticada (JSESSIONID etc.).
     """
-    s = requests.Session()
 
     headers = {
         "Accept": "*/*",
@@ -1265,7 +1356,8 @@ def login_inea_session(cnpj: str, cpf: str, senha: str, unidade_codigo: str = ""
     }
 
     # GET inicial (seta JSESSIONID muitas vezes)
-    s.get(f"{INEA_BASE}/", headers=headers, timeout=30)
+    inicial = await requisitar_async("GET", f"{INEA_BASE}/", headers=headers, timeout=30)
+    cookies = cookies_resposta(inicial)
 
     payload = {
         "acao": "autenticaUsuario",
@@ -1276,7 +1368,8 @@ def login_inea_session(cnpj: str, cpf: str, senha: str, unidade_codigo: str = ""
         "tipoPessoaSociedade": tipo,
     }
 
-    r = s.post(LOGIN_URL, data=payload, headers=headers, timeout=30)
+    r = await requisitar_async("POST", LOGIN_URL, cookies=cookies, data=payload, headers=headers, timeout=30)
+    cookies.update(cookies_resposta(r))
 
     # tenta interpretar retorno (às vezes vem JSON)
     try:
@@ -1285,19 +1378,27 @@ def login_inea_session(cnpj: str, cpf: str, senha: str, unidade_codigo: str = ""
         body = r.text[:500]
 
     # valida cookie básico
-    js = s.cookies.get("JSESSIONID") or r.cookies.get("JSESSIONID")
+    js = cookies.get("JSESSIONID")
     if not js:
         raise RuntimeError(f"Login sem JSESSIONID. status={r.status_code} body={body}")
 
     # se a API do INEA voltar algo que sinalize erro: você pode reforçar aqui
     # Ex.: {"sucesso":"N"} etc. Como você não colou o payload de retorno do login, mantive leve.
 
-    return s
+    return cookies
 
-def salvar_manifesto_inea(
+
+def login_inea_session(cnpj: str, cpf: str, senha: str, unidade_codigo: str = "", tipo: str = "J") -> requests.Session:
+    """
+    Faz login e devolve requests.Session autenticada (com cookies).
+    """
+    cookies = executar_sincrono(login_inea_cookies_async(cnpj, cpf, senha, unidade_codigo, tipo))
+    return sessao_com_cookies(cookies)
+
+async def salvar_manifesto_inea_async(
     url: str,
     manifesto: dict,
-) -> requests.Response:
+) -> httpx.Response:
     """
     Salva um manifesto no INEA.
 
@@ -1319,11 +1420,7 @@ def salvar_manifesto_inea(
     destino_url = ""
 
     try:
-        payload_inea = json.dumps(
-            manifesto,
-            ensure_ascii=False,
-            separators=(",", ":"),
-        ).encode("utf-8")
+        payload_inea = codec_json.dumps(manifesto)
 
     except (TypeError, ValueError) as error:
         logger.error(
@@ -1357,14 +1454,12 @@ def salvar_manifesto_inea(
         # WORKAROUND: API Tree -> relay local -> INEA
         # ======================================================
         if INEA_WORKAROUND_ENABLED:
-            payload_relay = json.dumps(
+            payload_relay = codec_json.dumps(
                 {
                     "url": url,
                     "manifesto": manifesto,
-                },
-                ensure_ascii=False,
-                separators=(",", ":"),
-            ).encode("utf-8")
+                }
+            )
 
             logger.warning(
                 "[API INEA] Salvamento utilizando workaround | "
@@ -1373,18 +1468,17 @@ def salvar_manifesto_inea(
                 len(payload_relay),
             )
 
-            response_inea, destino_url = executar_post_inea_relay(
+            response_inea, destino_url = await executar_post_inea_relay_async(
                 "/inea/salvarManifesto",
                 safe_to_retry=False,
                 headers={
                     "Content-Type": "application/json; charset=utf-8",
                     "Accept": "application/json, text/plain, */*",
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
-                data=payload_relay,
+                content=payload_relay,
                 timeout=(20, 120),
-                allow_redirects=False,
+                follow_redirects=False,
             )
 
         # ======================================================
@@ -1400,23 +1494,23 @@ def salvar_manifesto_inea(
                 url_mascarada,
             )
 
-            response_inea = requests.post(
+            response_inea = await requisitar_async(
+                "POST",
                 url=destino_url,
                 headers={
                     "Content-Type": "application/json; charset=utf-8",
                     "Accept": "application/json, text/plain, */*",
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
-                data=payload_inea,
+                content=payload_inea,
                 timeout=(15, 90),
-                allow_redirects=False,
+                follow_redirects=False,
             )
 
     except HTTPException:
         raise
 
-    except requests.ConnectTimeout as error:
+    except httpx.ConnectTimeout as error:
         logger.error(
             "[API INEA] Timeout de conexão ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -1435,7 +1529,7 @@ def salvar_manifesto_inea(
             ),
         )
 
-    except requests.ReadTimeout as error:
+    except httpx.ReadTimeout as error:
         logger.error(
             "[API INEA] Timeout de resposta ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -1454,7 +1548,7 @@ def salvar_manifesto_inea(
             ),
         )
 
-    except requests.SSLError as error:
+    except ErroSSL as error:
         logger.error(
             "[API INEA] Erro SSL ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -1469,7 +1563,7 @@ def salvar_manifesto_inea(
             detail=f"Erro SSL ao salvar manifesto no INEA: {str(error)}",
         )
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         logger.error(
             "[API INEA] Erro de comunicação ao salvar manifesto | "
             "modo=%s | destino=%s | endpoint=%s | erro=%s",
@@ -1510,12 +1604,19 @@ def salvar_manifesto_inea(
             modo,
             endpoint,
             response_inea.status_code,
-            response_inea.text[:1000],
+            resumo_texto(conteudo),
         )
 
     return response_inea
 
-def download_manifesto_inea(url: str) -> requests.Response:
+
+def salvar_manifesto_inea(
+    url: str,
+    manifesto: dict,
+) -> httpx.Response:
+    return executar_sincrono(salvar_manifesto_inea_async(url, manifesto))
+
+async def download_manifesto_inea_async(url: str, stream: bool = False) -> httpx.Response:
     """
     Faz o download de um manifesto do INEA.
 
@@ -1524,6 +1625,9 @@ def download_manifesto_inea(url: str) -> requests.Response:
 
     Workaround desabilitado:
         API Tree -> INEA diretamente
+
+    Com stream=True a resposta volta aberta, sem o corpo lido; quem chama
+    repassa o conteúdo e fecha a resposta.
     """
 
     codigo_barras, url_mascarada = (
@@ -1557,7 +1661,7 @@ def download_manifesto_inea(url: str) -> requests.Response:
                 codigo_barras,
             )
 
-            response_inea, destino_url = executar_post_inea_relay(
+            response_inea, destino_url = await executar_post_inea_relay_async(
                 "/inea/downloadManifesto",
                 safe_to_retry=True,
                 headers={
@@ -1567,13 +1671,13 @@ def download_manifesto_inea(url: str) -> requests.Response:
                     ),
                     "Content-Type": "application/json",
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
                 json={
                     "url": url,
                 },
                 timeout=(20, 120),
-                allow_redirects=True,
+                follow_redirects=True,
+                stream=stream,
             )
 
         # ======================================================
@@ -1589,7 +1693,8 @@ def download_manifesto_inea(url: str) -> requests.Response:
                 url_mascarada,
             )
 
-            response_inea = requests.post(
+            response_inea = await requisitar_async(
+                "POST",
                 url=destino_url,
                 headers={
                     "Accept": (
@@ -1597,16 +1702,16 @@ def download_manifesto_inea(url: str) -> requests.Response:
                         "application/octet-stream, */*"
                     ),
                     "User-Agent": "Tree-ESG-API/1.0",
-                    "Connection": "close",
                 },
                 timeout=(15, 60),
-                allow_redirects=True,
+                follow_redirects=True,
+                stream=stream,
             )
 
     except HTTPException:
         raise
 
-    except requests.ConnectTimeout as error:
+    except httpx.ConnectTimeout as error:
         logger.error(
             "[API INEA] Timeout de conexão no download | "
             "modo=%s | destino=%s | codigo_barras=%s | erro=%s",
@@ -1625,7 +1730,7 @@ def download_manifesto_inea(url: str) -> requests.Response:
             ),
         )
 
-    except requests.ReadTimeout as error:
+    except httpx.ReadTimeout as error:
         logger.error(
             "[API INEA] Timeout de resposta no download | "
             "modo=%s | destino=%s | codigo_barras=%s | erro=%s",
@@ -1644,7 +1749,7 @@ def download_manifesto_inea(url: str) -> requests.Response:
             ),
         )
 
-    except requests.SSLError as error:
+    except ErroSSL as error:
         logger.error(
             "[API INEA] Erro SSL no download | "
             "modo=%s | destino=%s | codigo_barras=%s | erro=%s",
@@ -1659,7 +1764,7 @@ def download_manifesto_inea(url: str) -> requests.Response:
             detail=f"Erro SSL durante o download: {str(error)}",
         )
 
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         logger.error(
             "[API INEA] Erro de comunicação no download | "
             "modo=%s | destino=%s | codigo_barras=%s | erro=%s",
@@ -1674,13 +1779,27 @@ def download_manifesto_inea(url: str) -> requests.Response:
             detail=f"Erro de comunicação durante o download: {str(error)}",
         )
 
-    conteudo = response_inea.content or b""
-
     content_type = response_inea.headers.get(
         "Content-Type",
         "application/octet-stream",
     )
 
+    if stream:
+        logger.info(
+            "[API INEA] Download iniciado em streaming | "
+            "modo=%s | destino=%s | codigo_barras=%s | "
+            "status=%s | content_type=%s",
+            modo,
+            destino_url,
+            codigo_barras,
+            response_inea.status_code,
+            content_type,
+        )
+
+        return response_inea
+
+    conteudo = response_inea.content or b""
+
     is_pdf = (
         "application/pdf" in content_type.lower()
         or conteudo.startswith(b"%PDF")
@@ -1701,6 +1820,10 @@ def download_manifesto_inea(url: str) -> requests.Response:
 
     return response_inea
 
+
+def download_manifesto_inea(url: str) -> httpx.Response:
+    return executar_sincrono(download_manifesto_inea_async(url))
+
 # =============
 # HELPERS
 # =============
@@ -0,0 +1,133 @@
+from typing import Any, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from services import codec_json
+
+
+# ==========================================================
+# JSON do órgão repassado sem decodificar
+# ==========================================================
+# As consultas de manifesto, parceiros e modelos só repassam o JSON do
+# órgão dentro do envelope {"sucesso": ..., "dados": ...}. Em vez de
+# response.json() seguido de nova serialização pelo FastAPI, o corpo é
+# guardado em bytes (JsonBruto) e emendado no envelope por RespostaEnvelope.
+
+_BOM_UTF8 = b"\xef\xbb\xbf"
+
+# Primeiro byte possível de um documento JSON.
+_INICIO_JSON = frozenset(b'{["-0123456789tfn')
+
+# Último byte esperado de objetos e arrays.
+_FECHAMENTOS = {ord("{"): ord("}"), ord("["): ord("]")}
+
+_ENCODINGS_UTF8 = {"utf-8", "utf8", "ascii", "us-ascii"}
+
+
+class JsonBruto:
+    """
+    Documento JSON em bytes (UTF-8), como veio do órgão.
+
+    objeto() decodifica sob demanda, para quem precisar transformar o
+    conteúdo; o resultado fica guardado.
+    """
+
+    __slots__ = ("conteudo", "_objeto", "_decodificado")
+
+    def __init__(self, conteudo: bytes):
+        self.conteudo = conteudo
+        self._objeto: Any = None
+        self._decodificado = False
+
+    def objeto(self) -> Any:
+        if not self._decodificado:
+            self._objeto = codec_json.loads(self.conteudo)
+            self._decodificado = True
+        return self._objeto
+
+    def __len__(self) -> int:
+        return len(self.conteudo)
+
+    def __repr__(self) -> str:
+        return f"JsonBruto({len(self.conteudo)} bytes)"
+
+
+def json_bruto(resp: httpx.Response, orgao: Optional[str] = None) -> JsonBruto:
+    """
+    Corpo da resposta como JsonBruto, sem decodificar o JSON.
+
+    Objetos e arrays são conferidos pelo primeiro e pelo último byte, sem
+    decodificar; escalares ("null", números, "true"...) são decodificados,
+    pois "null pointer exception" também começa com "n". O que não passa
+    (página de erro em HTML com status 200, texto solto) vira 502 em vez
+    de ser emendado no envelope. Corpos em outro charset são convertidos
+    para UTF-8.
+    """
+
+    conteudo = resp.content
+
+    if conteudo.startswith(_BOM_UTF8):
+        conteudo = conteudo[len(_BOM_UTF8):]
+
+    encoding = (resp.charset_encoding or "utf-8").lower()
+    if encoding not in _ENCODINGS_UTF8:
+        conteudo = resp.text.encode("utf-8")
+
+    conteudo = conteudo.strip()
+
+    if not _parece_json(conteudo):
+        raise HTTPException(
+            status_code=502,
+            detail=f"Resposta inválida do {orgao or 'órgão'}: conteúdo não é JSON",
+        )
+
+    return JsonBruto(conteudo)
+
+
+def _parece_json(conteudo: bytes) -> bool:
+    if not conteudo or conteudo[0] not in _INICIO_JSON:
+        return False
+
+    fechamento = _FECHAMENTOS.get(conteudo[0])
+    if fechamento is not None:
+        return conteudo[-1] == fechamento
+
+    # Escalar: curto, decodificar sai barato.
+    try:
+        codec_json.loads(conteudo)
+    except ValueError:
+        return False
+
+    return True
+
+
+def _codificar(valor: Any) -> bytes:
+    if isinstance(valor, JsonBruto):
+        return valor.conteudo
+
+    if isinstance(valor, dict):
+        return b"{" + b",".join(
+            _codificar(str(chave)) + b":" + _codificar(item) for chave, item in valor.items()
+        ) + b"}"
+
+    if isinstance(valor, (list, tuple)):
+        return b"[" + b",".join(_codificar(item) for item in valor) + b"]"
+
+    return codec_json.dumps(valor)
+
+
+def codificar_envelope(conteudo: Any) -> bytes:
+    """Serializa o envelope emendando os JsonBruto no lugar, sem decodificá-los."""
+
+    return _codificar(conteudo)
+
+
+class RespostaEnvelope(Response):
+    """JSONResponse que aceita JsonBruto em qualquer nível do conteúdo."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return codificar_envelope(content)
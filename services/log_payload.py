@@ -0,0 +1,245 @@
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+import httpx
+
+from services import codec_json
+from services.json_bruto import JsonBruto
+
+
+# ==========================================================
+# Log de payloads das rotas de escrita (salvarManifesto)
+# ==========================================================
+# Toda requisição registra só metadados (tamanho, status, duração), sem
+# serializar o corpo. O conteúdo, mascarado e truncado, vai para o log
+# numa amostra das requisições e sempre que a chamada falha.
+
+# Fração das requisições com corpo registrado (0.01 = 1%).
+LOG_PAYLOAD_AMOSTRAGEM = float(os.getenv("LOG_PAYLOAD_AMOSTRAGEM", "0.01"))
+
+# Registra o corpo mascarado de toda requisição que terminar em erro.
+LOG_PAYLOAD_SEMPRE_EM_ERRO = (
+    os.getenv("LOG_PAYLOAD_SEMPRE_EM_ERRO", "true").strip().lower() in ("1", "true", "sim", "yes")
+)
+
+# Tamanho máximo do trecho registrado de cada corpo.
+LOG_PAYLOAD_MAX_BYTES = int(os.getenv("LOG_PAYLOAD_MAX_BYTES", "2048"))
+
+# Profundidade máxima percorrida no JSON ao montar o resumo.
+_PROFUNDIDADE_MAXIMA = 12
+
+MASCARA = "***"
+
+# Campos mascarados (comparação sem maiúsculas, "_" e "-").
+_CHAVES_SENSIVEIS = frozenset((
+    "login",
+    "cpf",
+    "authorization",
+    "cookie",
+    "jsessionid",
+    "chave",
+    "chavefeam",
+))
+_TRECHOS_SENSIVEIS = ("senha", "password", "token", "secret")
+
+
+# Mesmos campos, em texto JSON que não foi decodificado ("senha": "...").
+_RE_CAMPO_SENSIVEL = re.compile(
+    r'("(?:[^"]*(?:' + "|".join(_TRECHOS_SENSIVEIS) + r')[^"]*|'
+    + "|".join(_CHAVES_SENSIVEIS) + r')"\s*:\s*)"[^"]*"',
+    re.IGNORECASE,
+)
+
+
+def chave_sensivel(chave: Any) -> bool:
+    normalizada = str(chave).lower().replace("_", "").replace("-", "")
+    return normalizada in _CHAVES_SENSIVEIS or any(trecho in normalizada for trecho in _TRECHOS_SENSIVEIS)
+
+
+class _Esgotado(Exception):
+    pass
+
+
+class _Resumo:
+    def __init__(self, limite: int):
+        self._partes: List[str] = []
+        self._restante = limite
+
+    def escrever(self, texto: str) -> None:
+        if len(texto) > self._restante:
+            self._partes.append(texto[: self._restante])
+            self._restante = 0
+            raise _Esgotado
+
+        self._partes.append(texto)
+        self._restante -= len(texto)
+
+    def texto(self) -> str:
+        return "".join(self._partes)
+
+
+def _escrever(valor: Any, resumo: _Resumo, profundidade: int, limite: int) -> None:
+    if profundidade > _PROFUNDIDADE_MAXIMA:
+        resumo.escrever('"…"')
+        return
+
+    if isinstance(valor, dict):
+        resumo.escrever("{")
+        for indice, (chave, item) in enumerate(valor.items()):
+            if indice:
+                resumo.escrever(",")
+            resumo.escrever(codec_json.dumps_str(str(chave)[:limite]) + ":")
+
+            if item is not None and chave_sensivel(chave):
+                resumo.escrever(f'"{MASCARA}"')
+            else:
+                _escrever(item, resumo, profundidade + 1, limite)
+        resumo.escrever("}")
+        return
+
+    if isinstance(valor, (list, tuple)):
+        resumo.escrever("[")
+        for indice, item in enumerate(valor):
+            if indice:
+                resumo.escrever(",")
+            _escrever(item, resumo, profundidade + 1, limite)
+        resumo.escrever("]")
+        return
+
+    if isinstance(valor, str):
+        # Corta antes de serializar: o custo não depende do tamanho da string.
+        valor = valor[:limite]
+
+    resumo.escrever(codec_json.dumps_str(valor))
+
+
+def resumo_payload(valor: Any, limite: int = LOG_PAYLOAD_MAX_BYTES) -> str:
+    """
+    JSON mascarado de valor, com no máximo limite caracteres.
+
+    O percurso para assim que o limite é atingido, então o custo é
+    proporcional ao limite e não ao tamanho do payload.
+    """
+
+    resumo = _Resumo(limite)
+
+    try:
+        _escrever(valor, resumo, 0, limite)
+    except _Esgotado:
+        return resumo.texto() + "…(truncado)"
+
+    return resumo.texto()
+
+
+def tamanho_payload(valor: Any) -> str:
+    """Só o tamanho do valor (itens ou bytes), para logs sem dados do órgão."""
+
+    if isinstance(valor, JsonBruto):
+        return f"{len(valor)} bytes"
+    if isinstance(valor, (list, tuple)):
+        return f"{len(valor)} itens"
+    if isinstance(valor, dict):
+        return f"{len(valor)} chaves"
+    if isinstance(valor, (bytes, str)):
+        return f"{len(valor)} bytes"
+
+    return type(valor).__name__
+
+
+def resumo_texto(conteudo: bytes, limite: int = LOG_PAYLOAD_MAX_BYTES) -> str:
+    """Início mascarado de um corpo de resposta, sem decodificar o restante."""
+
+    trecho = _RE_CAMPO_SENSIVEL.sub(rf'\1"{MASCARA}"', conteudo[:limite].decode("utf-8", errors="replace"))
+
+    if len(conteudo) > limite:
+        return trecho + "…(truncado)"
+
+    return trecho
+
+
+class RastreioPayload:
+    """
+    Log de uma requisição de escrita: metadados sempre, corpo mascarado só
+    quando sorteada para a amostra ou quando termina em erro.
+    """
+
+    def __init__(self, logger: logging.Logger, rota: str, amostragem: Optional[float] = None):
+        self._logger = logger
+        self._rota = rota
+        self._inicio = time.monotonic()
+        self._corpo: Any = None
+        self._corpo_registrado = False
+
+        taxa = LOG_PAYLOAD_AMOSTRAGEM if amostragem is None else amostragem
+        self.amostrado = taxa > 0 and random.random() < taxa
+
+    def _duracao(self) -> float:
+        return time.monotonic() - self._inicio
+
+    def _registrar_corpo(self, nivel: int) -> None:
+        if self._corpo_registrado or self._corpo is None:
+            return
+
+        self._corpo_registrado = True
+        self._logger.log(nivel, "[%s] Corpo da requisição | corpo=%s", self._rota, resumo_payload(self._corpo))
+
+    def entrada(self, corpo: Any, tamanho: int) -> None:
+        self._corpo = corpo
+
+        self._logger.info(
+            "[%s] Requisição recebida | tamanho=%s | amostrada=%s",
+            self._rota,
+            tamanho,
+            self.amostrado,
+        )
+
+        if self.amostrado:
+            self._registrar_corpo(logging.INFO)
+
+    def saida(self, resp: httpx.Response, orgao: str) -> None:
+        erro = resp.status_code >= 400
+        nivel = logging.WARNING if erro else logging.INFO
+
+        self._logger.log(
+            nivel,
+            "[%s] Resposta do %s | status=%s | tamanho=%s | duracao=%.2fs",
+            self._rota,
+            orgao,
+            resp.status_code,
+            len(resp.content),
+            self._duracao(),
+        )
+
+        if self.amostrado or (erro and LOG_PAYLOAD_SEMPRE_EM_ERRO):
+            self._registrar_corpo(nivel)
+            self._logger.log(
+                nivel,
+                "[%s] Corpo da resposta do %s | corpo=%s",
+                self._rota,
+                orgao,
+                resumo_texto(resp.content),
+            )
+
+    def falha(self, status_code: int, detalhe: Any) -> None:
+        self._logger.warning(
+            "[%s] Requisição recusada | status=%s | detalhe=%s | duracao=%.2fs",
+            self._rota,
+            status_code,
+            detalhe,
+            self._duracao(),
+        )
+
+        if LOG_PAYLOAD_SEMPRE_EM_ERRO:
+            self._registrar_corpo(logging.WARNING)
+
+    def excecao(self) -> None:
+        """Chamar dentro do except: registra o traceback e o corpo."""
+
+        self._logger.exception("[%s] Erro inesperado | duracao=%.2fs", self._rota, self._duracao())
+
+        if LOG_PAYLOAD_SEMPRE_EM_ERRO:
+            self._registrar_corpo(logging.ERROR)
@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import HTTPException
+
+from services.clientes_http import cookies_resposta, requisitar_async
+from services.rastreamento import span
+from services.resiliencia import BulkheadCheio, CircuitoAberto
+
+
+logger = logging.getLogger("login_controller")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Login direto no ControllerServlet (IMA, FEAM)
+# ==========================================================
+
+# Tenta o formulário de login por HTTP antes de chamar o serviço Selenium.
+# LOGIN_HTTP_ENABLED=false volta a usar apenas o navegador.
+LOGIN_HTTP_ENABLED = os.getenv("LOGIN_HTTP_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+HTTP = "http"
+NAVEGADOR = "navegador"
+
+Estrategia = Tuple[str, Callable[[], Awaitable[Dict[str, str]]]]
+
+
+class LoginHttpRecusado(Exception):
+    """O login por formulário não resultou numa sessão autenticada."""
+
+
+async def autenticar_controller_servlet_async(
+    controller_url: str,
+    cnpj: str,
+    senha: str,
+    cpf_usuario: str,
+    unidade_codigo: str = "",
+    timeout: int = 30,
+) -> Tuple[Dict[str, str], httpx.Response]:
+    """Envia acao=autenticaUsuario como o index.jsp faz; não valida a sessão."""
+
+    origem = "{0.scheme}://{0.netloc}".format(urlparse(controller_url))
+
+    # Headers parecidos com o browser (os essenciais)
+    headers = {
+        "Accept": "*/*",
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "Origin": origem,
+        "Referer": f"{origem}/index.jsp",
+        "X-Requested-With": "XMLHttpRequest",
+        "User-Agent": (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36"
+        ),
+    }
+
+    data = {
+        "acao": "autenticaUsuario",
+        "txtCnpj": cnpj,
+        "txtSenha": senha,
+        "txtUnidadeCodigo": unidade_codigo,
+        "txtCpfUsuario": cpf_usuario,
+        "tipoPessoaSociedade": "J",
+    }
+
+    resp = await requisitar_async("POST", controller_url, headers=headers, data=data, timeout=timeout)
+    resp.raise_for_status()
+
+    return cookies_resposta(resp), resp
+
+
+async def validar_sessao_controller_async(
+    controller_url: str,
+    cookies: Dict[str, str],
+    timeout: int = 30,
+) -> Dict[str, str]:
+    """
+    Confirma que o JSESSIONID está autenticado abrindo a página principal.
+
+    O servidor entrega um JSESSIONID já no primeiro acesso, antes do login;
+    só a presença do cookie não garante a sessão. Retorna os cookies
+    atualizados pela página (ex.: afinidade do balanceador).
+    """
+
+    if not cookies.get("JSESSIONID"):
+        raise LoginHttpRecusado("JSESSIONID não retornado no login")
+
+    resp = await requisitar_async(
+        "GET",
+        controller_url,
+        params={"acao": "paginaPrincipal"},
+        cookies=cookies,
+        timeout=timeout,
+        follow_redirects=True,
+    )
+
+    # Sem sessão o sistema redireciona (ou devolve) o formulário de login.
+    if (
+        resp.status_code != 200
+        or "paginaPrincipal" not in str(resp.url)
+        or 'id="txtSenha"' in resp.text
+    ):
+        raise LoginHttpRecusado(f"sessão não autenticada (HTTP {resp.status_code}, url={resp.url.path})")
+
+    return {**cookies, **cookies_resposta(resp)}
+
+
+async def login_controller_servlet_async(
+    controller_url: str,
+    cnpj: str,
+    senha: str,
+    cpf_usuario: str,
+    unidade_codigo: str = "",
+    timeout: int = 30,
+) -> Dict[str, str]:
+    """Login por formulário + verificação da sessão; retorna os cookies."""
+
+    cookies, _ = await autenticar_controller_servlet_async(
+        controller_url, cnpj, senha, cpf_usuario, unidade_codigo, timeout
+    )
+
+    return await validar_sessao_controller_async(controller_url, cookies, timeout)
+
+
+# ==========================================================
+# Cadeia de estratégias
+# ==========================================================
+
+_LOCK = threading.Lock()
+_ESTATISTICAS: Dict[str, Dict[str, Any]] = {}
+
+
+def _registrar(orgao: str, estrategia: str, sucesso: bool, duracao: float) -> None:
+    with _LOCK:
+        por_orgao = _ESTATISTICAS.setdefault(orgao, {"ultima_estrategia": None})
+        contadores = por_orgao.setdefault(estrategia, {"sucessos": 0, "falhas": 0, "duracao_media": 0.0})
+
+        if sucesso:
+            contadores["sucessos"] += 1
+            n = contadores["sucessos"]
+            contadores["duracao_media"] += (duracao - contadores["duracao_media"]) / n
+            por_orgao["ultima_estrategia"] = estrategia
+        else:
+            contadores["falhas"] += 1
+
+
+async def login_com_fallback_async(orgao: str, estrategias: List[Estrategia]) -> Dict[str, str]:
+    """
+    Tenta as estratégias em ordem e retorna os cookies da primeira que der
+    certo, registrando qual foi. O erro da última é repassado.
+
+    Circuito aberto/bulkhead cheio não passa para a próxima estratégia:
+    o órgão está indisponível para qualquer uma delas.
+    """
+
+    ultimo_erro: BaseException = HTTPException(status_code=502, detail=f"Nenhuma estratégia de login para {orgao}")
+
+    with span(f"login {orgao}", {"mtr.orgao": orgao}) as atual:
+        for nome, estrategia in estrategias:
+            inicio = time.monotonic()
+
+            try:
+                with span(f"login {orgao} {nome}", {"mtr.orgao": orgao, "mtr.estrategia": nome}):
+                    cookies = await estrategia()
+            except (CircuitoAberto, BulkheadCheio):
+                raise
+            except (LoginHttpRecusado, HTTPException, httpx.HTTPError, ValueError) as error:
+                _registrar(orgao, nome, False, time.monotonic() - inicio)
+                logger.warning(
+                    "[LOGIN %s] Estratégia falhou | estrategia=%s | duracao=%.2fs | erro=%s",
+                    orgao,
+                    nome,
+                    time.monotonic() - inicio,
+                    str(error) or type(error).__name__,
+                )
+                ultimo_erro = error
+                continue
+
+            duracao = time.monotonic() - inicio
+            _registrar(orgao, nome, True, duracao)
+            atual.set_attribute("mtr.estrategia", nome)
+            logger.info("[LOGIN %s] Login concluído | estrategia=%s | duracao=%.2fs", orgao, nome, duracao)
+            return cookies
+
+        raise ultimo_erro
+
+
+def estrategias_login(
+    rapida: Callable[[], Awaitable[Dict[str, str]]],
+    navegador: Callable[[], Awaitable[Dict[str, str]]],
+) -> List[Estrategia]:
+    if not LOGIN_HTTP_ENABLED:
+        return [(NAVEGADOR, navegador)]
+
+    return [(HTTP, rapida), (NAVEGADOR, navegador)]
+
+
+def estatisticas_login() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            "login_http_habilitado": LOGIN_HTTP_ENABLED,
+            "orgaos": {
+                orgao: {
+                    chave: dict(valor) if isinstance(valor, dict) else valor
+                    for chave, valor in dados.items()
+                }
+                for orgao, dados in _ESTATISTICAS.items()
+            },
+        }
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from services.clientes_http import executar_sincrono
+from services.concorrencia import LimiteConcorrencia
+from services.feam import gerar_token_feam_async, retorna_manifesto_feam_async
+from services.fepam import retorna_manifesto_fepam_async
+from services.ima import consultar_manifesto_ima_async
+from services.inea import retorna_manifesto_inea_async
+from services.semad import consultar_manifesto_semad_async, gerar_token_semad_async
+from services.sigor import consultar_manifesto_sigor_async, gerar_token_sigor_async
+from services.sinir import consultar_manifesto_sinir_async, gerar_token_sinir_async
+
+
+logger = logging.getLogger("lote_manifestos")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração da consulta em lote
+# ==========================================================
+
+# Máximo de códigos aceitos por requisição.
+LOTE_MAX_CODIGOS = int(os.getenv("LOTE_MAX_CODIGOS", "500"))
+
+# Consultas simultâneas por órgão, somando todos os lotes em andamento.
+# Pode ser ajustado por órgão: LOTE_CONCORRENCIA_INEA=4, etc.
+LOTE_CONCORRENCIA_PADRAO = int(os.getenv("LOTE_CONCORRENCIA_PADRAO", "8"))
+
+
+# =========================
+# Schema de entrada
+# =========================
+class ConsultaManifestosLoteRequest(BaseModel):
+    orgao: str
+    codigos: List[str]
+    cpfCnpj: Optional[str] = None
+    cpf: Optional[str] = None
+    cnpj: Optional[str] = None
+    senha: str
+    unidade: Optional[str] = None
+    unidadeGerador: Optional[str] = None
+    pessoaCodigo: Optional[int] = None
+
+
+# Campos de credencial exigidos por órgão (mesmos das rotas individuais).
+CAMPOS_OBRIGATORIOS = {
+    "FEAM": ("cnpj", "unidadeGerador"),
+    "IMA": ("cnpj", "unidadeGerador"),
+    "INEA": ("cpf", "cnpj", "unidadeGerador"),
+    "FEPAM": ("cpf", "cnpj"),
+    "SINIR": ("cpfCnpj", "unidade"),
+    "SIGOR": ("cpfCnpj", "unidade"),
+    "SEMAD": ("pessoaCodigo", "cnpj", "cpf"),
+}
+
+_LIMITES: Dict[str, LimiteConcorrencia] = {
+    orgao: LimiteConcorrencia(
+        int(os.getenv(f"LOTE_CONCORRENCIA_{orgao}", str(LOTE_CONCORRENCIA_PADRAO)))
+    )
+    for orgao in CAMPOS_OBRIGATORIOS
+}
+
+
+def validar_lote(dados: ConsultaManifestosLoteRequest) -> tuple[str, List[str]]:
+    orgao = (dados.orgao or "").strip().upper()
+
+    if orgao not in CAMPOS_OBRIGATORIOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Órgão inválido. Use: {', '.join(sorted(CAMPOS_OBRIGATORIOS))}",
+        )
+
+    campos_ausentes = [
+        campo
+        for campo in CAMPOS_OBRIGATORIOS[orgao]
+        if getattr(dados, campo) is None or str(getattr(dados, campo)).strip() == ""
+    ]
+
+    if campos_ausentes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos obrigatórios para {orgao} não informados: {', '.join(campos_ausentes)}",
+        )
+
+    codigos = [str(codigo).strip() for codigo in dados.codigos if str(codigo).strip()]
+
+    if not codigos:
+        raise HTTPException(
+            status_code=400,
+            detail="Informe ao menos um código.",
+        )
+
+    if len(codigos) > LOTE_MAX_CODIGOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {LOTE_MAX_CODIGOS} códigos por lote.",
+        )
+
+    return orgao, codigos
+
+
+def _consulta_por_orgao(
+    orgao: str,
+    dados: ConsultaManifestosLoteRequest,
+) -> tuple[Optional[Callable[[], Awaitable[Any]]], Callable[[str], Awaitable[Any]]]:
+    """Retorna (autenticação única ou None, consulta de um código)."""
+
+    if orgao == "FEAM":
+        if not str(dados.unidadeGerador).strip().isdigit():
+            raise HTTPException(
+                status_code=400,
+                detail="unidadeGerador da FEAM deve conter somente números.",
+            )
+
+        unidade = int(dados.unidadeGerador)
+        return (
+            lambda: gerar_token_feam_async(dados.cnpj, dados.senha, unidade),
+            lambda codigo: retorna_manifesto_feam_async(dados.cnpj, dados.senha, unidade, codigo),
+        )
+
+    if orgao == "SINIR":
+        return (
+            lambda: gerar_token_sinir_async(dados.cpfCnpj, dados.senha, dados.unidade),
+            lambda codigo: consultar_manifesto_sinir_async(dados.cpfCnpj, dados.senha, dados.unidade, codigo),
+        )
+
+    if orgao == "SIGOR":
+        return (
+            lambda: gerar_token_sigor_async(dados.cpfCnpj, dados.senha, dados.unidade),
+            lambda codigo: consultar_manifesto_sigor_async(dados.cpfCnpj, dados.senha, dados.unidade, codigo),
+        )
+
+    if orgao == "SEMAD":
+        return (
+            lambda: gerar_token_semad_async(dados.pessoaCodigo, dados.cnpj, dados.cpf, dados.senha),
+            lambda codigo: consultar_manifesto_semad_async(
+                dados.pessoaCodigo, dados.cnpj, dados.cpf, dados.senha, codigo
+            ),
+        )
+
+    # IMA, INEA e FEPAM recebem as credenciais em cada chamada (sem token).
+    if orgao == "IMA":
+        return None, lambda codigo: consultar_manifesto_ima_async(
+            codigo, dados.unidadeGerador, dados.senha, dados.cnpj
+        )
+
+    if orgao == "INEA":
+        return None, lambda codigo: retorna_manifesto_inea_async(
+            dados.cpf, dados.senha, dados.cnpj, dados.unidadeGerador, codigo
+        )
+
+    return None, lambda codigo: retorna_manifesto_fepam_async(dados.cnpj, dados.cpf, dados.senha, codigo)
+
+
+async def _consultar_item(
+    limite: LimiteConcorrencia,
+    consultar: Callable[[str], Awaitable[Any]],
+    codigo: str,
+) -> Dict[str, Any]:
+    async with limite:
+        try:
+            return {"codigo": codigo, "sucesso": True, "dados": await consultar(codigo)}
+        except HTTPException as error:
+            return {
+                "codigo": codigo,
+                "sucesso": False,
+                "status_code": error.status_code,
+                "erro": error.detail,
+            }
+        except Exception as error:
+            logger.exception("[LOTE] Erro inesperado ao consultar código | codigo=%s", codigo)
+            return {
+                "codigo": codigo,
+                "sucesso": False,
+                "status_code": 500,
+                "erro": str(error),
+            }
+
+
+async def consultar_manifestos_lote_async(dados: ConsultaManifestosLoteRequest) -> Dict[str, Any]:
+    orgao, codigos = validar_lote(dados)
+    autenticar, consultar = _consulta_por_orgao(orgao, dados)
+
+    inicio = time.monotonic()
+
+    # Autentica uma vez antes do fan-out: credencial inválida falha o lote
+    # inteiro em vez de repetir o gettoken para cada código.
+    if autenticar is not None:
+        await autenticar()
+
+    # Códigos repetidos são consultados uma única vez.
+    unicos = list(dict.fromkeys(codigos))
+    limite = _LIMITES[orgao]
+
+    resultados = await asyncio.gather(
+        *[_consultar_item(limite, consultar, codigo) for codigo in unicos]
+    )
+    por_codigo = dict(zip(unicos, resultados))
+
+    # Contagens sobre a lista devolvida (um item por código recebido,
+    # repetidos inclusive): sucessos + falhas == total.
+    itens = [por_codigo[codigo] for codigo in codigos]
+    sucessos = sum(1 for item in itens if item["sucesso"])
+
+    logger.info(
+        "[LOTE] Consulta finalizada | orgao=%s | codigos=%s | unicos=%s | sucessos=%s | falhas=%s | duracao=%.2fs",
+        orgao,
+        len(codigos),
+        len(unicos),
+        sucessos,
+        len(itens) - sucessos,
+        time.monotonic() - inicio,
+    )
+
+    return {
+        "orgao": orgao,
+        "total": len(itens),
+        "unicos": len(unicos),
+        "sucessos": sucessos,
+        "falhas": len(itens) - sucessos,
+        "resultados": itens,
+    }
+
+
+def consultar_manifestos_lote(dados: ConsultaManifestosLoteRequest) -> Dict[str, Any]:
+    return executar_sincrono(consultar_manifestos_lote_async(dados))
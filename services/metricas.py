@@ -0,0 +1,251 @@
+import bisect
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+
+
+# ==========================================================
+# Métricas dos órgãos (formato Prometheus)
+# ==========================================================
+# Alimentadas por requisitar_async (services/clientes_http.py), por onde
+# passam as chamadas de todos os serviços. Expostas em GET /metrics.
+
+METRICAS_ENABLED = os.getenv("METRICAS_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+BUCKETS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Rótulo de hosts fora de HOSTS_UPSTREAM (relay, serviços de login), para
+# que subdomínios variáveis não criem séries novas.
+ORGAO_EXTERNO = "externo"
+OPERACAO_DESCONHECIDA = "outro"
+
+# Trechos do caminho que não identificam a operação.
+_SEGMENTOS_GENERICOS = frozenset((
+    "api",
+    "apiws",
+    "rest",
+    "mtr",
+    "mtrservice",
+    "controllerservlet",
+    "inea",
+))
+
+_RE_OPERACAO = re.compile(r"^[A-Za-z][A-Za-z_-]{0,47}$")
+
+Rotulos = Tuple[str, ...]
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Rotulos, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str]):
+        self.nome = nome
+        self._ajuda = ajuda
+        self._rotulos = tuple(rotulos)
+        self._valores: Dict[Rotulos, float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *valores: str, quantidade: float = 1) -> None:
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + quantidade
+
+    def exposicao(self) -> List[str]:
+        with self._lock:
+            valores = sorted(self._valores.items())
+
+        linhas = [f"# HELP {self.nome} {self._ajuda}", f"# TYPE {self.nome} counter"]
+        for rotulos, valor in valores:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self._rotulos, rotulos)} {_numero(valor)}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str], buckets: Sequence[float]):
+        self.nome = nome
+        self._ajuda = ajuda
+        self._rotulos = tuple(rotulos)
+        self._buckets = tuple(sorted(buckets))
+        # rotulos -> (contagem por bucket, soma, total)
+        self._series: Dict[Rotulos, List] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *valores: str) -> None:
+        indice = bisect.bisect_left(self._buckets, valor)
+
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * len(self._buckets), 0.0, 0]
+
+            if indice < len(self._buckets):
+                serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exposicao(self) -> List[str]:
+        with self._lock:
+            series = sorted((rotulos, (list(s[0]), s[1], s[2])) for rotulos, s in self._series.items())
+
+        linhas = [f"# HELP {self.nome} {self._ajuda}", f"# TYPE {self.nome} histogram"]
+
+        for rotulos, (contagens, soma, total) in series:
+            acumulado = 0
+            for limite, contagem in zip(self._buckets, contagens):
+                acumulado += contagem
+                le = f'le="{_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self._rotulos, rotulos, le)} {acumulado}")
+
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self._rotulos, rotulos, le)} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self._rotulos, rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self._rotulos, rotulos)} {total}")
+
+        return linhas
+
+
+LATENCIA = Histograma(
+    "upstream_latencia_segundos",
+    "Duração das requisições aos órgãos (até o corpo lido; em streaming, até os cabeçalhos).",
+    ("orgao", "operacao"),
+    BUCKETS_LATENCIA,
+)
+BYTES_RESPOSTA = Histograma(
+    "upstream_resposta_bytes",
+    "Tamanho do corpo das respostas dos órgãos.",
+    ("orgao", "operacao"),
+    BUCKETS_BYTES,
+)
+BYTES_REQUISICAO = Histograma(
+    "upstream_requisicao_bytes",
+    "Tamanho do corpo enviado aos órgãos.",
+    ("orgao", "operacao"),
+    BUCKETS_BYTES,
+)
+RESPOSTAS = Contador(
+    "upstream_respostas_total",
+    "Respostas dos órgãos por status HTTP.",
+    ("orgao", "operacao", "status"),
+)
+TIMEOUTS = Contador(
+    "upstream_timeouts_total",
+    "Requisições aos órgãos encerradas por timeout.",
+    ("orgao", "operacao"),
+)
+ERROS = Contador(
+    "upstream_erros_total",
+    "Falhas sem resposta HTTP (conexão, TLS, circuito aberto, bulkhead).",
+    ("orgao", "operacao", "tipo"),
+)
+
+_METRICAS = (LATENCIA, BYTES_RESPOSTA, BYTES_REQUISICAO, RESPOSTAS, TIMEOUTS, ERROS)
+
+
+def operacao_da_requisicao(request: httpx.Request) -> str:
+    """
+    Nome da operação a partir da requisição: o primeiro trecho do caminho
+    que não seja prefixo de API (retornaManifesto, gettoken,
+    pesquisaParceiro...), o nome do arquivo quando o caminho termina em um
+    (.java, .jsp) ou, no ControllerServlet, o parâmetro acao. Códigos,
+    CPFs e senhas do caminho nunca viram rótulo.
+    """
+
+    acao = request.url.params.get("acao")
+
+    if acao is None and request.url.path.lower().endswith("controllerservlet"):
+        tipo = request.headers.get("Content-Type", "")
+        if "x-www-form-urlencoded" in tipo:
+            try:
+                acao = parse_qs(request.content.decode("utf-8", errors="ignore")).get("acao", [None])[0]
+            except httpx.RequestNotRead:
+                acao = None
+
+    if acao is not None:
+        return acao if _RE_OPERACAO.match(acao) else OPERACAO_DESCONHECIDA
+
+    arquivo = request.url.path.rsplit("/", 1)[-1]
+    if "." in arquivo:
+        nome = arquivo.split(".", 1)[0]
+        return nome if _RE_OPERACAO.match(nome) else OPERACAO_DESCONHECIDA
+
+    for segmento in request.url.path.split("/"):
+        if not segmento or segmento.lower() in _SEGMENTOS_GENERICOS:
+            continue
+        return segmento if _RE_OPERACAO.match(segmento) else OPERACAO_DESCONHECIDA
+
+    return OPERACAO_DESCONHECIDA
+
+
+def _tamanho_requisicao(request: httpx.Request) -> Optional[int]:
+    try:
+        return len(request.content)
+    except httpx.RequestNotRead:
+        return None
+
+
+def registrar_resposta(
+    orgao: str,
+    operacao: str,
+    request: httpx.Request,
+    resp: httpx.Response,
+    duracao: float,
+    stream: bool = False,
+) -> None:
+    if not METRICAS_ENABLED:
+        return
+
+    LATENCIA.observar(duracao, orgao, operacao)
+    RESPOSTAS.incrementar(orgao, operacao, str(resp.status_code))
+
+    enviados = _tamanho_requisicao(request)
+    if enviados:
+        BYTES_REQUISICAO.observar(enviados, orgao, operacao)
+
+    # Em streaming o corpo ainda não foi lido: o tamanho entra em
+    # registrar_bytes_stream, quando o repasse termina.
+    if not stream:
+        BYTES_RESPOSTA.observar(len(resp.content), orgao, operacao)
+
+
+def registrar_falha(orgao: str, operacao: str, erro: BaseException, duracao: Optional[float] = None) -> None:
+    if not METRICAS_ENABLED:
+        return
+
+    if duracao is not None:
+        LATENCIA.observar(duracao, orgao, operacao)
+
+    if isinstance(erro, httpx.TimeoutException):
+        TIMEOUTS.incrementar(orgao, operacao)
+    else:
+        ERROS.incrementar(orgao, operacao, type(erro).__name__)
+
+
+def registrar_bytes_stream(orgao: str, operacao: str, total: int) -> None:
+    if METRICAS_ENABLED:
+        BYTES_RESPOSTA.observar(total, orgao, operacao)
+
+
+def exposicao_prometheus() -> str:
+    linhas: List[str] = []
+    for metrica in _METRICAS:
+        linhas.extend(metrica.exposicao())
+    return "\n".join(linhas) + "\n"
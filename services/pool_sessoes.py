@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar, Union
+
+import httpx
+from fastapi import HTTPException
+
+from services.armazem_sessoes import armazem_sessoes
+
+
+logger = logging.getLogger("pool_sessoes")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do pool de sessões autenticadas
+# ==========================================================
+
+# Quantidade máxima de sessões simultâneas por órgão.
+POOL_SESSOES_TAMANHO = int(os.getenv("POOL_SESSOES_TAMANHO", "2"))
+
+# Tempo de vida de uma sessão antes de forçar novo login.
+# O JSESSIONID dos sistemas MTR expira após ~30 min sem uso.
+POOL_SESSOES_TTL_SEGUNDOS = float(os.getenv("POOL_SESSOES_TTL_SEGUNDOS", "900"))
+
+# Tempo máximo aguardando uma sessão livre quando o pool está cheio.
+POOL_SESSOES_ESPERA_SEGUNDOS = float(os.getenv("POOL_SESSOES_ESPERA_SEGUNDOS", "60"))
+
+T = TypeVar("T")
+
+
+class SessaoExpirada(Exception):
+    """O órgão recusou a sessão emprestada; é necessário novo login."""
+
+
+@dataclass
+class SessaoAutenticada:
+    cookies: Dict[str, str] = field(default_factory=dict)
+    token: Optional[str] = None
+    expira_em: float = 0.0
+
+    # Posição no pool; a sessão de cada vaga é a mesma em todos os workers.
+    vaga: Optional[int] = None
+
+    def expirada(self) -> bool:
+        return time.monotonic() >= self.expira_em
+
+
+class PoolSessoes:
+    """
+    Pool de sessões autenticadas de um órgão.
+
+    Cada sessão (cookies/token) é emprestada com exclusividade e devolvida
+    ao final da operação. O login só é refeito quando a sessão passa do
+    TTL ou quando o órgão a recusa.
+
+    Quem espera por uma sessão recebe um Future: o resultado é a própria
+    sessão devolvida por outro usuário ou o número de uma vaga livre para
+    um novo login.
+
+    O login de cada vaga fica no armazém de sessões (ARMAZEM_SESSOES): com
+    sqlite/redis, a vaga 0 de todos os workers usa o mesmo login, feito
+    por um só deles. A exclusividade do empréstimo vale dentro do processo.
+    """
+
+    def __init__(
+        self,
+        orgao: str,
+        login: Callable[[], Awaitable[SessaoAutenticada]],
+        tamanho: int = POOL_SESSOES_TAMANHO,
+        ttl_segundos: float = POOL_SESSOES_TTL_SEGUNDOS,
+    ):
+        self.orgao = orgao
+        self._login = login
+        self._tamanho = max(1, tamanho)
+        self._ttl_segundos = ttl_segundos
+        self._livres: List[SessaoAutenticada] = []
+        self._esperando: Deque[Future] = deque()
+        self._vagas: List[int] = list(range(self._tamanho))
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _chave(self, vaga: Optional[int]) -> str:
+        return f"sessao:{self.orgao}:{vaga}"
+
+    @staticmethod
+    def _dados(sessao: SessaoAutenticada) -> Dict[str, Any]:
+        return {"cookies": sessao.cookies, "token": sessao.token}
+
+    async def _criar(self, vaga: int) -> SessaoAutenticada:
+        inicio = time.monotonic()
+
+        async def renovar():
+            sessao = await self._login()
+            validade = sessao.expira_em - time.monotonic() if sessao.expira_em else self._ttl_segundos
+            return self._dados(sessao), time.time() + validade
+
+        dados, expira_em, renovada = await armazem_sessoes().obter_ou_renovar(self._chave(vaga), renovar)
+
+        sessao = SessaoAutenticada(
+            cookies=dados["cookies"],
+            token=dados["token"],
+            expira_em=time.monotonic() + (expira_em - time.time()),
+            vaga=vaga,
+        )
+
+        logger.info(
+            "[POOL SESSOES] %s | orgao=%s | vaga=%s | duracao=%.2fs",
+            "Login realizado" if renovada else "Sessão reaproveitada do armazém",
+            self.orgao,
+            vaga,
+            time.monotonic() - inicio,
+        )
+
+        return sessao
+
+    async def _invalidar(self, sessao: SessaoAutenticada) -> None:
+        # Só apaga se ainda for a mesma: outro worker pode já ter refeito o login.
+        await armazem_sessoes().remover(self._chave(sessao.vaga), self._dados(sessao))
+
+    def _liberar_vaga(self, vaga: Optional[int]) -> None:
+        # Chamado com o lock adquirido.
+        self._total -= 1
+        if vaga is not None:
+            heapq.heappush(self._vagas, vaga)
+
+    def _entregar(self, conteudo: Union[SessaoAutenticada, int]) -> bool:
+        # Chamado com o lock adquirido.
+        while self._esperando:
+            futuro = self._esperando.popleft()
+
+            if futuro.set_running_or_notify_cancel():
+                futuro.set_result(conteudo)
+                return True
+
+        return False
+
+    def _devolver(self, sessao: SessaoAutenticada) -> None:
+        with self._lock:
+            if not self._entregar(sessao):
+                self._livres.append(sessao)
+
+    def _descartar(self, vaga: Optional[int]) -> None:
+        with self._lock:
+            # A vaga passa direto para quem está esperando.
+            if vaga is None or not self._entregar(vaga):
+                self._liberar_vaga(vaga)
+
+    async def _aguardar_vaga(self, futuro: Future) -> Union[SessaoAutenticada, int]:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(futuro), POOL_SESSOES_ESPERA_SEGUNDOS)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            # A entrega pode ter ocorrido junto com o timeout/cancelamento.
+            if futuro.done() and not futuro.cancelled():
+                conteudo = futuro.result()
+
+                if isinstance(conteudo, SessaoAutenticada):
+                    self._devolver(conteudo)
+                else:
+                    self._descartar(conteudo)
+
+            if isinstance(error, asyncio.CancelledError):
+                raise
+
+            raise HTTPException(
+                status_code=503,
+                detail=f"Nenhuma sessão {self.orgao} disponível no momento.",
+            )
+
+    async def _obter(self) -> SessaoAutenticada:
+        futuro: Optional[Future] = None
+        vaga: Optional[int] = None
+
+        with self._lock:
+            while self._livres:
+                sessao = self._livres.pop()
+
+                if not sessao.expirada():
+                    return sessao
+
+                self._liberar_vaga(sessao.vaga)
+
+            if self._total < self._tamanho:
+                self._total += 1
+                vaga = heapq.heappop(self._vagas)
+            else:
+                futuro = Future()
+                self._esperando.append(futuro)
+
+        if futuro is not None:
+            conteudo = await self._aguardar_vaga(futuro)
+
+            if not isinstance(conteudo, SessaoAutenticada):
+                vaga = conteudo
+            elif not conteudo.expirada():
+                return conteudo
+            else:
+                vaga = conteudo.vaga
+
+        try:
+            return await self._criar(vaga)
+        except BaseException:
+            self._descartar(vaga)
+            raise
+
+    @asynccontextmanager
+    async def emprestar(self) -> AsyncIterator[SessaoAutenticada]:
+        sessao = await self._obter()
+
+        try:
+            yield sessao
+        except SessaoExpirada:
+            # Apaga do armazém antes de liberar a vaga: quem estiver
+            # esperando não pode recarregar a mesma sessão recusada.
+            try:
+                await self._invalidar(sessao)
+            finally:
+                self._descartar(sessao.vaga)
+            raise
+        except BaseException:
+            self._devolver(sessao)
+            raise
+        else:
+            self._devolver(sessao)
+
+    async def executar(self, operacao: Callable[[SessaoAutenticada], Awaitable[T]]) -> T:
+        """Executa a operação com uma sessão do pool, refazendo o login uma vez se expirou."""
+
+        try:
+            async with self.emprestar() as sessao:
+                return await operacao(sessao)
+        except SessaoExpirada as error:
+            logger.warning(
+                "[POOL SESSOES] Sessão recusada pelo órgão; refazendo login | orgao=%s | motivo=%s",
+                self.orgao,
+                str(error),
+            )
+
+        try:
+            async with self.emprestar() as sessao:
+                return await operacao(sessao)
+        except SessaoExpirada as error:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Sessão {self.orgao} recusada mesmo após novo login: {str(error)}",
+            )
+
+    def limpar(self) -> None:
+        with self._lock:
+            for sessao in self._livres:
+                self._liberar_vaga(sessao.vaga)
+            self._livres = []
+
+
+def verificar_sessao_valida(resp: httpx.Response) -> None:
+    """
+    Identifica respostas que indicam sessão vencida nos ControllerServlet
+    e nas APIs com Bearer: 401/403 ou página HTML de login no lugar do JSON.
+    """
+
+    if resp.status_code in (401, 403):
+        raise SessaoExpirada(f"HTTP {resp.status_code}")
+
+    content_type = (resp.headers.get("Content-Type") or "").lower()
+
+    if "text/html" in content_type and not resp.text.lstrip().startswith(("{", "[")):
+        raise SessaoExpirada("resposta HTML no lugar de JSON")
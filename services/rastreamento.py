@@ -0,0 +1,225 @@
+import functools
+import importlib.util
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, MutableMapping, Optional, TypeVar
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # pragma: no cover - depende do ambiente
+    trace = None
+
+
+logger = logging.getLogger("rastreamento")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Tracing (OpenTelemetry), opcional
+# ==========================================================
+# Spans nas rotas (MiddlewareRastreamento), nas chamadas aos órgãos
+# (requisitar_async), nos logins e na consulta do relay INEA no
+# Firestore. Desligado, span() não faz nada e nenhum pacote do
+# OpenTelemetry é importado além da API.
+
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").strip().lower() in ("1", "true", "sim", "yes")
+
+# "console" (stdout, funciona offline) ou "otlp" (endpoint em
+# OTEL_EXPORTER_OTLP_ENDPOINT, padrão http://localhost:4318).
+OTEL_EXPORTER = os.getenv("OTEL_EXPORTER", "console").strip().lower()
+
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "tree-apis")
+
+CONSOLE = "console"
+OTLP = "otlp"
+
+# Versões recentes do FastAPI já criam o span de cada rota com o
+# TracerProvider global; nelas MiddlewareRastreamento não é instalado.
+FASTAPI_COM_TELEMETRIA = importlib.util.find_spec("fastapi.telemetry") is not None
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+_tracer = None
+
+
+def _exportador() -> Any:
+    if OTEL_EXPORTER == OTLP:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+
+    if OTEL_EXPORTER != CONSOLE:
+        logger.warning("[TRACING] OTEL_EXPORTER desconhecido (%s); usando console", OTEL_EXPORTER)
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    return ConsoleSpanExporter()
+
+
+def configurar_rastreamento() -> bool:
+    """Cria o TracerProvider com o exportador escolhido; chamar uma vez no startup."""
+
+    global _tracer
+
+    if not OTEL_ENABLED or _tracer is not None:
+        return _tracer is not None
+
+    if trace is None:
+        logger.warning("[TRACING] opentelemetry-api não instalado; tracing desligado")
+        return False
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(_exportador()))
+    except ImportError as error:
+        logger.warning("[TRACING] SDK/exportador do OpenTelemetry não instalado; tracing desligado | erro=%s", error)
+        return False
+
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("tree-apis")
+
+    logger.info("[TRACING] Tracing habilitado | exportador=%s | servico=%s", OTEL_EXPORTER, OTEL_SERVICE_NAME)
+    return True
+
+
+def encerrar_rastreamento() -> None:
+    """Envia os spans pendentes (shutdown da aplicação)."""
+
+    if _tracer is not None:
+        trace.get_tracer_provider().shutdown()
+
+
+class _SpanNulo:
+    def set_attribute(self, chave: str, valor: Any) -> None:
+        pass
+
+    def update_name(self, nome: str) -> None:
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+@contextmanager
+def span(
+    nome: str,
+    atributos: Optional[Dict[str, Any]] = None,
+    *,
+    cliente: bool = False,
+    servidor: bool = False,
+    contexto: Any = None,
+) -> Iterator[Any]:
+    """
+    Span filho do span corrente (ou do contexto informado). Exceções ficam
+    registradas no span e seguem adiante; HTTPException com status < 500
+    não marca erro.
+    """
+
+    if _tracer is None:
+        yield _SPAN_NULO
+        return
+
+    tipo = SpanKind.CLIENT if cliente else SpanKind.SERVER if servidor else SpanKind.INTERNAL
+    atributos = {chave: valor for chave, valor in (atributos or {}).items() if valor is not None}
+
+    with _tracer.start_as_current_span(
+        nome,
+        context=contexto,
+        kind=tipo,
+        attributes=atributos,
+        record_exception=False,
+        set_status_on_exception=False,
+    ) as atual:
+        try:
+            yield atual
+        except BaseException as error:
+            status = getattr(error, "status_code", 500)
+            if not isinstance(status, int) or status >= 500:
+                atual.record_exception(error)
+                atual.set_status(Status(StatusCode.ERROR, type(error).__name__))
+            raise
+
+
+def rastrear(nome: str, atributos: Optional[Dict[str, Any]] = None) -> Callable[[F], F]:
+    """Decorator de span para funções assíncronas (logins, etapas dos serviços)."""
+
+    def decorar(funcao: F) -> F:
+        @functools.wraps(funcao)
+        async def envolvida(*args, **kwargs):
+            with span(nome, atributos):
+                return await funcao(*args, **kwargs)
+
+        return envolvida  # type: ignore[return-value]
+
+    return decorar
+
+
+def injetar_contexto(headers: MutableMapping[str, str]) -> None:
+    """traceparent/tracestate do span corrente nos headers de saída."""
+
+    if _tracer is not None:
+        propagate.inject(headers)
+
+
+def marcar_status(atual: Any, status_code: int) -> None:
+    atual.set_attribute("http.response.status_code", status_code)
+
+    if _tracer is not None and status_code >= 500:
+        atual.set_status(Status(StatusCode.ERROR))
+
+
+# ==========================================================
+# Spans das rotas
+# ==========================================================
+
+
+def instrumentar_rotas(app: Any) -> None:
+    if not FASTAPI_COM_TELEMETRIA:
+        app.add_middleware(MiddlewareRastreamento)
+
+
+class MiddlewareRastreamento:
+    """
+    Span SERVER por requisição, com o contexto recebido em traceparent.
+    O nome usa o template da rota (POST /fepam/busca-parceiro), não o
+    caminho com códigos e senhas.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: MutableMapping[str, Any], receive: Callable, send: Callable) -> None:
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {chave.decode("latin-1"): valor.decode("latin-1") for chave, valor in scope.get("headers", [])}
+        metodo = scope.get("method", "GET")
+        status_code: Optional[int] = None
+
+        async def enviar(mensagem: MutableMapping[str, Any]) -> None:
+            nonlocal status_code
+            if mensagem["type"] == "http.response.start":
+                status_code = mensagem["status"]
+            await send(mensagem)
+
+        with span(
+            metodo,
+            {"http.request.method": metodo},
+            servidor=True,
+            contexto=propagate.extract(headers),
+        ) as atual:
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                rota = scope.get("route")
+                atual.update_name(f"{metodo} {getattr(rota, 'path', 'rota desconhecida')}")
+                if rota is not None:
+                    atual.set_attribute("http.route", rota.path)
+                if status_code is not None:
+                    marcar_status(atual, status_code)
@@ -0,0 +1,393 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from services.concorrencia import LimiteConcorrencia
+
+
+logger = logging.getLogger("resiliencia")
+logger.setLevel(logging.INFO)
+
+# ==========================================================
+# Configuração do circuit breaker e do bulkhead por órgão
+# ==========================================================
+# Cada valor pode ser ajustado por órgão com o sufixo _<ORGAO>, por
+# exemplo CIRCUITO_LIMIAR_FALHAS_INEA=3 ou BULKHEAD_LIMITE_FEAM=10.
+
+RESILIENCIA_ENABLED = os.getenv("RESILIENCIA_ENABLED", "true").strip().lower() in ("1", "true", "sim", "yes")
+
+# Falhas seguidas (conexão, timeout, 502/503/504) que abrem o circuito.
+CIRCUITO_LIMIAR_FALHAS = int(os.getenv("CIRCUITO_LIMIAR_FALHAS", "5"))
+
+# Tempo com o circuito aberto antes de deixar passar uma requisição de teste.
+CIRCUITO_TEMPO_ABERTO_SEGUNDOS = float(os.getenv("CIRCUITO_TEMPO_ABERTO_SEGUNDOS", "30"))
+
+# Requisições de teste simultâneas no estado meio-aberto.
+CIRCUITO_TESTES_MEIO_ABERTO = int(os.getenv("CIRCUITO_TESTES_MEIO_ABERTO", "1"))
+
+# Requisições simultâneas a um mesmo órgão; o restante espera na fila.
+BULKHEAD_LIMITE = int(os.getenv("BULKHEAD_LIMITE", "20"))
+
+# Espera máxima por uma vaga antes de responder 503.
+BULKHEAD_ESPERA_SEGUNDOS = float(os.getenv("BULKHEAD_ESPERA_SEGUNDOS", "5"))
+
+STATUS_FALHA_UPSTREAM = {502, 503, 504}
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio-aberto"
+
+
+def _config(nome: str, orgao: str, padrao: Any) -> Any:
+    valor = os.getenv(f"{nome}_{orgao.upper().replace('.', '_').replace('-', '_')}")
+
+    if valor is None:
+        return padrao
+
+    return type(padrao)(valor)
+
+
+def _retry_after(segundos: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(segundos)))}
+
+
+class CircuitoAberto(HTTPException):
+    """Órgão fora do ar: a requisição é recusada sem ir ao upstream."""
+
+    def __init__(self, orgao: str, segundos: float):
+        super().__init__(
+            status_code=503,
+            detail=f"{orgao} indisponível no momento (circuito aberto). Tente novamente mais tarde.",
+            headers=_retry_after(segundos),
+        )
+
+
+class BulkheadCheio(HTTPException):
+    """Todas as vagas do órgão ocupadas por mais tempo que a espera máxima."""
+
+    def __init__(self, orgao: str, segundos: float):
+        super().__init__(
+            status_code=503,
+            detail=f"Muitas requisições simultâneas para {orgao}. Tente novamente em instantes.",
+            headers=_retry_after(segundos),
+        )
+
+
+class Disjuntor:
+    """
+    Circuit breaker de um órgão.
+
+    fechado -> aberto: após limiar_falhas falhas seguidas.
+    aberto -> meio-aberto: passado tempo_aberto, libera requisições de teste.
+    meio-aberto -> fechado no primeiro sucesso; -> aberto na primeira falha.
+    """
+
+    def __init__(
+        self,
+        orgao: str,
+        limiar_falhas: int = CIRCUITO_LIMIAR_FALHAS,
+        tempo_aberto: float = CIRCUITO_TEMPO_ABERTO_SEGUNDOS,
+        testes_meio_aberto: int = CIRCUITO_TESTES_MEIO_ABERTO,
+    ):
+        self.orgao = orgao
+        self._limiar_falhas = max(1, limiar_falhas)
+        self._tempo_aberto = tempo_aberto
+        self._testes_meio_aberto = max(1, testes_meio_aberto)
+        self._estado = FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._testes_em_andamento = 0
+        self._lock = threading.Lock()
+        self._contadores = {"recusadas": 0, "aberturas": 0}
+
+    def permitir(self) -> bool:
+        """Reserva a passagem; retorna se é uma requisição de teste."""
+
+        with self._lock:
+            if self._estado == ABERTO:
+                restante = self._aberto_ate - time.monotonic()
+
+                if restante > 0:
+                    self._contadores["recusadas"] += 1
+                    raise CircuitoAberto(self.orgao, restante)
+
+                self._estado = MEIO_ABERTO
+                self._testes_em_andamento = 0
+                logger.info("[CIRCUITO] Meio-aberto; liberando requisição de teste | orgao=%s", self.orgao)
+
+            if self._estado == MEIO_ABERTO:
+                if self._testes_em_andamento >= self._testes_meio_aberto:
+                    self._contadores["recusadas"] += 1
+                    raise CircuitoAberto(self.orgao, 1)
+
+                self._testes_em_andamento += 1
+                return True
+
+            return False
+
+    def _abrir(self) -> None:
+        # Chamado com o lock adquirido.
+        self._estado = ABERTO
+        self._aberto_ate = time.monotonic() + self._tempo_aberto
+        self._contadores["aberturas"] += 1
+
+        logger.warning(
+            "[CIRCUITO] Circuito aberto | orgao=%s | falhas_seguidas=%s | por=%.0fs",
+            self.orgao,
+            self._falhas_seguidas,
+            self._tempo_aberto,
+        )
+
+    def registrar_sucesso(self, teste: bool) -> None:
+        with self._lock:
+            if teste:
+                self._testes_em_andamento -= 1
+
+            if self._estado != FECHADO:
+                logger.info("[CIRCUITO] Circuito fechado | orgao=%s", self.orgao)
+
+            self._estado = FECHADO
+            self._falhas_seguidas = 0
+
+    def registrar_falha(self, teste: bool) -> None:
+        with self._lock:
+            self._falhas_seguidas += 1
+
+            if teste:
+                self._testes_em_andamento -= 1
+
+            if self._estado == MEIO_ABERTO or (
+                self._estado == FECHADO and self._falhas_seguidas >= self._limiar_falhas
+            ):
+                self._abrir()
+
+    def liberar(self, teste: bool) -> None:
+        """Requisição cancelada antes do fim: não conta como sucesso nem falha."""
+
+        if teste:
+            with self._lock:
+                self._testes_em_andamento -= 1
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            estado = self._estado
+
+            if estado == ABERTO and time.monotonic() >= self._aberto_ate:
+                estado = MEIO_ABERTO
+
+            return {
+                "estado": estado,
+                "falhas_seguidas": self._falhas_seguidas,
+                **self._contadores,
+            }
+
+
+class Vaga:
+    """Vaga ocupada no bulkhead; soltar() a devolve uma única vez."""
+
+    def __init__(self, limite: LimiteConcorrencia):
+        self._limite = limite
+        self._ocupada = True
+        self._lock = threading.Lock()
+
+    def soltar(self) -> None:
+        with self._lock:
+            if not self._ocupada:
+                return
+
+            self._ocupada = False
+
+        self._limite.liberar()
+
+
+class _CorpoComVaga(httpx.AsyncByteStream):
+    """Corpo de uma resposta com stream=True que solta a vaga ao ser fechado."""
+
+    def __init__(self, corpo: httpx.AsyncByteStream, vaga: Vaga):
+        self._corpo = corpo
+        self._vaga = vaga
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for bloco in self._corpo:
+            yield bloco
+
+    async def aclose(self) -> None:
+        try:
+            await self._corpo.aclose()
+        finally:
+            self._vaga.soltar()
+
+
+class Bulkhead:
+    """Limite de requisições simultâneas de um órgão, com espera máxima."""
+
+    def __init__(self, orgao: str, limite: int = BULKHEAD_LIMITE, espera: float = BULKHEAD_ESPERA_SEGUNDOS):
+        self.orgao = orgao
+        self._limite = LimiteConcorrencia(limite)
+        self._espera = espera
+        self._recusadas = 0
+        self._lock = threading.Lock()
+
+    async def ocupar(self) -> Vaga:
+        try:
+            await asyncio.wait_for(self._limite.__aenter__(), timeout=self._espera)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._recusadas += 1
+
+            logger.warning(
+                "[BULKHEAD] Sem vaga para o órgão | orgao=%s | em_uso=%s | aguardando=%s",
+                self.orgao,
+                self._limite.em_uso(),
+                self._limite.aguardando(),
+            )
+            raise BulkheadCheio(self.orgao, self._espera)
+
+        return Vaga(self._limite)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            recusadas = self._recusadas
+
+        return {
+            "em_uso": self._limite.em_uso(),
+            "aguardando": self._limite.aguardando(),
+            "recusadas": recusadas,
+        }
+
+
+_DISJUNTORES: Dict[str, Disjuntor] = {}
+_BULKHEADS: Dict[str, Bulkhead] = {}
+_LOCK = threading.Lock()
+
+
+def _disjuntor(orgao: str) -> Disjuntor:
+    with _LOCK:
+        disjuntor = _DISJUNTORES.get(orgao)
+
+        if disjuntor is None:
+            disjuntor = Disjuntor(
+                orgao,
+                limiar_falhas=_config("CIRCUITO_LIMIAR_FALHAS", orgao, CIRCUITO_LIMIAR_FALHAS),
+                tempo_aberto=_config("CIRCUITO_TEMPO_ABERTO_SEGUNDOS", orgao, CIRCUITO_TEMPO_ABERTO_SEGUNDOS),
+                testes_meio_aberto=_config("CIRCUITO_TESTES_MEIO_ABERTO", orgao, CIRCUITO_TESTES_MEIO_ABERTO),
+            )
+            _DISJUNTORES[orgao] = disjuntor
+
+        return disjuntor
+
+
+def _bulkhead(orgao: str) -> Bulkhead:
+    with _LOCK:
+        bulkhead = _BULKHEADS.get(orgao)
+
+        if bulkhead is None:
+            bulkhead = Bulkhead(
+                orgao,
+                limite=_config("BULKHEAD_LIMITE", orgao, BULKHEAD_LIMITE),
+                espera=_config("BULKHEAD_ESPERA_SEGUNDOS", orgao, BULKHEAD_ESPERA_SEGUNDOS),
+            )
+            _BULKHEADS[orgao] = bulkhead
+
+        return bulkhead
+
+
+class Protecao:
+    """Resultado de proteger(): informe a resposta com registrar(resp)."""
+
+    def __init__(self, disjuntor: Disjuntor, teste: bool):
+        self._disjuntor = disjuntor
+        self._teste = teste
+        self._registrado = False
+        self._vaga: Optional[Vaga] = None
+
+    def registrar(self, resp: Optional[httpx.Response]) -> None:
+        if self._registrado:
+            return
+
+        self._registrado = True
+
+        if resp is None or resp.status_code in STATUS_FALHA_UPSTREAM:
+            self._disjuntor.registrar_falha(self._teste)
+        else:
+            self._disjuntor.registrar_sucesso(self._teste)
+
+    def manter_vaga(self, resp: httpx.Response) -> None:
+        """
+        Resposta com stream=True: a vaga do bulkhead segue com ela e só
+        volta no aclose(), quando o corpo já foi repassado.
+        """
+
+        vaga, self._vaga = self._vaga, None
+
+        if vaga is None:
+            return
+
+        resp.stream = _CorpoComVaga(resp.stream, vaga)
+        # Resposta descartada sem aclose() não prende a vaga para sempre.
+        weakref.finalize(resp, vaga.soltar)
+
+    def liberar(self) -> None:
+        if not self._registrado:
+            self._registrado = True
+            self._disjuntor.liberar(self._teste)
+
+        vaga, self._vaga = self._vaga, None
+
+        if vaga is not None:
+            vaga.soltar()
+
+
+@asynccontextmanager
+async def proteger(orgao: str) -> AsyncIterator[Optional[Protecao]]:
+    """
+    Envolve uma chamada ao órgão com bulkhead e circuit breaker.
+
+    Com o circuito aberto ou sem vaga no bulkhead levanta 503 com
+    Retry-After sem tocar no upstream. Erros de transporte do httpx contam
+    como falha automaticamente; a resposta deve ser informada com
+    protecao.registrar(resp) para que 502/503/504 também contem. Com
+    stream=True, protecao.manter_vaga(resp) segura a vaga até o aclose().
+    """
+
+    if not RESILIENCIA_ENABLED:
+        yield None
+        return
+
+    disjuntor = _disjuntor(orgao)
+    teste = disjuntor.permitir()
+    protecao = Protecao(disjuntor, teste)
+
+    try:
+        protecao._vaga = await _bulkhead(orgao).ocupar()
+        yield protecao
+    except httpx.TransportError:
+        protecao.registrar(None)
+        raise
+    finally:
+        protecao.liberar()
+
+
+def estado_resiliencia() -> Dict[str, Any]:
+    with _LOCK:
+        orgaos = sorted(set(_DISJUNTORES) | set(_BULKHEADS))
+
+    return {
+        "habilitado": RESILIENCIA_ENABLED,
+        "orgaos": {
+            orgao: {
+                "circuito": _disjuntor(orgao).estado(),
+                "bulkhead": _bulkhead(orgao).estado(),
+            }
+            for orgao in orgaos
+        },
+    }
@@ -1,8 +1,28 @@
+import logging
+import httpx
 import requests
 from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import Dict, Tuple, Optional, Union, Any
 
+from services.cache_tokens import executar_com_token, obter_token
+from services.clientes_http import (
+    cookies_com_sessao,
+    cookies_resposta,
+    executar_sincrono,
+    requisitar_async,
+    sessao_com_cookies,
+)
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import tamanho_payload
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, SessaoExpirada, verificar_sessao_valida
+from services.rastreamento import rastrear
+
+
+logger = logging.getLogger("semad")
+logger.setLevel(logging.INFO)
+
 SEMAD_BASE_URL = "https://mtr.meioambiente.go.gov.br/api"
 
 
@@ -20,7 +40,8 @@ class ConsultaSemadManifestoRequest(BaseModel):
 # =========================
 # Passo 1 - Get Token SEMAD
 # =========================
-def gerar_token_semad(
+@rastrear("token SEMAD")
+async def _solicitar_token_semad(
     pessoa_codigo: int,
     cnpj: str,
     cpf: str,
@@ -40,13 +61,14 @@ def gerar_token_semad(
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             url,
             json=payload,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com a SEMAD (token): {str(e)}"
@@ -69,25 +91,36 @@ def gerar_token_semad(
     return data["token"]
 
 
-def buscar_parceiro_semad(
+async def gerar_token_semad_async(
+    pessoa_codigo: int,
+    cnpj: str,
+    cpf: str,
+    senha: str
+) -> str:
+    return await obter_token(
+        ("SEMAD", pessoa_codigo, cnpj, cpf, senha),
+        lambda: _solicitar_token_semad(pessoa_codigo, cnpj, cpf, senha),
+    )
+
+
+def gerar_token_semad(
+    pessoa_codigo: int,
+    cnpj: str,
+    cpf: str,
+    senha: str
+) -> str:
+    return executar_sincrono(gerar_token_semad_async(pessoa_codigo, cnpj, cpf, senha))
+
+
+async def buscar_parceiro_semad_async(
     cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
     cnpj: str,
     armazenador: bool = False,
     tipo_pessoa: str = "2",
     codigo_unidade: str = "armazenador",
     timeout: int = 30,
-    session: Optional[requests.Session] = None,
 ) -> Dict[str, Any]:
 
-    # Reaproveita session se você passar uma (recomendado).
-    s = session or requests.Session()
-
-    # Injeta cookies recebidos
-    if isinstance(cookies, requests.cookies.RequestsCookieJar):
-        s.cookies.update(cookies)
-    else:
-        s.cookies.update(cookies)
-
     headers = {
         "Accept": "*/*",
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
@@ -102,24 +135,32 @@ def buscar_parceiro_semad(
 
     # Form data na ordem (pra ficar bem próximo do Network do Chrome)
     if armazenador == True:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-            ("codigoUnidade", ""),
-            ("armazenador", "S"),  # esse "S" solto do payload
-        ]
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+            "codigoUnidade": "",
+            "armazenador": "S",  # esse "S" solto do payload
+        }
     else:
-        form_fields = [
-            ("acao", "buscaPessoaPorTipo"),
-            ("cnpj", cnpj),
-            ("tipoPessoa", tipo_pessoa),
-        ]
+        form_fields = {
+            "acao": "buscaPessoaPorTipo",
+            "cnpj": cnpj,
+            "tipoPessoa": tipo_pessoa,
+        }
 
     BASE_URL = "https://mtr.meioambiente.go.gov.br/ControllerServlet"
 
 
-    resp = s.post(BASE_URL, headers=headers, data=form_fields, timeout=timeout)
+    resp = await requisitar_async(
+        "POST",
+        BASE_URL,
+        cookies=cookies,
+        headers=headers,
+        data=form_fields,
+        timeout=timeout,
+    )
+    verificar_sessao_valida(resp)
     resp.raise_for_status()
 
     # A resposta diz ser application/json;charset=utf-8
@@ -135,6 +176,27 @@ def buscar_parceiro_semad(
         }
 
 
+def buscar_parceiro_semad(
+    cookies: Union[Dict[str, str], requests.cookies.RequestsCookieJar],
+    cnpj: str,
+    armazenador: bool = False,
+    tipo_pessoa: str = "2",
+    codigo_unidade: str = "armazenador",
+    timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
+    return executar_sincrono(
+        buscar_parceiro_semad_async(
+            cookies=cookies_com_sessao(cookies, session),
+            cnpj=cnpj,
+            armazenador=armazenador,
+            tipo_pessoa=tipo_pessoa,
+            codigo_unidade=codigo_unidade,
+            timeout=timeout,
+        )
+    )
+
+
 
 
 # =========================
@@ -142,16 +204,15 @@ def buscar_parceiro_semad(
 # =========================
 LOGIN_URL = "https://mtr.meioambiente.go.gov.br/ControllerServlet"
 
-def autenticar_e_obter_cookies(
+@rastrear("login SEMAD")
+async def autenticar_e_obter_cookies_async(
     cnpj: str,
     senha: str,
     cpf_usuario: str,
     unidade_codigo: str = "",
     cpf_usuario2: str = "",   # caso exista "txtCpfUsuario" e outro campo, deixe aqui se precisar
     timeout: int = 30,
-) -> Tuple[Dict[str, str], str, requests.Session]:
-
-    s = requests.Session()
+) -> Tuple[Dict[str, str], str]:
 
     # Headers parecidos com o browser (os essenciais)
     headers = {
@@ -175,134 +236,122 @@ def autenticar_e_obter_cookies(
         "tipoPessoaSociedade": "J",
     }
 
-    resp = s.post(LOGIN_URL, headers=headers, data=data, timeout=timeout)
+    resp = await requisitar_async("POST", LOGIN_URL, headers=headers, data=data, timeout=timeout)
     resp.raise_for_status()
 
-    # Cookies que a sessão armazenou (vindos dos Set-Cookie do servidor)
-    cookies = s.cookies.get_dict()
+    # Cookies vindos dos Set-Cookie do servidor
+    cookies = cookies_resposta(resp)
+
+    return cookies, resp.text
 
-    return cookies, resp.text, s
+
+def autenticar_e_obter_cookies(
+    cnpj: str,
+    senha: str,
+    cpf_usuario: str,
+    unidade_codigo: str = "",
+    cpf_usuario2: str = "",
+    timeout: int = 30,
+) -> Tuple[Dict[str, str], str, requests.Session]:
+    cookies, texto = executar_sincrono(
+        autenticar_e_obter_cookies_async(cnpj, senha, cpf_usuario, unidade_codigo, cpf_usuario2, timeout)
+    )
+    return cookies, texto, sessao_com_cookies(cookies)
 
 BASE_URL = "https://mtr.meioambiente.go.gov.br/ControllerServlet"
 
 
 # =========================
-# BUSCAR TRANSPORTADOR
+# POOL DE SESSÕES (conta de busca de parceiros)
 # =========================
 
-def buscar_transportador_semad(cnpj):
-    print('\n===================BUSCANDO TRANSPORTADOR ========\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies, body, session = autenticar_e_obter_cookies(
+async def _login_parceiros_semad() -> SessaoAutenticada:
+    cookies, body = await autenticar_e_obter_cookies_async(
         cnpj="39228967000160",
         senha="Tree@2025",
         cpf_usuario="04304532642",
         unidade_codigo=""
     )
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('COOKIE_GENERICO', cookies.get('CookieGenericoGoias'))
-    print('TS01925403', cookies.get('TS01925403'))
-    print('---------------------------------------------------\n')
-    
+
     cookies_login = {
     "JSESSIONID": cookies.get('JSESSIONID'),
     "TS01925403": cookies.get('TS01925403'),
     "CookieGenericoGoias": cookies.get('CookieGenericoGoias'),
     }
-    
-    r = buscar_parceiro_semad(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="2",
+
+    return SessaoAutenticada(cookies=cookies_login)
+
+
+_POOL_PARCEIROS_SEMAD = PoolSessoes("SEMAD", _login_parceiros_semad)
+
+
+# =========================
+# BUSCAR TRANSPORTADOR
+# =========================
+
+async def buscar_transportador_semad_async(cnpj):
+    r = await _POOL_PARCEIROS_SEMAD.executar(
+        lambda sessao: buscar_parceiro_semad_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+        )
     )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[SEMAD] Busca de transportador concluída | %s", tamanho_payload(r))
 
     return r
-  
+
+
+def buscar_transportador_semad(cnpj):
+    return executar_sincrono(buscar_transportador_semad_async(cnpj))
+
 # =========================
 # BUSCAR DESTINO
 # =========================
-  
-def buscar_destino_semad(cnpj):
-    print('\n===================BUSCANDO DESTINO ==============\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies, body, session = autenticar_e_obter_cookies(
-        cnpj="39228967000160",
-        senha="Tree@2025",
-        cpf_usuario="04304532642",
-        unidade_codigo=""
-    )
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('COOKIE_GENERICO', cookies.get('CookieGenericoGoias'))
-    print('TS01925403', cookies.get('TS01925403'))
-    print('---------------------------------------------------\n')
-    
-    cookies_login = {
-    "JSESSIONID": cookies.get('JSESSIONID'),
-    "TS01925403": cookies.get('TS01925403'),
-    "CookieGenericoGoias": cookies.get('CookieGenericoGoias'),
-    }
-    
-    r = buscar_parceiro_semad(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="4",
+
+async def buscar_destino_semad_async(cnpj):
+    r = await _POOL_PARCEIROS_SEMAD.executar(
+        lambda sessao: buscar_parceiro_semad_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="4",
+        )
     )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[SEMAD] Busca de destino concluída | %s", tamanho_payload(r))
 
     return r
-  
+
+
+def buscar_destino_semad(cnpj):
+    return executar_sincrono(buscar_destino_semad_async(cnpj))
+
 # =========================
 # BUSCAR ARMAZENADOR
 # =========================
-  
-def buscar_armazenador_semad(cnpj):
-    print('\n============== BUSCANDO ARMAZENADOR ==============\n')
-    
-    print('\n===================BUSCANDO OS COOKIES =============')
-    cookies, body, session = autenticar_e_obter_cookies(
-        cnpj="39228967000160",
-        senha="Tree@2025",
-        cpf_usuario="04304532642",
-        unidade_codigo=""
-    )
-    print('\n-------------------Cookies capturados --------------')
-    print('JSESSIONID', cookies.get('JSESSIONID'))
-    print('COOKIE_GENERICO', cookies.get('CookieGenericoGoias'))
-    print('TS01925403', cookies.get('TS01925403'))
-    print('---------------------------------------------------\n')
-    
-    cookies_login = {
-    "JSESSIONID": cookies.get('JSESSIONID'),
-    "TS01925403": cookies.get('TS01925403'),
-    "CookieGenericoGoias": cookies.get('CookieGenericoGoias'),
-    }
-    
-    r = buscar_parceiro_semad(
-        cookies=cookies_login,
-        cnpj=cnpj,
-        tipo_pessoa="2",
-        armazenador=True
+
+async def buscar_armazenador_semad_async(cnpj):
+    r = await _POOL_PARCEIROS_SEMAD.executar(
+        lambda sessao: buscar_parceiro_semad_async(
+            cookies=sessao.cookies,
+            cnpj=cnpj,
+            tipo_pessoa="2",
+            armazenador=True,
+        )
     )
-    print('\n======= Resposta =========')
-    print(r)
-    print('==========================\n')
+    logger.debug("[SEMAD] Busca de armazenador concluída | %s", tamanho_payload(r))
 
     return r
-   
+
+
+def buscar_armazenador_semad(cnpj):
+    return executar_sincrono(buscar_armazenador_semad_async(cnpj))
+
 
 # =========================
 # Passo 2 - Retorna Manifesto
 # =========================
-def retorna_manifesto_semad(
+@coalescer("SEMAD", "retorna_manifesto_token")
+async def retorna_manifesto_semad_async(
     token: str,
     codigo_barras: str
 ):
@@ -314,33 +363,72 @@ def retorna_manifesto_semad(
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             url,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com a SEMAD (manifesto): {str(e)}"
         )
 
+    if response.status_code in (401, 403):
+        raise SessaoExpirada(f"HTTP {response.status_code}")
+
     if response.status_code != 200:
         raise HTTPException(
             status_code=502,
             detail="Erro ao consultar manifesto na SEMAD"
         )
 
-    return response.json()
+    return json_bruto(response, "SEMAD")
 
 
-def download_mtr_semad(
+def retorna_manifesto_semad(
+    token: str,
+    codigo_barras: str
+):
+    return executar_sincrono(retorna_manifesto_semad_async(token, codigo_barras))
+
+
+@coalescer("SEMAD", "retorna_manifesto")
+async def consultar_manifesto_semad_async(
+    pessoa_codigo: int,
+    cnpj: str,
+    cpf: str,
+    senha: str,
+    codigo_barras: str
+):
+    return await executar_com_token(
+        ("SEMAD", pessoa_codigo, cnpj, cpf, senha),
+        lambda: _solicitar_token_semad(pessoa_codigo, cnpj, cpf, senha),
+        lambda token: retorna_manifesto_semad_async(token=token, codigo_barras=codigo_barras),
+    )
+
+
+def consultar_manifesto_semad(
     pessoa_codigo: int,
     cnpj: str,
     cpf: str,
     senha: str,
     codigo_barras: str
-) -> requests.Response:
+):
+    return executar_sincrono(consultar_manifesto_semad_async(pessoa_codigo, cnpj, cpf, senha, codigo_barras))
+
+
+async def download_mtr_semad_async(
+    pessoa_codigo: int,
+    cnpj: str,
+    cpf: str,
+    senha: str,
+    codigo_barras: str,
+    stream: bool = False
+) -> httpx.Response:
+    # Com stream=True o PDF não é lido aqui: quem chama repassa o corpo
+    # e fecha a resposta.
     codigo_barras = str(codigo_barras or "").strip()
 
     if len(codigo_barras) != 34:
@@ -352,23 +440,27 @@ def download_mtr_semad(
             )
         )
 
-    session = requests.Session()
-
-    session.headers.update({
+    headers_navegador = {
         "User-Agent": (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/145.0.0.0 Safari/537.36"
         ),
         "Accept": "*/*"
-    })
+    }
+
+    # Cookies acumulados ao longo do fluxo (papel da antiga requests.Session)
+    cookies: Dict[str, str] = {}
 
     try:
-        session.get(
+        home_response = await requisitar_async(
+            "GET",
             "https://mtr.meioambiente.go.gov.br/",
+            headers=headers_navegador,
             timeout=20
         )
-    except requests.RequestException:
+        cookies.update(cookies_resposta(home_response))
+    except httpx.HTTPError:
         pass
 
     token_url = f"{SEMAD_BASE_URL}/gettoken"
@@ -381,15 +473,18 @@ def download_mtr_semad(
     }
 
     try:
-        token_response = session.post(
+        token_response = await requisitar_async(
+            "POST",
             token_url,
+            cookies=cookies,
             json=token_payload,
             headers={
+                **headers_navegador,
                 "Content-Type": "application/json"
             },
             timeout=30
         )
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         raise HTTPException(
             status_code=502,
             detail=(
@@ -419,6 +514,7 @@ def download_mtr_semad(
         )
 
     token = token_data.get("token")
+    cookies.update(cookies_resposta(token_response))
 
     if (
         token_data.get("retornoCodigo") != 0
@@ -441,16 +537,20 @@ def download_mtr_semad(
 
 
     try:
-        download_response = session.post(
+        download_response = await requisitar_async(
+            "POST",
             download_url,
+            cookies=cookies,
             headers={
+                **headers_navegador,
                 "Accept": "application/pdf",
                 "Content-Type": "application/pdf",
                 "Authorization": f"Bearer {token}"
             },
-            timeout=60
+            timeout=60,
+            stream=stream
         )
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
         raise HTTPException(
             status_code=502,
             detail=(
@@ -461,6 +561,16 @@ def download_mtr_semad(
 
     return download_response
 
+
+def download_mtr_semad(
+    pessoa_codigo: int,
+    cnpj: str,
+    cpf: str,
+    senha: str,
+    codigo_barras: str
+) -> httpx.Response:
+    return executar_sincrono(download_mtr_semad_async(pessoa_codigo, cnpj, cpf, senha, codigo_barras))
+
 #buscar_transportador_semad('39228967000160')
 #buscar_destino_semad('39228967000160')
 #buscar_armazenador_semad('39228967000160')
\ No newline at end of file
@@ -1,10 +1,23 @@
-import requests
+import logging
+
+import httpx
 from fastapi import HTTPException
 from pydantic import BaseModel
-import json
+
+from services.cache_tokens import executar_com_token, obter_token
+from services.clientes_http import executar_sincrono, requisitar_async
+from services import codec_json
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import tamanho_payload
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, SessaoExpirada, verificar_sessao_valida
+from services.rastreamento import rastrear
 
 SIGOR_BASE_URL = "https://mtrr.cetesb.sp.gov.br/apiws/rest"
 
+logger = logging.getLogger("sigor")
+logger.setLevel(logging.INFO)
+
 
 # ==================================================
 # Schema de entrada SIGOR
@@ -23,7 +36,8 @@ class ConsultaSigorModeloRequest(BaseModel):
 # ==================================================
 # Passo 1 - Get Token SIGOR
 # ==================================================
-def gerar_token_sigor(cpf_cnpj: str, senha: str, unidade: str) -> str:
+@rastrear("token SIGOR")
+async def _solicitar_token_sigor(cpf_cnpj: str, senha: str, unidade: str) -> str:
     url = f"{SIGOR_BASE_URL}/gettoken"
 
     payload = {
@@ -37,13 +51,14 @@ def gerar_token_sigor(cpf_cnpj: str, senha: str, unidade: str) -> str:
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             url,
             json=payload,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SIGOR (token): {str(e)}"
@@ -66,16 +81,28 @@ def gerar_token_sigor(cpf_cnpj: str, senha: str, unidade: str) -> str:
     # objetoResposta já vem como: "Bearer xxxxx"
     return data["objetoResposta"]
 
+
+async def gerar_token_sigor_async(cpf_cnpj: str, senha: str, unidade: str) -> str:
+    return await obter_token(
+        ("SIGOR", cpf_cnpj, unidade, senha),
+        lambda: _solicitar_token_sigor(cpf_cnpj, senha, unidade),
+    )
+
+
+def gerar_token_sigor(cpf_cnpj: str, senha: str, unidade: str) -> str:
+    return executar_sincrono(gerar_token_sigor_async(cpf_cnpj, senha, unidade))
+
 # ==================================================
 # LOGIN NÃO OFICIAL
 # ==================================================
 
-def login_nao_oficial():
+@rastrear("login SIGOR")
+async def login_nao_oficial_async():
 
     try:
         url = "https://mtrr.cetesb.sp.gov.br/api/mtr/carregaDadosLogin"
         
-        payload = json.dumps({
+        payload = codec_json.dumps({
         "sistema": "",
         "email": "danielle@recicla.se",
         "senha": "Tree@2025",
@@ -86,28 +113,31 @@ def login_nao_oficial():
         
         headers = {'Content-Type': 'application/json'}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = await requisitar_async("POST", url, headers=headers, content=payload)
         
         response = response.json()
         objetoResposta = response.get('objetoResposta')
         token = objetoResposta.get('token')
-        print('response', response)
-        print('objetoResposta', objetoResposta)
-        print('token', token)
+        logger.debug("[SIGOR] Login não oficial concluído | %s", tamanho_payload(response))
         
         return token
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SIGOR (manifesto): {str(e)}"
         )
-        
+
+
+def login_nao_oficial():
+    return executar_sincrono(login_nao_oficial_async())
+
 # ==================================================
 # Passo 2 - Retorna Manifesto
 # ==================================================
 
-def retorna_manifesto_sigor(
+@coalescer("SIGOR", "retorna_manifesto_token")
+async def retorna_manifesto_sigor_async(
     token_bearer: str,
     manifesto_numero: str
 ):
@@ -118,103 +148,154 @@ def retorna_manifesto_sigor(
     }
 
     try:
-        response = requests.get(
+        response = await requisitar_async(
+            "GET",
             url,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SIGOR (manifesto): {str(e)}"
         )
 
+    if response.status_code in (401, 403):
+        raise SessaoExpirada(f"HTTP {response.status_code}")
+
     if response.status_code != 200:
         raise HTTPException(
             status_code=502,
             detail="Erro ao consultar manifesto no SIGOR"
         )
 
-    return response.json()
+    return json_bruto(response, "SIGOR")
+
+
+def retorna_manifesto_sigor(
+    token_bearer: str,
+    manifesto_numero: str
+):
+    return executar_sincrono(retorna_manifesto_sigor_async(token_bearer, manifesto_numero))
+
+
+@coalescer("SIGOR", "retorna_manifesto")
+async def consultar_manifesto_sigor_async(
+    cpf_cnpj: str,
+    senha: str,
+    unidade: str,
+    manifesto_numero: str
+):
+    return await executar_com_token(
+        ("SIGOR", cpf_cnpj, unidade, senha),
+        lambda: _solicitar_token_sigor(cpf_cnpj, senha, unidade),
+        lambda token: retorna_manifesto_sigor_async(token_bearer=token, manifesto_numero=manifesto_numero),
+    )
+
+
+def consultar_manifesto_sigor(
+    cpf_cnpj: str,
+    senha: str,
+    unidade: str,
+    manifesto_numero: str
+):
+    return executar_sincrono(consultar_manifesto_sigor_async(cpf_cnpj, senha, unidade, manifesto_numero))
 
 # ==================================================
-# Retorna Dados Transportador
+# Pool de sessões (conta da API não oficial)
 # ==================================================
 
-def retorna_dados_transportador_sigor(cnpj):
+async def _login_parceiros_sigor() -> SessaoAutenticada:
+    token = await login_nao_oficial_async()
 
-    token = login_nao_oficial()
-    print('token', token)
+    if not token:
+        raise HTTPException(
+            status_code=502,
+            detail="Login SIGOR não retornou token"
+        )
+
+    return SessaoAutenticada(token=token)
 
-    url = f"https://mtrr.cetesb.sp.gov.br/api/mtr/pesquisaParceiro/5/{cnpj}"
 
-    payload = {}
+_POOL_PARCEIROS_SIGOR = PoolSessoes("SIGOR", _login_parceiros_sigor)
+
+
+async def _pesquisa_parceiro_sigor(sessao: SessaoAutenticada, url: str) -> httpx.Response:
     headers = {
-    'Authorization': f'Bearer {token}'
+    'Authorization': f'Bearer {sessao.token}'
     }
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+    try:
+        response = await requisitar_async("GET", url, headers=headers, timeout=30)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Erro de comunicação com o SIGOR (parceiro): {str(e)}"
+        )
+
+    verificar_sessao_valida(response)
+    return response
 
 # ==================================================
-# Retorna Dados Destino
+# Retorna Dados Transportador
 # ==================================================
 
-def retorna_dados_destino_sigor(cnpj):
+async def retorna_dados_transportador_sigor_async(cnpj):
+    url = f"https://mtrr.cetesb.sp.gov.br/api/mtr/pesquisaParceiro/5/{cnpj}"
+
+    response = await _POOL_PARCEIROS_SIGOR.executar(lambda sessao: _pesquisa_parceiro_sigor(sessao, url))
+    return json_bruto(response, "SIGOR")
 
-    token = login_nao_oficial()
-    print('token', token)
 
+def retorna_dados_transportador_sigor(cnpj):
+    return executar_sincrono(retorna_dados_transportador_sigor_async(cnpj))
+
+# ==================================================
+# Retorna Dados Destino
+# ==================================================
+
+async def retorna_dados_destino_sigor_async(cnpj):
     url = f"https://mtrr.cetesb.sp.gov.br/api/mtr/pesquisaParceiro/9/{cnpj}"
 
-    payload = {}
-    headers = {
-    'Authorization': f'Bearer {token}'
-    }
+    response = await _POOL_PARCEIROS_SIGOR.executar(lambda sessao: _pesquisa_parceiro_sigor(sessao, url))
+    return json_bruto(response, "SIGOR")
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+
+def retorna_dados_destino_sigor(cnpj):
+    return executar_sincrono(retorna_dados_destino_sigor_async(cnpj))
 
 # ==================================================
 # Retorna Dados Armazenador
 # ==================================================
 
-def retorna_dados_armazenador_sigor(cnpj):
-
-    token = login_nao_oficial()
-    print('token', token)
-
+async def retorna_dados_armazenador_sigor_async(cnpj):
     url = f"https://mtrr.cetesb.sp.gov.br/api/mtr/pesquisaParceiro/10/{cnpj}"
 
-    payload = {}
-    headers = {
-    'Authorization': f'Bearer {token}'
-    }
+    response = await _POOL_PARCEIROS_SIGOR.executar(lambda sessao: _pesquisa_parceiro_sigor(sessao, url))
+    return json_bruto(response, "SIGOR")
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+
+def retorna_dados_armazenador_sigor(cnpj):
+    return executar_sincrono(retorna_dados_armazenador_sigor_async(cnpj))
 
 
 # ==================================================
 # BUSCA MODELOS 
 # ==================================================  
-def busca_modelos_sigor(login: str = "04304532642", senha: str = "Tree@2025", parCodigo: int = 69122):
-    print('\n... buscando modelos')
+async def busca_modelos_sigor_async(login: str = "04304532642", senha: str = "Tree@2025", parCodigo: int = 69122):
+    logger.debug("[SIGOR] Buscando modelos | parCodigo=%s", parCodigo)
 
-    token = login_nao_oficial()
-    
-    print('token:', token)
+    token = await login_nao_oficial_async()
 
     url = f"https://mtrr.cetesb.sp.gov.br/api/mtr/manifestoModelo/{parCodigo}"
 
-    payload = {}
     headers = {
     'Authorization': f'Bearer {token}'
     }
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+    response = await requisitar_async("GET", url, headers=headers)
+    return json_bruto(response, "SIGOR")
+
+
+def busca_modelos_sigor(login: str = "04304532642", senha: str = "Tree@2025", parCodigo: int = 69122):
+    return executar_sincrono(busca_modelos_sigor_async(login, senha, parCodigo))
@@ -1,10 +1,23 @@
-import requests
+import logging
+
+import httpx
 from fastapi import HTTPException
 from pydantic import BaseModel
-import json
+
+from services.cache_tokens import executar_com_token, obter_token
+from services.clientes_http import executar_sincrono, requisitar_async
+from services import codec_json
+from services.concorrencia import coalescer
+from services.json_bruto import json_bruto
+from services.log_payload import tamanho_payload
+from services.pool_sessoes import PoolSessoes, SessaoAutenticada, SessaoExpirada, verificar_sessao_valida
+from services.rastreamento import rastrear
 
 SINIR_BASE_URL = "https://admin.sinir.gov.br/apiws/rest"
 
+logger = logging.getLogger("sinir")
+logger.setLevel(logging.INFO)
+
 # =========================
 # Schema de entrada SINIR Busca Modelo
 # =========================
@@ -26,7 +39,8 @@ class ConsultaSinirManifestoRequest(BaseModel):
 # =========================
 # Passo 1 - Get Token SINIR
 # =========================
-def gerar_token_sinir(cpf_cnpj: str, senha: str, unidade: str) -> str:
+@rastrear("token SINIR")
+async def _solicitar_token_sinir(cpf_cnpj: str, senha: str, unidade: str) -> str:
     url = f"{SINIR_BASE_URL}/gettoken"
 
     payload = {
@@ -40,13 +54,14 @@ def gerar_token_sinir(cpf_cnpj: str, senha: str, unidade: str) -> str:
     }
 
     try:
-        response = requests.post(
+        response = await requisitar_async(
+            "POST",
             url,
             json=payload,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SINIR (token): {str(e)}"
@@ -69,18 +84,30 @@ def gerar_token_sinir(cpf_cnpj: str, senha: str, unidade: str) -> str:
     # objetoResposta já vem como: "Bearer xxxxx"
     return data["objetoResposta"]
 
+
+async def gerar_token_sinir_async(cpf_cnpj: str, senha: str, unidade: str) -> str:
+    return await obter_token(
+        ("SINIR", cpf_cnpj, unidade, senha),
+        lambda: _solicitar_token_sinir(cpf_cnpj, senha, unidade),
+    )
+
+
+def gerar_token_sinir(cpf_cnpj: str, senha: str, unidade: str) -> str:
+    return executar_sincrono(gerar_token_sinir_async(cpf_cnpj, senha, unidade))
+
 # ==================================================
 # LOGIN NÃO OFICIAL
 # ==================================================
 
-def login_nao_oficial_sinir(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
+@rastrear("login SINIR")
+async def login_nao_oficial_sinir_async(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
     
-    print('login sinir api não oficial...')
+    logger.debug("[SINIR] Login não oficial")
 
     try:
         url = "https://mtr.sinir.gov.br/api/mtr/login"
         
-        payload = json.dumps({
+        payload = codec_json.dumps({
             "parCodigo": parCodigo,
             "login": login,
             "senha": senha
@@ -88,7 +115,7 @@ def login_nao_oficial_sinir(login: str = "04304532642", senha: str = "Sinir@2601
         
         headers = {'Content-Type': 'application/json'}
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = await requisitar_async("POST", url, headers=headers, content=payload)
         
         response = response.json()
         objetoResposta = response.get('objetoResposta')
@@ -96,17 +123,22 @@ def login_nao_oficial_sinir(login: str = "04304532642", senha: str = "Sinir@2601
         
         return token
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SIGOR (manifesto): {str(e)}"
         )
+
+
+def login_nao_oficial_sinir(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
+    return executar_sincrono(login_nao_oficial_sinir_async(login, senha, parCodigo))
     
 # =========================
 # Passo 2 - Retorna Manifesto
 # =========================
-def retorna_manifesto_sinir(
+@coalescer("SINIR", "retorna_manifesto_token")
+async def retorna_manifesto_sinir_async(
     token_bearer: str,
     manifesto_numero: str
 ):
@@ -117,83 +149,147 @@ def retorna_manifesto_sinir(
     }
 
     try:
-        response = requests.get(
+        response = await requisitar_async(
+            "GET",
             url,
             headers=headers,
             timeout=30
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=502,
             detail=f"Erro de comunicação com o SINIR (manifesto): {str(e)}"
         )
 
+    if response.status_code in (401, 403):
+        raise SessaoExpirada(f"HTTP {response.status_code}")
+
     if response.status_code != 200:
         raise HTTPException(
             status_code=502,
             detail="Erro ao consultar manifesto no SINIR"
         )
 
-    return response.json()
+    return json_bruto(response, "SINIR")
+
+
+def retorna_manifesto_sinir(
+    token_bearer: str,
+    manifesto_numero: str
+):
+    return executar_sincrono(retorna_manifesto_sinir_async(token_bearer, manifesto_numero))
+
+
+@coalescer("SINIR", "retorna_manifesto")
+async def consultar_manifesto_sinir_async(
+    cpf_cnpj: str,
+    senha: str,
+    unidade: str,
+    manifesto_numero: str
+):
+    return await executar_com_token(
+        ("SINIR", cpf_cnpj, unidade, senha),
+        lambda: _solicitar_token_sinir(cpf_cnpj, senha, unidade),
+        lambda token: retorna_manifesto_sinir_async(token_bearer=token, manifesto_numero=manifesto_numero),
+    )
+
+
+def consultar_manifesto_sinir(
+    cpf_cnpj: str,
+    senha: str,
+    unidade: str,
+    manifesto_numero: str
+):
+    return executar_sincrono(consultar_manifesto_sinir_async(cpf_cnpj, senha, unidade, manifesto_numero))
 
 # ==================================================
-# Retorna Dados Transportador
+# Pool de sessões (conta da API não oficial)
 # ==================================================
 
-def retorna_dados_transportador_sinir(cnpj):
-    print('\nretornando dados do transportador')
+async def _login_parceiros_sinir() -> SessaoAutenticada:
+    token = await login_nao_oficial_sinir_async()
+
+    if not token:
+        raise HTTPException(
+            status_code=502,
+            detail="Login SINIR não retornou token"
+        )
+
+    return SessaoAutenticada(token=token)
+
+
+_POOL_PARCEIROS_SINIR = PoolSessoes("SINIR", _login_parceiros_sinir)
 
-    token = login_nao_oficial_sinir()
-    url = f"https://mtr.sinir.gov.br/api/mtr/pesquisaParceiro/5/{cnpj}"
 
-    payload = {}
+async def _pesquisa_parceiro_sinir(sessao: SessaoAutenticada, url: str) -> httpx.Response:
     headers = {
-    'Authorization': f'Bearer {token}'
+    'Authorization': f'Bearer {sessao.token}'
     }
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+    try:
+        response = await requisitar_async("GET", url, headers=headers, timeout=30)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Erro de comunicação com o SINIR (parceiro): {str(e)}"
+        )
+
+    verificar_sessao_valida(response)
+    return response
 
 # ==================================================
-# Retorna Dados Destino
+# Retorna Dados Transportador
 # ==================================================
 
-def retorna_dados_destino_sinir(cnpj):
-    print('\nretornando dados do destino')
+async def retorna_dados_transportador_sinir_async(cnpj):
+
+    url = f"https://mtr.sinir.gov.br/api/mtr/pesquisaParceiro/5/{cnpj}"
+
+    response = await _POOL_PARCEIROS_SINIR.executar(lambda sessao: _pesquisa_parceiro_sinir(sessao, url))
+    r = json_bruto(response, "SINIR")
+
+    logger.debug("[SINIR] Busca de transportador concluída | %s", tamanho_payload(r))
+    return r
+
+
+def retorna_dados_transportador_sinir(cnpj):
+    return executar_sincrono(retorna_dados_transportador_sinir_async(cnpj))
+
+# ==================================================
+# Retorna Dados Destino
+# ==================================================
 
-    token = login_nao_oficial_sinir()
+async def retorna_dados_destino_sinir_async(cnpj):
 
     url = f"https://mtr.sinir.gov.br/api/mtr/pesquisaParceiro/9/{cnpj}"
 
-    payload = {}
-    headers = {
-    'Authorization': f'Bearer {token}'
-    }
+    response = await _POOL_PARCEIROS_SINIR.executar(lambda sessao: _pesquisa_parceiro_sinir(sessao, url))
+    r = json_bruto(response, "SINIR")
+
+    logger.debug("[SINIR] Busca de destino concluída | %s", tamanho_payload(r))
+    return r
+
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+def retorna_dados_destino_sinir(cnpj):
+    return executar_sincrono(retorna_dados_destino_sinir_async(cnpj))
 
 # ==================================================
 # Retorna Dados Armazenador
 # ==================================================
 
-def retorna_dados_armazenador_sinir(cnpj):
-    
-    print('\n... retornando dados do armazenador')
-    token = login_nao_oficial_sinir()
+async def retorna_dados_armazenador_sinir_async(cnpj):
 
     url = f"https://mtr.sinir.gov.br/api/mtr/pesquisaParceiro/10/{cnpj}"
 
-    payload = {}
-    headers = {
-    'Authorization': f'Bearer {token}'
-    }
+    response = await _POOL_PARCEIROS_SINIR.executar(lambda sessao: _pesquisa_parceiro_sinir(sessao, url))
+    r = json_bruto(response, "SINIR")
+
+    logger.debug("[SINIR] Busca de armazenador concluída | %s", tamanho_payload(r))
+    return r
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+
+def retorna_dados_armazenador_sinir(cnpj):
+    return executar_sincrono(retorna_dados_armazenador_sinir_async(cnpj))
 
 #retorna_dados_armazenador('50891995000104')
 #retorna_dados_transportador('39228967000160')
@@ -204,21 +300,21 @@ def retorna_dados_armazenador_sinir(cnpj):
 # ==================================================
 # BUSCA MODELOS 
 # ==================================================  
-def busca_modelos_sinir(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
-    print('\n... buscando modelos')
+async def busca_modelos_sinir_async(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
+    logger.debug("[SINIR] Buscando modelos | parCodigo=%s", parCodigo)
 
-    token = login_nao_oficial_sinir()
-    
-    print('token:', token)
+    token = await login_nao_oficial_sinir_async()
 
     url = f"https://mtr.sinir.gov.br/api/mtr/manifestoModelo/{parCodigo}"
 
-    payload = {}
     headers = {
     'Authorization': f'Bearer {token}'
     }
 
-    response = requests.request("GET", url, headers=headers, data=payload)
-    print(response.text)
-    return response.text
+    response = await requisitar_async("GET", url, headers=headers)
+    return json_bruto(response, "SINIR")
+
+
+def busca_modelos_sinir(login: str = "04304532642", senha: str = "Sinir@2601", parCodigo: int = 490976):
+    return executar_sincrono(busca_modelos_sinir_async(login, senha, parCodigo))
 